@@ -2,6 +2,7 @@
 
 import sys
 import os
+import time
 import argparse
 import logging
 import chmutil
@@ -10,10 +11,18 @@ from chmutil.core import CHMConfigFromConfigFactory
 from chmutil.cluster import ClusterFactory
 from chmutil.cluster import BatchedTasksListGenerator
 from chmutil.core import Parameters
-from chmutil.cluster import CHMTaskChecker
-from chmutil.cluster import MergeTaskChecker
 from chmutil.core import CHMJobCreator
 from chmutil.cluster import TaskSummaryFactory
+from chmutil.cluster import JobProgressMonitor
+from chmutil.cluster import HostAnalyzer
+from chmutil.cluster import write_exclude_hosts_file
+from chmutil.cluster import TaskFailureClassifier
+from chmutil.cluster import TaskRetryPlanner
+from chmutil.cluster import get_task_failures
+from chmutil.cluster import JobStateScanner
+from chmutil.cluster import SchedulerQueryFactory
+from chmutil.cluster import SchedulerQueryError
+from chmutil.cluster import get_live_batched_tasks
 from chmutil import core
 
 
@@ -24,6 +33,15 @@ SUBMIT = 'submit'
 SUBMIT_FLAG = '--' + SUBMIT
 DETAILED = 'detailed'
 DETAILED_FLAG = '--' + DETAILED
+WATCH = 'watch'
+WATCH_FLAG = '--' + WATCH
+ANALYZEHOSTS = 'analyzehosts'
+ANALYZEHOSTS_FLAG = '--' + ANALYZEHOSTS
+SKIPRUNNING = 'skiprunning'
+SKIPRUNNING_FLAG = '--' + SKIPRUNNING
+TEXT_FORMAT = 'text'
+JSON_FORMAT = 'json'
+CSV_FORMAT = 'csv'
 
 
 def _parse_arguments(desc, args):
@@ -42,18 +60,72 @@ def _parse_arguments(desc, args):
     batchchm = CHMJobCreator.CONFIG_BATCHED_TASKS_FILE_NAME
     parser.add_argument(SUBMIT_FLAG, action="store_true",
                         help='rewrite {batchchm}'
-                             'and {batchmerge} files with any'
-                             'jobs that need to still be'
-                             'processed. WARNING: Do NOT add this'
+                             ' and {batchmerge} files with any'
+                             ' jobs that need to still be'
+                             ' processed. WARNING: Do NOT add this'
                              ' flag if tasks are still running,'
                              ' since key configuration files '
                              'will be '
-                             'rewritten.'.format(batchchm=batchchm,
-                                                 batchmerge=bmerge))
+                             'rewritten, unless {skiprunning}'
+                             ' is also set. Tasks that failed are '
+                             'retried with more memory if they ran '
+                             'out of memory, more walltime if they '
+                             'ran out of time, and are held back if '
+                             'their input image is bad or they failed '
+                             'too often. Retry state is kept in {retry} '
+                             'file in job directory'.format(
+                                 batchchm=batchchm, batchmerge=bmerge,
+                                 skiprunning=SKIPRUNNING_FLAG,
+                                 retry=CHMJobCreator.TASK_RETRY_FILE_NAME))
 
     parser.add_argument(DETAILED_FLAG, action="store_true",
                         help='output detailed summary '
                              'information for job')
+    parser.add_argument(WATCH_FLAG, action="store_true",
+                        help='after outputting summary keep monitoring '
+                             'job, outputting throughput, estimated time '
+                             'to completion, and CPU hours consumed every '
+                             '--interval seconds until all tasks are '
+                             'complete. Press Ctrl-C to stop')
+    parser.add_argument("--interval", type=float, default=60.0,
+                        help='seconds between checks in ' + WATCH_FLAG +
+                             ' mode (default 60)')
+    parser.add_argument("--format", choices=[TEXT_FORMAT, JSON_FORMAT,
+                                             CSV_FORMAT],
+                        default=TEXT_FORMAT,
+                        help='format of summary. ' + JSON_FORMAT + ' and ' +
+                             CSV_FORMAT + ' imply ' + DETAILED_FLAG +
+                             ' and output task counts, compute, '
+                             'walltime and memory percentiles, '
+                             'throughput, and estimated cost to finish '
+                             'for each phase (default ' + TEXT_FORMAT +
+                             ')')
+    parser.add_argument("--costpercpuhour", type=float, default=1.0,
+                        help='cost charged per CPU hour, such as service '
+                             'units, used to estimate cost to finish in ' +
+                             JSON_FORMAT + ' and ' + CSV_FORMAT +
+                             ' summary (default 1.0)')
+    parser.add_argument(ANALYZEHOSTS_FLAG, action="store_true",
+                        help='group task run times and failures by host '
+                             'and flag hosts that are slow or where many '
+                             'tasks failed. Flagged hosts are added to ' +
+                             CHMJobCreator.EXCLUDE_HOSTS_FILE_NAME +
+                             ' file in job directory which ' +
+                             SUBMIT_FLAG + ' uses to keep tasks off of '
+                             'those hosts. Delete or edit the file to '
+                             'allow the hosts again')
+    parser.add_argument(SKIPRUNNING_FLAG, action="store_true",
+                        help='with ' + SUBMIT_FLAG + ' ask scheduler, '
+                             'with one squeue or qstat call per phase, '
+                             'which array tasks of the job are still '
+                             'queued or running. Their tasks are not '
+                             'resubmitted and their entries in batched '
+                             'config files are left unchanged')
+    parser.add_argument("--schedulercmd",
+                        help='command run instead of squeue or qstat by ' +
+                             SKIPRUNNING_FLAG + '. Must accept the same '
+                             'arguments and produce the same output, '
+                             'useful for testing')
     parser.add_argument("--skipchm", action="store_true",
                         help='skips examination of CHM jobs. This will'
                              ' mean stats on CHM jobs will be invalid')
@@ -74,47 +146,152 @@ def _get_chmconfig(jobdir):
     return cfac.get_chmconfig(skip_loading_mergeconfig=False)
 
 
-def _get_incompleted_chm_task_list(chmconfig):
-    """Gets incompleted chm tasks
+def _write_held_tasks(prefix, held, planner):
+    """Writes tasks held back from submission to standard out
     """
-    chm_checker = CHMTaskChecker(chmconfig)
-    return chm_checker.get_incomplete_tasks_list()
-
-
-def _get_incompleted_merge_task_list(mergeconfig):
-    """Gets incompleted merge tasks as list
+    if not held:
+        return
+    sys.stdout.write('Held back ' + str(len(held)) + ' ' + prefix +
+                     ' tasks for inspection. To retry them remove their '
+                     'sections from ' + planner.get_state_file() + '\n\n')
+    for taskid in sorted(held.keys(), key=lambda x: int(x)):
+        (failure, log) = held[taskid]
+        line = '  ' + prefix + ' task ' + taskid + ': ' + failure
+        if log is not None:
+            line += ' (' + log + ')'
+        sys.stdout.write(line + '\n')
+    sys.stdout.write('\n')
+
+
+def _submit_tasks(prefix, batcher, config_file, log_dir, task_list,
+                  walltime, memory_in_gb, planner, get_submit_command,
+                  log_files=None, scheduler_query=None, job_name=None):
+    """Classifies why tasks in `task_list` failed in the last
+       submission, writes batched config file with tasks grouped by
+       resources they need, and outputs one submit command per group
+    :param prefix: phase of tasks ie chm or merge
+    :param get_submit_command: cluster method that returns submit command
+    :param log_files: if set, list of files in `log_dir`
+    :param scheduler_query: if set, `SchedulerQuery` used to find tasks
+                            of `job_name` still queued or running which
+                            are skipped and left in batched config file
+    :param job_name: name of job on scheduler
+    :raises SchedulerQueryError: if scheduler cannot be queried
     """
-    merge_checker = MergeTaskChecker(mergeconfig)
-    return merge_checker.get_incomplete_tasks_list()
-
-
-def _submit_chm_tasks(batcher, config_file, task_list,
-                      cluster):
-    """submit CHM tasks
-    """
-    num_tasks = batcher.write_batched_config(config_file,
-                                             task_list)
-    sys.stdout.write('Run this:\n\n ' +
-                     cluster.get_chm_submit_command(num_tasks) +
-                     '\n\n')
+    live_tasks = None
+    running = []
+    if scheduler_query is not None:
+        live_ids = scheduler_query.get_live_array_task_ids(job_name)
+        live_tasks = get_live_batched_tasks(config_file, live_ids)
+        for ids in live_tasks.values():
+            running.extend(ids)
+        running_set = set(running)
+        task_list = [x for x in task_list if x not in running_set]
+        if live_tasks:
+            sys.stdout.write('Skipping ' + str(len(running_set)) + ' ' +
+                             prefix + ' tasks in ' + str(len(live_tasks)) +
+                             ' array tasks of ' + job_name +
+                             ' still queued or running\n\n')
+        if not task_list:
+            sys.stdout.write('All incomplete ' + prefix + ' tasks are '
+                             'queued or running, nothing to submit\n\n')
+            return 0
+
+    classifier = TaskFailureClassifier(memory_limit_in_gb=memory_in_gb)
+    failures = get_task_failures(config_file, log_dir, task_list,
+                                 classifier, log_files=log_files)
+    counts = {}
+    for (failure, log) in failures.values():
+        if failure != TaskFailureClassifier.NO_LOG:
+            counts[failure] = counts.get(failure, 0) + 1
+    if counts:
+        sys.stdout.write('Failed ' + prefix + ' tasks by cause: ' +
+                         ', '.join([x + ' ' + str(counts[x])
+                                    for x in sorted(counts.keys())]) +
+                         '\n\n')
+
+    (groups, held) = planner.plan(prefix, task_list, failures, walltime,
+                                  memory_in_gb, running_tasks=running)
+    planner.save()
+    _write_held_tasks(prefix, held, planner)
+    if not groups:
+        return 0
+
+    ranges = batcher.write_batched_config_for_groups(config_file,
+                                                     [x[2] for x in groups],
+                                                     keep_tasks=live_tasks)
+    sys.stdout.write('Run this:\n\n')
+    for ((task_walltime, task_memory, tasks),
+         (first_task, num_tasks)) in zip(groups, ranges):
+        override_walltime = None
+        override_memory = None
+        if task_walltime != str(walltime):
+            override_walltime = task_walltime
+        if task_memory != str(memory_in_gb):
+            override_memory = task_memory
+        if override_walltime is not None or override_memory is not None:
+            sys.stdout.write(' # ' + str(len(tasks)) + ' ' + prefix +
+                             ' tasks retried with walltime ' +
+                             task_walltime + ' and ' + task_memory +
+                             'G memory\n')
+        cmd = get_submit_command(num_tasks, first_task=first_task,
+                                 walltime=override_walltime,
+                                 memory_in_gb=override_memory)
+        sys.stdout.write(' ' + cmd + '\n\n')
     return 0
 
 
-def _submit_merge_tasks(batcher, config_file, task_list,
-                        cluster):
-    """submit CHM tasks
+def _get_log_files(job_state, prefix):
+    """Gets log files of phase `prefix` from `job_state`
+    :returns: list of log files or None if `job_state` is None
     """
-    num_tasks = batcher.write_batched_config(config_file,
-                                             task_list)
-    sys.stdout.write('Run this:\n\n ' +
-                     cluster.get_merge_submit_command(num_tasks) +
-                     '\n\n')
-    return 0
+    if job_state is None:
+        return None
+    if prefix == 'chm':
+        return job_state.get_chm_log_files()
+    return job_state.get_merge_log_files()
 
 
-def _submit(chmconfig, chm_task_list, merge_task_list):
+def _submit(chmconfig, chm_task_list, merge_task_list, job_state=None,
+            scheduler_query=None):
     """Generates new configuration files and outputs commands
-       to submit incomplete CHM and merge tasks
+       to submit incomplete CHM and merge tasks. Tasks that failed
+       in the last submission are retried with more memory or walltime,
+       or held back, depending on why they failed
+    :param job_state: if set, log files in `JobState` are used instead
+                      of listing log directories
+    :param scheduler_query: if set, `SchedulerQuery` used to skip tasks
+                            still queued or running
+    """
+    try:
+        return _submit_incomplete_tasks(chmconfig, chm_task_list,
+                                        merge_task_list, job_state,
+                                        scheduler_query)
+    except SchedulerQueryError as e:
+        logger.error('Unable to get queued and running tasks from '
+                     'scheduler, nothing was changed: ' + str(e))
+        return 3
+
+
+def _check_job_name_saved(config, option, config_file):
+    """Makes sure job name `option` is set in `config` so scheduler is
+       not queried with a default name that matches no job, which would
+       resubmit tasks that are still queued or running
+    :raises SchedulerQueryError: if `option` is not in `config`
+    """
+    if config is not None and config.has_option(CHMJobCreator.CONFIG_DEFAULT,
+                                                option):
+        return
+    raise SchedulerQueryError('No ' + option + ' in ' + config_file +
+                              ' file which is the case for jobs created '
+                              'by older versions. Add ' + option +
+                              ' = <name job was submitted with> to the '
+                              'default section of that file')
+
+
+def _submit_incomplete_tasks(chmconfig, chm_task_list, merge_task_list,
+                             job_state, scheduler_query):
+    """Does the work of `_submit`
     """
     cfac = ClusterFactory()
     clust = cfac.get_cluster_by_name(chmconfig.get_cluster())
@@ -124,6 +301,9 @@ def _submit(chmconfig, chm_task_list, merge_task_list):
         return 2
 
     clust.set_chmconfig(chmconfig)
+    planner = TaskRetryPlanner(os.path.join(chmconfig.get_out_dir(),
+                                            CHMJobCreator.
+                                            TASK_RETRY_FILE_NAME))
 
     num_chm_tasks = len(chm_task_list)
     if num_chm_tasks > 0:
@@ -133,7 +313,18 @@ def _submit(chmconfig, chm_task_list, merge_task_list):
                     ' CHM tasks that need submission')
         chm_con_file = chmconfig.get_batchedjob_config_file_path()
         logger.info('Batched config file path: ' + chm_con_file)
-        return _submit_chm_tasks(batcher, chm_con_file, chm_task_list, clust)
+        if scheduler_query is not None:
+            _check_job_name_saved(chmconfig.get_config(),
+                                  CHMJobCreator.CONFIG_JOB_NAME,
+                                  CHMJobCreator.CONFIG_FILE_NAME)
+        return _submit_tasks('chm', batcher, chm_con_file,
+                             chmconfig.get_stdout_dir(), chm_task_list,
+                             chmconfig.get_walltime(),
+                             chmconfig.get_max_chm_memory_in_gb(), planner,
+                             clust.get_chm_submit_command,
+                             log_files=_get_log_files(job_state, 'chm'),
+                             scheduler_query=scheduler_query,
+                             job_name=chmconfig.get_job_name())
 
     num_merge_tasks = len(merge_task_list)
     if num_merge_tasks > 0:
@@ -145,44 +336,187 @@ def _submit(chmconfig, chm_task_list, merge_task_list):
                     ' Merge tasks that need submission')
         mer_con_file = chmconfig.get_batched_mergejob_config_file_path()
         logger.info('Batched config file path: ' + mer_con_file)
-        return _submit_merge_tasks(batcher, mer_con_file, merge_task_list,
-                                   clust)
+        if scheduler_query is not None:
+            _check_job_name_saved(chmconfig.get_merge_config(),
+                                  CHMJobCreator.MERGE_JOB_NAME,
+                                  CHMJobCreator.MERGE_CONFIG_FILE_NAME)
+        return _submit_tasks('merge', batcher, mer_con_file,
+                             chmconfig.get_merge_stdout_dir(),
+                             merge_task_list,
+                             chmconfig.get_merge_walltime(),
+                             chmconfig.get_max_merge_memory_in_gb(), planner,
+                             clust.get_merge_submit_command,
+                             log_files=_get_log_files(job_state, 'merge'),
+                             scheduler_query=scheduler_query,
+                             job_name=chmconfig.get_mergejob_name())
 
     sys.stdout.write('\nAll jobs completed. Have a nice day!\n\n')
     return 0
 
 
+def _watch_chm_job(chmconfig, chm_task_list, merge_task_list, interval,
+                   sleep=time.sleep, cache_file=None):
+    """Monitors job with `JobProgressMonitor` writing progress to
+       standard out every `interval` seconds until all tasks complete
+    :param sleep: function to invoke to wait `interval` seconds
+    :param cache_file: if set, task log cache file used so logs parsed
+                       by earlier runs are not parsed again
+    :returns: 0
+    """
+    monitor = JobProgressMonitor(chmconfig,
+                                 chm_incomplete_tasks=chm_task_list,
+                                 merge_incomplete_tasks=merge_task_list,
+                                 cache_file=cache_file)
+    sys.stdout.write('Watching job every ' + str(interval) +
+                     ' seconds. Press Ctrl-C to stop\n\n')
+    try:
+        monitor.update()
+        sys.stdout.write(monitor.get_progress() + '\n')
+        while not monitor.is_complete():
+            sys.stdout.flush()
+            sleep(interval)
+            monitor.update()
+            sys.stdout.write(monitor.get_progress() + '\n')
+    except KeyboardInterrupt:
+        sys.stdout.write('\nStopped watching job\n')
+        return 0
+    sys.stdout.write('All tasks completed\n')
+    return 0
+
+
+def _write_task_summary(ts, theargs):
+    """Writes `TaskSummary` `ts` to standard out in format
+       set by --format
+    """
+    if theargs.format == JSON_FORMAT:
+        sys.stdout.write(ts.get_summary_as_json(cost_per_cpu_hour=theargs.
+                                                costpercpuhour) + '\n')
+        return
+    if theargs.format == CSV_FORMAT:
+        sys.stdout.write(ts.get_summary_as_csv(cost_per_cpu_hour=theargs.
+                                               costpercpuhour))
+        return
+    sys.stdout.write(ts.get_summary() + '\n')
+
+
+def _analyze_hosts(chmconfig, jobdir, out=None, job_state=None):
+    """Analyzes task logs by host writing report to `out` and
+       adding flagged hosts to exclude hosts file in `jobdir`
+    :param out: file to write report to, if None standard out is used
+    :param job_state: if set, log files in `JobState` are used instead
+                      of listing log directories
+    :returns: list of hosts flagged
+    """
+    if out is None:
+        out = sys.stdout
+    chm_logs = None
+    merge_logs = None
+    if job_state is not None:
+        chm_logs = job_state.get_chm_log_files()
+        merge_logs = job_state.get_merge_log_files()
+    analyzer = HostAnalyzer()
+    phases = [('CHM', chmconfig.get_stdout_dir(),
+               int(chmconfig.get_number_tiles_per_task()) *
+               int(chmconfig.get_number_tasks_per_node()), chm_logs),
+              ('Merge', chmconfig.get_merge_stdout_dir(),
+               int(chmconfig.get_number_merge_tasks_per_node()), merge_logs)]
+    all_flagged = set()
+    for (prefix, log_dir, tiles, log_files) in phases:
+        host_stats = analyzer.get_host_stats(log_dir, tiles,
+                                             log_files=log_files)
+        if not host_stats:
+            out.write(prefix + ' tasks by host: no task logs with host '
+                               'found\n\n')
+            continue
+        flagged = analyzer.get_flagged_hosts(host_stats)
+        out.write(analyzer.get_report(prefix, host_stats, flagged) + '\n')
+        all_flagged.update(flagged.keys())
+
+    if all_flagged:
+        exclude_file = os.path.join(jobdir,
+                                    CHMJobCreator.EXCLUDE_HOSTS_FILE_NAME)
+        hosts = write_exclude_hosts_file(exclude_file, all_flagged)
+        out.write('Hosts excluded on submit (' + exclude_file + '): ' +
+                  ','.join(hosts) + '\n\n')
+    return sorted(all_flagged)
+
+
+def _get_job_state(chmconfig, theargs):
+    """Scans job once with `JobStateScanner` reading log directories
+       only if a summary, host analysis, or submit needs them and
+       input images only if a detailed summary is requested
+    :returns: `JobState`
+    """
+    scan_logs = (theargs.detailed is True or theargs.analyzehosts is True or
+                 theargs.submit is True)
+    scanner = JobStateScanner(chmconfig, skip_chm=theargs.skipchm,
+                              scan_logs=scan_logs,
+                              scan_images=theargs.detailed)
+    return scanner.scan()
+
+
 def _check_chm_job(theargs):
     """Runs all jobs for task
     """
-    sys.stdout.write('\nAnalyzing job. This may take a minute...\n\n')
+    if theargs.format != TEXT_FORMAT:
+        # compute statistics are what make machine readable output useful
+        theargs.detailed = True
+    else:
+        sys.stdout.write('\nAnalyzing job. This may take a minute...\n\n')
 
-    if theargs.detailed:
-        sys.stdout.write('In fact this may take extra long cause '
-                         '--detailed was set\n')
-        sys.stdout.write('WARNING: Runtime information is new and'
-                         ' may contain errors\n\n')
+        if theargs.detailed:
+            sys.stdout.write('In fact this may take extra long cause '
+                             '--detailed was set\n')
+            sys.stdout.write('WARNING: Runtime information is new and'
+                             ' may contain errors\n\n')
 
     chmconfig = _get_chmconfig(theargs.jobdir)
-    if theargs.skipchm is False:
-        chm_task_list = _get_incompleted_chm_task_list(chmconfig.get_config())
-    else:
+    if theargs.skipchm is True:
         logger.info("--skipchm set to True. Skipping examination of CHM jobs.")
-        chm_task_list = []
 
-    merge_task_list = _get_incompleted_merge_task_list(chmconfig.
-                                                       get_merge_config())
+    job_state = _get_job_state(chmconfig, theargs)
+    chm_task_list = job_state.get_chm_incomplete_tasks()
+    merge_task_list = job_state.get_merge_incomplete_tasks()
 
+    cache_file = os.path.join(theargs.jobdir,
+                              CHMJobCreator.TASK_LOG_CACHE_FILE_NAME)
     tsf = TaskSummaryFactory(chmconfig, chm_incomplete_tasks=chm_task_list,
                              merge_incomplete_tasks=merge_task_list,
-                             output_compute=theargs.detailed)
+                             output_compute=theargs.detailed,
+                             cache_file=cache_file,
+                             job_state=job_state)
     ts = tsf.get_task_summary()
 
-    sys.stdout.write(ts.get_summary() + '\n')
+    _write_task_summary(ts, theargs)
+
+    if theargs.analyzehosts is True:
+        if theargs.format == TEXT_FORMAT:
+            _analyze_hosts(chmconfig, theargs.jobdir, job_state=job_state)
+        else:
+            _analyze_hosts(chmconfig, theargs.jobdir, out=sys.stderr,
+                           job_state=job_state)
+
+    if theargs.watch is True:
+        if theargs.submit is True:
+            logger.warning(SUBMIT_FLAG + ' ignored since ' + WATCH_FLAG +
+                           ' is set')
+        return _watch_chm_job(chmconfig, chm_task_list, merge_task_list,
+                              theargs.interval, cache_file=cache_file)
 
     if theargs.submit is True:
         logger.info(SUBMIT_FLAG + ' set')
-        return _submit(chmconfig, chm_task_list, merge_task_list)
+        scheduler_query = None
+        if theargs.skiprunning is True:
+            sfac = SchedulerQueryFactory()
+            scheduler_query = sfac.get_scheduler_query_by_cluster_name(
+                chmconfig.get_cluster(), command=theargs.schedulercmd)
+            if scheduler_query is None:
+                logger.error(SKIPRUNNING_FLAG + ' not supported on cluster: ' +
+                             str(chmconfig.get_cluster()) + ', nothing was '
+                             'changed')
+                return 3
+        return _submit(chmconfig, chm_task_list, merge_task_list,
+                       job_state=job_state, scheduler_query=scheduler_query)
     return 0
 
 
@@ -222,7 +556,17 @@ def main(arglist):
               and verifies existance of final probability maps for
               each input image.
 
-              NOTE: It is assumed no active tasks are running on this CHM job.
+              NOTE: It is assumed no active tasks are running on this CHM job
+              unless {skiprunning} is set, in which case the scheduler
+              is asked which tasks are still queued or running and
+              those are not resubmitted.
+
+              To monitor a running job add {watch} flag. This keeps
+              state of the job in memory and every --interval seconds
+              outputs tasks completed per minute, estimated time to
+              completion, and CPU hours consumed so far. Only
+              directories that changed since the previous check are
+              examined.
 
               Example usage default:
 
@@ -246,7 +590,9 @@ def main(arglist):
                          probmaps=CHMJobCreator.PROBMAPS_DIR,
                          tiles=CHMJobCreator.TILES_DIR,
                          submit=SUBMIT_FLAG,
-                         detailed=DETAILED_FLAG)
+                         detailed=DETAILED_FLAG,
+                         watch=WATCH_FLAG,
+                         skiprunning=SKIPRUNNING_FLAG)
 
     theargs = _parse_arguments(desc, arglist[1:])
     theargs.program = arglist[0]
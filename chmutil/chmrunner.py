@@ -8,12 +8,15 @@ import uuid
 import configparser
 import shutil
 import chmutil
+from PIL import Image
 
 from chmutil.core import CHMJobCreator
 from chmutil.core import CHMConfigFromConfigFactory
 from chmutil.core import Parameters
 from chmutil.core import SingularityAbortError
 from chmutil import core
+from chmutil import image
+from chmutil import fileutil
 
 LOG_FORMAT = "%(asctime)-15s %(levelname)s (%(process)d) %(name)s %(message)s"
 
@@ -60,37 +63,205 @@ def _run_jobs(chmconfig, theargs, taskid):
                              CHMJobCreator.CONFIG_FILE_NAME))
 
     tasks = bconfig.get(taskid, CHMJobCreator.BCONFIG_TASK_ID).split(',')
+
+    outbox = None
+    if (config.has_option(CHMJobCreator.CONFIG_DEFAULT,
+                          CHMJobCreator.CONFIG_STAGE_INPUT) and
+            config.getboolean(CHMJobCreator.CONFIG_DEFAULT,
+                              CHMJobCreator.CONFIG_STAGE_INPUT)):
+        outbox = os.path.join(theargs.scratchdir,
+                              CHMJobCreator.OUTBOX_PREFIX +
+                              uuid.uuid4().hex)
+        logger.debug('Results will be copied back from ' + outbox)
+        os.makedirs(outbox, mode=0o775)
+
+    run_dir = os.path.join(theargs.jobdir, CHMJobCreator.RUN_DIR)
     process_list = []
     logger.debug('Running ' + str(len(tasks)) + ' child processes')
     for t in tasks:
         pid = os.fork()
         if pid is 0:
             logger.debug('In child submitting job to run task ' + t)
-            try:
-                return _run_single_chm_job(theargs.jobdir,
-                                           theargs.scratchdir, t, config)
-            except SingularityAbortError:
-                logger.exception('Caught SingularityAbortError, retrying job')
-                return _run_single_chm_job(theargs.jobdir,
-                                           theargs.scratchdir, t, config)
-            except Exception:
-                logger.exception('Caught exception')
-                return 2
+            exitcode = _run_task(theargs.jobdir, theargs.scratchdir, t,
+                                 config, outbox=outbox)
+            if exitcode == 0 and outbox is not None:
+                _copy_back_task_outputs(outbox, run_dir,
+                                        config.get(t, CHMJobCreator.
+                                                   CONFIG_OUTPUT_IMAGE))
+            return exitcode
         else:
             logger.debug('Appending child process to list: ' + str(pid))
             process_list.append(pid)
 
-    return core.wait_for_children_to_exit(process_list)
+    exitcode = core.wait_for_children_to_exit(process_list)
+    if outbox is not None:
+        # moves any results children were unable to move
+        failed = _copy_back_outputs(outbox, run_dir)
+        if failed > 0 and exitcode == 0:
+            exitcode = 4
+        stager = core.InputStager(os.path.join(theargs.scratchdir,
+                                               CHMJobCreator.STAGING_DIR))
+        stager.remove_stale()
+    return exitcode
+
+
+def _run_task(jobdir, scratchdir, taskid, config, outbox=None):
+    """Runs CHM task `taskid` via `_run_single_chm_job` retrying
+       once if singularity aborts
+    :returns: exit code of task, 2 if an exception was caught
+    """
+    try:
+        return _run_single_chm_job(jobdir, scratchdir, taskid, config,
+                                   outbox=outbox)
+    except SingularityAbortError:
+        logger.exception('Caught SingularityAbortError, retrying job')
+        return _run_single_chm_job(jobdir, scratchdir, taskid, config,
+                                   outbox=outbox)
+    except Exception:
+        logger.exception('Caught exception')
+        return 2
+
+
+def _move_to_run_dir(src, outbox, run_dir):
+    """Moves `src` under `outbox` to the same relative path under
+       `run_dir`
+    :returns: True if moved otherwise False
+    """
+    dest = os.path.join(run_dir, os.path.relpath(src, outbox))
+    try:
+        dest_dir = os.path.dirname(dest)
+        if not os.path.isdir(dest_dir):
+            try:
+                os.makedirs(dest_dir, mode=0o775)
+            except OSError:
+                # another task may have created it
+                if not os.path.isdir(dest_dir):
+                    raise
+        shutil.move(src, dest)
+        logger.debug('Copied ' + src + ' to ' + dest)
+        return True
+    except (IOError, OSError, shutil.Error):
+        logger.exception('Unable to copy ' + src + ' to ' + dest)
+        return False
+
+
+def _copy_back_task_outputs(outbox, run_dir, out_image):
+    """Moves result of one task, and its crop configuration if any,
+       from `outbox` to the same relative path under `run_dir` so it
+       is kept even if the job is killed before the other tasks finish.
+       The crop configuration is moved first and the image only if that
+       succeeds, since a task is complete once its image exists.
+       Results that are not moved are left for `_copy_back_outputs`
+    :param outbox: node local directory tasks wrote results to
+    :param run_dir: run directory of job on shared storage
+    :param out_image: output image path of task from configuration
+    :returns: number of files that could not be moved
+    """
+    if out_image.startswith('/'):
+        return 0
+    src_image = os.path.join(outbox, out_image)
+    src_config = src_image + image.CROP_CONFIG_SUFFIX
+    if os.path.isfile(src_config):
+        if not _move_to_run_dir(src_config, outbox, run_dir):
+            logger.error('Leaving ' + src_image + ' for final copy back')
+            return 2
+    if os.path.isfile(src_image):
+        if not _move_to_run_dir(src_image, outbox, run_dir):
+            return 1
+    return 0
+
+
+def _copy_back_outputs(outbox, run_dir):
+    """Moves all files still under `outbox` to the same relative path
+       under `run_dir` and then removes `outbox`. Crop configurations
+       are moved before images and an image whose crop configuration
+       could not be moved is left in `outbox`
+    :param outbox: node local directory tasks wrote results to
+    :param run_dir: run directory of job on shared storage
+    :returns: number of files that could not be moved
+    """
+    failed = 0
+    moved = 0
+    suffix = image.CROP_CONFIG_SUFFIX
+    file_list = sorted(fileutil.walk_files(outbox),
+                       key=lambda path: not path.endswith(suffix))
+    failed_configs = set()
+    for src in file_list:
+        if src + suffix in failed_configs:
+            logger.error('Not copying ' + src + ' since its crop config '
+                         'could not be copied')
+            failed += 1
+            continue
+        if _move_to_run_dir(src, outbox, run_dir):
+            moved += 1
+            continue
+        failed += 1
+        if src.endswith(suffix):
+            failed_configs.add(src)
+    logger.info('Copied ' + str(moved) + ' results to ' + run_dir)
+    if failed == 0:
+        shutil.rmtree(outbox)
+    else:
+        logger.error(str(failed) + ' results left in ' + outbox)
+    return failed
+
+
+def _crop_prob_map(prob_map, args, tile_size, overlap_size):
+    """Crops `prob_map` in place to the bounding box of the tiles
+       in `args` and writes a crop configuration next to it with the
+       offset and size of the full image. The box is grown to include
+       any nonzero pixels outside of it so no data is lost when the
+       crops are merged
+    :param prob_map: path to probability map written by CHM
+    :param args: CHM arguments with -t COL,ROW tile flags
+    :param tile_size: tile size in WxH format
+    :param overlap_size: overlap size in WxH format
+    :returns: path to crop configuration or None if image was not cropped
+    """
+    img = Image.open(prob_map)
+    try:
+        img.load()
+        full_size = img.size
+        box = core.get_chm_tiles_bounding_box(args, tile_size,
+                                              overlap_size)
+        if box is None:
+            logger.debug('No tiles in args, not cropping ' + prob_map)
+            return None
+        content = img.getbbox()
+        if content is not None:
+            box = (min(box[0], content[0]), min(box[1], content[1]),
+                   max(box[2], content[2]), max(box[3], content[3]))
+        box = (max(box[0], 0), max(box[1], 0),
+               min(box[2], full_size[0]), min(box[3], full_size[1]))
+        if (box[0] >= box[2] or box[1] >= box[3] or
+                box == (0, 0, full_size[0], full_size[1])):
+            logger.debug('Tiles cover whole image, not cropping ' +
+                         prob_map)
+            return None
+        logger.debug('Cropping ' + prob_map + ' to ' + str(box))
+        cropped = img.crop(box)
+        img_format = img.format
+    finally:
+        img.close()
+    try:
+        cropped.save(prob_map, format=img_format)
+    finally:
+        cropped.close()
+    return image.write_crop_config(prob_map, box[0:2], full_size)
 
 
-def _run_single_chm_job(jobdir, scratchdir, taskid, config):
+def _run_single_chm_job(jobdir, scratchdir, taskid, config, outbox=None):
     """runs CHM Job
     :param scratchdir: temp directory
+    :param outbox: if set, results with relative output paths are written
+                   to the same relative path under this directory to be
+                   copied back later
     :returns: exit code for program. 0 success otherwise failure
     """
     # TODO REFACTOR THIS INTO FACTORY CLASS TO GET CONFIG
     # TODO REFACTOR THIS INTO CLASS TO GENERATE CHM JOB COMMAND
     out_dir = None
+    stager = None
     try:
         out_dir = os.path.join(scratchdir, str(taskid) + '.' +
                                uuid.uuid4().hex)
@@ -104,6 +275,14 @@ def _run_single_chm_job(jobdir, scratchdir, taskid, config):
 
         logger.debug('Creating directory ' + out_dir)
         os.makedirs(out_dir, mode=0o775)
+
+        chm_input_image = input_image
+        if (config.has_option(taskid, CHMJobCreator.CONFIG_STAGE_INPUT) and
+                config.getboolean(taskid, CHMJobCreator.CONFIG_STAGE_INPUT)):
+            stager = core.InputStager(os.path.join(scratchdir,
+                                                   CHMJobCreator.STAGING_DIR))
+            chm_input_image = stager.acquire(input_image)
+
         if config.get(taskid, CHMJobCreator.
                       CONFIG_DISABLE_HISTEQ_IMAGES) == 'True':
             histeq_flag = ' -h '
@@ -111,7 +290,7 @@ def _run_single_chm_job(jobdir, scratchdir, taskid, config):
             histeq_flag = ' '
 
         cmd = ('"' + config.get('DEFAULT', CHMJobCreator.CONFIG_CHM_BIN) +
-               '" test "' + input_image + '" ' + out_dir + ' -m "' +
+               '" test "' + chm_input_image + '" ' + out_dir + ' -m "' +
                config.get(taskid, CHMJobCreator.CONFIG_MODEL) +
                '" -b ' +
                config.get(taskid, CHMJobCreator.CONFIG_TILE_SIZE) +
@@ -141,18 +320,55 @@ def _run_single_chm_job(jobdir, scratchdir, taskid, config):
         out_image = config.get(taskid,
                                CHMJobCreator.CONFIG_OUTPUT_IMAGE)
 
+        dest_image = None
         if not out_image.startswith('/'):
+            if outbox is not None:
+                dest_image = os.path.join(outbox, out_image)
             logger.debug('Prepending rundir to out image path' + out_image)
             out_image = os.path.join(jobdir, CHMJobCreator.RUN_DIR, out_image)
 
+        if dest_image is None:
+            dest_image = out_image
+        else:
+            dest_dir = os.path.dirname(dest_image)
+            if not os.path.isdir(dest_dir):
+                os.makedirs(dest_dir, mode=0o775)
+
+        crop_config = None
+        if (config.has_option(taskid, CHMJobCreator.CONFIG_CROP_TILES) and
+                config.getboolean(taskid, CHMJobCreator.CONFIG_CROP_TILES)):
+            crop_config = _crop_prob_map(prob_map,
+                                         config.get(taskid,
+                                                    CHMJobCreator.CONFIG_ARGS),
+                                         config.get(taskid, CHMJobCreator.
+                                                    CONFIG_TILE_SIZE),
+                                         config.get(taskid, CHMJobCreator.
+                                                    CONFIG_OVERLAP_SIZE))
+
+        # the task is complete once its output image exists so results
+        # of an earlier run are removed and the crop config is moved
+        # before the image is moved into place
+        out_crop_config = out_image + image.CROP_CONFIG_SUFFIX
+        if crop_config is not None:
+            if os.path.isfile(out_image):
+                logger.debug('Removing image from earlier run: ' +
+                             out_image)
+                os.unlink(out_image)
+            shutil.move(crop_config, dest_image + image.CROP_CONFIG_SUFFIX)
+        elif os.path.isfile(out_crop_config):
+            logger.debug('Removing crop config from earlier run: ' +
+                         out_crop_config)
+            os.unlink(out_crop_config)
+
         logger.debug('Copying image ' + prob_map +
                      ' to final destination: ' +
-                     out_image)
-
-        shutil.move(prob_map, out_image)
+                     dest_image)
 
+        shutil.move(prob_map, dest_image)
         return exitcode
     finally:
+        if stager is not None and chm_input_image != input_image:
+            stager.release(input_image)
         if out_dir is not None:
             if os.path.isdir(out_dir):
                 logger.debug('Removing directory: ' + out_dir)
@@ -0,0 +1,301 @@
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import zlib
+import uuid
+import logging
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+ZARRAY_FILE = '.zarray'
+"""Name of file holding array metadata in Zarr version 2 layout
+"""
+
+ZATTRS_FILE = '.zattrs'
+"""Name of file holding user attributes in Zarr version 2 layout
+"""
+
+ZARR_FORMAT = 2
+
+DTYPES = {'|u1': ('L', 1), '<u2': ('I;16', 2)}
+"""Supported data types mapped to tuple (Pillow mode, bytes per pixel)
+"""
+
+
+class ChunkStoreError(Exception):
+    """Raised when there is a problem with a chunk store
+    """
+    pass
+
+
+def create_chunk_store(path, shape, chunks, dtype='|u1', compress_level=5,
+                       attributes=None):
+    """Creates an empty 3D chunk store directory using the Zarr version 2
+       layout, a `.zarray` JSON metadata file plus one zlib compressed
+       file per chunk named z.y.x in C order. Chunks are only written
+       when data is stored so creating the store is cheap and chunks
+       that are never written read back as zeros.
+    :param path: directory to create, must not already contain a store
+    :param shape: tuple (nz, ny, nx) of array
+    :param chunks: tuple (cz, cy, cx) size of chunks
+    :param dtype: data type '|u1' for 8-bit or '<u2' for 16-bit unsigned
+    :param compress_level: zlib compression level 0-9
+    :param attributes: optional dict written to `.zattrs` file
+    :raises ChunkStoreError: if store already exists or arguments are
+                             invalid
+    :returns: `ChunkStore` for `path`
+    """
+    if dtype not in DTYPES:
+        raise ChunkStoreError('Unsupported dtype ' + str(dtype))
+    if len(shape) != 3 or len(chunks) != 3:
+        raise ChunkStoreError('shape and chunks must have 3 dimensions')
+    for val in chunks:
+        if val <= 0:
+            raise ChunkStoreError('chunks must be positive: ' +
+                                  str(chunks))
+    meta_file = os.path.join(path, ZARRAY_FILE)
+    if os.path.isfile(meta_file):
+        raise ChunkStoreError(meta_file + ' already exists')
+    if not os.path.isdir(path):
+        os.makedirs(path, mode=0o755)
+
+    meta = {'zarr_format': ZARR_FORMAT,
+            'shape': list(shape),
+            'chunks': list(chunks),
+            'dtype': dtype,
+            'compressor': {'id': 'zlib', 'level': compress_level},
+            'fill_value': 0,
+            'order': 'C',
+            'filters': None}
+    f = open(meta_file, 'w')
+    json.dump(meta, f, indent=4, sort_keys=True)
+    f.close()
+    if attributes is not None:
+        f = open(os.path.join(path, ZATTRS_FILE), 'w')
+        json.dump(attributes, f, indent=4, sort_keys=True)
+        f.close()
+    return ChunkStore(path)
+
+
+class ChunkStore(object):
+    """Reads and writes 2D sections of a 3D chunk store created by
+       `create_chunk_store`. Every chunk is its own file so separate
+       processes can write different z slabs at the same time without
+       locking as long as their slabs do not share chunks. Chunks are
+       written to a temporary file and renamed so readers never see
+       a partial chunk.
+    """
+    def __init__(self, path):
+        """Constructor, reads metadata of store
+        :param path: directory containing store
+        :raises ChunkStoreError: if metadata is missing or unsupported
+        """
+        self._path = path
+        meta_file = os.path.join(path, ZARRAY_FILE)
+        if not os.path.isfile(meta_file):
+            raise ChunkStoreError('No ' + ZARRAY_FILE + ' found in ' + path)
+        f = open(meta_file, 'r')
+        try:
+            meta = json.load(f)
+        finally:
+            f.close()
+        if meta.get('zarr_format') != ZARR_FORMAT:
+            raise ChunkStoreError('Unsupported zarr_format ' +
+                                  str(meta.get('zarr_format')))
+        if meta.get('dtype') not in DTYPES:
+            raise ChunkStoreError('Unsupported dtype ' +
+                                  str(meta.get('dtype')))
+        compressor = meta.get('compressor')
+        if compressor is not None and compressor.get('id') != 'zlib':
+            raise ChunkStoreError('Unsupported compressor ' +
+                                  str(compressor.get('id')))
+        if meta.get('order', 'C') != 'C' or meta.get('filters'):
+            raise ChunkStoreError('Only C order without filters supported')
+        self._shape = tuple(meta['shape'])
+        self._chunks = tuple(meta['chunks'])
+        self._dtype = meta['dtype']
+        self._compressor = compressor
+        (self._mode, self._bytes_per_pixel) = DTYPES[self._dtype]
+        self._fill_value = meta.get('fill_value') or 0
+
+    def get_shape(self):
+        """Gets shape of array
+        :returns: tuple (nz, ny, nx)
+        """
+        return self._shape
+
+    def get_chunks(self):
+        """Gets size of chunks
+        :returns: tuple (cz, cy, cx)
+        """
+        return self._chunks
+
+    def get_attributes(self):
+        """Gets user attributes of store
+        :returns: dict, empty if store has no attributes
+        """
+        attr_file = os.path.join(self._path, ZATTRS_FILE)
+        if not os.path.isfile(attr_file):
+            return {}
+        f = open(attr_file, 'r')
+        try:
+            return json.load(f)
+        finally:
+            f.close()
+
+    def _get_chunk_path(self, cz, cy, cx):
+        """Gets path to chunk with indexes `cz`, `cy`, `cx`
+        """
+        return os.path.join(self._path, str(cz) + '.' + str(cy) + '.' +
+                            str(cx))
+
+    def _read_chunk(self, cz, cy, cx):
+        """Reads chunk
+        :returns: bytes of uncompressed chunk or None if chunk
+                  was never written
+        """
+        chunk_path = self._get_chunk_path(cz, cy, cx)
+        if not os.path.isfile(chunk_path):
+            return None
+        f = open(chunk_path, 'rb')
+        try:
+            data = f.read()
+        finally:
+            f.close()
+        if self._compressor is not None:
+            data = zlib.decompress(data)
+        return data
+
+    def _write_chunk(self, cz, cy, cx, data):
+        """Compresses `data` and writes it to chunk file via rename
+        """
+        if self._compressor is not None:
+            data = zlib.compress(data, self._compressor.get('level', 5))
+        chunk_path = self._get_chunk_path(cz, cy, cx)
+        tmp_path = os.path.join(self._path, '.' + uuid.uuid4().hex + '.tmp')
+        f = open(tmp_path, 'wb')
+        try:
+            f.write(data)
+        finally:
+            f.close()
+        os.rename(tmp_path, chunk_path)
+
+    def _check_section(self, z):
+        """Raises ChunkStoreError if `z` is not a valid section
+        """
+        if z < 0 or z >= self._shape[0]:
+            raise ChunkStoreError('Section ' + str(z) + ' is outside of '
+                                  'array with ' + str(self._shape[0]) +
+                                  ' sections')
+
+    def write_section(self, z, img):
+        """Writes `img` as section `z`. Chunks in the section that are
+           entirely zero are not written. If chunks span more than one
+           section the other sections in those chunks are preserved,
+           but the caller must make sure no one else writes them at the
+           same time.
+        :param z: index of section starting at 0
+        :param img: Pillow image the size of a section, converted
+                    to mode of store if needed
+        :raises ChunkStoreError: if `z` is out of range or `img` is the
+                                 wrong size
+        """
+        self._check_section(z)
+        (nz, ny, nx) = self._shape
+        (chz, chy, chx) = self._chunks
+        if img.size != (nx, ny):
+            raise ChunkStoreError('Section ' + str(z) + ' has size ' +
+                                  str(img.size) + ' but store requires ' +
+                                  str((nx, ny)))
+        if img.mode != self._mode:
+            img = img.convert(self._mode)
+        cz = z // chz
+        zoffset = z - cz * chz
+        plane_size = chy * chx * self._bytes_per_pixel
+        written = 0
+        for cy in range(0, (ny + chy - 1) // chy):
+            for cx in range(0, (nx + chx - 1) // chx):
+                x = cx * chx
+                y = cy * chy
+                # crop pads edge chunks with zeros to full chunk size
+                tile = img.crop((x, y, x + chx, y + chy))
+                is_empty = tile.getbbox() is None
+                plane = tile.tobytes()
+                tile.close()
+                if chz == 1:
+                    if is_empty:
+                        # remove chunk left from an earlier write
+                        chunk_path = self._get_chunk_path(cz, cy, cx)
+                        if os.path.isfile(chunk_path):
+                            os.unlink(chunk_path)
+                        continue
+                    data = plane
+                else:
+                    existing = self._read_chunk(cz, cy, cx)
+                    if existing is None:
+                        if is_empty:
+                            continue
+                        data = bytearray(plane_size * chz)
+                    else:
+                        data = bytearray(existing)
+                    start = zoffset * plane_size
+                    data[start:start + plane_size] = plane
+                    data = bytes(data)
+                self._write_chunk(cz, cy, cx, data)
+                written += 1
+        logger.debug('Wrote ' + str(written) + ' chunks for section ' +
+                     str(z) + ' to ' + self._path)
+
+    def read_region(self, z, box):
+        """Reads region of section `z` decompressing only the chunks the
+           region overlaps
+        :param z: index of section starting at 0
+        :param box: tuple (left, upper, right, lower), area outside of
+                    array is filled with 0
+        :raises ChunkStoreError: if `z` is out of range
+        :returns: Pillow image
+        """
+        self._check_section(z)
+        (nz, ny, nx) = self._shape
+        (chz, chy, chx) = self._chunks
+        (left, upper, right, lower) = box
+        result = Image.new(self._mode, (right - left, lower - upper),
+                           self._fill_value)
+        x0 = max(left, 0)
+        y0 = max(upper, 0)
+        x1 = min(right, nx)
+        y1 = min(lower, ny)
+        if x0 >= x1 or y0 >= y1:
+            return result
+        cz = z // chz
+        plane_size = chy * chx * self._bytes_per_pixel
+        start = (z - cz * chz) * plane_size
+        for cy in range(y0 // chy, (y1 - 1) // chy + 1):
+            for cx in range(x0 // chx, (x1 - 1) // chx + 1):
+                data = self._read_chunk(cz, cy, cx)
+                if data is None:
+                    continue
+                tile = Image.frombytes(self._mode, (chx, chy),
+                                       data[start:start + plane_size])
+                tx = cx * chx
+                ty = cy * chy
+                piece = tile.crop((max(x0, tx) - tx, max(y0, ty) - ty,
+                                   min(x1, tx + chx) - tx,
+                                   min(y1, ty + chy) - ty))
+                result.paste(piece, (max(x0, tx) - left,
+                                     max(y0, ty) - upper))
+                piece.close()
+                tile.close()
+        return result
+
+    def read_subvolume(self, zrange, box):
+        """Reads subvolume as list of section regions
+        :param zrange: tuple (first, last) sections to read, `last`
+                       is exclusive
+        :param box: tuple (left, upper, right, lower)
+        :returns: list of Pillow images, one per section
+        """
+        return [self.read_region(z, box) for z in range(zrange[0],
+                                                        zrange[1])]
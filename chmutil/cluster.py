@@ -2,19 +2,328 @@
 
 
 import os
+import re
 import sys
+import math
 import stat
+import time
+import json
+import csv
 import logging
+import getpass
+import threading
+import subprocess
+import multiprocessing
+from array import array
 import shutil
 import configparser
 from configparser import NoOptionError
+from xml.etree import ElementTree
 
 from chmutil.core import CHMJobCreator
+from chmutil import fileutil
 from chmutil.image import ImageStatsSummary
 from chmutil.image import ImageStatsFromDirectoryFactory
 
 logger = logging.getLogger(__name__)
 
+LOG_TAIL_BYTES = 16384
+"""Number of bytes at end of task log file searched for run times.
+   /usr/bin/time -v and shell time write their output last
+"""
+
+LOG_TIME_REGEX = re.compile(
+    br'^(?:[ \t]*User time \(seconds\): (?P<usertime>[0-9.]+)'
+    br'|[ \t]*Maximum resident set size \(kbytes\): (?P<maxrss>[0-9]+)'
+    br'|[ \t]*Elapsed \(wall clock\) time \(h:mm:ss or m:ss\): '
+    br'(?P<elapsed>[0-9:.]+)'
+    br'|real (?P<real>[0-9.]+)'
+    br'|user (?P<user>[0-9.]+))[ \t\r]*$', re.MULTILINE)
+"""Matches every line of task log files that has run time information
+"""
+
+LOG_HEAD_BYTES = 4096
+"""Number of bytes at start of task log file searched for host. Submit
+   scripts echo the host first
+"""
+
+LOG_HOST_REGEX = re.compile(br'^HOST: *(?P<host>\S+)', re.MULTILINE)
+"""Matches line of task log file with host task ran on
+"""
+
+LOG_EXIT_CODE_REGEX = re.compile(br'exited with code: *(?P<code>-?[0-9]+)')
+"""Matches line of task log file with exit code of runner script
+"""
+
+
+def _get_seconds_from_elapsed_time(elapsed):
+    """Converts h:mm:ss or m:ss time to seconds
+    :param elapsed: time as bytes
+    :returns: float seconds
+    """
+    seconds = 0.0
+    for val in elapsed.split(b':'):
+        seconds = seconds * 60 + float(val)
+    return seconds
+
+
+def _parse_task_log_data(data):
+    """Parses run times out of task log `data`. If `data` has several
+       /usr/bin/time -v blocks, such as one per task run on a node, their
+       user and wall clock times are summed and the largest resident
+       set size is kept. Shell time real and user values replace
+       what was found before them
+    :param data: bytes of task log
+    :returns: tuple (user time in seconds, walltime in seconds,
+              max memory in kb)
+    """
+    usertime = 0.0
+    walltime = 0.0
+    max_memory = 0
+    for match in LOG_TIME_REGEX.finditer(data):
+        group = match.lastgroup
+        val = match.group(group)
+        if group == 'usertime':
+            usertime += float(val)
+        elif group == 'user':
+            usertime = float(val)
+        elif group == 'maxrss':
+            max_memory = max(max_memory, int(val))
+        elif group == 'elapsed':
+            walltime += _get_seconds_from_elapsed_time(val)
+        else:
+            walltime = float(val)
+    return usertime, walltime, max_memory
+
+
+def parse_task_log(path, tail_bytes=LOG_TAIL_BYTES):
+    """Parses run times from end of task log file `path`. If no walltime
+       is found in the last `tail_bytes` bytes the whole file is parsed.
+       This is the function invoked by `multiprocessing.Pool` in
+       `TaskSummaryFactory`
+    :param path: path to task log file
+    :param tail_bytes: number of bytes at end of file to search
+    :returns: tuple (user time in seconds, walltime in seconds,
+              max memory in kb) or None if file could not be read
+    """
+    try:
+        f = open(path, 'rb')
+        try:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            f.seek(max(size - tail_bytes, 0))
+            res = _parse_task_log_data(f.read())
+            if res[1] <= 0 and size > tail_bytes:
+                f.seek(0)
+                res = _parse_task_log_data(f.read())
+            return res
+        finally:
+            f.close()
+    except (IOError, OSError) as e:
+        logger.debug('Unable to read ' + path + ' : ' + str(e))
+    return None
+
+
+def parse_task_log_host_info(path, tail_bytes=LOG_TAIL_BYTES):
+    """Parses host, exit code, and run times from task log file `path`.
+       Host is found in the first `LOG_HEAD_BYTES` bytes, exit code
+       and run times in the last `tail_bytes` bytes, falling back to
+       the whole file if no walltime is found there. This is the
+       function invoked by `multiprocessing.Pool` in `HostAnalyzer`
+    :param path: path to task log file
+    :param tail_bytes: number of bytes at end of file to search
+    :returns: tuple (host, exit code, user time in seconds, walltime in
+              seconds, max memory in kb) where host and exit code are
+              None if not found, or None if file could not be read
+    """
+    try:
+        f = open(path, 'rb')
+        try:
+            head = f.read(LOG_HEAD_BYTES)
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            f.seek(max(size - tail_bytes, 0))
+            tail = f.read()
+            res = _parse_task_log_data(tail)
+            if res[1] <= 0 and size > tail_bytes:
+                f.seek(0)
+                res = _parse_task_log_data(f.read())
+        finally:
+            f.close()
+    except (IOError, OSError) as e:
+        logger.debug('Unable to read ' + path + ' : ' + str(e))
+        return None
+
+    host = None
+    match = LOG_HOST_REGEX.search(head)
+    if match is not None:
+        host = match.group('host').decode('ascii', 'replace')
+    exit_code = None
+    for match in LOG_EXIT_CODE_REGEX.finditer(tail):
+        exit_code = int(match.group('code'))
+    return (host, exit_code) + tuple(res)
+
+
+def read_exclude_hosts_file(path):
+    """Reads hosts to exclude from file `path` with one host per line.
+       Blank lines and lines starting with # are skipped
+    :param path: path to file
+    :returns: sorted list of hosts, empty if file does not exist
+    """
+    if path is None or not os.path.isfile(path):
+        return []
+    hosts = set()
+    f = open(path, 'r')
+    try:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            hosts.add(line)
+    finally:
+        f.close()
+    return sorted(hosts)
+
+
+def write_exclude_hosts_file(path, hosts):
+    """Adds `hosts` to hosts to exclude in file `path` keeping any
+       hosts already in file
+    :param path: path to file
+    :param hosts: list of hosts to add
+    :returns: sorted list of all hosts in file
+    """
+    all_hosts = sorted(set(read_exclude_hosts_file(path)) | set(hosts))
+    f = open(path, 'w')
+    try:
+        f.write('# Hosts excluded when tasks are submitted by ' +
+                CHMJobCreator.CHECKCHMJOB + '\n')
+        for host in all_hosts:
+            f.write(host + '\n')
+    finally:
+        f.close()
+    return all_hosts
+
+
+def _parse_task_log_with_path(path):
+    """Parses task log file `path` with `parse_task_log`. This is the
+       function invoked by `multiprocessing.Pool` in
+       `TaskSummaryFactory`
+    :returns: tuple (path, result of `parse_task_log`)
+    """
+    return path, parse_task_log(path)
+
+
+class TaskLogCache(object):
+    """Persistent cache of run times parsed from task log files so
+       only new or changed log files need to be parsed. Entries are
+       keyed by path, size, and modification time and stored in a tab
+       delimited file with columns path, size, mtime, user time,
+       walltime, and max memory.
+    """
+    HEADER = '# chmutil task log cache v2'
+    """First line of cache file, version is increased whenever the
+       way run times are parsed changes so old entries are discarded
+    """
+
+    def __init__(self, cache_file):
+        """Constructor, loads `cache_file` if it exists
+        :param cache_file: path to cache file
+        """
+        self._cache_file = cache_file
+        self._entries = {}
+        self._modified = False
+        self._load()
+
+    def _load(self):
+        """Loads entries from cache file skipping lines that are
+           not valid
+        """
+        if self._cache_file is None or not os.path.isfile(self._cache_file):
+            return
+        f = open(self._cache_file, 'r')
+        try:
+            first = f.readline().rstrip('\n')
+            if first != TaskLogCache.HEADER:
+                logger.warning('Ignoring cache with unknown format: ' +
+                               self._cache_file)
+                return
+            for line in f:
+                fields = line.rstrip('\n').split('\t')
+                if len(fields) != 6:
+                    continue
+                try:
+                    self._entries[fields[0]] = (int(fields[1]), fields[2],
+                                                float(fields[3]),
+                                                float(fields[4]),
+                                                int(fields[5]))
+                except ValueError:
+                    continue
+        finally:
+            f.close()
+        logger.debug('Loaded ' + str(len(self._entries)) +
+                     ' entries from ' + self._cache_file)
+
+    def _get_mtime_str(self, mtime):
+        """Gets string form of modification time used in key
+        """
+        return '%.6f' % mtime
+
+    def get_entry_count(self):
+        """Gets number of entries in cache
+        """
+        return len(self._entries)
+
+    def get(self, path, size, mtime):
+        """Gets cached run times for `path`
+        :param path: path to log file
+        :param size: current size of file in bytes
+        :param mtime: current modification time of file
+        :returns: tuple (user time in seconds, walltime in seconds,
+                  max memory in kb) or None if not in cache or file
+                  changed since it was cached
+        """
+        entry = self._entries.get(path)
+        if entry is None:
+            return None
+        if entry[0] != size or entry[1] != self._get_mtime_str(mtime):
+            return None
+        return entry[2], entry[3], entry[4]
+
+    def set(self, path, size, mtime, runtimes):
+        """Adds or replaces entry for `path`
+        :param path: path to log file
+        :param size: size of file in bytes when parsed
+        :param mtime: modification time of file when parsed
+        :param runtimes: tuple (user time, walltime, max memory)
+        """
+        self._entries[path] = (size, self._get_mtime_str(mtime),
+                               float(runtimes[0]), float(runtimes[1]),
+                               int(runtimes[2]))
+        self._modified = True
+
+    def save(self):
+        """Writes cache file if any entries were added. The file is
+           written to a temporary file and renamed so an interrupted
+           save does not corrupt it
+        """
+        if self._cache_file is None or self._modified is False:
+            return
+        tmp_file = self._cache_file + '.' + str(os.getpid()) + '.tmp'
+        f = open(tmp_file, 'w')
+        try:
+            f.write(TaskLogCache.HEADER + '\n')
+            for path in sorted(self._entries.keys()):
+                entry = self._entries[path]
+                f.write(path + '\t' + str(entry[0]) + '\t' + entry[1] +
+                        '\t' + repr(entry[2]) + '\t' + repr(entry[3]) +
+                        '\t' + str(entry[4]) + '\n')
+        finally:
+            f.close()
+        os.rename(tmp_file, self._cache_file)
+        self._modified = False
+        logger.debug('Wrote ' + str(len(self._entries)) + ' entries to ' +
+                     self._cache_file)
+
 
 class InvalidConfigFileError(Exception):
     """Raised if config file path is invalid
@@ -38,6 +347,139 @@ class InvalidWorkingDirError(Exception):
     pass
 
 
+class LogBucketHistogram(object):
+    """Histogram with a fixed number of logarithmically sized buckets
+       so percentiles of any number of values can be estimated in
+       constant memory. Every bucket spans values within
+       `relative_accuracy` of its center, so a percentile is within
+       that relative error of the true value. Values at or below
+       `min_value` share one bucket, as do values above `max_value`.
+       Histograms with the same parameters can be merged, which lets
+       separate parsers build their own histogram and combine them.
+    """
+    def __init__(self, relative_accuracy=0.01, min_value=0.001,
+                 max_value=1.0e12):
+        """Constructor
+        :param relative_accuracy: max relative error of percentiles
+        :param min_value: values at or below this are counted in the
+                          lowest bucket
+        :param max_value: values above this are counted in the highest
+                          bucket
+        """
+        self._relative_accuracy = relative_accuracy
+        self._min_value = min_value
+        self._max_value = max_value
+        self._gamma = (1.0 + relative_accuracy) / (1.0 - relative_accuracy)
+        self._log_gamma = math.log(self._gamma)
+        self._offset = int(math.ceil(math.log(min_value) / self._log_gamma))
+        self._num_buckets = (int(math.ceil(math.log(max_value) /
+                                           self._log_gamma)) -
+                             self._offset + 2)
+        # buckets are allocated on first add
+        self._buckets = None
+        self._count = 0
+        self._sum = 0
+        self._min = None
+        self._max = None
+
+    def _get_bucket_index(self, value):
+        """Gets index of bucket `value` belongs in
+        """
+        if value <= self._min_value:
+            return 0
+        if value > self._max_value:
+            return self._num_buckets - 1
+        return int(math.ceil(math.log(value) / self._log_gamma)) - \
+            self._offset + 1
+
+    def _get_bucket_value(self, index):
+        """Gets value at center of bucket `index` which must be above 0
+        """
+        upper = math.pow(self._gamma, index + self._offset - 1)
+        return 2.0 * upper / (self._gamma + 1.0)
+
+    def add(self, value):
+        """Adds `value` to histogram
+        """
+        if self._buckets is None:
+            self._buckets = array('l', [0]) * self._num_buckets
+        self._buckets[self._get_bucket_index(value)] += 1
+        self._count += 1
+        self._sum += value
+        if self._min is None or value < self._min:
+            self._min = value
+        if self._max is None or value > self._max:
+            self._max = value
+
+    def merge(self, other):
+        """Adds counts in `other` histogram to this histogram
+        :param other: `LogBucketHistogram` created with same parameters
+        :raises ValueError: if `other` has different parameters
+        """
+        if (other._relative_accuracy != self._relative_accuracy or
+                other._min_value != self._min_value or
+                other._max_value != self._max_value):
+            raise ValueError('Cannot merge histograms with different '
+                             'parameters')
+        if other._count == 0:
+            return
+        if self._buckets is None:
+            self._buckets = array('l', other._buckets)
+        else:
+            for i in range(self._num_buckets):
+                self._buckets[i] += other._buckets[i]
+        self._count += other._count
+        self._sum += other._sum
+        if self._min is None or other._min < self._min:
+            self._min = other._min
+        if self._max is None or other._max > self._max:
+            self._max = other._max
+
+    def get_count(self):
+        """Gets number of values added
+        """
+        return self._count
+
+    def get_sum(self):
+        """Gets sum of values added
+        """
+        return self._sum
+
+    def get_min(self):
+        """Gets smallest value added or None if empty
+        """
+        return self._min
+
+    def get_max(self):
+        """Gets largest value added or None if empty
+        """
+        return self._max
+
+    def get_percentile(self, percent):
+        """Gets estimate of percentile using nearest rank method.
+           Percentile 0 and 100 return exact min and max
+        :param percent: percentile from 0 to 100
+        :returns: value or None if histogram is empty
+        """
+        if self._count == 0:
+            return None
+        if percent <= 0:
+            return self._min
+        if percent >= 100:
+            return self._max
+        rank = max(int(math.ceil(percent / 100.0 * self._count)), 1)
+        seen = 0
+        for i in range(self._num_buckets):
+            seen += self._buckets[i]
+            if seen >= rank:
+                if i == 0:
+                    # values at or below min_value are often all zero
+                    return self._min
+                value = self._get_bucket_value(i)
+                return min(max(value, self._min), self._max)
+        return self._max
+
+
 class TaskStats(object):
     """Container object that holds information about
        runtime performance of a set of tasks
@@ -52,6 +494,9 @@ class TaskStats(object):
         self._total_tasks_with_cputimes = 0
         self._total_memorykb = 0
         self._max_memorykb = 0
+        self._walltime_hist = LogBucketHistogram()
+        self._usertime_hist = LogBucketHistogram()
+        self._memory_hist = LogBucketHistogram()
 
     def set_completed_task_count(self, count):
         """sets number of completed tasks
@@ -126,6 +571,62 @@ class TaskStats(object):
         """
         return self._total_memorykb
 
+    def add_task_runtimes(self, usertime, walltime, max_memorykb):
+        """Adds run times of one task updating totals, max memory, and
+           histograms used for percentiles
+        :param usertime: user time of task in seconds
+        :param walltime: walltime of task in seconds
+        :param max_memorykb: max resident memory of task in kilobytes
+        """
+        self._total_tasks_with_cputimes += 1
+        self._total_usertime += usertime
+        self._total_walltime += walltime
+        self._total_memorykb += max_memorykb
+        if max_memorykb > self._max_memorykb:
+            self._max_memorykb = max_memorykb
+        self._usertime_hist.add(usertime)
+        self._walltime_hist.add(walltime)
+        self._memory_hist.add(max_memorykb)
+
+    def merge(self, other):
+        """Adds counts, totals, and histograms of `other` to this
+           object so stats gathered separately can be combined
+        :param other: `TaskStats` to merge
+        """
+        self._completed_task_count += other.get_completed_task_count()
+        self._total_task_count += other.get_total_task_count()
+        self._total_tasks_with_cputimes += other.\
+            get_total_tasks_with_cputimes()
+        self._total_usertime += other.get_total_cpu_usertime()
+        self._total_walltime += other.get_total_cpu_walltime()
+        self._total_memorykb += other.get_total_memory_in_kb()
+        if other.get_max_memory_in_kb() > self._max_memorykb:
+            self._max_memorykb = other.get_max_memory_in_kb()
+        self._usertime_hist.merge(other._usertime_hist)
+        self._walltime_hist.merge(other._walltime_hist)
+        self._memory_hist.merge(other._memory_hist)
+
+    def get_walltime_percentile(self, percent):
+        """Gets estimated percentile of task walltimes in seconds
+        :param percent: percentile from 0 to 100
+        :returns: walltime in seconds or None if no runtimes were added
+        """
+        return self._walltime_hist.get_percentile(percent)
+
+    def get_usertime_percentile(self, percent):
+        """Gets estimated percentile of task user times in seconds
+        :param percent: percentile from 0 to 100
+        :returns: user time in seconds or None if no runtimes were added
+        """
+        return self._usertime_hist.get_percentile(percent)
+
+    def get_max_memory_percentile_in_kb(self, percent):
+        """Gets estimated percentile of task max memory in kilobytes
+        :param percent: percentile from 0 to 100
+        :returns: memory in kilobytes or None if no runtimes were added
+        """
+        return self._memory_hist.get_percentile(percent)
+
 
 class TaskSummary(object):
     """Summary of a CHM job
@@ -136,6 +637,23 @@ class TaskSummary(object):
     MEGA_VAL = 1000000
     GIGA_VAL = 1000000000
 
+    PERCENTILES = [50, 95, 99, 100]
+    """Percentiles of walltime and memory output by
+       `get_summary_as_dict`, 100 is the max
+    """
+
+    CSV_COLUMNS = ['phase', 'total_tasks', 'completed_tasks',
+                   'tasks_with_cputimes', 'cpu_usertime_seconds',
+                   'cpu_walltime_seconds', 'cpu_hours', 'total_memory_kb',
+                   'avg_memory_kb', 'max_memory_kb', 'walltime_p50_seconds',
+                   'walltime_p95_seconds', 'walltime_p99_seconds',
+                   'walltime_max_seconds', 'max_rss_p50_kb',
+                   'max_rss_p95_kb', 'max_rss_p99_kb', 'max_rss_max_kb',
+                   'pixels_per_cpu_second', 'remaining_cpu_hours',
+                   'estimated_cost_to_finish']
+    """Columns output by `get_summary_as_csv`
+    """
+
     def __init__(self, chmconfig, chm_task_stats=None,
                  merge_task_stats=None,
                  image_stats_summary=None):
@@ -144,6 +662,7 @@ class TaskSummary(object):
         self._chmconfig = chmconfig
         self._chm_task_stats = chm_task_stats
         self._merge_task_stats = merge_task_stats
+        self._image_stats_summary = image_stats_summary
         self._chm_task_summary = self.\
             _get_summary_from_task_stats(self._chm_task_stats)
         self._chm_compute_summary = self.\
@@ -167,6 +686,11 @@ class TaskSummary(object):
         """
         return self._merge_task_stats
 
+    def get_image_stats_summary(self):
+        """Returns `ImageStatsSummary` of input images
+        """
+        return self._image_stats_summary
+
     def _convert_number_to_string(self, val):
         """Converts `val` to string with thousands separator (ie
            1233 becomes 1,233) for versions of python > 2.6
@@ -385,6 +909,133 @@ class TaskSummary(object):
         return ('Number input images: ' + strcnt + ' (' + sizestr +
                 'bytes)\nDimensions of images: ' + dim_str + '\n\n')
 
+    def _get_phase_dict_from_task_stats(self, task_stats,
+                                        cost_per_cpu_hour):
+        """Creates dict of counts and compute statistics from
+           `task_stats`. Values that cannot be calculated, such as
+           compute statistics when no task has cpu times, are None
+        :param task_stats: `TaskStats` object
+        :param cost_per_cpu_hour: cost charged per CPU hour used to
+                                  calculate estimated cost to finish
+        :returns: dict with keys in `CSV_COLUMNS` except phase
+        """
+        res = dict.fromkeys(TaskSummary.CSV_COLUMNS[1:])
+        if task_stats is None:
+            return res
+        total = task_stats.get_total_task_count()
+        completed = task_stats.get_completed_task_count()
+        res['total_tasks'] = total
+        res['completed_tasks'] = completed
+        num_tasks = task_stats.get_total_tasks_with_cputimes()
+        res['tasks_with_cputimes'] = num_tasks
+        if num_tasks <= 0:
+            return res
+
+        usertime = task_stats.get_total_cpu_usertime()
+        res['cpu_usertime_seconds'] = usertime
+        res['cpu_walltime_seconds'] = task_stats.get_total_cpu_walltime()
+        res['cpu_hours'] = usertime / 3600.0
+        res['total_memory_kb'] = task_stats.get_total_memory_in_kb()
+        res['avg_memory_kb'] = (float(task_stats.get_total_memory_in_kb()) /
+                                num_tasks)
+        res['max_memory_kb'] = task_stats.get_max_memory_in_kb()
+        for pct in TaskSummary.PERCENTILES:
+            if pct == 100:
+                suffix = 'max'
+            else:
+                suffix = 'p' + str(pct)
+            res['walltime_' + suffix + '_seconds'] = task_stats.\
+                get_walltime_percentile(pct)
+            res['max_rss_' + suffix + '_kb'] = task_stats.\
+                get_max_memory_percentile_in_kb(pct)
+
+        if (self._image_stats_summary is not None and total > 0 and
+                usertime > 0):
+            # input pixels processed so far, assuming every task covers
+            # an equal share of the pixels, per second of cpu user time
+            pixels = self._image_stats_summary.get_total_pixels()
+            res['pixels_per_cpu_second'] = (float(pixels) * completed /
+                                            total / usertime)
+
+        remaining_hours = max(total - completed, 0) * usertime / \
+            num_tasks / 3600.0
+        res['remaining_cpu_hours'] = remaining_hours
+        if cost_per_cpu_hour is not None:
+            res['estimated_cost_to_finish'] = (remaining_hours *
+                                               cost_per_cpu_hour)
+        return res
+
+    def get_summary_as_dict(self, cost_per_cpu_hour=1.0):
+        """Gets the summary of CHM job as a dict suitable for
+           conversion to JSON
+        :param cost_per_cpu_hour: cost charged per CPU hour, such as
+                                  service units, used to calculate
+                                  estimated cost to finish
+        :returns: dict with keys chmutil_version, job, images, chm, and
+                  merge. job and images are None if the information is
+                  not available. chm and merge are dicts of counts and
+                  compute statistics
+        """
+        res = {'chmutil_version': None,
+               'job': None,
+               'images': None,
+               'chm': self._get_phase_dict_from_task_stats(
+                   self._chm_task_stats, cost_per_cpu_hour),
+               'merge': self._get_phase_dict_from_task_stats(
+                   self._merge_task_stats, cost_per_cpu_hour)}
+        if self._chmconfig is not None:
+            con = self._chmconfig
+            res['chmutil_version'] = con.get_version()
+            res['job'] = {'tile_size': con.get_tile_size(),
+                          'overlap_size': con.get_overlap_size(),
+                          'disable_histogram_eq':
+                              con.get_disable_histogram_eq_val(),
+                          'tiles_per_task': con.get_number_tiles_per_task(),
+                          'tasks_per_node': con.get_number_tasks_per_node(),
+                          'model': con.get_model(),
+                          'chm_binary': con.get_chm_binary()}
+        if self._image_stats_summary is not None:
+            iss = self._image_stats_summary
+            res['images'] = {'count': iss.get_image_count(),
+                             'total_bytes': iss.
+                             get_total_size_of_images_in_bytes(),
+                             'total_pixels': iss.get_total_pixels()}
+        return res
+
+    def get_summary_as_json(self, cost_per_cpu_hour=1.0):
+        """Gets the summary of CHM job as JSON string
+        :param cost_per_cpu_hour: see `get_summary_as_dict`
+        """
+        return json.dumps(self.get_summary_as_dict(
+            cost_per_cpu_hour=cost_per_cpu_hour), indent=2, sort_keys=True)
+
+    def get_summary_as_csv(self, cost_per_cpu_hour=1.0):
+        """Gets the summary of CHM job as comma separated values with a
+           header row of `CSV_COLUMNS` followed by a row for CHM phase
+           and a row for merge phase. Values that are not available
+           are left empty
+        :param cost_per_cpu_hour: see `get_summary_as_dict`
+        """
+        summary = self.get_summary_as_dict(
+            cost_per_cpu_hour=cost_per_cpu_hour)
+        lines = []
+
+        class LineWriter(object):
+            def write(self, line):
+                lines.append(line)
+
+        writer = csv.writer(LineWriter(), lineterminator='\n')
+        writer.writerow(TaskSummary.CSV_COLUMNS)
+        for phase in ['chm', 'merge']:
+            row = [phase]
+            for col in TaskSummary.CSV_COLUMNS[1:]:
+                val = summary[phase][col]
+                if val is None:
+                    val = ''
+                row.append(val)
+            writer.writerow(row)
+        return ''.join(lines)
+
     def get_summary(self):
         """Gets the summary of CHM job in human readable form
         """
@@ -425,125 +1076,134 @@ class TaskSummaryFactory(object):
     MAXMEM_STR = 'Maximum resident set size (kbytes): '
     REAL_STR = 'real '
     USER_STR = 'user '
+    """Kept for compatibility, task logs are parsed with
+       `LOG_TIME_REGEX` which matches these lines
+    """
+    PARALLEL_LOG_THRESHOLD = 500
+    """Minimum number of log files before they are parsed in a
+       process pool
+    """
 
     def __init__(self, chmconfig, chm_incomplete_tasks=None,
                  merge_incomplete_tasks=None,
-                 output_compute=False):
+                 output_compute=False,
+                 processes=None,
+                 cache_file=None,
+                 job_state=None):
         """Constructor
            :param chmconfig: Should be a `CHMConfig` object loaded with a
                              valid CHM job
            :param chm_incomplete_tasks: list of incomplete chm tasks
            :param merge_incomplete_tasks: list of incomplete merge tasks
+           :param processes: number of processes to parse log files
+                             with, if None number of cpus is used
+           :param cache_file: if set, run times parsed from log files are
+                              cached in this file via `TaskLogCache`
+           :param job_state: if set, log files and input image summary
+                             scanned by `JobStateScanner` are used
+                             instead of scanning directories again
         """
         self._chmconfig = chmconfig
         self._chm_incomplete_tasks = chm_incomplete_tasks
         self._merge_incomplete_tasks = merge_incomplete_tasks
         self._output_compute = output_compute
+        if processes is None:
+            processes = multiprocessing.cpu_count()
+        self._processes = processes
+        self._cache = None
+        if cache_file is not None:
+            self._cache = TaskLogCache(cache_file)
+        self._job_state = job_state
 
     def _get_files_in_directory_generator(self, path):
-        """Generator that gets files in directory"""
-
-        if path is None:
-            logger.error('Path is None, returning nothing')
-            return
-
-        # first time we encounter a file yield it
-        if os.path.isfile(path):
-            yield path
-
-        # second time we encounter a file just return
-        if os.path.isfile(path):
-            return
-
-        if not os.path.isdir(path):
-            return
+        """Generator that gets files in directory and its subdirectories
+           via `fileutil.walk_files`"""
+        return fileutil.walk_files(path)
 
-        logger.debug(path + ' is a directory looking for files within')
-        for entry in os.listdir(path):
-            fullpath = os.path.join(path, entry)
-            if os.path.isfile(fullpath):
-                yield fullpath
-            if os.path.isdir(fullpath):
-                for aentry in self._get_files_in_directory_generator(fullpath):
-                    yield aentry
-
-    def _get_compute_hours_consumed(self, dirpath):
+    def _get_compute_hours_consumed(self, dirpath, log_files=None):
         """Looks at output from chm tasks to determine how much
-        compute was consumed
+        compute was consumed. Files are parsed with `parse_task_log`
+        in a process pool if there are at least
+        `PARALLEL_LOG_THRESHOLD` of them
         :param dirpath: directory containing task output files
-        returns: array of tuples
-                 [(user time in seconds,walltime in seconds,max memory in kb)]
-        """
-        res = []
-        for taskfile in self._get_files_in_directory_generator(dirpath):
-            logger.debug('Examining ' + taskfile)
-            f = open(taskfile, 'r')
-            usertime = 0
-            max_memory = 0
-            walltime = 0
-            for line in f:
-                if TaskSummaryFactory.USERTIME_STR in line:
-                    usertime = float(line[line.index(': ')+1:].rstrip())
-                if TaskSummaryFactory.MAXMEM_STR in line:
-                    max_memory = int(line[line.index('): ')+2:].rstrip())
-                if TaskSummaryFactory.ELAPSTIME_STR in line:
-                    walltime_raw = line[line.index('): ')+2:].rstrip()
-                    split_time = walltime_raw.split(':')
-                    if len(split_time) == 3:
-                        walltime += float(split_time[0]) * 3600
-                        walltime += float(split_time[1]) * 60
-                        walltime += float(split_time[2])
-                    if len(split_time) == 2:
-                        walltime += float(split_time[0]) * 60
-                        walltime += float(split_time[1])
-
-                if line.startswith(TaskSummaryFactory.REAL_STR):
-
-                    walltime = float(line[len(TaskSummaryFactory.
-                                              REAL_STR):].rstrip())
-
-                if line.startswith(TaskSummaryFactory.USER_STR):
-                    usertime = float(line[len(TaskSummaryFactory.
-                                              USER_STR):].rstrip())
-            if walltime > 0:
-                res.append((usertime, walltime, max_memory))
-            else:
-                logger.debug('Parsed file had 0 walltime so skipping : ' +
-                             taskfile)
-        return res
-
-    def _update_chm_task_stats_with_compute(self, taskstats, runtimes_list):
+        :param log_files: if set, list of task output files to use
+                          instead of files in `dirpath`
+        returns: `TaskStats` with run times of every file that had a
+                 walltime added one at a time via
+                 `TaskStats.add_task_runtimes`
+        """
+        compute_stats = TaskStats()
+
+        def add_runtimes(res):
+            if res is None or res[1] <= 0:
+                return
+            compute_stats.add_task_runtimes(res[0], res[1], res[2])
+
+        if log_files is None:
+            log_files = self._get_files_in_directory_generator(dirpath)
+        file_list = []
+        file_stats = {}
+        for taskfile in log_files:
+            if self._cache is not None:
+                try:
+                    st = os.stat(taskfile)
+                except OSError:
+                    continue
+                file_stats[taskfile] = st
+                res = self._cache.get(taskfile, st.st_size, st.st_mtime)
+                if res is not None:
+                    add_runtimes(res)
+                    continue
+            file_list.append(taskfile)
+
+        logger.debug('Parsing ' + str(len(file_list)) + ' log files, ' +
+                     str(len(file_stats) - len(file_list)) +
+                     ' found in cache')
+        pool = None
+        if (self._processes <= 1 or
+                len(file_list) < TaskSummaryFactory.PARALLEL_LOG_THRESHOLD):
+            results = map(_parse_task_log_with_path, file_list)
+        else:
+            pool = multiprocessing.Pool(processes=self._processes)
+            results = pool.imap_unordered(_parse_task_log_with_path,
+                                          file_list, chunksize=64)
+        try:
+            for (taskfile, res) in results:
+                add_runtimes(res)
+                if self._cache is not None and res is not None:
+                    st = file_stats[taskfile]
+                    self._cache.set(taskfile, st.st_size, st.st_mtime, res)
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+        if self._cache is not None:
+            try:
+                self._cache.save()
+            except (IOError, OSError):
+                logger.exception('Unable to save task log cache')
+        return compute_stats
+
+    def _update_chm_task_stats_with_compute(self, taskstats, compute_stats):
         """Updates if needed `TaskStats` passed in as chmts
         with compute usage if requested via `output_compute` flag
         in constructor
+        :param compute_stats: `TaskStats` with run times from
+                              `_get_compute_hours_consumed` which is
+                              merged into `taskstats`
         :returns TaskStats: updated with compute stats if needed
         """
-        if self._output_compute is False or runtimes_list is None:
+        if self._output_compute is False or compute_stats is None:
             return taskstats
 
         if taskstats is None:
             logger.error('TaskStats is None, skipping update of compute times')
             return None
 
-        num_tasks = len(runtimes_list)
-        logger.debug('Found ' + str(num_tasks) + ' with compute times')
-        sum_usertime = 0
-        sum_walltime = 0
-        max_memory = 0
-        sum_memory = 0
-        for t in runtimes_list:
-            sum_usertime += t[0]
-            sum_walltime += t[1]
-            sum_memory += t[2]
-            if t[2] > max_memory:
-                max_memory = t[2]
-
-        taskstats.set_total_tasks_with_cputimes(num_tasks)
-        taskstats.set_total_cpu_usertime(sum_usertime)
-        taskstats.set_total_cpu_walltime(sum_walltime)
-        taskstats.set_max_memory_in_kb(max_memory)
-        taskstats.set_total_memory_in_kb(sum_memory)
-
+        logger.debug('Found ' +
+                     str(compute_stats.get_total_tasks_with_cputimes()) +
+                     ' with compute times')
+        taskstats.merge(compute_stats)
         return taskstats
 
     def _get_chm_task_stats(self):
@@ -565,18 +1225,24 @@ class TaskSummaryFactory(object):
         chmts.set_completed_task_count(completed_chm_tasks)
         chmts.set_total_task_count(total_chm_tasks)
 
-        runtimes_list = []
+        compute_stats = None
+        if self._output_compute is not True:
+            return chmts
         try:
             stdout_dir = self._chmconfig.get_stdout_dir()
             logger.debug('Examining ' + stdout_dir + ' for log files to' +
                          'calculate compute times')
 
-            runtimes_list = self._get_compute_hours_consumed(stdout_dir)
+            log_files = None
+            if self._job_state is not None:
+                log_files = self._job_state.get_chm_log_files()
+            compute_stats = self._get_compute_hours_consumed(
+                stdout_dir, log_files=log_files)
         except AttributeError:
             logger.error('Unable to get output directory from config'
                          'skipping examining of compute hours consumed')
 
-        chmts = self._update_chm_task_stats_with_compute(chmts, runtimes_list)
+        chmts = self._update_chm_task_stats_with_compute(chmts, compute_stats)
         return chmts
 
     def _get_merge_task_stats(self):
@@ -596,10 +1262,17 @@ class TaskSummaryFactory(object):
         mergets.set_completed_task_count(completed_merge_tasks)
         mergets.set_total_task_count(total_merge_tasks)
 
+        if self._output_compute is not True:
+            return mergets
+
         stdout_dir = self._chmconfig.get_merge_stdout_dir()
-        runtimes_list = self._get_compute_hours_consumed(stdout_dir)
+        log_files = None
+        if self._job_state is not None:
+            log_files = self._job_state.get_merge_log_files()
+        compute_stats = self._get_compute_hours_consumed(stdout_dir,
+                                                         log_files=log_files)
         mergets = self._update_chm_task_stats_with_compute(mergets,
-                                                           runtimes_list)
+                                                           compute_stats)
 
         return mergets
 
@@ -610,16 +1283,12 @@ class TaskSummaryFactory(object):
             logger.debug('Skipping analysis of input image data')
             return None
 
-        imgdir = self._chmconfig.get_images()
-        if not os.path.isdir(imgdir):
-            logger.error('Input image path not a directory')
-            return ImageStatsSummary()
+        if self._job_state is not None and\
+                self._job_state.get_image_stats_summary() is not None:
+            return self._job_state.get_image_stats_summary()
 
-        fac = ImageStatsFromDirectoryFactory(imgdir)
-        isum = ImageStatsSummary()
-        for iis in fac.get_input_image_stats():
-            isum.add_image_stats(iis)
-        return isum
+        return _get_image_stats_summary_for_directory(self._chmconfig.
+                                                      get_images())
 
     def get_task_summary(self):
         """Gets `TaskSummary` for CHM job defined in constructor
@@ -631,77 +1300,1191 @@ class TaskSummaryFactory(object):
                            image_stats_summary=self._get_image_stats_summary())
 
 
+def _get_incomplete_tasks(config, option, dir_files=None):
+    """Gets tasks in `config` whose output file, set by `option`, does
+       not exist
+    :param config: `configparser.ConfigParser` with a section per task
+    :param option: option in each task section with path to output file
+    :param dir_files: if set, dict of directory path to set of file
+                      names in that directory. Output files are looked
+                      up in it, listing and adding any directory not yet
+                      in it, instead of a stat per task
+    :returns: list of incomplete task ids in config order
+    """
+    task_list = []
+
+    try:
+        jobdir = config.get(CHMJobCreator.CONFIG_DEFAULT,
+                            CHMJobCreator.JOB_DIR)
+    except NoOptionError:
+        logger.exception('No ' + CHMJobCreator.JOB_DIR +
+                         ' in configuration')
+        jobdir = None
+
+    for s in config.sections():
+        out_file = config.get(s, option)
+        if not out_file.startswith('/') and jobdir is not None:
+            out_file = os.path.join(jobdir, CHMJobCreator.RUN_DIR,
+                                    out_file)
+        if dir_files is None:
+            logger.debug('Checking if image file exists: ' + out_file)
+            if not os.path.isfile(out_file):
+                task_list.append(s)
+            continue
+        (dirpath, name) = os.path.split(out_file)
+        if dirpath not in dir_files:
+            dir_files[dirpath] = fileutil.get_file_names(dirpath)
+        if name not in dir_files[dirpath]:
+            task_list.append(s)
+
+    logger.info('Found ' + str(len(task_list)) + ' of ' +
+                str(len(config.sections())) + ' to be incomplete tasks')
+    return task_list
+
+
 class CHMTaskChecker(object):
     """Checks and returns incomplete CHM Jobs
     """
-    def __init__(self, config):
+    def __init__(self, config, dir_files=None):
+        """Constructor
+        :param config: Should be `configparser.ConfigParser` object
+                       loaded from CHM task configuration file
+                       as obtained from `CHMConfig.get_config()
+        :param dir_files: if set, dict of directory path to set of file
+                          names used as a cache of directory listings so
+                          each output directory is listed once instead
+                          of a stat per task
+        """
         self._config = config
+        self._dir_files = dir_files
 
     def get_incomplete_tasks_list(self):
         """gets list of incomplete jobs
         """
-        config = self._config
-        task_list = []
-
-        try:
-            jobdir = config.get(CHMJobCreator.CONFIG_DEFAULT,
-                                CHMJobCreator.JOB_DIR)
-        except NoOptionError:
-            logger.exception('No ' + CHMJobCreator.JOB_DIR +
-                             ' in configuration')
-            jobdir = None
-
-        for s in config.sections():
-            out_file = config.get(s, CHMJobCreator.CONFIG_OUTPUT_IMAGE)
-            if not out_file.startswith('/') and jobdir is not None:
-                out_file = os.path.join(jobdir, CHMJobCreator.RUN_DIR,
-                                        out_file)
-            logger.debug('Checking if image file exists: ' + out_file)
-            if not os.path.isfile(out_file):
-                task_list.append(s)
-
-        logger.info('Found ' + str(len(task_list)) + ' of ' +
-                    str(len(config.sections())) + ' to be incomplete tasks')
-        return task_list
+        return _get_incomplete_tasks(self._config,
+                                     CHMJobCreator.CONFIG_OUTPUT_IMAGE,
+                                     dir_files=self._dir_files)
 
 
 class MergeTaskChecker(object):
     """Checks and returns incomplete Merge Jobs
     """
-    def __init__(self, config):
+    def __init__(self, config, dir_files=None):
         """Constructor
         :param config: Should be `configparser.ConfigParser` object
                        loaded from Merge task configuration file
                        as obtained from `CHMConfig.get_merge_config()
+        :param dir_files: if set, dict of directory path to set of file
+                          names used as a cache of directory listings so
+                          each output directory is listed once instead
+                          of a stat per task
         """
         self._config = config
+        self._dir_files = dir_files
 
     def get_incomplete_tasks_list(self):
         """gets list of incomplete jobs
         """
-        config = self._config
-        task_list = []
+        return _get_incomplete_tasks(self._config,
+                                     CHMJobCreator.MERGE_OUTPUT_IMAGE,
+                                     dir_files=self._dir_files)
+
+
+class JobState(object):
+    """In memory state of a CHM job built by `JobStateScanner` from
+       one pass over the job directories. Summaries, host analysis,
+       and submit decisions are all made from this state so the file
+       system is only traversed once per run of checkchmjob.py
+    """
+    def __init__(self, chm_incomplete_tasks=None,
+                 merge_incomplete_tasks=None, chm_log_files=None,
+                 merge_log_files=None, image_stats_summary=None):
+        """Constructor
+        :param chm_incomplete_tasks: list of incomplete CHM task ids
+        :param merge_incomplete_tasks: list of incomplete merge task ids
+        :param chm_log_files: list of CHM task log files or None if
+                              logs were not scanned
+        :param merge_log_files: list of merge task log files or None if
+                                logs were not scanned
+        :param image_stats_summary: `ImageStatsSummary` of input images
+                                    or None if images were not scanned
+        """
+        self._chm_incomplete_tasks = chm_incomplete_tasks
+        self._merge_incomplete_tasks = merge_incomplete_tasks
+        self._chm_log_files = chm_log_files
+        self._merge_log_files = merge_log_files
+        self._image_stats_summary = image_stats_summary
+
+    def get_chm_incomplete_tasks(self):
+        """Gets list of incomplete CHM task ids
+        """
+        return self._chm_incomplete_tasks
+
+    def get_merge_incomplete_tasks(self):
+        """Gets list of incomplete merge task ids
+        """
+        return self._merge_incomplete_tasks
+
+    def get_chm_log_files(self):
+        """Gets list of CHM task log files or None if not scanned
+        """
+        return self._chm_log_files
+
+    def get_merge_log_files(self):
+        """Gets list of merge task log files or None if not scanned
+        """
+        return self._merge_log_files
+
+    def get_image_stats_summary(self):
+        """Gets `ImageStatsSummary` of input images or None if not
+           scanned
+        """
+        return self._image_stats_summary
+
+
+def _get_image_stats_summary_for_directory(imgdir):
+    """Creates `ImageStatsSummary` for images in `imgdir`
+    :param imgdir: directory of input images
+    :returns: `ImageStatsSummary`, empty if `imgdir` is not a directory
+    """
+    if not os.path.isdir(imgdir):
+        logger.error('Input image path not a directory')
+        return ImageStatsSummary()
+
+    fac = ImageStatsFromDirectoryFactory(imgdir)
+    isum = ImageStatsSummary()
+    for iis in fac.get_input_image_stats():
+        isum.add_image_stats(iis)
+    return isum
+
+
+class JobStateScanner(object):
+    """Builds `JobState` for a CHM job. `CHMTaskChecker` and
+       `MergeTaskChecker` are given a directory listing cache so
+       instead of a stat per task each directory under run/tiles and
+       run/probmaps is listed once. The log directories
+       and input images are scanned in the same pass. The CHM, merge,
+       log, and image scans run concurrently on threads since they are
+       bound by file system latency, not cpu
+    """
+    def __init__(self, chmconfig, skip_chm=False, scan_logs=False,
+                 scan_images=False):
+        """Constructor
+        :param chmconfig: `CHMConfig` object loaded with CHM and merge
+                          configuration
+        :param skip_chm: if True CHM tasks are not examined and the
+                         incomplete CHM task list is empty
+        :param scan_logs: if True list files in CHM and merge log
+                          directories
+        :param scan_images: if True compute `ImageStatsSummary` of
+                            input images
+        """
+        self._chmconfig = chmconfig
+        self._skip_chm = skip_chm
+        self._scan_logs = scan_logs
+        self._scan_images = scan_images
+
+    def _get_incomplete_tasks(self, checker_class, config):
+        """Gets incomplete tasks in `config` with `checker_class`
+           passing it a directory listing cache so each output
+           directory is listed once
+        :param checker_class: `CHMTaskChecker` or `MergeTaskChecker`
+        :returns: list of incomplete task ids in config order
+        """
+        if config is None:
+            return []
+        dir_files = {}
+        checker = checker_class(config, dir_files=dir_files)
+        task_list = checker.get_incomplete_tasks_list()
+        logger.debug('Listed ' + str(len(dir_files)) + ' directories')
+        return task_list
+
+    def _get_log_files(self, log_dir):
+        """Gets list of files in `log_dir`
+        """
+        return list(fileutil.walk_files(log_dir))
+
+    def _run_in_threads(self, funcs):
+        """Runs every function in `funcs` in its own thread
+        :param funcs: dict of name to tuple (function, args)
+        :raises: first exception raised by a function
+        :returns: dict of name to value returned by function
+        """
+        results = {}
+        errors = []
+
+        def run(name, func, args):
+            try:
+                results[name] = func(*args)
+            except Exception as e:
+                logger.exception('Caught exception scanning ' + name)
+                errors.append(e)
+
+        threads = []
+        for name in sorted(funcs.keys()):
+            (func, args) = funcs[name]
+            t = threading.Thread(target=run, args=(name, func, args))
+            t.daemon = True
+            t.start()
+            threads.append(t)
+        for t in threads:
+            t.join()
+        if errors:
+            raise errors[0]
+        return results
+
+    def scan(self):
+        """Scans job
+        :returns: `JobState`
+        """
+        funcs = {'merge': (self._get_incomplete_tasks,
+                           (MergeTaskChecker,
+                            self._chmconfig.get_merge_config()))}
+        if self._skip_chm is False:
+            funcs['chm'] = (self._get_incomplete_tasks,
+                            (CHMTaskChecker, self._chmconfig.get_config()))
+        if self._scan_logs is True:
+            funcs['chmlogs'] = (self._get_log_files,
+                                (self._chmconfig.get_stdout_dir(),))
+            funcs['mergelogs'] = (self._get_log_files,
+                                  (self._chmconfig.get_merge_stdout_dir(),))
+        if self._scan_images is True:
+            funcs['images'] = (_get_image_stats_summary_for_directory,
+                               (self._chmconfig.get_images(),))
+
+        res = self._run_in_threads(funcs)
+        return JobState(chm_incomplete_tasks=res.get('chm', []),
+                        merge_incomplete_tasks=res['merge'],
+                        chm_log_files=res.get('chmlogs'),
+                        merge_log_files=res.get('mergelogs'),
+                        image_stats_summary=res.get('images'))
+
+
+class HostStats(object):
+    """Run time and failure statistics of tasks that ran on one host
+    """
+    def __init__(self, host):
+        """Constructor
+        :param host: name of host
+        """
+        self._host = host
+        self._task_count = 0
+        self._failed_task_count = 0
+        self._unknown_task_count = 0
+        self._total_walltime = 0.0
+        self._seconds_per_tile = LogBucketHistogram()
+
+    def add_task(self, exit_code, walltime, tiles):
+        """Adds task that ran on host. Task failed if `exit_code` is
+           not 0. If `exit_code` is missing the task is counted as
+           unknown, not failed, since it may still be running
+        :param exit_code: exit code of task or None if not found in log
+        :param walltime: walltime of task in seconds
+        :param tiles: number of tiles, or images for merge tasks,
+                      processed by task
+        """
+        self._task_count += 1
+        if exit_code is None:
+            self._unknown_task_count += 1
+            return
+        if exit_code != 0:
+            self._failed_task_count += 1
+            return
+        if walltime > 0 and tiles > 0:
+            self._total_walltime += walltime
+            self._seconds_per_tile.add(float(walltime) / tiles)
+
+    def get_host(self):
+        """Gets name of host
+        """
+        return self._host
+
+    def get_task_count(self):
+        """Gets number of tasks that ran on host
+        """
+        return self._task_count
+
+    def get_failed_task_count(self):
+        """Gets number of tasks that failed on host
+        """
+        return self._failed_task_count
+
+    def get_unknown_task_count(self):
+        """Gets number of tasks on host whose log has no exit code,
+           because they are still running or were killed
+        """
+        return self._unknown_task_count
+
+    def get_finished_task_count(self):
+        """Gets number of tasks on host with an exit code in log
+        """
+        return self._task_count - self._unknown_task_count
+
+    def get_total_walltime(self):
+        """Gets total walltime in seconds of successful tasks
+        """
+        return self._total_walltime
+
+    def get_median_seconds_per_tile(self):
+        """Gets median seconds per tile of successful tasks
+        :returns: seconds or None if no successful tasks had walltime
+        """
+        return self._seconds_per_tile.get_percentile(50)
+
+
+class HostAnalyzer(object):
+    """Groups run time and failure data in task log files by the host
+       each task ran on and flags hosts that are slow or fail often.
+       A host is slow if its median seconds per tile has a robust
+       z score, calculated from the median absolute deviation (MAD)
+       of all hosts, above `OUTLIER_THRESHOLD`.
+    """
+    OUTLIER_THRESHOLD = 3.5
+    """Robust z score above which a host is flagged as slow
+    """
+
+    MIN_HOSTS = 3
+    """Minimum number of hosts with run times needed to look for
+       slow hosts
+    """
+
+    MIN_FAILED_TASKS = 2
+    """Minimum number of failed tasks on a host to flag it
+    """
+
+    MAX_FAILURE_RATE = 0.5
+    """Hosts where at least this fraction of finished tasks failed
+       are flagged if they have at least `MIN_FAILED_TASKS` failures.
+       Tasks whose log has no exit code are not counted
+    """
+
+    PARALLEL_LOG_THRESHOLD = 500
+    """Minimum number of log files before they are parsed in a
+       process pool
+    """
+
+    def __init__(self, processes=None):
+        """Constructor
+        :param processes: number of processes to parse log files
+                          with, if None number of cpus is used
+        """
+        if processes is None:
+            processes = multiprocessing.cpu_count()
+        self._processes = processes
+
+    def get_host_stats(self, log_dir, tiles_per_task, log_files=None):
+        """Parses task log files in `log_dir`
+        :param log_dir: directory containing task log files
+        :param tiles_per_task: number of tiles, or images for merge
+                               tasks, each task log covers
+        :param log_files: if set, list of task log files to use instead
+                          of files in `log_dir`
+        :returns: dict of host name to `HostStats`, logs without a host
+                  are skipped
+        """
+        if log_files is None:
+            file_list = list(fileutil.walk_files(log_dir))
+        else:
+            file_list = list(log_files)
+        pool = None
+        if (self._processes <= 1 or
+                len(file_list) < HostAnalyzer.PARALLEL_LOG_THRESHOLD):
+            results = map(parse_task_log_host_info, file_list)
+        else:
+            pool = multiprocessing.Pool(processes=self._processes)
+            results = pool.imap_unordered(parse_task_log_host_info,
+                                          file_list, chunksize=64)
+        host_stats = {}
+        try:
+            for res in results:
+                if res is None or res[0] is None:
+                    continue
+                host = res[0]
+                if host not in host_stats:
+                    host_stats[host] = HostStats(host)
+                host_stats[host].add_task(res[1], res[3], tiles_per_task)
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+        return host_stats
+
+    def _get_median(self, values):
+        """Gets median of list of `values`
+        """
+        values = sorted(values)
+        mid = len(values) // 2
+        if len(values) % 2 == 1:
+            return values[mid]
+        return (values[mid - 1] + values[mid]) / 2.0
+
+    def get_outlier_scores(self, host_stats):
+        """Gets robust z score of median seconds per tile of each host,
+           0.6745 * (value - median) / MAD. If MAD is 0 the mean
+           absolute deviation times 1.2533 is used instead
+        :param host_stats: dict of host name to `HostStats`
+        :returns: dict of host name to score, empty if fewer than
+                  `MIN_HOSTS` hosts have run times or the hosts do
+                  not differ
+        """
+        values = {}
+        for host in host_stats:
+            val = host_stats[host].get_median_seconds_per_tile()
+            if val is not None:
+                values[host] = val
+        if len(values) < HostAnalyzer.MIN_HOSTS:
+            return {}
+        median = self._get_median(values.values())
+        deviations = [abs(v - median) for v in values.values()]
+        mad = self._get_median(deviations)
+        if mad > 0:
+            scale = 0.6745 / mad
+        else:
+            meanad = sum(deviations) / len(deviations)
+            if meanad <= 0:
+                return {}
+            scale = 1.0 / (1.2533 * meanad)
+        scores = {}
+        for host in values:
+            scores[host] = (values[host] - median) * scale
+        return scores
+
+    def get_flagged_hosts(self, host_stats):
+        """Flags hosts whose seconds per tile is an outlier or where
+           many tasks failed
+        :param host_stats: dict of host name to `HostStats`
+        :returns: dict of host name to reason host was flagged
+        """
+        flagged = {}
+        scores = self.get_outlier_scores(host_stats)
+        for host in sorted(scores.keys()):
+            if scores[host] > HostAnalyzer.OUTLIER_THRESHOLD:
+                flagged[host] = ('slow, {0:.1f} seconds per tile '
+                                 '(score {1:.1f})'.format(
+                                     host_stats[host].
+                                     get_median_seconds_per_tile(),
+                                     scores[host]))
+        for host in sorted(host_stats.keys()):
+            hs = host_stats[host]
+            failed = hs.get_failed_task_count()
+            if (failed >= HostAnalyzer.MIN_FAILED_TASKS and
+                    float(failed) / hs.get_finished_task_count() >=
+                    HostAnalyzer.MAX_FAILURE_RATE):
+                reason = (str(failed) + ' of ' +
+                          str(hs.get_finished_task_count()) +
+                          ' finished tasks failed')
+                if host in flagged:
+                    flagged[host] += ', ' + reason
+                else:
+                    flagged[host] = reason
+        return flagged
+
+    def get_report(self, prefix, host_stats, flagged):
+        """Gets human readable report of `host_stats`
+        :param prefix: string put at start of report such as CHM
+        :param host_stats: dict of host name to `HostStats`
+        :param flagged: dict of flagged hosts from `get_flagged_hosts`
+        :returns: string with one line per host sorted by seconds per
+                  tile, slowest first, with flagged hosts marked by *
+        """
+        scores = self.get_outlier_scores(host_stats)
+
+        def sort_key(host):
+            val = host_stats[host].get_median_seconds_per_tile()
+            if val is None:
+                val = -1.0
+            return (-val, host)
+
+        res = (str(prefix) + ' tasks by host (' + str(len(host_stats)) +
+               ' hosts):\n')
+        for host in sorted(host_stats.keys(), key=sort_key):
+            hs = host_stats[host]
+            spt = hs.get_median_seconds_per_tile()
+            if spt is None:
+                spt_str = 'NA'
+            else:
+                spt_str = '{0:.1f}'.format(spt)
+            if host in scores:
+                score_str = '{0:.1f}'.format(scores[host])
+            else:
+                score_str = 'NA'
+            mark = '  '
+            if host in flagged:
+                mark = '* '
+            res += (mark + host + ': ' + str(hs.get_task_count()) +
+                    ' tasks, ' + str(hs.get_failed_task_count()) +
+                    ' failed, ' + str(hs.get_unknown_task_count()) +
+                    ' unknown, ' + spt_str + ' seconds per tile, score ' +
+                    score_str + '\n')
+        for host in sorted(flagged.keys()):
+            res += '* ' + host + ' flagged: ' + flagged[host] + '\n'
+        return res
+
+
+def _get_seconds_from_walltime(walltime):
+    """Converts walltime of form [D-]HH:MM:SS to seconds
+    :param walltime: walltime as string
+    :returns: int seconds
+    """
+    days = 0
+    if '-' in walltime:
+        (day_str, walltime) = walltime.split('-', 1)
+        days = int(day_str)
+    seconds = 0
+    for val in walltime.split(':'):
+        seconds = seconds * 60 + int(val)
+    return days * 86400 + seconds
+
+
+def _get_walltime_from_seconds(seconds):
+    """Converts `seconds` to walltime of form HH:MM:SS
+    :param seconds: number of seconds
+    :returns: walltime as string
+    """
+    seconds = int(math.ceil(seconds))
+    return '{0:02d}:{1:02d}:{2:02d}'.format(seconds // 3600,
+                                            (seconds % 3600) // 60,
+                                            seconds % 60)
+
+
+def get_latest_task_logs(log_dir, newer_than=None, log_files=None):
+    """Finds newest task log file for each array task id in `log_dir`.
+       Log files are named <job id>.<array task id>.out by the submit
+       scripts
+    :param log_dir: directory containing task log files
+    :param newer_than: if set, only log files modified at or after this
+                       time in seconds since epoch are considered
+    :param log_files: if set, list of files to use instead of files in
+                      `log_dir`, files in subdirectories are skipped
+    :returns: dict of array task id as int to path of log file
+    """
+    if log_files is None:
+        log_files = fileutil.walk_files(log_dir, recursive=False)
+    log_dir = os.path.normpath(log_dir)
+    newest = {}
+    for path in log_files:
+        if not path.endswith(Scheduler.OUT_SUFFIX) or\
+                os.path.normpath(os.path.dirname(path)) != log_dir:
+            continue
+        name = os.path.basename(path)[:-len(Scheduler.OUT_SUFFIX)]
+        split_name = name.rsplit('.', 1)
+        if len(split_name) != 2 or not split_name[1].isdigit():
+            continue
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            continue
+        if newer_than is not None and mtime < newer_than:
+            continue
+        array_id = int(split_name[1])
+        if array_id not in newest or mtime > newest[array_id][0]:
+            newest[array_id] = (mtime, path)
+    return dict((key, val[1]) for (key, val) in newest.items())
+
+
+class TaskFailureClassifier(object):
+    """Classifies why a task failed from the end of its task log file
+       so it can be retried with more resources or held back instead
+       of being resubmitted unchanged
+    """
+    OOM = 'oom'
+    WALLTIME = 'walltime'
+    SINGULARITY = 'singularity'
+    BAD_INPUT = 'badinput'
+    UNKNOWN = 'unknown'
+    NO_LOG = 'nolog'
+    """Task has no log file from last submission, it never ran
+    """
+
+    PATTERNS = [(SINGULARITY, [b'ABORT: Could not create temporary '
+                               b'directory /tmp',
+                               b'ABORT: Could not create directory /tmp']),
+                (BAD_INPUT, [b'cannot identify image file',
+                             b'image file is truncated',
+                             b'DecompressionBombError',
+                             b'Error using imread']),
+                (WALLTIME, [b'DUE TO TIME LIMIT',
+                            b'exceeded hard wallclock time',
+                            b'h_rt limit',
+                            b'walltime exceeded limit',
+                            b'job killed: walltime']),
+                (OOM, [b'oom-kill',
+                       b'Out of memory',
+                       b'out of memory',
+                       b'MemoryError',
+                       b'Exceeded job memory limit',
+                       b'exceeded memory limit',
+                       b'std::bad_alloc'])]
+    """Tuples of (failure, list of strings found in log) checked in
+       order. The singularity strings are the ones chmrunner.py aborts
+       on
+    """
+
+    OOM_EXIT_CODES = [137]
+    """Exit codes of tasks killed with SIGKILL, usually by the kernel
+       out of memory killer
+    """
+
+    MEMORY_LIMIT_FRACTION = 0.95
+    """Tasks whose maximum resident set size reaches this fraction of
+       the memory limit are considered out of memory
+    """
+
+    def __init__(self, memory_limit_in_gb=None, tail_bytes=LOG_TAIL_BYTES):
+        """Constructor
+        :param memory_limit_in_gb: memory limit of tasks, if None
+                                   resident set size is not checked
+        :param tail_bytes: number of bytes at end of log file to search
+        """
+        self._memory_limit_kb = None
+        if memory_limit_in_gb is not None:
+            self._memory_limit_kb = float(memory_limit_in_gb) * 1024 * 1024
+        self._tail_bytes = tail_bytes
+
+    def _read_tail(self, path):
+        """Reads last `tail_bytes` bytes of `path`
+        :returns: bytes or None if file could not be read
+        """
+        try:
+            f = open(path, 'rb')
+            try:
+                f.seek(0, os.SEEK_END)
+                f.seek(max(f.tell() - self._tail_bytes, 0))
+                return f.read()
+            finally:
+                f.close()
+        except (IOError, OSError) as e:
+            logger.debug('Unable to read ' + path + ' : ' + str(e))
+        return None
+
+    def classify(self, path):
+        """Classifies failure of task with log file `path`
+        :param path: path to task log file, can be None
+        :returns: one of `OOM`, `WALLTIME`, `SINGULARITY`, `BAD_INPUT`,
+                  `UNKNOWN`, or `NO_LOG` if `path` is None or cannot
+                  be read
+        """
+        if path is None:
+            return TaskFailureClassifier.NO_LOG
+        data = self._read_tail(path)
+        if data is None:
+            return TaskFailureClassifier.NO_LOG
+
+        for (failure, patterns) in TaskFailureClassifier.PATTERNS:
+            for pattern in patterns:
+                if pattern in data:
+                    return failure
+
+        exit_code = None
+        for match in LOG_EXIT_CODE_REGEX.finditer(data):
+            exit_code = int(match.group('code'))
+        if exit_code in TaskFailureClassifier.OOM_EXIT_CODES:
+            return TaskFailureClassifier.OOM
+
+        if self._memory_limit_kb is not None:
+            max_memory = _parse_task_log_data(data)[2]
+            if max_memory >= (self._memory_limit_kb *
+                              TaskFailureClassifier.MEMORY_LIMIT_FRACTION):
+                return TaskFailureClassifier.OOM
+        return TaskFailureClassifier.UNKNOWN
+
+
+def get_task_failures(batched_config_file, log_dir, task_list, classifier,
+                      log_files=None):
+    """Classifies failures of incomplete tasks in `task_list` using the
+       batched config file of the last submission to map each task to
+       the array task that ran it. Only log files written after the
+       batched config file are used so a task is never classified
+       from an older submission
+    :param batched_config_file: batched config file of last submission
+    :param log_dir: directory containing task log files
+    :param task_list: list of incomplete task ids
+    :param classifier: `TaskFailureClassifier` to classify logs with
+    :param log_files: if set, list of files to use instead of files in
+                      `log_dir`
+    :returns: dict of task id to tuple (failure, path to log file or
+              None)
+    """
+    res = {}
+    for taskid in task_list:
+        res[taskid] = (TaskFailureClassifier.NO_LOG, None)
 
+    if batched_config_file is None or\
+            not os.path.isfile(batched_config_file):
+        return res
+
+    bconfig = configparser.ConfigParser()
+    bconfig.read(batched_config_file)
+    logs = get_latest_task_logs(log_dir,
+                                newer_than=os.path.getmtime(
+                                    batched_config_file),
+                                log_files=log_files)
+    for section in bconfig.sections():
+        if not section.isdigit():
+            continue
         try:
-            jobdir = config.get(CHMJobCreator.CONFIG_DEFAULT,
-                                CHMJobCreator.JOB_DIR)
+            taskids = bconfig.get(section, CHMJobCreator.BCONFIG_TASK_ID)
         except NoOptionError:
-            logger.exception('No ' + CHMJobCreator.JOB_DIR +
-                             ' in configuration')
-            jobdir = None
-
-        for s in config.sections():
-            out_file = config.get(s, CHMJobCreator.MERGE_OUTPUT_IMAGE)
-            if not out_file.startswith('/') and jobdir is not None:
-                out_file = os.path.join(jobdir, CHMJobCreator.RUN_DIR,
-                                        out_file)
-            logger.debug('Checking if image file exists: ' + out_file)
-            if not os.path.isfile(out_file):
-                task_list.append(s)
+            continue
+        log = logs.get(int(section))
+        if log is None:
+            continue
+        failure = classifier.classify(log)
+        for taskid in taskids.split(','):
+            if taskid in res:
+                res[taskid] = (failure, log)
+    return res
+
+
+class TaskRetryPlanner(object):
+    """Decides how incomplete tasks are retried based on why their
+       last attempt failed. Tasks that ran out of memory or time are
+       retried with `RESOURCE_FACTOR` times more, tasks with bad input
+       images or that failed `MAX_FAILURES` times are held back for
+       inspection, and all others are retried unchanged. Failure
+       counts and resources of each task are kept in a state file so
+       increases compound across submissions
+    """
+    MAX_FAILURES = 3
+    """Number of failures after which a task is held back
+    """
 
-        logger.info('Found ' + str(len(task_list)) + ' of ' +
-                    str(len(config.sections())) + ' to be incomplete tasks')
-        return task_list
+    RESOURCE_FACTOR = 1.5
+    """Factor memory or walltime is increased by on each retry
+    """
+
+    FAILURES = 'failures'
+    LAST_FAILURE = 'lastfailure'
+    WALLTIME = 'walltime'
+    MEMORY = 'memory'
+
+    def __init__(self, state_file, max_failures=MAX_FAILURES,
+                 resource_factor=RESOURCE_FACTOR):
+        """Constructor, loads state file if it exists
+        :param state_file: path to file to store retry state in
+        :param max_failures: number of failures after which a task is
+                             held back
+        :param resource_factor: factor to increase memory or walltime by
+        """
+        self._state_file = state_file
+        self._max_failures = max_failures
+        self._resource_factor = resource_factor
+        self._state = configparser.ConfigParser()
+        if state_file is not None and os.path.isfile(state_file):
+            self._state.read(state_file)
+
+    def get_state_file(self):
+        """Gets path to state file
+        """
+        return self._state_file
+
+    def _get_section(self, prefix, taskid):
+        """Gets section name in state for task
+        """
+        return prefix + '.' + str(taskid)
+
+    def _get_increased_memory(self, memory_in_gb):
+        """Gets `memory_in_gb` increased by resource factor
+        :returns: memory in gigabytes rounded up to an int as string
+        """
+        return str(int(math.ceil(float(memory_in_gb) *
+                                 self._resource_factor)))
+
+    def _get_increased_walltime(self, walltime):
+        """Gets `walltime` increased by resource factor
+        """
+        return _get_walltime_from_seconds(_get_seconds_from_walltime(walltime)
+                                          * self._resource_factor)
+
+    def plan(self, prefix, task_list, failures, walltime, memory_in_gb,
+             running_tasks=None):
+        """Updates state with `failures` and groups tasks to retry
+           by resources they need. State of tasks with `prefix` that
+           are no longer in `task_list` is removed since they completed
+        :param prefix: phase of tasks ie chm or merge
+        :param task_list: list of incomplete task ids
+        :param failures: dict of task id to tuple (failure, log file)
+                         as returned by `get_task_failures`
+        :param walltime: walltime tasks were configured with
+        :param memory_in_gb: memory tasks were configured with
+        :param running_tasks: list of task ids still queued or running
+                              whose state is kept but are not planned
+        :returns: tuple (list of tuples (walltime, memory in gb, list
+                  of task ids) with tasks to retry using configured
+                  resources first, dict of task id to tuple (failure,
+                  log file) of tasks held back)
+        """
+        base = (str(walltime), str(memory_in_gb))
+        pending = set(task_list)
+        if running_tasks is not None:
+            pending.update(running_tasks)
+        for section in self._state.sections():
+            if section.startswith(prefix + '.') and\
+                    section[len(prefix) + 1:] not in pending:
+                self._state.remove_section(section)
+
+        groups = {}
+        held = {}
+        for taskid in task_list:
+            (failure, log) = failures.get(taskid,
+                                          (TaskFailureClassifier.NO_LOG,
+                                           None))
+            section = self._get_section(prefix, taskid)
+            if self._state.has_section(section):
+                count = self._state.getint(section,
+                                           TaskRetryPlanner.FAILURES)
+                task_walltime = self._state.get(section,
+                                                TaskRetryPlanner.WALLTIME)
+                task_memory = self._state.get(section,
+                                              TaskRetryPlanner.MEMORY)
+            else:
+                count = 0
+                (task_walltime, task_memory) = base
+
+            if failure != TaskFailureClassifier.NO_LOG:
+                count += 1
+                if failure == TaskFailureClassifier.OOM:
+                    task_memory = self._get_increased_memory(task_memory)
+                elif failure == TaskFailureClassifier.WALLTIME:
+                    task_walltime = self._get_increased_walltime(
+                        task_walltime)
+                if not self._state.has_section(section):
+                    self._state.add_section(section)
+                self._state.set(section, TaskRetryPlanner.FAILURES,
+                                str(count))
+                self._state.set(section, TaskRetryPlanner.LAST_FAILURE,
+                                failure)
+                self._state.set(section, TaskRetryPlanner.WALLTIME,
+                                task_walltime)
+                self._state.set(section, TaskRetryPlanner.MEMORY,
+                                task_memory)
+
+            if self._state.has_section(section) and\
+                    (count >= self._max_failures or
+                     self._state.get(section, TaskRetryPlanner.LAST_FAILURE)
+                     == TaskFailureClassifier.BAD_INPUT):
+                held[taskid] = (self._state.get(section,
+                                                TaskRetryPlanner.LAST_FAILURE),
+                                log)
+                continue
+            key = (task_walltime, task_memory)
+            if key not in groups:
+                groups[key] = []
+            groups[key].append(taskid)
+
+        def sort_key(key):
+            return (key != base, float(key[1]),
+                    _get_seconds_from_walltime(key[0]))
+
+        res = []
+        for key in sorted(groups.keys(), key=sort_key):
+            res.append((key[0], key[1], groups[key]))
+        return res, held
+
+    def save(self):
+        """Writes state to state file
+        """
+        if self._state_file is None:
+            return
+        f = open(self._state_file, 'w')
+        try:
+            self._state.write(f)
+        finally:
+            f.close()
+
+
+class JobProgressMonitor(object):
+    """Tracks progress of a running CHM job in memory so it can be
+       refreshed repeatedly without rescanning every task output and
+       log file. Incomplete tasks are grouped by the directory their
+       output is written to and a directory is only rechecked when its
+       modification time changes. Likewise only new log files, and log
+       files of tasks still running, are parsed to keep a running tally
+       of CPU hours. The cost of `update` thus depends on the number of
+       directories and the changes since the last call, not on the
+       number of tasks in the job. inotify is not available in the
+       python standard library so modification times are polled.
+    """
+    CHM_PHASE = 'CHM'
+    MERGE_PHASE = 'Merge'
+
+    RATE_WINDOW = 10
+    """Number of most recent updates used to calculate throughput
+    """
+
+    MTIME_GRANULARITY = 2.0
+    """Directories modified within this many seconds of the previous
+       update are rechecked even if modification time is unchanged,
+       since file systems with coarse timestamps can hide a change
+    """
+
+    def __init__(self, chmconfig, chm_incomplete_tasks=None,
+                 merge_incomplete_tasks=None, clock=time.time,
+                 cache_file=None):
+        """Constructor
+        :param chmconfig: `CHMConfig` object loaded with CHM and merge
+                          configuration
+        :param chm_incomplete_tasks: list of incomplete CHM task ids as
+                                     returned by `CHMTaskChecker`
+        :param merge_incomplete_tasks: list of incomplete merge task ids
+                                       as returned by `MergeTaskChecker`
+        :param clock: function returning current time in seconds
+        :param cache_file: if set, run times parsed from log files are
+                           cached in this file via `TaskLogCache` so
+                           the first update only parses logs that are
+                           new or changed since the cache was written
+        """
+        self._chmconfig = chmconfig
+        self._clock = clock
+        self._cache = None
+        if cache_file is not None:
+            self._cache = TaskLogCache(cache_file)
+        self._phases = [JobProgressMonitor.CHM_PHASE,
+                        JobProgressMonitor.MERGE_PHASE]
+        self._totals = {}
+        self._pending = {}
+        self._pending_count = {}
+        self._dir_mtimes = {}
+        self._samples = {}
+        self._usertime = 0.0
+        self._seen_logs = set()
+        self._running_logs = {}
+        self._log_dirs = []
+        self._last_update = None
+
+        self._add_phase(JobProgressMonitor.CHM_PHASE,
+                        chmconfig.get_config(),
+                        CHMJobCreator.CONFIG_OUTPUT_IMAGE,
+                        chm_incomplete_tasks)
+        self._add_phase(JobProgressMonitor.MERGE_PHASE,
+                        chmconfig.get_merge_config(),
+                        CHMJobCreator.MERGE_OUTPUT_IMAGE,
+                        merge_incomplete_tasks)
+        for log_dir in [chmconfig.get_stdout_dir(),
+                        chmconfig.get_merge_stdout_dir()]:
+            self._log_dirs.append(log_dir)
+            self._dir_mtimes[log_dir] = None
+
+    def _add_phase(self, phase, config, option, incomplete_tasks):
+        """Groups output paths of `incomplete_tasks` by directory
+        """
+        pending = {}
+        total = 0
+        if config is not None:
+            total = len(config.sections())
+            try:
+                jobdir = config.get(CHMJobCreator.CONFIG_DEFAULT,
+                                    CHMJobCreator.JOB_DIR)
+            except NoOptionError:
+                jobdir = None
+            for taskid in incomplete_tasks or []:
+                out_file = config.get(taskid, option)
+                if not out_file.startswith('/') and jobdir is not None:
+                    out_file = os.path.join(jobdir, CHMJobCreator.RUN_DIR,
+                                            out_file)
+                dirpath = os.path.dirname(out_file)
+                if dirpath not in pending:
+                    pending[dirpath] = {}
+                    self._dir_mtimes[dirpath] = None
+                pending[dirpath][taskid] = out_file
+
+        self._totals[phase] = total
+        self._pending[phase] = pending
+        self._pending_count[phase] = sum([len(x) for x in pending.values()])
+        self._samples[phase] = []
+
+    def _get_mtime(self, path):
+        """Gets modification time of `path` or None if it does not exist
+        """
+        try:
+            return os.stat(path).st_mtime
+        except OSError:
+            return None
+
+    def _has_changed(self, path):
+        """Checks if directory `path` may have changed since last update
+           and records its current modification time
+        """
+        mtime = self._get_mtime(path)
+        if mtime is None:
+            return False
+        prev = self._dir_mtimes.get(path)
+        self._dir_mtimes[path] = mtime
+        if prev is None or mtime != prev:
+            return True
+        if self._last_update is None:
+            return True
+        return mtime >= self._last_update - \
+            JobProgressMonitor.MTIME_GRANULARITY
+
+    def _update_phase(self, phase):
+        """Removes tasks whose output now exists from pending tasks
+           of `phase`, only examining directories that changed
+        """
+        pending = self._pending[phase]
+        for dirpath in list(pending.keys()):
+            if not self._has_changed(dirpath):
+                continue
+            tasks = pending[dirpath]
+            for taskid in list(tasks.keys()):
+                if os.path.isfile(tasks[taskid]):
+                    del tasks[taskid]
+                    self._pending_count[phase] -= 1
+            if not tasks:
+                del pending[dirpath]
+
+    def _add_log(self, path):
+        """Parses log file `path`, or gets its run times from cache,
+           adding its user time to CPU hours tally. Logs without a
+           walltime belong to running tasks and are parsed again when
+           their size changes
+        """
+        try:
+            st = os.stat(path)
+        except OSError:
+            self._running_logs.pop(path, None)
+            return
+        res = None
+        if self._cache is not None:
+            res = self._cache.get(path, st.st_size, st.st_mtime)
+        if res is None:
+            res = parse_task_log(path)
+            if self._cache is not None and res is not None:
+                self._cache.set(path, st.st_size, st.st_mtime, res)
+        if res is not None and res[1] > 0:
+            self._running_logs.pop(path, None)
+            self._usertime += res[0]
+            return
+        self._running_logs[path] = st.st_size
+
+    def _update_logs(self):
+        """Parses new log files and log files of running tasks that
+           have grown since the last update
+        """
+        for path in list(self._running_logs.keys()):
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                del self._running_logs[path]
+                continue
+            if size != self._running_logs[path]:
+                self._add_log(path)
+
+        for log_dir in self._log_dirs:
+            if not self._has_changed(log_dir):
+                continue
+            for path in fileutil.walk_files(log_dir):
+                if path in self._seen_logs:
+                    continue
+                self._seen_logs.add(path)
+                self._add_log(path)
+
+    def update(self):
+        """Checks for newly completed tasks and new log files
+        """
+        now = self._clock()
+        for phase in self._phases:
+            self._update_phase(phase)
+            samples = self._samples[phase]
+            samples.append((now, self.get_completed_task_count(phase)))
+            if len(samples) > JobProgressMonitor.RATE_WINDOW:
+                del samples[0]
+        self._update_logs()
+        if self._cache is not None:
+            try:
+                self._cache.save()
+            except (IOError, OSError):
+                logger.exception('Unable to save task log cache')
+        self._last_update = now
+
+    def get_total_task_count(self, phase):
+        """Gets total number of tasks in `phase`
+        """
+        return self._totals[phase]
+
+    def get_completed_task_count(self, phase):
+        """Gets number of completed tasks in `phase`
+        """
+        return self._totals[phase] - self._pending_count[phase]
+
+    def get_cpu_hours(self):
+        """Gets user CPU hours consumed by tasks that have finished
+        """
+        return self._usertime / 3600.0
+
+    def get_tasks_per_minute(self, phase):
+        """Gets rate tasks in `phase` completed over the last
+           `RATE_WINDOW` updates
+        :returns: tasks per minute as float or None if fewer than two
+                  updates have been done
+        """
+        samples = self._samples[phase]
+        if len(samples) < 2:
+            return None
+        elapsed = samples[-1][0] - samples[0][0]
+        if elapsed <= 0:
+            return None
+        return (samples[-1][1] - samples[0][1]) * 60.0 / elapsed
+
+    def get_eta_in_seconds(self, phase):
+        """Gets estimated seconds until all tasks in `phase` complete
+           at current throughput
+        :returns: seconds as float, 0 if phase is complete, or None if
+                  throughput is unknown or zero
+        """
+        remaining = self._pending_count[phase]
+        if remaining <= 0:
+            return 0.0
+        rate = self.get_tasks_per_minute(phase)
+        if rate is None or rate <= 0:
+            return None
+        return remaining * 60.0 / rate
+
+    def is_complete(self):
+        """Returns True if all tasks in every phase are complete
+        """
+        for phase in self._phases:
+            if self._pending_count[phase] > 0:
+                return False
+        return True
+
+    def _get_eta_as_string(self, eta):
+        """Converts `eta` seconds to H:MM:SS or NA if None
+        """
+        if eta is None:
+            return 'NA'
+        eta = int(round(eta))
+        return '{0:d}:{1:02d}:{2:02d}'.format(eta // 3600,
+                                              (eta % 3600) // 60,
+                                              eta % 60)
+
+    def get_progress(self):
+        """Gets progress of job in human readable form
+        :returns: string of form
+                  <date> CHM tasks: # of # completed, # tasks/min,
+                  ETA H:MM:SS
+                  <date> Merge tasks: # of # completed, # tasks/min,
+                  ETA H:MM:SS
+                  <date> CPU consumption so far: # CPU hours
+        """
+        stamp = time.strftime('%Y-%m-%d %H:%M:%S',
+                              time.localtime(self._clock()))
+        res = ''
+        for phase in self._phases:
+            rate = self.get_tasks_per_minute(phase)
+            if rate is None:
+                rate_str = 'NA'
+            else:
+                rate_str = '{0:,.1f}'.format(rate)
+            res += (stamp + ' ' + phase + ' tasks: ' +
+                    '{0:,}'.format(self.get_completed_task_count(phase)) +
+                    ' of ' +
+                    '{0:,}'.format(self.get_total_task_count(phase)) +
+                    ' completed, ' + rate_str + ' tasks/min, ETA ' +
+                    self._get_eta_as_string(self.get_eta_in_seconds(phase)) +
+                    '\n')
+        return (res + stamp + ' CPU consumption so far: ' +
+                '{0:,.1f}'.format(self.get_cpu_hours()) + ' CPU hours\n')
 
 
 class CanMergeTaskBeRun(object):
@@ -778,17 +2561,67 @@ class BatchedTasksListGenerator(object):
             return 0
 
         bconfig = configparser.ConfigParser()
+        task_counter = self._add_tasks_to_config(bconfig, task_list, 1)
+        self._write_batched_task_config(bconfig, configfile)
+        return task_counter-1
 
+    def _add_tasks_to_config(self, bconfig, task_list, task_counter):
+        """Adds `task_list` batched by tasks per node to `bconfig` as
+           sections numbered from `task_counter`
+        :returns: number of next section
+        """
         total = len(task_list)
-        task_counter = 1
         for j in range(0, total, self._tasks_per_node):
             bconfig.add_section(str(task_counter))
             bconfig.set(str(task_counter), CHMJobCreator.BCONFIG_TASK_ID,
                         ','.join(task_list[j:j+self._tasks_per_node]))
             task_counter += 1
+        return task_counter
+
+    def write_batched_config_for_groups(self, configfile, task_lists,
+                                        keep_tasks=None):
+        """Like `write_batched_config` but tasks in each list of
+           `task_lists` are batched separately and given consecutive
+           array task ids so each list can be submitted as its own
+           array job with different resources
+        :param configfile: file path to write configuration file to
+        :param task_lists: list of task lists
+        :param keep_tasks: dict of array task id as int to list of task
+                           ids of array tasks still queued or running.
+                           These are written unchanged and new array
+                           task ids start after the largest of them
+        :raises InvalidConfigFileError: if configfile parameter is None
+        :raises InvalidTaskListError: if task_lists parameter is None
+        :returns: list of tuples (first array task id, number of array
+                  tasks) one per list in `task_lists`
+        """
+        if configfile is None:
+            raise InvalidConfigFileError('configfile passed in cannot be null')
+
+        if task_lists is None:
+            raise InvalidTaskListError('task lists cannot be None')
+
+        if sum([len(x) for x in task_lists]) == 0:
+            logger.debug('All tasks complete')
+            return [(1, 0) for x in task_lists]
+
+        bconfig = configparser.ConfigParser()
+        task_counter = 1
+        if keep_tasks:
+            for array_id in sorted(keep_tasks.keys()):
+                bconfig.add_section(str(array_id))
+                bconfig.set(str(array_id), CHMJobCreator.BCONFIG_TASK_ID,
+                            ','.join(keep_tasks[array_id]))
+            task_counter = max(keep_tasks.keys()) + 1
+        res = []
+        for task_list in task_lists:
+            next_counter = self._add_tasks_to_config(bconfig, task_list,
+                                                     task_counter)
+            res.append((task_counter, next_counter - task_counter))
+            task_counter = next_counter
 
         self._write_batched_task_config(bconfig, configfile)
-        return task_counter-1
+        return res
 
 
 class Cluster(object):
@@ -851,6 +2684,41 @@ class Cluster(object):
                          'tasks per int conversion failed')
             return self._default_merge_tasks_per_node
 
+    def get_exclude_hosts(self):
+        """Gets hosts to exclude from `CHMJobCreator.EXCLUDE_HOSTS_FILE_NAME`
+           file in job directory
+        :returns: sorted list of hosts, empty if there are none
+        """
+        if self._chmconfig is None or self._chmconfig.get_out_dir() is None:
+            return []
+        return read_exclude_hosts_file(os.path.join(self._chmconfig.
+                                                    get_out_dir(),
+                                                    CHMJobCreator.
+                                                    EXCLUDE_HOSTS_FILE_NAME))
+
+    def _get_exclude_hosts_arg(self):
+        """Gets argument for submit command that keeps tasks off of
+           hosts in `get_exclude_hosts`
+        :returns: empty string since base class does not know scheduler
+        """
+        return ''
+
+    def _get_resource_args(self, walltime, memory_in_gb,
+                           memory_resources=None):
+        """Gets arguments for submit command that override walltime
+           and memory set in submit script
+        :param walltime: walltime or None to keep walltime of script
+        :param memory_in_gb: memory or None to keep memory of script
+        :param memory_resources: names of memory resources to set
+        :returns: empty string since base class does not know scheduler
+        """
+        return ''
+
+    def _get_array_range(self, first_task, number_jobs):
+        """Gets range of array task ids as first-last
+        """
+        return str(first_task) + '-' + str(first_task + number_jobs - 1)
+
     def get_checkchmjob_command(self):
         """Returns checkchmjob.py command the user should run
         :returns: string containing checkchmjob.py the user should invoke
@@ -922,24 +2790,68 @@ class RocceCluster(Cluster):
         self._default_jobs_per_node = RocceCluster.DEFAULT_JOBS_PER_NODE
         self._default_merge_tasks_per_node = RocceCluster.DEFAULT_JOBS_PER_NODE
 
-    def get_chm_submit_command(self, number_jobs):
+    def get_chm_submit_command(self, number_jobs, first_task=1,
+                               walltime=None, memory_in_gb=None):
         """Returns submit command user should invoke
            to run jobs on scheduler
+        :param number_jobs: number of array tasks to submit
+        :param first_task: first array task id
+        :param walltime: walltime overriding the one in script
+        :param memory_in_gb: memory overriding the one in script
         """
         val = ('cd "' + self._chmconfig.get_out_dir() + '";' +
-               'qsub -t 1-' + str(number_jobs) + ' ' +
+               'qsub ' + self._get_exclude_hosts_arg() +
+               self._get_resource_args(walltime, memory_in_gb) + '-t ' +
+               self._get_array_range(first_task, number_jobs) + ' ' +
                self._submit_script_name)
         return val
 
-    def get_merge_submit_command(self, number_jobs):
+    def get_merge_submit_command(self, number_jobs, first_task=1,
+                                 walltime=None, memory_in_gb=None):
         """Returns submit command user should invoke
            to run jobs on scheduler
+        :param number_jobs: number of array tasks to submit
+        :param first_task: first array task id
+        :param walltime: walltime overriding the one in script
+        :param memory_in_gb: memory overriding the one in script
         """
         val = ('cd "' + self._chmconfig.get_out_dir() + '";' +
-               'qsub -t 1-' + str(number_jobs) + ' ' +
-               self._merge_submit_script_name)
+               'qsub ' + self._get_exclude_hosts_arg() +
+               self._get_resource_args(walltime, memory_in_gb,
+                                       memory_resources=['h_vmem',
+                                                         'virtual_free']) +
+               '-t ' + self._get_array_range(first_task, number_jobs) +
+               ' ' + self._merge_submit_script_name)
         return val
 
+    def _get_resource_args(self, walltime, memory_in_gb,
+                           memory_resources=None):
+        """Gets SGE resource request overriding walltime and memory
+        :returns: string of form -l h_rt=walltime,h_vmem=memG followed
+                  by a space or empty string if neither is set
+        """
+        if memory_resources is None:
+            memory_resources = ['h_vmem']
+        reqs = []
+        if walltime is not None:
+            reqs.append('h_rt=' + walltime)
+        if memory_in_gb is not None:
+            for name in memory_resources:
+                reqs.append(name + '=' + str(memory_in_gb) + 'G')
+        if not reqs:
+            return ''
+        return '-l ' + ','.join(reqs) + ' '
+
+    def _get_exclude_hosts_arg(self):
+        """Gets SGE hostname resource request that excludes hosts
+        :returns: string of form -l h='!(host1|host2)' followed by a
+                  space or empty string if no hosts are excluded
+        """
+        hosts = self.get_exclude_hosts()
+        if not hosts:
+            return ''
+        return "-l h='!(" + '|'.join(hosts) + ")' "
+
     def generate_submit_script(self):
         """Creates submit script and instructions for invocation
         :returns: path to submit script
@@ -1052,31 +2964,83 @@ class GordonCluster(Cluster):
                     GordonCluster.WARNING_MESSAGE)
         return number_tasks, ''
 
-    def get_chm_submit_command(self, number_jobs):
+    def _get_exclude_hosts_warning(self):
+        """PBS on Gordon cannot exclude hosts when submitting so this
+           returns a warning listing hosts that should be excluded
+        :returns: warning message or empty string if no hosts are
+                  excluded
+        """
+        hosts = self.get_exclude_hosts()
+        if not hosts:
+            return ''
+        return ('\n# ' + self._cluster + ' cannot exclude hosts on ' +
+                'submit, tasks may run on: ' + ','.join(hosts) + '\n\n')
+
+    def get_chm_submit_command(self, number_jobs, first_task=1,
+                               walltime=None, memory_in_gb=None):
         """Returns submit command user should invoke
-           to run jobs on scheduler. Do
+           to run jobs on scheduler. The submit script is only
+           regenerated when `first_task` is 1, otherwise the array
+           range is passed to qsub so the script used by earlier
+           commands is left alone
+        :param number_jobs: number of array tasks to submit
+        :param first_task: first array task id
+        :param walltime: walltime overriding the one in script
+        :param memory_in_gb: ignored since tasks get whole nodes
         """
         (number_tasks, warn_msg) = self.\
             _get_adjusted_number_of_tasks_and_warning(number_jobs)
+        warn_msg += self._get_exclude_hosts_warning()
 
-        self.generate_submit_script(number_tasks=number_tasks)
+        if first_task == 1:
+            self.generate_submit_script(number_tasks=number_tasks)
         val = (warn_msg + 'cd "' + self._chmconfig.get_out_dir() + '";' +
-               'qsub ' +
+               'qsub ' + self._get_resource_args(walltime, memory_in_gb) +
+               self._get_array_range_arg(first_task, number_tasks) +
                GordonCluster.SUBMIT_SCRIPT_NAME)
         return val
 
-    def get_merge_submit_command(self, number_jobs):
+    def get_merge_submit_command(self, number_jobs, first_task=1,
+                                 walltime=None, memory_in_gb=None):
         """Returns submit command user should invoke
            to run jobs on scheduler
+        :param number_jobs: number of array tasks to submit
+        :param first_task: first array task id
+        :param walltime: walltime overriding the one in script
+        :param memory_in_gb: ignored since tasks get whole nodes
         """
         (number_tasks, warn_msg) = self. \
             _get_adjusted_number_of_tasks_and_warning(number_jobs)
-        self.generate_merge_submit_script(number_tasks=number_tasks)
+        warn_msg += self._get_exclude_hosts_warning()
+        if first_task == 1:
+            self.generate_merge_submit_script(number_tasks=number_tasks)
         val = (warn_msg + 'cd "' + self._chmconfig.get_out_dir() + '";' +
-               'qsub ' +
+               'qsub ' + self._get_resource_args(walltime, memory_in_gb) +
+               self._get_array_range_arg(first_task, number_tasks) +
                GordonCluster.MERGE_SUBMIT_SCRIPT_NAME)
         return val
 
+    def _get_array_range_arg(self, first_task, number_tasks):
+        """Gets qsub argument for array range if it differs from the
+           one written in submit script
+        :returns: string of form -t first-last followed by a space or
+                  empty string if `first_task` is 1
+        """
+        if first_task == 1:
+            return ''
+        return '-t ' + self._get_array_range(first_task, number_tasks) + ' '
+
+    def _get_resource_args(self, walltime, memory_in_gb,
+                           memory_resources=None):
+        """Gets PBS resource request overriding walltime. Memory is
+           not requested since tasks get whole nodes
+        :returns: string of form -l walltime=walltime followed by a
+                  space or empty string if `walltime` is None
+        """
+        if walltime is None:
+            return ''
+        return '-l walltime=' + walltime + ' '
+
     def _get_standard_out_filename(self):
         """Gets standard out file name for jobs
         """
@@ -1181,24 +3145,61 @@ class CometCluster(Cluster):
         self._default_jobs_per_node = CometCluster.DEFAULT_JOBS_PER_NODE
         self._default_merge_tasks_per_node = CometCluster.MERGE_TASKS_PER_NODE
 
-    def get_chm_submit_command(self, number_jobs):
+    def get_chm_submit_command(self, number_jobs, first_task=1,
+                               walltime=None, memory_in_gb=None):
         """Returns submit command user should invoke
-           to run jobs on scheduler. Do
+           to run jobs on scheduler
+        :param number_jobs: number of array tasks to submit
+        :param first_task: first array task id
+        :param walltime: walltime overriding the one in script
+        :param memory_in_gb: memory overriding the one in script
         """
         val = ('cd "' + self._chmconfig.get_out_dir() + '";' +
-               'sbatch -a 1-' + str(number_jobs) + ' ' +
+               'sbatch ' + self._get_exclude_hosts_arg() +
+               self._get_resource_args(walltime, memory_in_gb) + '-a ' +
+               self._get_array_range(first_task, number_jobs) + ' ' +
                CometCluster.SUBMIT_SCRIPT_NAME)
         return val
 
-    def get_merge_submit_command(self, number_jobs):
+    def get_merge_submit_command(self, number_jobs, first_task=1,
+                                 walltime=None, memory_in_gb=None):
         """Returns submit command user should invoke
            to run jobs on scheduler
+        :param number_jobs: number of array tasks to submit
+        :param first_task: first array task id
+        :param walltime: walltime overriding the one in script
+        :param memory_in_gb: memory overriding the one in script
         """
         val = ('cd "' + self._chmconfig.get_out_dir() + '";' +
-               'sbatch -a 1-' + str(number_jobs) + ' ' +
+               'sbatch ' + self._get_exclude_hosts_arg() +
+               self._get_resource_args(walltime, memory_in_gb) + '-a ' +
+               self._get_array_range(first_task, number_jobs) + ' ' +
                CometCluster.MERGE_SUBMIT_SCRIPT_NAME)
         return val
 
+    def _get_resource_args(self, walltime, memory_in_gb,
+                           memory_resources=None):
+        """Gets SLURM arguments overriding walltime and memory
+        :returns: string of form -t walltime --mem=memG followed by a
+                  space or empty string if neither is set
+        """
+        res = ''
+        if walltime is not None:
+            res += '-t ' + walltime + ' '
+        if memory_in_gb is not None:
+            res += '--mem=' + str(memory_in_gb) + 'G '
+        return res
+
+    def _get_exclude_hosts_arg(self):
+        """Gets SLURM argument that excludes hosts
+        :returns: string of form --exclude=host1,host2 followed by a
+                  space or empty string if no hosts are excluded
+        """
+        hosts = self.get_exclude_hosts()
+        if not hosts:
+            return ''
+        return '--exclude=' + ','.join(hosts) + ' '
+
     def _get_standard_out_filename(self):
         """Gets standard out file name for jobs
         """
@@ -1733,3 +3734,272 @@ class PBSScheduler(Scheduler):
         res += 'echo "JOBID: $PBS_JOBID"\n\n'
 
         return res
+
+
+class SchedulerQueryError(Exception):
+    """Raised when scheduler cannot be queried
+    """
+    pass
+
+
+class SchedulerQuery(object):
+    """Base class for objects that ask the scheduler, with one call,
+       which array tasks of a job are still queued or running so
+       checkchmjob.py can skip them when resubmitting. Subclasses set
+       the command and parse its output. The command can be replaced,
+       with a script that prints canned output for example, via the
+       `command` parameter of the constructor
+    """
+    DEFAULT_COMMAND = 'notset'
+
+    def __init__(self, command=None, user=None):
+        """Constructor
+        :param command: path to scheduler query command, if None
+                        `DEFAULT_COMMAND` is used
+        :param user: user whose jobs are queried, if None the current
+                     user is used
+        """
+        if command is None:
+            command = self.DEFAULT_COMMAND
+        self._command = command
+        if user is None:
+            user = getpass.getuser()
+        self._user = user
+
+    def get_command(self):
+        """Gets scheduler query command
+        """
+        return self._command
+
+    def _get_command_args(self, job_name):
+        """Gets arguments for query command
+        :returns: list of arguments following command
+        """
+        return []
+
+    def _parse_output(self, output, job_name):
+        """Parses output of query command
+        :returns: set of array task ids as int
+        """
+        return set()
+
+    def _run_command(self, cmd):
+        """Runs `cmd`
+        :param cmd: list with command and arguments
+        :raises SchedulerQueryError: if command cannot be run or exits
+                                     with non zero exit code
+        :returns: standard out of command as string
+        """
+        logger.debug('Running ' + ' '.join(cmd))
+        try:
+            p = subprocess.Popen(cmd, stdout=subprocess.PIPE,
+                                 stderr=subprocess.PIPE)
+            (out, err) = p.communicate()
+        except OSError as e:
+            raise SchedulerQueryError('Unable to run ' + cmd[0] + ' : ' +
+                                      str(e))
+        if p.returncode != 0:
+            raise SchedulerQueryError(cmd[0] + ' exited with code ' +
+                                      str(p.returncode) + ' : ' +
+                                      err.decode('utf-8', 'replace').strip())
+        return out.decode('utf-8', 'replace')
+
+    def get_live_array_task_ids(self, job_name):
+        """Gets ids of array tasks of jobs named `job_name` that are
+           queued or running
+        :param job_name: name of job
+        :raises SchedulerQueryError: if scheduler cannot be queried
+        :returns: set of array task ids as int
+        """
+        cmd = [self._command] + self._get_command_args(job_name)
+        res = self._parse_output(self._run_command(cmd), job_name)
+        logger.info('Found ' + str(len(res)) + ' queued or running array '
+                    'tasks for ' + job_name)
+        return res
+
+
+def _parse_array_task_ids(tasks):
+    """Parses array task ids in SGE format such as 1-9:2,12
+    :param tasks: string of comma separated ids or ranges
+    :returns: set of ids as int
+    """
+    res = set()
+    for val in tasks.split(','):
+        val = val.strip()
+        if not val:
+            continue
+        step = 1
+        if ':' in val:
+            (val, step_str) = val.split(':', 1)
+            step = int(step_str)
+        if '-' in val:
+            (first, last) = val.split('-', 1)
+            res.update(range(int(first), int(last) + 1, step))
+        else:
+            res.add(int(val))
+    return res
+
+
+class SLURMSchedulerQuery(SchedulerQuery):
+    """Queries SLURM via squeue which, with -r, prints one line per
+       array task in form <job id>_<array task id>
+    """
+    DEFAULT_COMMAND = 'squeue'
+
+    def _get_command_args(self, job_name):
+        """Gets squeue arguments
+        """
+        return ['-h', '-r', '-u', self._user, '-n', job_name, '-o', '%i']
+
+    def _parse_output(self, output, job_name):
+        """Parses squeue output
+        """
+        res = set()
+        for line in output.splitlines():
+            split_id = line.strip().split('_')
+            if len(split_id) == 2 and split_id[1].isdigit():
+                res.add(int(split_id[1]))
+        return res
+
+
+class SGESchedulerQuery(SchedulerQuery):
+    """Queries SGE via qstat xml output which does not truncate job
+       names. Array tasks are listed in the tasks element as ranges
+    """
+    DEFAULT_COMMAND = 'qstat'
+
+    def _get_command_args(self, job_name):
+        """Gets qstat arguments
+        """
+        return ['-u', self._user, '-g', 'd', '-xml']
+
+    def _parse_output(self, output, job_name):
+        """Parses qstat xml output
+        """
+        res = set()
+        try:
+            root = ElementTree.fromstring(output)
+        except ElementTree.ParseError as e:
+            raise SchedulerQueryError('Unable to parse qstat output: ' +
+                                      str(e))
+        for job in root.iter('job_list'):
+            if job.findtext('JB_name') != job_name:
+                continue
+            tasks = job.findtext('tasks')
+            if tasks:
+                res.update(_parse_array_task_ids(tasks))
+        return res
+
+
+class PBSSchedulerQuery(SchedulerQuery):
+    """Queries Torque PBS via qstat -t -f which prints a block per
+       array task starting with Job Id: <job id>[<array task id>].
+       Torque names array tasks <job name>-<array task id>
+    """
+    DEFAULT_COMMAND = 'qstat'
+
+    DONE_STATES = ['C']
+    """Job states of array tasks that are no longer running
+    """
+
+    def _get_command_args(self, job_name):
+        """Gets qstat arguments
+        """
+        return ['-t', '-f']
+
+    def _add_task(self, res, job, job_name):
+        """Adds array task id of `job` to `res` if it belongs to
+           `job_name` and is not done
+        """
+        if 'id' not in job or job.get('job_state') in\
+                PBSSchedulerQuery.DONE_STATES:
+            return
+        owner = job.get('Job_Owner')
+        if owner is not None and owner.split('@')[0] != self._user:
+            return
+        name = job.get('Job_Name')
+        task_id = job['id']
+        if name == job_name or name == job_name + '-' + str(task_id):
+            res.add(task_id)
+
+    def _parse_output(self, output, job_name):
+        """Parses qstat -f output
+        """
+        res = set()
+        job = {}
+        for line in output.splitlines():
+            if line.startswith('Job Id:'):
+                self._add_task(res, job, job_name)
+                job = {}
+                job_id = line[len('Job Id:'):].strip()
+                if '[' in job_id and ']' in job_id:
+                    task_id = job_id[job_id.index('[') + 1:job_id.index(']')]
+                    if task_id.isdigit():
+                        job['id'] = int(task_id)
+                continue
+            if ' = ' in line:
+                (key, val) = line.split(' = ', 1)
+                job[key.strip()] = val.strip()
+        self._add_task(res, job, job_name)
+        return res
+
+
+class SchedulerQueryFactory(object):
+    """Factory that produces `SchedulerQuery` objects
+    """
+    def __init__(self):
+        """Constructor"""
+        pass
+
+    def get_scheduler_query_by_cluster_name(self, clustername, command=None):
+        """Gets SchedulerQuery object by `clustername`
+        :param clustername: name of cluster
+        :param command: if set, command to run instead of default
+                        scheduler query command
+        :returns: SchedulerQuery object appropriate for cluster or None
+                  if none found
+        """
+        if clustername is None:
+            logger.error('clustername passed in is None')
+            return None
+
+        lc_cluster = clustername.lower()
+        if lc_cluster == SchedulerFactory.ROCCE:
+            return SGESchedulerQuery(command=command)
+        if lc_cluster == SchedulerFactory.GORDON:
+            return PBSSchedulerQuery(command=command)
+        if lc_cluster == SchedulerFactory.COMET:
+            return SLURMSchedulerQuery(command=command)
+
+        logger.error('No scheduler query supporting ' + lc_cluster +
+                     ' found')
+        return None
+
+
+def get_live_batched_tasks(batched_config_file, array_task_ids):
+    """Maps array task ids that are queued or running to the task ids
+       they run via batched config file of last submission
+    :param batched_config_file: batched config file of last submission
+    :param array_task_ids: set of array task ids as int
+    :returns: dict of array task id as int to list of task ids,
+              array task ids not in batched config file are skipped
+    """
+    res = {}
+    if not array_task_ids or batched_config_file is None or\
+            not os.path.isfile(batched_config_file):
+        return res
+    bconfig = configparser.ConfigParser()
+    bconfig.read(batched_config_file)
+    for array_id in array_task_ids:
+        section = str(array_id)
+        if not bconfig.has_section(section):
+            logger.warning('Array task ' + section + ' is not in ' +
+                           batched_config_file)
+            continue
+        try:
+            res[array_id] = bconfig.get(section,
+                                        CHMJobCreator.BCONFIG_TASK_ID).\
+                split(',')
+        except NoOptionError:
+            continue
+    return res
@@ -2,6 +2,11 @@
 
 
 import os
+import errno
+import fcntl
+import hashlib
+import shutil
+import uuid
 import datetime
 import logging
 import configparser
@@ -9,7 +14,9 @@ from configparser import NoOptionError
 import shlex
 import subprocess
 import time
+from array import array
 from chmutil.image import ImageStatsFromDirectoryFactory
+from chmutil.chunkstore import create_chunk_store
 import chmutil
 
 logger = logging.getLogger(__name__)
@@ -65,6 +72,36 @@ def parse_width_and_height_from_str(val):
     return int(sval[0]), int(sval[1])
 
 
+def get_chm_tiles_bounding_box(args, tile_size, overlap_size):
+    """Gets box in image covered by the CHM tiles set via -t COL,ROW
+       flags in `args`. CHM only writes the part of each tile that is
+       not overlap so tile COL,ROW covers the tile size minus twice the
+       overlap starting at (COL - 1) and (ROW - 1) times that size.
+    :param args: CHM arguments ie '-t 1,1 -t 1,2'
+    :param tile_size: tile size in WxH format
+    :param overlap_size: overlap size in WxH format
+    :returns: tuple (left, upper, right, lower) or None if `args` has
+              no tiles. Box may extend past the edge of the image
+    """
+    (t_width, t_height) = parse_width_and_height_from_str(tile_size)
+    (o_width, o_height) = parse_width_and_height_from_str(overlap_size)
+    step_w = t_width - (2 * o_width)
+    step_h = t_height - (2 * o_height)
+    tokens = args.split()
+    cols = []
+    rows = []
+    for i in range(len(tokens) - 1):
+        if tokens[i] != '-t':
+            continue
+        (col, row) = tokens[i + 1].split(',')
+        cols.append(int(col))
+        rows.append(int(row))
+    if not cols:
+        return None
+    return ((min(cols) - 1) * step_w, (min(rows) - 1) * step_h,
+            max(cols) * step_w, max(rows) * step_h)
+
+
 def setup_logging(thelogger,
                   log_format='%(asctime)-15s %(levelname)s %(name)s '
                              '%(message)s',
@@ -87,6 +124,9 @@ def setup_logging(thelogger,
     logging.getLogger('chmutil.core').setLevel(numericloglevel)
     logging.getLogger('chmutil.cluster').setLevel(numericloglevel)
     logging.getLogger('chmutil.image').setLevel(numericloglevel)
+    logging.getLogger('chmutil.mrc').setLevel(numericloglevel)
+    logging.getLogger('chmutil.chunkstore').setLevel(numericloglevel)
+    logging.getLogger('chmutil.fileutil').setLevel(numericloglevel)
 
 
 def add_standard_parameters(parser):
@@ -261,6 +301,195 @@ def get_first_sequence_of_numbers_in_string(val):
     return int(cur_val)
 
 
+class InputStager(object):
+    """Stages input images into a node local directory so CHM tasks on
+       the same node that process tiles of the same image read it from
+       shared storage only once. Tasks call `acquire` to get the path
+       of the staged copy and `release` when done. The first `acquire`
+       copies the image and the last `release` deletes it. A references
+       file next to the staged copy holds the process id of each task
+       using it and is updated under an exclusive lock (flock) so tasks
+       in separate processes can share it. Process ids of tasks that
+       were killed before calling `release` are dropped the next time
+       the file is read and `remove_stale` deletes copies no live task
+       is using. The staged copy keeps the file name of the original.
+    """
+    LOCK_SUFFIX = '.lock'
+    REFS_SUFFIX = '.refs'
+
+    def __init__(self, staging_dir):
+        """Constructor
+        :param staging_dir: node local directory to stage images in,
+                            created if needed
+        """
+        self._staging_dir = staging_dir
+
+    def _get_key(self, image_path):
+        """Gets unique name for `image_path` within staging directory
+        """
+        return hashlib.md5(os.path.abspath(image_path).
+                           encode('utf-8')).hexdigest()
+
+    def _lock(self, key):
+        """Opens and exclusively locks lock file for `key`
+        :returns: open lock file which is unlocked by closing it
+        """
+        if not os.path.isdir(self._staging_dir):
+            try:
+                os.makedirs(self._staging_dir, mode=0o755)
+            except OSError:
+                # another task may have created it
+                if not os.path.isdir(self._staging_dir):
+                    raise
+        lock_file = open(os.path.join(self._staging_dir,
+                                      key + InputStager.LOCK_SUFFIX), 'a')
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        return lock_file
+
+    def _is_process_alive(self, pid):
+        """Checks if process with id `pid` is running on this node
+        """
+        try:
+            os.kill(pid, 0)
+        except OSError as e:
+            return e.errno == errno.EPERM
+        return True
+
+    def _read_refs(self, refs_file):
+        """Reads process ids of tasks using staged copy skipping
+           processes that are no longer running
+        :returns: list of process ids, empty if `refs_file` does
+                  not exist
+        """
+        if not os.path.isfile(refs_file):
+            return []
+        f = open(refs_file, 'r')
+        try:
+            data = f.read()
+        finally:
+            f.close()
+        pids = []
+        for line in data.split():
+            try:
+                pid = int(line)
+            except ValueError:
+                logger.warning('Skipping invalid entry in ' + refs_file +
+                               ' : ' + line)
+                continue
+            if self._is_process_alive(pid):
+                pids.append(pid)
+            else:
+                logger.info('Dropping reference from process ' +
+                            str(pid) + ' which is no longer running')
+        return pids
+
+    def _write_refs(self, refs_file, pids):
+        """Writes process ids of tasks using staged copy
+        """
+        f = open(refs_file, 'w')
+        for pid in pids:
+            f.write(str(pid) + '\n')
+        f.flush()
+        f.close()
+
+    def _remove_staged(self, key, refs_file):
+        """Removes staged copy for `key` and its references file.
+           Caller must hold lock for `key`
+        """
+        staged_dir = os.path.join(self._staging_dir, key)
+        logger.debug('Removing staged copy ' + staged_dir)
+        if os.path.isdir(staged_dir):
+            shutil.rmtree(staged_dir)
+        if os.path.isfile(refs_file):
+            os.unlink(refs_file)
+
+    def get_staged_path(self, image_path):
+        """Gets path the staged copy of `image_path` has
+        :param image_path: path to image on shared storage
+        :returns: path within staging directory
+        """
+        return os.path.join(self._staging_dir, self._get_key(image_path),
+                            os.path.basename(image_path))
+
+    def acquire(self, image_path):
+        """Stages `image_path` if not already staged and adds a
+           reference to it for the current process
+        :param image_path: path to image on shared storage
+        :returns: path to staged copy of image
+        """
+        key = self._get_key(image_path)
+        staged = self.get_staged_path(image_path)
+        refs_file = os.path.join(self._staging_dir,
+                                 key + InputStager.REFS_SUFFIX)
+        lock_file = self._lock(key)
+        try:
+            pids = self._read_refs(refs_file)
+            if not pids or not os.path.isfile(staged):
+                staged_dir = os.path.dirname(staged)
+                if not os.path.isdir(staged_dir):
+                    os.makedirs(staged_dir, mode=0o755)
+                logger.info('Staging ' + image_path + ' to ' + staged)
+                tmp_file = staged + '.' + uuid.uuid4().hex + '.tmp'
+                shutil.copyfile(image_path, tmp_file)
+                os.rename(tmp_file, staged)
+            else:
+                logger.debug('Reusing staged ' + staged)
+            pids.append(os.getpid())
+            self._write_refs(refs_file, pids)
+        finally:
+            lock_file.close()
+        return staged
+
+    def release(self, image_path):
+        """Removes reference of current process to staged copy of
+           `image_path` deleting the copy once no task is using it
+        :param image_path: path to image on shared storage passed
+                           to `acquire`
+        """
+        key = self._get_key(image_path)
+        refs_file = os.path.join(self._staging_dir,
+                                 key + InputStager.REFS_SUFFIX)
+        lock_file = self._lock(key)
+        try:
+            pids = self._read_refs(refs_file)
+            if os.getpid() in pids:
+                pids.remove(os.getpid())
+            if pids:
+                self._write_refs(refs_file, pids)
+                return
+            self._remove_staged(key, refs_file)
+        finally:
+            lock_file.close()
+
+    def remove_stale(self):
+        """Removes staged copies that no running task holds a
+           reference to, such as those left by tasks that were killed
+           before calling `release`
+        :returns: number of staged copies removed
+        """
+        if not os.path.isdir(self._staging_dir):
+            return 0
+        removed = 0
+        for entry in os.listdir(self._staging_dir):
+            if not entry.endswith(InputStager.REFS_SUFFIX):
+                continue
+            key = entry[:-len(InputStager.REFS_SUFFIX)]
+            refs_file = os.path.join(self._staging_dir, entry)
+            lock_file = self._lock(key)
+            try:
+                if not os.path.isfile(refs_file):
+                    continue
+                pids = self._read_refs(refs_file)
+                if pids:
+                    self._write_refs(refs_file, pids)
+                    continue
+                self._remove_staged(key, refs_file)
+                removed += 1
+            finally:
+                lock_file.close()
+        return removed
+
+
 class CHMJobCreator(object):
     """Creates CHM Job to run on cluster
     """
@@ -275,6 +504,16 @@ class CHMJobCreator(object):
     MERGE_MERGETILES_BIN = 'mergetilesbin'
     MERGE_TASKS_PER_NODE = 'mergetaskspernode'
     MERGE_GENTIFS = 'gentifs'
+    MERGE_TILEDTIFS = 'tiledtifs'
+    MERGE_TIFF_TILE_SIZE = 'tifftilesize'
+    TIFF_TILE_ALIGNMENT = 16
+    MERGE_CHUNKSTORE = 'chunkstore'
+    MERGE_SECTION = 'section'
+    CHUNKSTORE_DIR = 'probmaps.zarr'
+    CHUNKSTORE_SECTIONS = 'sections'
+    MERGE_PYRAMID_DIR = 'pyramiddir'
+    MERGE_PYRAMID_TILE_SIZE = 'pyramidtilesize'
+    PYRAMIDS_DIR = 'pyramids'
     RUN_DIR = 'chmrun'
     STDOUT_DIR = 'stdout'
     TILES_DIR = 'tiles'
@@ -298,10 +537,19 @@ class CHMJobCreator(object):
     CONFIG_ACCOUNT = 'account'
     CHMUTIL_VERSION = 'chmutilversion'
     CONFIG_CLUSTER = 'cluster'
+    CONFIG_JOB_NAME = 'jobname'
+    MERGE_JOB_NAME = 'mergejobname'
+    CONFIG_CROP_TILES = 'croptiles'
+    CONFIG_STAGE_INPUT = 'stageinput'
+    STAGING_DIR = 'chmstaging'
+    OUTBOX_PREFIX = 'chmoutbox.'
     CHMRUNNER = 'chmrunner.py'
     MERGERUNNER = 'mergetilerunner.py'
     CHECKCHMJOB = 'checkchmjob.py'
     README_TXT_FILE = 'readme.txt'
+    TASK_LOG_CACHE_FILE_NAME = 'tasklogs.cache'
+    EXCLUDE_HOSTS_FILE_NAME = 'excludehosts'
+    TASK_RETRY_FILE_NAME = 'taskretries'
     PMAP_SUFFIX = '.tif'
     README_BODY = """chmutil job to run CHM jobs on cluster of computers
 ===========================================================
@@ -438,6 +686,12 @@ runmerge.CLUSTER
                    str(self._chmopts.get_account()))
         config.set('', CHMJobCreator.CONFIG_CLUSTER,
                    str(self._chmopts.get_cluster()))
+        config.set('', CHMJobCreator.CONFIG_JOB_NAME,
+                   str(self._chmopts.get_job_name()))
+        if self._chmopts.get_croptiles_arg() is True:
+            config.set('', CHMJobCreator.CONFIG_CROP_TILES, 'True')
+        if self._chmopts.get_stageinput_arg() is True:
+            config.set('', CHMJobCreator.CONFIG_STAGE_INPUT, 'True')
         return config
 
     def _write_config(self, config):
@@ -493,10 +747,64 @@ runmerge.CLUSTER
                    str(self._chmopts.get_number_merge_tasks_per_node()))
         config.set('', CHMJobCreator.MERGE_GENTIFS,
                    str(self._chmopts.get_gentifs_arg()))
+        if self._chmopts.get_tiledtifs_arg() is True:
+            config.set('', CHMJobCreator.MERGE_TILEDTIFS, 'True')
+            config.set('', CHMJobCreator.MERGE_TIFF_TILE_SIZE,
+                       self._get_tiff_tile_size())
+        if self._chmopts.get_chunkstore_arg() is True:
+            config.set('', CHMJobCreator.MERGE_CHUNKSTORE,
+                       CHMJobCreator.CHUNKSTORE_DIR)
+        if self._chmopts.get_pyramids_arg() is True:
+            config.set('', CHMJobCreator.MERGE_PYRAMID_TILE_SIZE,
+                       str(self._chmopts.get_pyramid_tile_size()))
         config.set('', CHMJobCreator.CONFIG_CLUSTER,
                    str(self._chmopts.get_cluster()))
+        config.set('', CHMJobCreator.MERGE_JOB_NAME,
+                   str(self._chmopts.get_mergejob_name()))
         return config
 
+    def _get_tiff_tile_size(self):
+        """Gets size of tiles for tiled tif probability maps which
+           is the step CHM tiles are placed at, aka tile size minus
+           overlap on both sides, rounded up to a multiple of
+           `TIFF_TILE_ALIGNMENT` as required by the TIFF format
+        :returns: string in WxH format
+        """
+        align = CHMJobCreator.TIFF_TILE_ALIGNMENT
+        sizes = []
+        for (size, overlap) in ((self._chmopts.get_tile_width(),
+                                 self._chmopts.get_overlap_width()),
+                                (self._chmopts.get_tile_height(),
+                                 self._chmopts.get_overlap_height())):
+            step = max(size - 2 * overlap, align)
+            sizes.append(str(((step + align - 1) // align) * align))
+        return 'x'.join(sizes)
+
+    def _create_chunk_store(self, run_dir, imagestats):
+        """Creates chunk store that merge tasks write probability maps
+           into with one section per image in order of `imagestats`.
+           Chunks hold one section and are the size of tiled tif tiles
+           so each merge task writes its own chunks
+        :param run_dir: Base run directory for CHM job
+        :param imagestats: list of ImageStats for images in job
+        :returns: path to chunk store
+        """
+        store_dir = os.path.join(run_dir, CHMJobCreator.CHUNKSTORE_DIR)
+        width = max([iis.get_width() for iis in imagestats])
+        height = max([iis.get_height() for iis in imagestats])
+        (c_width,
+         c_height) = parse_width_and_height_from_str(self.
+                                                     _get_tiff_tile_size())
+        names = [os.path.basename(iis.get_file_path())
+                 for iis in imagestats]
+        logger.debug('Creating chunk store ' + store_dir + ' with shape ' +
+                     str((len(imagestats), height, width)))
+        create_chunk_store(store_dir, (len(imagestats), height, width),
+                           (1, c_height, c_width),
+                           attributes={CHMJobCreator.
+                                       CHUNKSTORE_SECTIONS: names})
+        return store_dir
+
     def _write_merge_config(self, config):
         """Writes `config` to file to merge config
         :param config: configparser config object
@@ -615,6 +923,11 @@ runmerge.CLUSTER
         else:
             imgsuffix = None
 
+        if self._chmopts.get_chunkstore_arg() is True and imagestats:
+            # sections of chunk store are in order of image name
+            imagestats.sort(key=lambda iis: iis.get_file_path())
+            self._create_chunk_store(run_dir, imagestats)
+
         for iis in imagestats:
             i_name = self._create_output_image_dir(iis, run_dir)
             img_cntr = 1
@@ -622,6 +935,15 @@ runmerge.CLUSTER
                                                     str(mergecounter),
                                                     i_name,
                                                     imgsuffix)
+            if self._chmopts.get_chunkstore_arg() is True:
+                mergeconfig.set(str(mergecounter),
+                                CHMJobCreator.MERGE_SECTION,
+                                str(mergecounter - 1))
+            if self._chmopts.get_pyramids_arg() is True:
+                mergeconfig.set(str(mergecounter),
+                                CHMJobCreator.MERGE_PYRAMID_DIR,
+                                os.path.join(CHMJobCreator.PYRAMIDS_DIR,
+                                             i_name))
             for a in arg_gen.get_args(iis):
                 counter_as_str = str(counter)
                 self._add_task_for_image_to_config(config, counter_as_str,
@@ -663,7 +985,13 @@ class CHMConfig(object):
                  config=None,
                  mergeconfig=None,
                  rawargs=None,
-                 gentifs=False):
+                 gentifs=False,
+                 tiledtifs=False,
+                 chunkstore=False,
+                 croptiles=False,
+                 stageinput=False,
+                 pyramids=False,
+                 pyramid_tile_size=128):
         """Constructor
         """
         self._images = images
@@ -693,6 +1021,12 @@ class CHMConfig(object):
         self._cluster = cluster
         self._rawargs = rawargs
         self._gentifs = gentifs
+        self._tiledtifs = tiledtifs
+        self._chunkstore = chunkstore
+        self._croptiles = croptiles
+        self._stageinput = stageinput
+        self._pyramids = pyramids
+        self._pyramid_tile_size = pyramid_tile_size
 
     def get_gentifs_arg(self):
         """Gets value of gentifs argument
@@ -700,6 +1034,48 @@ class CHMConfig(object):
         """
         return self._gentifs
 
+    def get_tiledtifs_arg(self):
+        """Gets value of tiledtifs argument which if True means
+           probability maps are written as tiled compressed tif files
+        :returns: Can be False, True, or None
+        """
+        return self._tiledtifs
+
+    def get_chunkstore_arg(self):
+        """Gets value of chunkstore argument which if True means
+           probability maps are also written to a chunk store
+        :returns: Can be False, True, or None
+        """
+        return self._chunkstore
+
+    def get_pyramids_arg(self):
+        """Gets value of pyramids argument which if True means merge
+           tasks also write a zoom pyramid of png tiles of each
+           probability map
+        :returns: Can be False, True, or None
+        """
+        return self._pyramids
+
+    def get_pyramid_tile_size(self):
+        """Gets size in pixels of tiles in zoom pyramids
+        """
+        return self._pyramid_tile_size
+
+    def get_croptiles_arg(self):
+        """Gets value of croptiles argument which if True means CHM
+           tasks save only the part of the probability map covered by
+           their tiles
+        :returns: Can be False, True, or None
+        """
+        return self._croptiles
+
+    def get_stageinput_arg(self):
+        """Gets value of stageinput argument which if True means CHM
+           tasks copy input images to node local scratch before running
+        :returns: Can be False, True, or None
+        """
+        return self._stageinput
+
     def _extract_width_and_height(self, val):
         """parses WxH value into tuple
         """
@@ -995,11 +1371,38 @@ class CHMConfigFromConfigFactory(object):
                 logger.warning('No gentifs found. setting to False')
                 gentifs = False
 
+            try:
+                tiledtifs = mergecon.getboolean(default,
+                                                CHMJobCreator.MERGE_TILEDTIFS)
+            except NoOptionError:
+                logger.debug('No tiledtifs found. setting to False')
+                tiledtifs = False
+
+            chunkstore = mergecon.has_option(default,
+                                             CHMJobCreator.MERGE_CHUNKSTORE)
+
+            pyramids = mergecon.has_option(default, CHMJobCreator.
+                                           MERGE_PYRAMID_TILE_SIZE)
+            pyramid_tile_size = 128
+            if pyramids is True:
+                pyramid_tile_size = mergecon.getint(default,
+                                                    CHMJobCreator.
+                                                    MERGE_PYRAMID_TILE_SIZE)
+
+            mergejobname = 'mergechmjob'
+            if mergecon.has_option(default, CHMJobCreator.MERGE_JOB_NAME):
+                mergejobname = mergecon.get(default,
+                                            CHMJobCreator.MERGE_JOB_NAME)
         else:
             logger.debug('Skipping load of merge job configuration')
             mergecon = None
             merge_t_node = 1
             gentifs = False
+            tiledtifs = False
+            chunkstore = False
+            pyramids = False
+            pyramid_tile_size = 128
+            mergejobname = 'mergechmjob'
 
         if config is None:
             logger.debug('Config is None')
@@ -1013,7 +1416,12 @@ class CHMConfigFromConfigFactory(object):
                                  None, None, cluster=cluster,
                                  mergeconfig=mergecon,
                                  gentifs=gentifs,
-                                 merge_tasks_per_node=merge_t_node)
+                                 tiledtifs=tiledtifs,
+                                 chunkstore=chunkstore,
+                                 pyramids=pyramids,
+                                 pyramid_tile_size=pyramid_tile_size,
+                                 merge_tasks_per_node=merge_t_node,
+                                 mergejobname=mergejobname)
 
             logger.error('Mergeconfig is None')
             return CHMConfig(None, None, self._job_dir,
@@ -1034,6 +1442,20 @@ class CHMConfigFromConfigFactory(object):
             account = config.get(default, CHMJobCreator.CONFIG_ACCOUNT)
             logger.debug('account found in config: ' + str(account))
 
+        jobname = 'chmjob'
+        if config.has_option(default, CHMJobCreator.CONFIG_JOB_NAME):
+            jobname = config.get(default, CHMJobCreator.CONFIG_JOB_NAME)
+
+        croptiles = False
+        if config.has_option(default, CHMJobCreator.CONFIG_CROP_TILES):
+            croptiles = config.getboolean(default,
+                                          CHMJobCreator.CONFIG_CROP_TILES)
+
+        stageinput = False
+        if config.has_option(default, CHMJobCreator.CONFIG_STAGE_INPUT):
+            stageinput = config.getboolean(default,
+                                           CHMJobCreator.CONFIG_STAGE_INPUT)
+
         opts = CHMConfig(config.get(default, CHMJobCreator.CONFIG_IMAGES),
                          config.get(default, CHMJobCreator.CONFIG_MODEL),
                          self._job_dir,
@@ -1052,7 +1474,15 @@ class CHMConfigFromConfigFactory(object):
                          config=config,
                          account=account,
                          mergeconfig=mergecon,
-                         gentifs=gentifs)
+                         gentifs=gentifs,
+                         tiledtifs=tiledtifs,
+                         chunkstore=chunkstore,
+                         pyramids=pyramids,
+                         pyramid_tile_size=pyramid_tile_size,
+                         croptiles=croptiles,
+                         stageinput=stageinput,
+                         jobname=jobname,
+                         mergejobname=mergejobname)
         return opts
 
 
@@ -1111,6 +1541,7 @@ class Box(object):
     """Represents a box used in Pillow image library
     """
     COMMA = ','
+    __slots__ = ('_left', '_upper', '_right', '_lower')
 
     def __init__(self, left=None, upper=None, right=None, lower=None):
         """constructor"""
@@ -1203,7 +1634,8 @@ class Box(object):
         return False
 
     def does_box_intersect(self, box):
-        """Checks if two Box's intersect
+        """Checks if two Box's intersect. Edges are inclusive so
+           boxes that share an edge are considered intersecting
         :param box: Box to check
         :return: True if they intersect, False otherwise
         """
@@ -1214,18 +1646,193 @@ class Box(object):
         if box.are_any_corners_none() is True:
             return False
 
-        # check for overlap and case where box passed in
-        # could be within this box
-        c_list = box.get_list_of_tuple_of_corner_coordinates()
-        for c_tup in c_list:
-            if self.is_coordinate_in_box(c_tup) is True:
-                return True
+        # boxes intersect if they overlap along both axes
+        if self._left > box._right or box._left > self._right:
+            return False
+
+        if self._upper > box._lower or box._upper > self._lower:
+            return False
+
+        return True
+
+    def get_area(self):
+        """Gets area of box
+        :returns: (right - left) * (lower - upper) or None if any
+                  corners are None
+        """
+        if self.are_any_corners_none() is True:
+            return None
+        return (self._right - self._left) * (self._lower - self._upper)
 
-        # case where this box is smaller and partially or wholly
-        # within larger box
-        c_list = self.get_list_of_tuple_of_corner_coordinates()
-        for c_tup in c_list:
-            if box.is_coordinate_in_box(c_tup) is True:
-                return True
 
+class BoxList(object):
+    """Compact collection of boxes stored as four integer arrays
+       (left, upper, right, lower) instead of a list of `Box`
+       objects. Bulk queries are plain Python loops over the arrays
+       that do not create any `Box` objects, they are not vectorized.
+       `Box` objects passed in are copied into the arrays and `Box`
+       objects returned are new copies, changing them does not
+       change the list.
+    """
+    TYPECODE = 'l'
+
+    def __init__(self, boxes=None):
+        """Constructor
+        :param boxes: optional iterable of `Box` objects to add
+        """
+        self._left = array(BoxList.TYPECODE)
+        self._upper = array(BoxList.TYPECODE)
+        self._right = array(BoxList.TYPECODE)
+        self._lower = array(BoxList.TYPECODE)
+        if boxes is not None:
+            for box in boxes:
+                self.append(box)
+
+    def __len__(self):
+        return len(self._left)
+
+    def append(self, box):
+        """Adds `box` to end of list
+        :param box: Box to add
+        :raises ValueError: if any corners of `box` are None
+        """
+        if box is None or box.are_any_corners_none():
+            raise ValueError('Box cannot have None corners')
+        (left, upper, right, lower) = box.get_box_as_tuple()
+        self._left.append(left)
+        self._upper.append(upper)
+        self._right.append(right)
+        self._lower.append(lower)
+
+    def get_box(self, index):
+        """Gets copy of box at `index`
+        :param index: index of box
+        :returns: new Box with coordinates copied from the arrays
+        """
+        return Box(left=self._left[index], upper=self._upper[index],
+                   right=self._right[index], lower=self._lower[index])
+
+    def get_intersecting_indexes(self, box):
+        """Gets indexes of boxes that intersect `box` using the same
+           inclusive edge rules as `Box.does_box_intersect`
+        :param box: Box to check
+        :returns: list of int indexes
+        """
+        if box is None or box.are_any_corners_none():
+            return []
+        (left, upper, right, lower) = box.get_box_as_tuple()
+        return [i for i, (bl, bu, br, bo) in
+                enumerate(zip(self._left, self._upper,
+                              self._right, self._lower))
+                if bl <= right and left <= br and
+                bu <= lower and upper <= bo]
+
+    def does_box_intersect_any(self, box):
+        """Checks if `box` intersects any box in this list
+        :param box: Box to check
+        :returns: True if it does, False otherwise
+        """
+        if box is None or box.are_any_corners_none():
+            return False
+        (left, upper, right, lower) = box.get_box_as_tuple()
+        return any(bl <= right and left <= br and
+                   bu <= lower and upper <= bo
+                   for bl, bu, br, bo in zip(self._left, self._upper,
+                                             self._right, self._lower))
+
+    def get_containing_indexes(self, coordinate_tuple):
+        """Gets indexes of boxes that contain coordinate using the same
+           inclusive edge rules as `Box.is_coordinate_in_box`
+        :param coordinate_tuple: tuple containing 2 ints (x, y)
+        :returns: list of int indexes
+        """
+        if coordinate_tuple is None:
+            return []
+        x = int(coordinate_tuple[0])
+        y = int(coordinate_tuple[1])
+        return [i for i, (bl, bu, br, bo) in
+                enumerate(zip(self._left, self._upper,
+                              self._right, self._lower))
+                if bl <= x <= br and bu <= y <= bo]
+
+    def get_areas(self):
+        """Gets area of every box
+        :returns: array of areas in same order as boxes
+        """
+        areas = array(BoxList.TYPECODE)
+        for bl, bu, br, bo in zip(self._left, self._upper,
+                                  self._right, self._lower):
+            areas.append((br - bl) * (bo - bu))
+        return areas
+
+    def get_total_area(self):
+        """Gets sum of area of all boxes, overlapping regions are
+           counted once per box
+        :returns: int
+        """
+        return sum(self.get_areas())
+
+
+class BoxGridIndex(object):
+    """Spatial index of `Box` objects that buckets boxes into a uniform
+       grid of cells so checking a new box for intersection only
+       compares it with boxes in the cells it covers instead of every
+       box added. Works best when cell size is close to box size.
+       Each cell holds its boxes in a `BoxList`
+    """
+    def __init__(self, cell_width, cell_height):
+        """Constructor
+        :param cell_width: width of grid cell in pixels
+        :param cell_height: height of grid cell in pixels
+        """
+        self._cell_width = max(int(cell_width), 1)
+        self._cell_height = max(int(cell_height), 1)
+        self._cells = {}
+        self._count = 0
+
+    def _get_cell_keys(self, box):
+        """Gets keys of all cells `box` covers. Box edges are
+           inclusive, matching `Box.does_box_intersect`
+        :param box: Box with no None corners
+        :returns: list of (column, row) tuples
+        """
+        (left, upper, right, lower) = box.get_box_as_tuple()
+        keys = []
+        for row in range(upper // self._cell_height,
+                         (lower // self._cell_height) + 1):
+            for col in range(left // self._cell_width,
+                             (right // self._cell_width) + 1):
+                keys.append((col, row))
+        return keys
+
+    def add_box(self, box):
+        """Adds `box` to index, boxes with None corners are ignored
+        :param box: Box to add
+        """
+        if box is None or box.are_any_corners_none():
+            return
+        for key in self._get_cell_keys(box):
+            if key not in self._cells:
+                self._cells[key] = BoxList()
+            self._cells[key].append(box)
+        self._count += 1
+
+    def get_box_count(self):
+        """Gets number of boxes added
+        :returns: int
+        """
+        return self._count
+
+    def does_box_intersect_any(self, box):
+        """Checks if `box` intersects any box in the index
+        :param box: Box to check
+        :returns: True if it does, False otherwise
+        """
+        if box is None or box.are_any_corners_none():
+            return False
+        for key in self._get_cell_keys(box):
+            if key not in self._cells:
+                continue
+            if self._cells[key].does_box_intersect_any(box) is True:
+                return True
         return False
@@ -4,12 +4,19 @@ import sys
 import os
 import argparse
 import logging
+import multiprocessing
+import hashlib
+import shutil
+import configparser
 import chmutil
 from PIL import Image
 from PIL import ImageOps
 from PIL import ImageFilter
 
 from chmutil.image import RowColumnImageTileGenerator
+from chmutil.image import ImagePyramidTileGenerator
+from chmutil.image import ParallelTileWriter
+from chmutil import image
 from chmutil.core import Parameters
 from chmutil import core
 
@@ -19,6 +26,17 @@ LOG_FORMAT = "%(asctime)-15s %(levelname)s (%(process)d) %(name)s %(message)s"
 logger = logging.getLogger('chmutil.createchmimage')
 
 
+HISTOGRAM_CACHE = 'stackhistogram.cfg'
+"""Name of file in output directory where the histogram computed
+   with --stackequalize is cached
+"""
+
+HISTOGRAM_SECTION = 'histogram'
+NUMIMAGES_KEY = 'numimages'
+SIGNATURE_KEY = 'signature'
+COUNTS_KEY = 'counts'
+
+
 class NoInputImageFoundError(Exception):
     """Raised if input image does not exist
     """
@@ -33,10 +51,13 @@ def _parse_arguments(desc, args):
     help_formatter = argparse.RawDescriptionHelpFormatter
     parser = argparse.ArgumentParser(description=desc,
                                      formatter_class=help_formatter)
-    parser.add_argument("image", help='Image to convert')
+    parser.add_argument("image", help='Image to convert or directory of '
+                                      'images to convert')
     parser.add_argument("output", help='Output image path, should have .png'
                                        ' extension, if not .png will be '
-                                       'appended')
+                                       'appended. If <image> is a '
+                                       'directory this is the output '
+                                       'directory')
     parser.add_argument("--equalize", action='store_true',
                         help='Run ImageOps.equalize on image'
                              'with no mask')
@@ -52,9 +73,56 @@ def _parse_arguments(desc, args):
     parser.add_argument("--gentiles", action='store_true',
                         help='Generate image tiles of size --tilesize'
                              ' storing results in <output> directory')
+    parser.add_argument("--genpyramid", action='store_true',
+                        help='Like --gentiles, but also generates tiles for '
+                             'downsampled zoom levels where each level '
+                             'is half the size of the previous level until '
+                             'the image fits in a single tile. Tiles are '
+                             'written to <zoom>/<row>_<col>.png where zoom '
+                             '0 is the smallest level and the highest zoom '
+                             'is full resolution, partial edge tiles are '
+                             'included. A ' + image.PYRAMID_DESCRIPTOR +
+                             ' file with the tile size and size of each '
+                             'level is written once all tiles are done')
     parser.add_argument("--tilesize", type=int, default=128,
-                        help='Sets tile size in pixels if --gentiles is set.'
-                             '(default 128)')
+                        help='Sets tile size in pixels if --gentiles or '
+                             '--genpyramid is set. (default 128)')
+    parser.add_argument("--threads", type=int, default=4,
+                        help='Number of threads used to encode and write '
+                             'tiles if --gentiles or --genpyramid is set. '
+                             '(default 4)')
+    parser.add_argument("--pngcompresslevel", type=int, default=6,
+                        choices=range(0, 10),
+                        help='zlib compression level (0-9) for png tiles. '
+                             'Lower values are faster, but produce '
+                             'larger files (default 6)')
+    parser.add_argument("--pngstrategy", default='default',
+                        choices=sorted(ParallelTileWriter.PNG_STRATEGIES
+                                       .keys()),
+                        help='zlib compression strategy for png tiles. '
+                             'rle is fast and works well for images with '
+                             'large uniform regions such as probability '
+                             'maps (default default)')
+    parser.add_argument("--tilearchive", action='store_true',
+                        help='Instead of writing tiles to <output> '
+                             'directory, store them in a single '
+                             'uncompressed zip file <output>.zip')
+    parser.add_argument("--suffix", default=None,
+                        help='If <image> is a directory, only convert '
+                             'files ending with this suffix ie .tif '
+                             '(default all files)')
+    parser.add_argument("--stackequalize", action='store_true',
+                        help='If <image> is a directory, equalize using '
+                             'a histogram computed across all images '
+                             'in the stack instead of per image. The '
+                             'histogram is cached in <output>/' +
+                             HISTOGRAM_CACHE + ' and reused on reruns '
+                             'if the images are unchanged')
+    parser.add_argument("--processes", type=int,
+                        default=multiprocessing.cpu_count(),
+                        help='If <image> is a directory, number of '
+                             'images to convert in parallel '
+                             '(default number of cpus)')
     parser.add_argument("--log", dest="loglevel", choices=['DEBUG',
                         'INFO', 'WARNING', 'ERROR', 'CRITICAL'],
                         help="Set the logging level (default WARNING)",
@@ -65,8 +133,13 @@ def _parse_arguments(desc, args):
     return parser.parse_args(args, namespace=parsed_arguments)
 
 
-def _convert_image(image_file, dest_file, theargs):
+def _convert_image(image_file, dest_file, theargs, lut=None):
     """Convert image
+    :param image_file: image to convert
+    :param dest_file: output path
+    :param theargs: parameters from _parse_arguments
+    :param lut: lookup table to apply instead of the one computed
+                from the image for --equalize and --autocontrast
     :raises NoInputImageFoundError: if input image file does not exist
     """
     if not os.path.isfile(image_file):
@@ -78,13 +151,14 @@ def _convert_image(image_file, dest_file, theargs):
     logger.info('Running ImageOps.grayscale')
     img = ImageOps.grayscale(img)
 
-    if theargs.equalize is True:
-        logger.info('Running ImageOps.equalize')
-        img = ImageOps.equalize(img)
-
-    if theargs.autocontrast is True:
-        logger.info('Running ImageOps.autocontrast')
-        img = ImageOps.autocontrast(img)
+    # equalize and autocontrast are combined into a single lookup table
+    if lut is None:
+        lut = image.get_point_lut(img.histogram(),
+                                  equalize=theargs.equalize,
+                                  autocontrast=theargs.autocontrast)
+    if lut is not None:
+        logger.info('Running equalize/autocontrast lookup table')
+        img = img.point(lut)
 
     if theargs.gaussianblur:
         logger.info('Running Image.filter Gaussian Blur')
@@ -95,42 +169,316 @@ def _convert_image(image_file, dest_file, theargs):
         logger.info('Downsampling by factor of ' + str(ds))
         img = img.resize((int(img.size[0]/ds), int(img.size[1]/ds)))
 
-    if theargs.gentiles:
+    if theargs.gentiles or theargs.genpyramid:
         logger.info('Generating tiles of size: ' + str(theargs.tilesize) +
                     ' pixels')
-        outpath = os.path.abspath(theargs.output)
-
-        if not os.path.isdir(outpath):
-            logger.info('Creating directory: ' + outpath)
-            os.makedirs(outpath, mode=0o755)
-        return _generate_tiles(img, theargs.tilesize, outpath)
+        outpath = dest_file
+        if theargs.tilearchive is True:
+            if not outpath.endswith('.zip'):
+                outpath += '.zip'
+        # tiles are written to a temporary path that is renamed once
+        # every tile is written so partially written tiles are not
+        # mistaken as done when resuming a stack conversion. Tiles are
+        # written directly to a tile directory that already exists
+        tmp_path = None
+        writepath = outpath
+        if theargs.tilearchive is True or not os.path.isdir(outpath):
+            tmp_path = outpath + '.tmp'
+            _remove_path(tmp_path)
+            writepath = tmp_path
+        if theargs.tilearchive is not True and not os.path.isdir(writepath):
+            logger.info('Creating directory: ' + writepath)
+            os.makedirs(writepath, mode=0o755)
+        writer = ParallelTileWriter(writepath, numthreads=theargs.threads,
+                                    compress_level=theargs.pngcompresslevel,
+                                    strategy=theargs.pngstrategy,
+                                    archive=theargs.tilearchive)
+        if theargs.genpyramid:
+            try:
+                image.write_image_pyramid(img, ImagePyramidTileGenerator(
+                    theargs.tilesize), writer)
+            finally:
+                writer.close()
+            retval = 0
+        else:
+            retval = _generate_tiles(img, theargs.tilesize, writepath,
+                                     writer=writer)
+        if tmp_path is not None:
+            os.rename(tmp_path, outpath)
+        return retval
 
     if not dest_file.endswith('.png'):
         dest_file += '.png'
-    img.save(dest_file, "PNG")
+
+    # write to temp file and rename so partially written images
+    # are not mistaken as done when resuming a stack conversion
+    tmp_file = dest_file + '.tmp'
+    img.save(tmp_file, "PNG")
+    os.rename(tmp_file, dest_file)
     return 0
 
 
-def _generate_tiles(img, tilesize, output):
+def _remove_path(path):
+    """Removes file or directory `path` if it exists
+    """
+    if os.path.isdir(path):
+        logger.info('Removing partially written directory: ' + path)
+        shutil.rmtree(path)
+    elif os.path.isfile(path):
+        logger.info('Removing partially written file: ' + path)
+        os.unlink(path)
+
+
+def _get_stack_dest_file(image_file, output_dir, theargs):
+    """Gets output path for `image_file` when converting a stack.
+       The suffix of `image_file` is replaced with .png unless tiles
+       are being generated in which case the suffix is removed.
+    :param image_file: path to input image
+    :param output_dir: output directory
+    :param theargs: parameters from _parse_arguments
+    :returns: path to output file or tile directory
+    """
+    prefix = os.path.splitext(os.path.basename(image_file))[0]
+    dest_file = os.path.join(output_dir, prefix)
+    if theargs.gentiles or theargs.genpyramid:
+        if theargs.tilearchive is True:
+            return dest_file + '.zip'
+        return dest_file
+    return dest_file + '.png'
+
+
+def _convert_stack_image(task):
+    """Converts a single image of a stack, this is the function
+       invoked by `multiprocessing.Pool` in `_convert_stack`
+    :param task: tuple (image_file, dest_file, theargs, lut)
+    :returns: tuple (image_file, exit code, error message or None)
+    """
+    (image_file, dest_file, theargs, lut) = task
+    try:
+        return image_file, _convert_image(image_file, dest_file,
+                                          theargs, lut=lut), None
+    except Exception as e:
+        logger.exception('Caught exception converting ' + image_file)
+        return image_file, 1, str(e)
+
+
+def _get_image_histogram(image_file):
+    """Gets histogram of grayscale version of image, this is the
+       function invoked by `multiprocessing.Pool` in
+       `_get_stack_histogram`
+    :param image_file: path to image
+    :returns: list of 256 pixel counts
+    """
+    img = Image.open(image_file)
+    try:
+        gray = ImageOps.grayscale(img)
+        hist = gray.histogram()
+        gray.close()
+        return hist
+    finally:
+        img.close()
+
+
+def _get_image_list_signature(image_list):
+    """Gets hash of sorted names, sizes, and modification times of
+       images in `image_list` so a cached histogram is only reused
+       when the images it was computed from are unchanged
+    :param image_list: list of image paths
+    :returns: hex digest string
+    """
+    sig = hashlib.sha1()
+    for image_file in sorted(image_list):
+        st = os.stat(image_file)
+        sig.update((os.path.basename(image_file) + '\t' + str(st.st_size) +
+                    '\t' + repr(st.st_mtime) + '\n').encode('utf-8'))
+    return sig.hexdigest()
+
+
+def _load_histogram_cache(cache_file, numimages, signature):
+    """Loads histogram written by `_write_histogram_cache`
+    :param cache_file: path to cache file
+    :param numimages: number of images expected in cached histogram
+    :param signature: value from `_get_image_list_signature` expected
+                      in cached histogram
+    :returns: list of 256 pixel counts or None if `cache_file` does not
+              exist, cannot be parsed, or was computed from different
+              images
+    """
+    if not os.path.isfile(cache_file):
+        return None
+    try:
+        config = configparser.ConfigParser()
+        config.read(cache_file)
+        if config.getint(HISTOGRAM_SECTION, NUMIMAGES_KEY) != numimages:
+            logger.warning('Ignoring ' + cache_file + ' since it was '
+                           'computed from a different number of images')
+            return None
+        if config.get(HISTOGRAM_SECTION, SIGNATURE_KEY) != signature:
+            logger.warning('Ignoring ' + cache_file + ' since images were '
+                           'added, removed, or modified since it was '
+                           'computed')
+            return None
+        hist = [int(val) for val in
+                config.get(HISTOGRAM_SECTION, COUNTS_KEY).split(',')]
+        if len(hist) != 256:
+            logger.warning('Ignoring ' + cache_file + ' since it does '
+                           'not have 256 counts')
+            return None
+        return hist
+    except (configparser.Error, ValueError):
+        logger.exception('Unable to parse ' + cache_file)
+        return None
+
+
+def _write_histogram_cache(cache_file, hist, numimages, signature):
+    """Writes histogram `hist` to `cache_file` in configparser format
+    :param cache_file: path to write to
+    :param hist: list of 256 pixel counts
+    :param numimages: number of images used to compute `hist`
+    :param signature: value from `_get_image_list_signature` for images
+                      used to compute `hist`
+    """
+    config = configparser.ConfigParser()
+    config.add_section(HISTOGRAM_SECTION)
+    config.set(HISTOGRAM_SECTION, NUMIMAGES_KEY, str(numimages))
+    config.set(HISTOGRAM_SECTION, SIGNATURE_KEY, signature)
+    config.set(HISTOGRAM_SECTION, COUNTS_KEY,
+               ','.join([str(val) for val in hist]))
+    f = open(cache_file, 'w')
+    try:
+        config.write(f)
+    finally:
+        f.close()
+
+
+def _get_stack_histogram(image_list, output_dir, processes):
+    """Gets histogram summed across all images in `image_list`.
+       Histograms for each image are computed on a pool of `processes`
+       processes and added up as they arrive so only one histogram per
+       process is held in memory. The result is cached in `output_dir`
+       and loaded from there on later calls as long as the names,
+       sizes, and modification times of the images are unchanged.
+    :param image_list: list of image paths
+    :param output_dir: directory where cache file is stored
+    :param processes: number of processes to use
+    :returns: list of 256 pixel counts
+    """
+    cache_file = os.path.join(output_dir, HISTOGRAM_CACHE)
+    signature = _get_image_list_signature(image_list)
+    hist = _load_histogram_cache(cache_file, len(image_list), signature)
+    if hist is not None:
+        logger.info('Using histogram cached in ' + cache_file)
+        return hist
+
+    logger.info('Computing histogram of ' + str(len(image_list)) +
+                ' images')
+    hist = [0] * 256
+    if processes <= 1 or len(image_list) <= 1:
+        results = map(_get_image_histogram, image_list)
+        pool = None
+    else:
+        pool = multiprocessing.Pool(processes=processes)
+        results = pool.imap_unordered(_get_image_histogram, image_list)
+    try:
+        for imghist in results:
+            for i in range(256):
+                hist[i] += imghist[i]
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    _write_histogram_cache(cache_file, hist, len(image_list), signature)
+    return hist
+
+
+def _convert_stack(image_dir, output_dir, theargs):
+    """Converts every image in `image_dir` writing results to
+       `output_dir` using a pool of `theargs.processes` processes.
+       Images whose output already exists are skipped so an
+       interrupted conversion can be resumed by rerunning this.
+       Output is written to a .tmp path and renamed once complete so
+       images that failed or were killed part way are converted again
+    :param image_dir: directory of images to convert
+    :param output_dir: directory to write output, created if needed
+    :param theargs: parameters from _parse_arguments
+    :returns: 0 upon success or 1 if any image failed to convert
+    """
+    if not os.path.isdir(output_dir):
+        logger.info('Creating directory: ' + output_dir)
+        os.makedirs(output_dir, mode=0o755)
+
+    image_list = sorted(image.get_image_path_list(image_dir,
+                                                  theargs.suffix))
+    lut = None
+    if theargs.stackequalize is True:
+        hist = _get_stack_histogram(image_list, output_dir,
+                                    theargs.processes)
+        lut = image.get_point_lut(hist, equalize=True,
+                                  autocontrast=theargs.autocontrast)
+
+    tasks = []
+    skipped = 0
+    for image_file in image_list:
+        dest_file = _get_stack_dest_file(image_file, output_dir, theargs)
+        if os.path.exists(dest_file):
+            skipped += 1
+            continue
+        tasks.append((image_file, dest_file, theargs, lut))
+
+    logger.info('Converting ' + str(len(tasks)) + ' images, skipping ' +
+                str(skipped) + ' images that already have output')
+
+    if theargs.processes <= 1 or len(tasks) <= 1:
+        results = map(_convert_stack_image, tasks)
+        pool = None
+    else:
+        pool = multiprocessing.Pool(processes=theargs.processes)
+        results = pool.imap_unordered(_convert_stack_image, tasks)
+
+    failed = 0
+    try:
+        for image_file, retval, msg in results:
+            if retval != 0:
+                failed += 1
+                sys.stderr.write('Error converting ' + image_file + ' : ' +
+                                 str(msg) + '\n')
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    if failed > 0:
+        logger.error(str(failed) + ' of ' + str(len(tasks)) +
+                     ' images failed to convert')
+        return 1
+    return 0
+
+
+def _generate_tiles(img, tilesize, output, tilegen=None, writer=None):
     """Generates square tiles from image of size `tilesize`
        storing results in `output` directory
     :param img: PIL image
     :param tilesize: size of tiles as int in pixels ie 128
     :param output: output directory to write results to. If directory
                    does not exist, it will be created.
-    :param includepartialtiles: boolean if True then code will output
-                                tiles with only partial data. Size of
-                                output tiles will be set b
+    :param tilegen: generator with get_image_tiles() method to use, if
+                    None `RowColumnImageTileGenerator` with lazy tiles
+                    is used so cropping happens on the writer threads
+    :param writer: `ParallelTileWriter` to write tiles with, if None
+                   one is created that writes to `output` directory.
+                   This method closes the writer.
     :returns: 0 upon success or non zero for error
     """
-    tilegen = RowColumnImageTileGenerator(tilesize)
-    zoom = '0'
-    for tile in tilegen.get_image_tiles(img):
-        name = (zoom + '-r' + str(tile.get_row()) + '_c' +
-                str(tile.get_col()) + '.png')
-        fp = os.path.join(output, name)
-        tile.get_image().save(fp)
-        tile.get_image().close()
+    if tilegen is None:
+        tilegen = RowColumnImageTileGenerator(tilesize, lazy=True)
+    if writer is None:
+        writer = ParallelTileWriter(output)
+    try:
+        for tile in tilegen.get_image_tiles(img):
+            writer.add_tile(image.get_tile_file_name(tile), tile)
+    finally:
+        writer.close()
     return 0
 
 
@@ -149,6 +497,20 @@ def main(arglist):
 
               By default only the conversion ot grayscale is performed.
 
+              If <image> is a directory, every image in the directory
+              (filtered by --suffix) is converted on --processes
+              processes with results written to <output> directory.
+              Images that already have output are skipped so an
+              interrupted run can be resumed by running the same
+              command again.
+
+              If --stackequalize is set along with a directory for
+              <image>, the histograms of all images are added together
+              and a single equalize (and autocontrast if set) lookup
+              table is applied to every image giving consistent
+              contrast across the stack. The summed histogram is
+              cached in <output>/{cache}
+
               Please note, regardless of order of optional flags the
               operations are performed in this order:
 
@@ -157,13 +519,20 @@ def main(arglist):
               3. AutoContrast
               4. GaussianBlur
               5. Downsample
-              6. Generate Tiles
+              6. Generate Tiles (or pyramid of tiles if --genpyramid set)
+
+              Tiles are png encoded and written by --threads threads.
+              The zlib settings used can be adjusted with
+              --pngcompresslevel and --pngstrategy. If --tilearchive
+              is set tiles are stored in a single zip file.
 
               Example Usage:
 
               createchmimage.py someimage.tif someimage.png
 
-              """.format(version=chmutil.__version__)
+              createchmimage.py --suffix .tif --equalize imagedir outdir
+
+              """.format(version=chmutil.__version__, cache=HISTOGRAM_CACHE)
 
     theargs = _parse_arguments(desc, arglist[1:])
     theargs.program = arglist[0]
@@ -171,6 +540,10 @@ def main(arglist):
     core.setup_logging(logger, log_format=LOG_FORMAT,
                        loglevel=theargs.loglevel)
     try:
+        if os.path.isdir(theargs.image):
+            return _convert_stack(os.path.abspath(theargs.image),
+                                  os.path.abspath(theargs.output),
+                                  theargs)
         return _convert_image(os.path.abspath(theargs.image),
                               os.path.abspath(theargs.output),
                               theargs)
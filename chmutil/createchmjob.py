@@ -11,6 +11,7 @@ from chmutil.core import CHMConfig
 from chmutil.core import Parameters
 from chmutil.cluster import ClusterFactory
 from chmutil import core
+from chmutil import image
 
 # create logger
 logger = logging.getLogger('chmutil.createchmjob')
@@ -54,6 +55,44 @@ def _parse_arguments(desc, args):
     parser.add_argument('--gentifs', action='store_true',
                         help='If set, probability map images will be saved as'
                              'tif files with .tif appended to file name')
+    parser.add_argument('--tiledtifs', action='store_true',
+                        help='If set, probability map images will be saved '
+                             'as tiled deflate compressed BigTIFF files '
+                             'with tiles aligned to the CHM tile grid so '
+                             'regions can be read without decoding the '
+                             'whole image. Implies --gentifs')
+    parser.add_argument('--chunkstore', action='store_true',
+                        help='If set, merge tasks also write probability '
+                             'maps into a Zarr style chunk store '
+                             'directory of zlib compressed chunks, with '
+                             'one section per image, so whole volume '
+                             'regions can be read without decoding every '
+                             'probability map')
+    parser.add_argument('--pyramids', action='store_true',
+                        help='If set, merge tasks also write a zoom pyramid '
+                             'of png tiles of each probability map to '
+                             + os.path.join(CHMJobCreator.RUN_DIR,
+                                            CHMJobCreator.PYRAMIDS_DIR,
+                                            '<image>') +
+                             ' laid out as <zoom>/<row>_<col>.png, zoom 0 '
+                             'being the smallest level, with a ' +
+                             image.PYRAMID_DESCRIPTOR + ' file describing '
+                             'the levels')
+    parser.add_argument('--pyramidtilesize', default=128, type=int,
+                        help='Size of pyramid tiles in pixels if '
+                             '--pyramids is set (default 128)')
+    parser.add_argument('--croptiles', action='store_true',
+                        help='If set, each CHM task saves only the part of '
+                             'the probability map covered by its tiles '
+                             'along with its offset instead of a full size '
+                             'image. The merge phase pastes the crops '
+                             'together')
+    parser.add_argument('--stageinput', action='store_true',
+                        help='If set, CHM tasks copy their input image '
+                             'to the node local scratch directory once '
+                             'per node and share it. Each task writes its '
+                             'result to scratch and moves it to the job '
+                             'directory as soon as it finishes')
     parser.add_argument('--tilespertask', '--jobspertask', dest='tilespertask',
                         default='50', type=int,
                         help='Number of tiles to run per task. Lower numbers '
@@ -122,7 +161,13 @@ def _create_chm_job(theargs):
                         version=chmutil.__version__,
                         cluster=theargs.cluster,
                         rawargs=theargs.rawargs,
-                        gentifs=theargs.gentifs)
+                        gentifs=theargs.gentifs or theargs.tiledtifs,
+                        tiledtifs=theargs.tiledtifs,
+                        chunkstore=theargs.chunkstore,
+                        pyramids=theargs.pyramids,
+                        pyramid_tile_size=theargs.pyramidtilesize,
+                        croptiles=theargs.croptiles,
+                        stageinput=theargs.stageinput)
 
         creator = CHMJobCreator(con)
         creator.create_job()
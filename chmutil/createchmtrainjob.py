@@ -10,6 +10,10 @@ import chmutil
 from chmutil.core import Parameters
 from chmutil.cluster import SchedulerFactory
 from chmutil import core
+from chmutil.image import ImageTile
+from chmutil.image import ParallelTileWriter
+from chmutil.mrc import MRCReader
+from chmutil.mrc import MRCError
 
 # create logger
 logger = logging.getLogger('chmutil.createchmtrainjob')
@@ -111,8 +115,7 @@ def _parse_arguments(desc, args):
     parser = argparse.ArgumentParser(description=desc,
                                      formatter_class=help_formatter)
     parser.add_argument("images", help='Directory of images or mrc file,'
-                                       'mrc file requires IMOD to'
-                                       'be installed and mod file to be'
+                                       'mrc file requires mod file to be'
                                        'passed into <labels>')
     parser.add_argument("labels", help='Directory containing label images or '
                                        'mod file. mod file can only be passed'
@@ -155,6 +158,14 @@ def _parse_arguments(desc, args):
                              'Only needed if mrc and mod files are'
                              'passed into <images> and <labels> '
                              '(default \'\')')
+    parser.add_argument('--usemrc2tif', action='store_true',
+                        help='Use IMOD mrc2tif to convert mrc files to '
+                             'png images instead of reading them '
+                             'directly. mrc2tif is also used if mrc '
+                             'file is not 8 or 16 bit unsigned')
+    parser.add_argument('--threads', type=int, default=4,
+                        help='Number of threads used to write png images '
+                             'when reading mrc files directly (default 4)')
     parser.add_argument('--version', action='version',
                         version=('%(prog)s ' + chmutil.__version__))
 
@@ -248,6 +259,69 @@ def _create_directories_and_readme(outdir, rawargs):
     return
 
 
+def _write_mrc_as_png_files(mrc_file, outroot, numthreads=4):
+    """Writes every section of `mrc_file` as png files named
+    <outroot>.###.png (zero padded to at least 3 digits) which is the
+    naming used by mrc2tif -p. The mrc file is read sequentially
+    through a memory map and sections are encoded and written on
+    `numthreads` threads.
+    :param mrc_file: path to mrc file
+    :param outroot: path prefix of output files
+    :param numthreads: number of threads to encode and write png files
+    :raises MRCError: if `mrc_file` is not a supported mrc file
+    :raises IOError: if `mrc_file` cannot be opened
+    """
+    reader = MRCReader(mrc_file)
+    try:
+        nz = reader.get_dimensions()[2]
+        width = max(3, len(str(nz - 1)))
+        prefix = os.path.basename(outroot)
+        writer = ParallelTileWriter(os.path.dirname(outroot),
+                                    numthreads=numthreads)
+        try:
+            for z in range(nz):
+                writer.add_tile(prefix + '.' + str(z).zfill(width) + '.png',
+                                ImageTile(reader.get_section_image(z)))
+        finally:
+            writer.close()
+        logger.debug('Wrote ' + str(nz) + ' png files from ' + mrc_file)
+    finally:
+        reader.close()
+
+
+def _convert_mrc_to_png_files(theargs, mrc_file, outroot):
+    """Converts `mrc_file` to png files named <outroot>.###.png reading
+    the mrc file directly unless theargs.usemrc2tif is True or the
+    mrc file cannot be read directly in which case IMOD mrc2tif -p is
+    used
+    :param theargs: Parameters from _parse_arguments function
+    :param mrc_file: path to mrc file
+    :param outroot: path prefix of output files
+    :raises IMODConversionError: if mrc2tif fails
+    """
+    if theargs.usemrc2tif is False:
+        try:
+            _write_mrc_as_png_files(mrc_file, outroot,
+                                    numthreads=theargs.threads)
+            return
+        except (MRCError, IOError, OSError) as e:
+            logger.warning('Unable to read ' + mrc_file + ' directly, '
+                           'falling back to mrc2tif : ' + str(e))
+
+    tmp_dir = os.path.join(theargs.outdir, TMP_DIR)
+    mrc2tif = os.path.join(theargs.imodbindir, 'mrc2tif')
+    logger.debug('Running ' + mrc2tif)
+    ecode, out, err = core.run_external_command((mrc2tif + ' -p ' +
+                                                mrc_file + ' ' +
+                                                outroot), tmp_dir)
+    logger.debug('Output from ' + mrc2tif + ': ' + str(out) + ':' + str(err))
+
+    if ecode is not 0:
+        raise IMODConversionError('Non zero exit code from mrc2tif: ' +
+                                  str(ecode) + ' : ' + str(out) + ' : ' +
+                                  str(err))
+
+
 def _convert_mod_mrc_files(theargs):
     """Check if images and labels are mrc and mod files, if yes
     use IMOD to convert them to images and labels
@@ -278,19 +352,8 @@ def _convert_mod_mrc_files(theargs):
 
     os.makedirs(images_dir, mode=0o755)
 
-    mrc2tif = os.path.join(theargs.imodbindir, 'mrc2tif')
-
-    logger.debug('Running ' + mrc2tif)
-    imageoutpath = os.path.join(images_dir, 'x')
-    ecode, out, err = core.run_external_command((mrc2tif + ' -p ' +
-                                                theargs.images + ' ' +
-                                                imageoutpath), tmp_dir)
-    logger.debug('Output from ' + mrc2tif + ': ' + str(out) + ':' + str(err))
-
-    if ecode is not 0:
-        raise IMODConversionError('Non zero exit code from mrc2tif: ' +
-                                  str(ecode) + ' : ' + str(out) + ' : ' +
-                                  str(err))
+    _convert_mrc_to_png_files(theargs, theargs.images,
+                              os.path.join(images_dir, 'x'))
 
     if not os.path.isfile(theargs.labels):
         raise IMODConversionError(theargs.labels +
@@ -315,16 +378,8 @@ def _convert_mod_mrc_files(theargs):
                                   str(ecode) + ' : ' + str(out) + ' : ' +
                                   str(err))
 
-    ecode, out, err = core.run_external_command((mrc2tif + ' -p ' +
-                                                tmp_mrc + ' ' +
-                                                os.path.join(labels_dir,
-                                                             'x')), tmp_dir)
-    logger.debug('Output from mrc2tif: ' + str(out) + ':' + str(err))
-
-    if ecode is not 0:
-        raise IMODConversionError('Non zero exit code from mrc2tif: ' +
-                                  str(ecode) + ' : ' + str(out) + ' : ' +
-                                  str(err))
+    _convert_mrc_to_png_files(theargs, tmp_mrc,
+                              os.path.join(labels_dir, 'x'))
     return images_dir, labels_dir
 
 
@@ -396,10 +451,12 @@ def main(arglist):
               images.mrc and put them in <outdir>/{images} directory and
               extract all labels from labels.mod and put them in
               <outdir>/{labels}/ directory giving them the name x.###.png.
-              createchmtrainjob.py does this by invoking mrc2tif -p on the
-              images.mrc and by invoking imodmop -mask 1 on the labels.mod
-              file followed by an mrc2tif -p on the mrc file created by
-              imodmop.
+              createchmtrainjob.py does this by reading the images.mrc
+              directly and by invoking imodmop -mask 1 on the labels.mod
+              file and then reading the mrc file created by imodmop.
+              If --usemrc2tif is set, or an mrc file is not 8 or 16 bit
+              unsigned data, mrc2tif -p is used to convert the mrc files
+              instead.
               """.format(version=chmutil.__version__,
                          stdout=STDOUT_DIR,
                          tmp=TMP_DIR,
@@ -9,6 +9,7 @@ import random
 import tempfile
 import shutil
 import configparser
+import multiprocessing
 from PIL import Image
 
 
@@ -16,11 +17,19 @@ from chmutil.core import Parameters
 from chmutil import core
 from chmutil import image
 from chmutil.core import Box
+from chmutil.core import BoxGridIndex
+from chmutil.image import ImageTile
+from chmutil.image import ParallelTileWriter
+from chmutil.mrc import MRCStackWriter
+from chmutil.mrc import MRCSectionWriter
 
 LOG_FORMAT = "%(asctime)-15s %(levelname)s (%(process)d) %(name)s %(message)s"
 
 IMAGEDIR_KEY = 'imagedir'
 
+RANDOM_SAMPLING = 'random'
+STRATIFIED_SAMPLING = 'stratified'
+
 # create logger
 logger = logging.getLogger('chmutil.createchmimage')
 
@@ -52,6 +61,16 @@ def _parse_arguments(desc, args):
                         help='Size of tiles in WxH format '
                              '(default 512x512)')
     parser.add_argument("--scratchdir", default='/tmp')
+    parser.add_argument("--processes", type=int, default=1,
+                        help='Number of images to extract tiles from in '
+                             'parallel. Each process holds one fully '
+                             'decoded compressed image in memory so '
+                             'memory used grows with this value '
+                             '(default 1)')
+    parser.add_argument("--usenewstack", action='store_true',
+                        help='Write tiles as tif files to --scratchdir '
+                             'and create mrc stack with IMOD newstack '
+                             'instead of writing mrc stack directly')
     parser.add_argument("--dontdeletescratch", action='store_true',
                         help='scratchdir will NOT be deleted if set')
     parser.add_argument("--log", dest="loglevel", choices=['DEBUG',
@@ -60,63 +79,93 @@ def _parse_arguments(desc, args):
                         default='WARNING')
     parser.add_argument("--seed", default=None,
                         help='Seed to use for random number generator')
+    parser.add_argument("--sampling", default=RANDOM_SAMPLING,
+                        choices=[RANDOM_SAMPLING, STRATIFIED_SAMPLING],
+                        help='How tiles are picked. ' + RANDOM_SAMPLING +
+                             ' picks tiles anywhere rejecting ones that '
+                             'overlap an existing tile. ' +
+                             STRATIFIED_SAMPLING + ' divides every image '
+                             'into a grid of cells at least the size of '
+                             'a tile and places each tile at a random '
+                             'location within a randomly chosen cell '
+                             'which never needs retries, but no more '
+                             'tiles than cells can be picked '
+                             '(default ' + RANDOM_SAMPLING + ')')
     parser.add_argument('--version', action='version',
                         version=('%(prog)s ' + chmutil.__version__))
 
     return parser.parse_args(args, namespace=parsed_arguments)
 
 
-def _pick_tile(img_path, tile_width, tile_height):
-    """picks a tile
+def _get_image_sizes(img_list):
+    """Gets size of every image in `img_list`. Pillow only reads
+       the image header on open so this does not decode the images
+    :param img_list: list of image paths
+    :returns: dict with image path as key and (width, height) as value
     """
-    img = None
-    try:
+    size_dict = {}
+    for img_path in img_list:
         img = Image.open(img_path)
-        xmax = img.size[0]-tile_width
-        ymax = img.size[1]-tile_height
-
-        xpos = random.randint(0, xmax)
-        ypos = random.randint(0, ymax)
-        logger.info('Rando tile: ' + img_path + ' x=' + str(xpos) +
-                    ' y='+str(ypos))
-        return Box(left=xpos, upper=ypos, right=xpos + tile_width,
-                   lower=ypos + tile_height)
-    finally:
-        if img is not None:
+        try:
+            size_dict[img_path] = img.size
+        finally:
             img.close()
+    return size_dict
 
 
-def _does_tile_intersect_any_other_tiles(tile_tuple_list, new_tile_tuple):
-    """check for intersection
+def _pick_tile(img_path, tile_width, tile_height, img_size=None):
+    """picks a tile
+    :param img_path: path to image
+    :param tile_width: width of tile
+    :param tile_height: height of tile
+    :param img_size: (width, height) of image, if None image is
+                     opened to get its size
+    :returns: Box
     """
-    for entry in tile_tuple_list:
-        if entry[0] == new_tile_tuple[0]:
-            if entry[1].does_box_intersect(new_tile_tuple[1]) is True:
-                logger.debug('Found intersecting tile')
-                return True
-    return False
+    if img_size is None:
+        img_size = _get_image_sizes([img_path])[img_path]
+    xmax = img_size[0]-tile_width
+    ymax = img_size[1]-tile_height
+
+    xpos = random.randint(0, xmax)
+    ypos = random.randint(0, ymax)
+    logger.info('Rando tile: ' + img_path + ' x=' + str(xpos) +
+                ' y='+str(ypos))
+    return Box(left=xpos, upper=ypos, right=xpos + tile_width,
+               lower=ypos + tile_height)
 
 
 def _pick_random_tiles(img_list, num_tiles, tile_width=512,
-                       tile_height=512,):
+                       tile_height=512, size_dict=None):
     """Using random generates a list of tuples with image path and tile
-    location
+    location. Tiles already picked are kept in a `BoxGridIndex` per
+    image so checking for overlap only looks at nearby tiles.
+    :param size_dict: dict of image path to (width, height), if None
+                      it is obtained via `_get_image_sizes`
     :returns: nested tuple (image path, (left, upper, right, and lower))
     """
     logger.info("Tile Width: " + str(tile_width) + " Tile Height: " +
                 str(tile_height))
 
+    if size_dict is None:
+        size_dict = _get_image_sizes(img_list)
+
     num_images = len(img_list)
     tile_tuple_list = []
+    index_dict = {}
     intersect_tile_count = 0
     while len(tile_tuple_list) < num_tiles:
         the_img = img_list[random.randint(0, num_images-1)]
-        tile_box = _pick_tile(the_img, tile_width, tile_height)
-        new_tile_tuple = the_img, tile_box
-        if _does_tile_intersect_any_other_tiles(tile_tuple_list,
-                                                new_tile_tuple) is False:
-            tile_tuple_list.append(new_tile_tuple)
+        tile_box = _pick_tile(the_img, tile_width, tile_height,
+                              img_size=size_dict[the_img])
+        if the_img not in index_dict:
+            index_dict[the_img] = BoxGridIndex(tile_width, tile_height)
+        box_index = index_dict[the_img]
+        if box_index.does_box_intersect_any(tile_box) is False:
+            box_index.add_box(tile_box)
+            tile_tuple_list.append((the_img, tile_box))
         else:
+            logger.debug('Found intersecting tile')
             intersect_tile_count += 1
             if intersect_tile_count >= ((num_tiles*10) + 1000):
                 logger.error('Having problems finding non intersecting '
@@ -128,6 +177,55 @@ def _pick_random_tiles(img_list, num_tiles, tile_width=512,
     return tile_tuple_list
 
 
+def _pick_stratified_tiles(img_list, num_tiles, tile_width=512,
+                           tile_height=512, size_dict=None):
+    """Divides each image into a grid of cells, each at least one
+    pixel larger than a tile in each dimension, then picks `num_tiles`
+    cells at random and places a tile at a random position within each
+    cell. Since tiles stay inside their cell they never intersect
+    so no retries are needed.
+    :param size_dict: dict of image path to (width, height), if None
+                      it is obtained via `_get_image_sizes`
+    :returns: nested tuple (image path, (left, upper, right, and lower))
+              or None if there are fewer cells than `num_tiles`
+    """
+    if size_dict is None:
+        size_dict = _get_image_sizes(img_list)
+
+    # cells are one pixel bigger than tile since Box edges are
+    # inclusive and tiles in adjacent cells must not touch
+    cell_list = []
+    for img_path in img_list:
+        (width, height) = size_dict[img_path]
+        numcols = (width + 1) // (tile_width + 1)
+        numrows = (height + 1) // (tile_height + 1)
+        for row in range(numrows):
+            for col in range(numcols):
+                cell_list.append((img_path, col, row, numcols, numrows))
+
+    if len(cell_list) < num_tiles:
+        logger.error('Only ' + str(len(cell_list)) + ' cells available '
+                     'which is less then ' + str(num_tiles) + ' tiles '
+                     'requested')
+        return None
+
+    tile_tuple_list = []
+    for (img_path, col, row, numcols, numrows) in random.sample(cell_list,
+                                                                num_tiles):
+        (width, height) = size_dict[img_path]
+        cell_left = (col * (width + 1)) // numcols
+        cell_right = ((col + 1) * (width + 1)) // numcols
+        cell_upper = (row * (height + 1)) // numrows
+        cell_lower = ((row + 1) * (height + 1)) // numrows
+        xpos = random.randint(cell_left, cell_right - tile_width - 1)
+        ypos = random.randint(cell_upper, cell_lower - tile_height - 1)
+        tile_tuple_list.append((img_path,
+                                Box(left=xpos, upper=ypos,
+                                    right=xpos + tile_width,
+                                    lower=ypos + tile_height)))
+    return tile_tuple_list
+
+
 def _get_tiles_from_tuple_list(img_list, config_file):
     """Loads list of tuples with image path and tile location
     :returns: nested tuple (image path, (left, upper, right, and lower))
@@ -159,25 +257,190 @@ def _get_tiles_from_tuple_list(img_list, config_file):
     return tile_tuple_list
 
 
-def _extract_and_save_tile(temp_dir, entry, counter):
-    """extract and save tile
+def _get_tile_file_name(counter):
+    """Gets name of tif file for tile number `counter`
+    :param counter: int tile number
+    :returns: string
     """
-    img = None
-    tile = None
+    return str(counter).zfill(4) + '.tif'
+
+
+def _group_tiles_by_image(tile_tuple_list):
+    """Groups tiles by the image they come from
+    :param tile_tuple_list: list of (image path, Box) tuples
+    :returns: list of (image path, [(counter, Box),...]) tuples ordered
+              by first appearance of image where counter is the index
+              of the tile in `tile_tuple_list`
+    """
+    group_dict = {}
+    img_order = []
+    counter = 0
+    for entry in tile_tuple_list:
+        if entry[0] not in group_dict:
+            group_dict[entry[0]] = []
+            img_order.append(entry[0])
+        group_dict[entry[0]].append((counter, entry[1]))
+        counter += 1
+    return [(img_path, group_dict[img_path]) for img_path in img_order]
+
+
+def _extract_and_save_tiles(task):
+    """Opens image once then reads and saves every tile from it as tif
+       files. Only the bytes for each tile are read if image is stored
+       uncompressed otherwise the image is decoded once. Tiles are
+       saved by a `ParallelTileWriter` so writes overlap with reads.
+       This is the function invoked by `multiprocessing.Pool` in
+       `_extract_tiles`
+    :param task: tuple (temp_dir, image path, [(counter, Box),...])
+    :returns: tuple (image path, error message or None)
+    """
+    (temp_dir, img_path, tile_list) = task
+    reader = None
     try:
-        logger.info('Creating tile from ' + entry[0] +
-                    ' with these coords ' +
-                    entry[1].get_box_as_comma_delimited_string())
-        img = Image.open(entry[0])
-        tile = img.crop(entry[1].get_box_as_tuple())
-        tif_file = os.path.join(temp_dir, str(counter).zfill(4) + '.tif')
-        logger.info('Saving file ' + tif_file)
-        tile.save(tif_file, format='TIFF')
+        logger.info('Creating ' + str(len(tile_list)) + ' tiles from ' +
+                    img_path)
+        reader = image.get_region_reader(img_path)
+        writer = ParallelTileWriter(temp_dir, numthreads=2,
+                                    imageformat='TIFF')
+        try:
+            for counter, box in tile_list:
+                logger.debug('Tile ' + str(counter) + ' coords ' +
+                             box.get_box_as_comma_delimited_string())
+                tile = reader.read_region(box.get_box_as_tuple())
+                writer.add_tile(_get_tile_file_name(counter),
+                                ImageTile(tile))
+        finally:
+            writer.close()
+        return img_path, None
+    except Exception as e:
+        logger.exception('Caught exception extracting tiles from ' +
+                         img_path)
+        return img_path, str(e)
     finally:
-        if img is not None:
-            img.close()
-        if tile is not None:
-            tile.close()
+        if reader is not None:
+            reader.close()
+
+
+def _crop_tiles(task):
+    """Opens image once then crops every tile from it writing each one
+       straight into the mrc stack so only one tile is held in memory.
+       Only the bytes for each tile are read if image is stored
+       uncompressed otherwise the image is decoded once. This is the
+       function invoked by `multiprocessing.Pool` in `_write_mrc_stack`
+    :param task: tuple (mrc file, (nx, ny, nz), image path,
+                 [(counter, Box),...])
+    :returns: tuple (image path, [(counter, section stats),...] of
+              tiles written, error message or None)
+    """
+    (dest_file, dimensions, img_path, tile_list) = task
+    (nx, ny, nz) = dimensions
+    reader = None
+    section_writer = None
+    written = []
+    try:
+        logger.info('Cropping ' + str(len(tile_list)) + ' tiles from ' +
+                    img_path)
+        reader = image.get_region_reader(img_path)
+        section_writer = MRCSectionWriter(dest_file, nx, ny, nz)
+        for counter, box in tile_list:
+            tile = reader.read_region(box.get_box_as_tuple())
+            try:
+                written.append((counter,
+                                section_writer.write_section(counter,
+                                                             tile)))
+            finally:
+                tile.close()
+        return img_path, written, None
+    except Exception as e:
+        logger.exception('Caught exception cropping tiles from ' +
+                         img_path)
+        return img_path, written, str(e)
+    finally:
+        if section_writer is not None:
+            section_writer.close()
+        if reader is not None:
+            reader.close()
+
+
+def _write_mrc_stack(dest_file, tile_tuple_list, processes):
+    """Crops tiles in `tile_tuple_list` and writes them directly to
+       mrc stack `dest_file` with tile N becoming section N. Each
+       source image is decoded once and images are processed in
+       parallel on `processes` processes which write their sections
+       into the stack and send back only pixel statistics this process
+       saves in the header
+    :param dest_file: path to mrc file to write
+    :param tile_tuple_list: list of (image path, Box) tuples where
+                            every Box is the same size
+    :param processes: number of processes to use
+    :returns: 0 upon success otherwise 1
+    """
+    (left, upper, right, lower) = tile_tuple_list[0][1].get_box_as_tuple()
+    writer = MRCStackWriter(dest_file, right - left, lower - upper,
+                            len(tile_tuple_list),
+                            label='chmutil createtrainingmrcstack.py ' +
+                                  chmutil.__version__)
+    dimensions = writer.get_dimensions()
+    tasks = [(dest_file, dimensions, img_path, tile_list) for
+             img_path, tile_list in _group_tiles_by_image(tile_tuple_list)]
+    if processes <= 1 or len(tasks) <= 1:
+        results = map(_crop_tiles, tasks)
+        pool = None
+    else:
+        pool = multiprocessing.Pool(processes=processes)
+        results = pool.imap_unordered(_crop_tiles, tasks)
+
+    failed = 0
+    try:
+        for img_path, written, msg in results:
+            for counter, stats in written:
+                writer.add_written_section(counter, stats)
+            if msg is not None:
+                failed += 1
+                logger.error('Unable to write tiles from ' + img_path +
+                             ' : ' + msg)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        writer.close()
+
+    if failed > 0:
+        return 1
+    return 0
+
+
+def _extract_tiles(temp_dir, tile_tuple_list, processes):
+    """Extracts tiles in `tile_tuple_list` saving them as tif files
+       named by their index in the list in `temp_dir`. Each source
+       image is decoded only once and images are processed in parallel
+       on `processes` processes
+    :param temp_dir: directory to write tiles to
+    :param tile_tuple_list: list of (image path, Box) tuples
+    :param processes: number of processes to use
+    :returns: number of images that failed
+    """
+    tasks = [(temp_dir, img_path, tile_list) for img_path, tile_list in
+             _group_tiles_by_image(tile_tuple_list)]
+    if processes <= 1 or len(tasks) <= 1:
+        results = map(_extract_and_save_tiles, tasks)
+        pool = None
+    else:
+        pool = multiprocessing.Pool(processes=processes)
+        results = pool.imap_unordered(_extract_and_save_tiles, tasks)
+
+    failed = 0
+    try:
+        for img_path, msg in results:
+            if msg is not None:
+                failed += 1
+                logger.error('Unable to extract tiles from ' + img_path +
+                             ' : ' + msg)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return failed
 
 
 def _save_tile_tuple_list_as_config_file(tile_tuple_list, config_file):
@@ -229,28 +492,47 @@ def _create_mrc_stack(image_dir, num_tiles, dest_file, theargs):
         random.seed(theargs.seed)
         tsize = core.parse_width_and_height_from_str(theargs.tilesize)
 
-        tile_tuple_list = _pick_random_tiles(img_list, num_tiles,
-                                             tile_width=tsize[0],
-                                             tile_height=tsize[1])
+        if theargs.sampling == STRATIFIED_SAMPLING:
+            pickfunc = _pick_stratified_tiles
+        else:
+            pickfunc = _pick_random_tiles
+        tile_tuple_list = pickfunc(img_list, num_tiles,
+                                   tile_width=tsize[0],
+                                   tile_height=tsize[1],
+                                   size_dict=_get_image_sizes(img_list))
         if tile_tuple_list is None:
             logger.error('Unable to generate random tiles')
             return 1
 
+    if theargs.usenewstack is False:
+        logger.info('Writing ' + str(len(tile_tuple_list)) +
+                    ' tiles to ' + dest_file)
+        exit = _write_mrc_stack(dest_file, tile_tuple_list,
+                                theargs.processes)
+        if exit != 0:
+            logger.error('Unable to write ' + dest_file + ', not writing '
+                         'tile config file')
+            return exit
+        _save_tile_tuple_list_as_config_file(tile_tuple_list,
+                                             dest_file + '.tile.list.config')
+        return 0
+
     temp_dir = tempfile.mkdtemp(dir=theargs.scratchdir)
     curdir = os.getcwd()
 
     try:
-        counter = 0
-        for entry in tile_tuple_list:
-            _extract_and_save_tile(temp_dir, entry, counter)
-            counter += 1
+        failed = _extract_tiles(temp_dir, tile_tuple_list,
+                                theargs.processes)
+        if failed > 0:
+            logger.error('Tile extraction failed for ' + str(failed) +
+                         ' images')
+            return 1
+
         logger.info('Changing to ' + temp_dir + 'directory to run newstack')
         os.chdir(temp_dir)
 
-        tif_list = []
-        for entry in os.listdir(temp_dir):
-            if entry.endswith('.tif'):
-                tif_list.append(entry)
+        tif_list = [_get_tile_file_name(counter) for counter in
+                    range(len(tile_tuple_list))]
         cmd = 'newstack ' + ' '.join(tif_list) + ' "' + dest_file + '"'
 
         exit, out, err = core.run_external_command(cmd, temp_dir)
@@ -258,6 +540,9 @@ def _create_mrc_stack(image_dir, num_tiles, dest_file, theargs):
         sys.stdout.write(out)
         sys.stderr.write(err)
 
+        if exit != 0:
+            logger.error('newstack failed, not writing tile config file')
+            return exit
         _save_tile_tuple_list_as_config_file(tile_tuple_list,
                                              dest_file + '.tile.list.config')
         return exit
@@ -283,6 +568,10 @@ def main(arglist):
 
               Creates mrc stack (output) by extracting random
               tiles from images in (imagedir)
+
+              The mrc stack is written directly unless --usenewstack
+              is set in which case tiles are written as tif files
+              to --scratchdir and IMOD newstack creates the stack.
               Example Usage:
 
               createtrainingmrcstack.py ./myimages 5 ./result.foo
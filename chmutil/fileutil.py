@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+
+import os
+import errno
+import logging
+
+try:
+    from os import scandir
+except ImportError:  # pragma: no cover
+    scandir = None
+
+try:
+    _buffer = buffer  # noqa: F821 python 2 only
+except NameError:
+    _buffer = None
+
+logger = logging.getLogger(__name__)
+
+
+def _list_directory(path):
+    """Lists entries of directory `path`. Uses `os.scandir` when
+       available so file type comes from the directory listing,
+       otherwise falls back to `os.listdir` with a stat per entry
+    :param path: directory to list
+    :raises OSError: if `path` cannot be listed
+    :returns: list of tuples (full path, name, is file, is directory)
+              where is directory is False for symbolic links to
+              directories, like `os.walk`, so links cannot cause cycles
+    """
+    res = []
+    if scandir is not None:
+        it = scandir(path)
+        try:
+            for entry in it:
+                try:
+                    res.append((entry.path, entry.name, entry.is_file(),
+                                entry.is_dir(follow_symlinks=False)))
+                except OSError:
+                    logger.debug('Unable to get type of ' + entry.path)
+        finally:
+            # close() only exists in python 3.6+
+            if hasattr(it, 'close'):
+                it.close()
+        return res
+
+    for name in os.listdir(path):  # pragma: no cover
+        fullpath = os.path.join(path, name)
+        res.append((fullpath, name, os.path.isfile(fullpath),
+                    os.path.isdir(fullpath) and
+                    not os.path.islink(fullpath)))
+    return res
+
+
+def walk_files(path, suffix=None, recursive=True):
+    """Generator that yields paths of files in `path` with one directory
+       listing per directory and no stat calls per file. Directories are
+       walked iteratively with a stack instead of nested generators.
+       Unreadable subdirectories are logged and skipped. Symbolic links
+       to directories are not followed, like `os.walk`.
+    :param path: directory to walk, if `path` is a file it is yielded
+                 if it matches `suffix`
+    :param suffix: if set, only yield files whose name ends with it
+    :param recursive: if True descend into subdirectories
+    :raises OSError: if `path` exists but is not a readable directory
+                     or file
+    :returns: generator of file paths
+    """
+    if path is None:
+        logger.error('Path is None, returning nothing')
+        return
+
+    stack = [path]
+    while stack:
+        dirpath = stack.pop()
+        try:
+            entries = _list_directory(dirpath)
+        except OSError as e:
+            if dirpath is not path:
+                logger.warning('Unable to list ' + dirpath + ' : ' + str(e))
+                continue
+            if e.errno == errno.ENOENT:
+                return
+            if e.errno == errno.ENOTDIR:
+                if suffix is None or path.endswith(suffix):
+                    yield path
+                return
+            raise
+
+        for (fullpath, name, is_file, is_dir) in entries:
+            if is_file:
+                if suffix is None or name.endswith(suffix):
+                    yield fullpath
+            elif is_dir and recursive is True:
+                stack.append(fullpath)
+
+
+def get_file_names(path):
+    """Gets names of files in directory `path` with a single directory
+       listing, so checking whether many files in one directory exist
+       costs one listing instead of one stat per file
+    :param path: directory to list
+    :returns: set of file names, empty if `path` does not exist or
+              cannot be listed
+    """
+    try:
+        entries = _list_directory(path)
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            logger.warning('Unable to list ' + path + ' : ' + str(e))
+        return set()
+    return set([name for (fullpath, name, is_file, is_dir) in entries
+                if is_file])
+
+
+def get_mapped_buffer(mapped, offset, size):
+    """Gets read only view of `size` bytes starting at `offset` of
+       memory map `mapped` without copying. Python 2 mmap objects do
+       not support memoryview so the old buffer type is used there
+    :param mapped: mmap object
+    :returns: memoryview or buffer which should be passed to
+              `release_mapped_buffer` when no longer needed
+    """
+    if _buffer is not None:  # pragma: no cover
+        return _buffer(mapped, offset, size)
+    return memoryview(mapped)[offset:offset + size]
+
+
+def release_mapped_buffer(buf):
+    """Releases view returned by `get_mapped_buffer` so the memory map
+       can be closed. Does nothing on python 2 where views cannot be
+       released
+    """
+    if hasattr(buf, 'release'):
+        buf.release()
@@ -1,14 +1,43 @@
 # -*- coding: utf-8 -*-
 
 import os
+import io
 import math
+import mmap
+import struct
+import zlib
 import logging
+import threading
+import zipfile
+import json
+import configparser
 from PIL import Image
 from PIL import ImageMath
+from PIL import ImageChops
+
+from chmutil import fileutil
+
+try:
+    import queue
+except ImportError:  # pragma: no cover
+    import Queue as queue
 
 
 logger = logging.getLogger(__name__)
 
+CROP_CONFIG_SUFFIX = '.crop.cfg'
+"""Suffix appended to path of a cropped image to get the path of
+   the configuration that holds its offset and full image size
+"""
+
+CROP_OFFSET = 'offset'
+CROP_FULL_SIZE = 'fullsize'
+
+PYRAMID_DESCRIPTOR = 'pyramid.json'
+"""Name of file describing image pyramid written by
+   `write_image_pyramid`
+"""
+
 
 class InvalidImageError(Exception):
     """Denotes invalid image object
@@ -31,7 +60,7 @@ def get_image_path_list(image_dir, suffix,
                    If `suffix` is None then all files match
     :raises InvalidImageDirError: if `image_dir` is None or not
                                   a directory
-    :raises OSError: if there is an error invoking os.listdir on `image_dir`
+    :raises OSError: if there is an error listing `image_dir`
     :returns: list of file paths
     """
     if image_dir is None:
@@ -40,19 +69,8 @@ def get_image_path_list(image_dir, suffix,
     if not os.path.isdir(image_dir):
         raise InvalidImageDirError('image_dir must be a directory')
 
-    if suffix is None:
-        adjusted_suffix = ''
-    else:
-        adjusted_suffix = suffix
-
-    img_list = []
-    for entry in os.listdir(image_dir):
-        fp = os.path.join(image_dir, entry)
-        if not os.path.isfile(fp):
-            logger.debug(entry + ' is not a file. skipping')
-            continue
-        if entry.endswith(adjusted_suffix):
-            img_list.append(fp)
+    img_list = list(fileutil.walk_files(image_dir, suffix=suffix,
+                                        recursive=False))
 
     if keysortfunc is not None:
         logger.debug('Sort function passed in sorting data')
@@ -61,9 +79,638 @@ def get_image_path_list(image_dir, suffix,
     return img_list
 
 
+def get_equalize_lut(histogram):
+    """Gets lookup table that equalizes an 8-bit grayscale image with
+       `histogram`. This uses the same algorithm as ImageOps.equalize
+       with no mask.
+    :param histogram: list of 256 pixel counts
+    :returns: list of 256 ints
+    """
+    histo = [val for val in histogram if val]
+    if len(histo) <= 1:
+        return list(range(256))
+    step = (sum(histo) - histo[-1]) // 255
+    if not step:
+        return list(range(256))
+    lut = []
+    n = step // 2
+    for i in range(256):
+        lut.append(min(n // step, 255))
+        n += histogram[i]
+    return lut
+
+
+def get_autocontrast_lut(histogram):
+    """Gets lookup table that maximizes contrast of an 8-bit
+       grayscale image with `histogram` by mapping the darkest pixel
+       to 0 and lightest to 255. This uses the same algorithm as
+       ImageOps.autocontrast with no cutoff
+    :param histogram: list of 256 pixel counts
+    :returns: list of 256 ints
+    """
+    lo = 0
+    while lo < 255 and not histogram[lo]:
+        lo += 1
+    hi = 255
+    while hi > 0 and not histogram[hi]:
+        hi -= 1
+    if hi <= lo:
+        return list(range(256))
+    scale = 255.0 / (hi - lo)
+    offset = -lo * scale
+    lut = []
+    for ix in range(256):
+        val = int(ix * scale + offset)
+        lut.append(min(max(val, 0), 255))
+    return lut
+
+
+def remap_histogram(histogram, lut):
+    """Gets histogram an image with `histogram` would have
+       after `lut` is applied to it
+    :param histogram: list of 256 pixel counts
+    :param lut: list of 256 ints
+    :returns: list of 256 pixel counts
+    """
+    newhist = [0] * 256
+    for i in range(256):
+        newhist[lut[i]] += histogram[i]
+    return newhist
+
+
+def get_point_lut(histogram, equalize=False, autocontrast=False):
+    """Combines equalize followed by autocontrast into a single
+       lookup table for an 8-bit grayscale image with `histogram`
+       so the image can be adjusted with one Image.point() call
+    :param histogram: list of 256 pixel counts of image
+    :param equalize: If True include equalization
+    :param autocontrast: If True include autocontrast
+    :returns: list of 256 ints or None if neither operation is requested
+    """
+    if equalize is False and autocontrast is False:
+        return None
+    lut = list(range(256))
+    if equalize is True:
+        lut = get_equalize_lut(histogram)
+        histogram = remap_histogram(histogram, lut)
+    if autocontrast is True:
+        aclut = get_autocontrast_lut(histogram)
+        lut = [aclut[val] for val in lut]
+    return lut
+
+
+class PillowRegionReader(object):
+    """Reads regions of an image with Pillow. The whole image is
+       decoded on the first read so this is the fallback used for
+       compressed formats
+    """
+    def __init__(self, path):
+        """Constructor
+        :param path: path to image
+        """
+        self._img = Image.open(path)
+
+    def get_size(self):
+        """Gets size of image
+        :returns: tuple (width, height)
+        """
+        return self._img.size
+
+    def read_region(self, box):
+        """Reads region of image
+        :param box: tuple (left, upper, right, lower), area outside of
+                    image is filled with 0
+        :returns: Pillow image
+        """
+        return self._img.crop(box)
+
+    def close(self):
+        """Closes image
+        """
+        if self._img is not None:
+            self._img.close()
+            self._img = None
+
+
+class MappedRegionReader(object):
+    """Reads regions of images whose pixel data is stored uncompressed,
+       such as uncompressed striped or tiled TIFF, BMP and PGM files.
+       Pillow parses the header and reports where each strip or tile is
+       stored, the file is then memory mapped and only the strips or
+       tiles overlapping a region are read.
+    """
+    RAW_BITS = {'L': 8, 'P': 8, 'LA': 16, 'I;16': 16,
+                'I;16B': 16, 'I;16L': 16, 'RGB': 24, 'RGBA': 32,
+                'RGBX': 32, 'I': 32, 'F': 32}
+    """Bits per pixel of rawmodes that can be read
+    """
+
+    def __init__(self, path):
+        """Constructor
+        :param path: path to image
+        :raises InvalidImageError: if image data is not stored in a
+                                   supported uncompressed layout
+        """
+        img = Image.open(path)
+        try:
+            self._mode = img.mode
+            self._size = img.size
+            self._tiles = self._parse_tiles(img.tile)
+            # palette is read from header so it is available without
+            # decoding pixel data
+            self._palette = None
+            if img.palette is not None and self._mode in ('P', 'PA'):
+                self._palette = img.palette.getdata()
+        finally:
+            img.close()
+        self._file = open(path, 'rb')
+        self._mmap = None
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0,
+                                   access=mmap.ACCESS_READ)
+        finally:
+            if self._mmap is None:
+                self._file.close()
+
+    def _parse_tiles(self, tiles):
+        """Converts Pillow tile descriptors into list of tuples
+           (extents, offset, rawmode, stride in bytes, orientation)
+        :raises InvalidImageError: if any descriptor is not raw or
+                                   uses an unsupported rawmode
+        """
+        if not tiles:
+            raise InvalidImageError('Image has no tile descriptors')
+        parsed = []
+        for tile in tiles:
+            (decoder, extents, offset, args) = tuple(tile)[0:4]
+            if decoder != 'raw':
+                raise InvalidImageError('Image data uses ' + str(decoder) +
+                                        ' decoder')
+            if not isinstance(args, tuple):
+                args = (args,)
+            rawmode = args[0]
+            stride = 0
+            orientation = 1
+            if len(args) > 1:
+                stride = args[1]
+            if len(args) > 2:
+                orientation = args[2]
+            if rawmode not in MappedRegionReader.RAW_BITS:
+                raise InvalidImageError('Unsupported rawmode ' +
+                                        str(rawmode))
+            if stride <= 0:
+                width = extents[2] - extents[0]
+                stride = (width * MappedRegionReader.RAW_BITS[rawmode] +
+                          7) // 8
+            parsed.append((extents, offset, rawmode, stride,
+                           orientation))
+        return parsed
+
+    def get_size(self):
+        """Gets size of image
+        :returns: tuple (width, height)
+        """
+        return self._size
+
+    def read_region(self, box):
+        """Reads region of image touching only the strips or tiles
+           that overlap it
+        :param box: tuple (left, upper, right, lower), area outside of
+                    image is filled with 0
+        :returns: Pillow image
+        """
+        (left, upper, right, lower) = box
+        result = Image.new(self._mode, (right - left, lower - upper))
+        if self._palette is not None:
+            (rawmode, palette) = self._palette
+            result.putpalette(palette, rawmode)
+        for (extents, offset, rawmode, stride, orientation) in self._tiles:
+            (ex0, ey0, ex1, ey1) = extents
+            ix0 = max(left, ex0)
+            iy0 = max(upper, ey0)
+            ix1 = min(right, ex1)
+            iy1 = min(lower, ey1)
+            if ix0 >= ix1 or iy0 >= iy1:
+                continue
+            height = ey1 - ey0
+            data = fileutil.get_mapped_buffer(self._mmap, offset,
+                                              stride * height)
+            tile_img = Image.frombuffer(self._mode, (ex1 - ex0, height),
+                                        data, 'raw', rawmode, stride,
+                                        orientation)
+            piece = tile_img.crop((ix0 - ex0, iy0 - ey0,
+                                   ix1 - ex0, iy1 - ey0))
+            result.paste(piece, (ix0 - left, iy0 - upper))
+            piece.close()
+            tile_img.close()
+            del tile_img
+            fileutil.release_mapped_buffer(data)
+        return result
+
+    def close(self):
+        """Unmaps and closes file
+        """
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class MRCRegionReader(object):
+    """Reads regions of a section of an MRC file through a memory map
+       using `chmutil.mrc.MRCReader`
+    """
+    def __init__(self, path, section=0):
+        """Constructor
+        :param path: path to MRC file
+        :param section: index of section to read regions from
+        :raises MRCError: if file is not a supported MRC file
+        """
+        from chmutil.mrc import MRCReader
+        self._reader = MRCReader(path)
+        self._section = section
+        (nx, ny, nz) = self._reader.get_dimensions()
+        self._size = (nx, ny)
+
+    def get_size(self):
+        """Gets size of section
+        :returns: tuple (width, height)
+        """
+        return self._size
+
+    def read_region(self, box):
+        """Reads region of section, only the rows of the section that
+           overlap `box` are sliced from the memory map
+        :param box: tuple (left, upper, right, lower), area outside of
+                    section is filled with 0
+        :returns: Pillow image
+        """
+        return self._reader.get_region_image(self._section, box)
+
+    def close(self):
+        """Closes MRC file
+        """
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
+
+
+class TiledTiffWriter(object):
+    """Writes Pillow images as tiled BigTIFF files with each tile
+       compressed with deflate (zlib) so readers such as
+       `TiledTiffRegionReader` can decompress just the tiles they need.
+       Tiles are compressed and written one at a time and the image
+       file directory (IFD) is written at the end of the file.
+    """
+    BIGTIFF_VERSION = 43
+    DEFLATE = 8
+    MODES = {'L': (8, 1, 1, 1), 'I;16': (16, 1, 1, 1),
+             'RGB': (8, 3, 2, 1)}
+    """Mode to (bits per sample, samples per pixel, photometric,
+       sample format)
+    """
+
+    def __init__(self, tilesize=(512, 512), compress_level=6):
+        """Constructor
+        :param tilesize: tuple (width, height) of tiles in pixels,
+                         both values must be multiples of 16
+        :param compress_level: zlib compression level 0-9
+        :raises ValueError: if tile width or height is not a positive
+                            multiple of 16
+        """
+        for val in tilesize:
+            if val <= 0 or val % 16 != 0:
+                raise ValueError('Tile width and height must be '
+                                 'positive multiples of 16: ' +
+                                 str(tilesize))
+        self._tilesize = tilesize
+        self._compress_level = compress_level
+
+    def _get_tag(self, tag, tagtype, values):
+        """Packs BigTIFF IFD entry of 20 bytes
+        :param tag: tag id
+        :param tagtype: 3 for SHORT, 4 for LONG, 16 for LONG8
+        :param values: list of values that must fit in 8 bytes
+        """
+        fmt = {3: 'H', 4: 'I', 16: 'Q'}[tagtype]
+        data = struct.pack('<' + str(len(values)) + fmt, *values)
+        return (struct.pack('<HHQ', tag, tagtype, len(values)) +
+                data + b'\0' * (8 - len(data)))
+
+    def save(self, img, path):
+        """Writes `img` to `path` as tiled deflate compressed BigTIFF
+        :param img: Pillow image of mode L, I;16, or RGB
+        :param path: path to write to
+        :raises InvalidImageError: if `img` is None or of unsupported mode
+        """
+        if img is None:
+            raise InvalidImageError('Image is None')
+        if img.mode not in TiledTiffWriter.MODES:
+            raise InvalidImageError('Unsupported image mode ' + img.mode)
+        (bits, samples, photometric,
+         sampleformat) = TiledTiffWriter.MODES[img.mode]
+        (width, height) = img.size
+        (twidth, theight) = self._tilesize
+
+        offsets = []
+        counts = []
+        f = open(path, 'wb')
+        try:
+            # header, IFD offset is written once it is known
+            f.write(struct.pack('<2sHHHQ', b'II',
+                                TiledTiffWriter.BIGTIFF_VERSION,
+                                8, 0, 0))
+            for y in range(0, height, theight):
+                for x in range(0, width, twidth):
+                    # crop pads partial edge tiles with zeros
+                    tile = img.crop((x, y, x + twidth, y + theight))
+                    data = zlib.compress(tile.tobytes(),
+                                         self._compress_level)
+                    tile.close()
+                    offsets.append(f.tell())
+                    counts.append(len(data))
+                    f.write(data)
+
+            # offsets and counts arrays then IFD
+            arrays_offset = f.tell()
+            numtiles = len(offsets)
+            f.write(struct.pack('<' + str(numtiles) + 'Q', *offsets))
+            f.write(struct.pack('<' + str(numtiles) + 'Q', *counts))
+            if numtiles == 1:
+                offsets_tag = self._get_tag(324, 16, offsets)
+                counts_tag = self._get_tag(325, 16, counts)
+            else:
+                offsets_tag = (struct.pack('<HHQQ', 324, 16, numtiles,
+                                           arrays_offset))
+                counts_tag = (struct.pack('<HHQQ', 325, 16, numtiles,
+                                          arrays_offset + numtiles * 8))
+            entries = [self._get_tag(256, 4, [width]),
+                       self._get_tag(257, 4, [height]),
+                       self._get_tag(258, 3, [bits] * samples),
+                       self._get_tag(259, 3, [TiledTiffWriter.DEFLATE]),
+                       self._get_tag(262, 3, [photometric]),
+                       self._get_tag(277, 3, [samples]),
+                       self._get_tag(284, 3, [1]),
+                       self._get_tag(322, 4, [twidth]),
+                       self._get_tag(323, 4, [theight]),
+                       offsets_tag,
+                       counts_tag,
+                       self._get_tag(339, 3, [sampleformat] * samples)]
+            ifd_offset = f.tell()
+            f.write(struct.pack('<Q', len(entries)))
+            for entry in entries:
+                f.write(entry)
+            f.write(struct.pack('<Q', 0))
+            f.seek(8)
+            f.write(struct.pack('<Q', ifd_offset))
+        finally:
+            f.close()
+
+
+class TiledTiffRegionReader(object):
+    """Reads regions of tiled TIFF or BigTIFF files, like those written
+       by `TiledTiffWriter`, decompressing only the tiles that overlap
+       the region. Supports uncompressed and deflate compressed tiles
+       with 8 or 16 bit grayscale or 8 bit RGB data.
+    """
+    COMPRESSIONS = (1, 8, 32946)
+
+    def __init__(self, path):
+        """Constructor, reads first image file directory of `path`
+        :param path: path to TIFF file
+        :raises InvalidImageError: if file is not a supported tiled TIFF
+        """
+        self._file = open(path, 'rb')
+        try:
+            self._parse_header()
+        except Exception:
+            self._file.close()
+            raise
+
+    def _read_values(self, endian, tagtype, count, data, big):
+        """Reads values of IFD entry whose value field is `data`
+        """
+        fmt = {3: 'H', 4: 'I', 16: 'Q'}.get(tagtype)
+        if fmt is None:
+            return None
+        size = struct.calcsize(fmt) * count
+        if size <= len(data):
+            raw = data[0:size]
+        else:
+            if big is True:
+                offset = struct.unpack(endian + 'Q', data)[0]
+            else:
+                offset = struct.unpack(endian + 'I', data)[0]
+            self._file.seek(offset)
+            raw = self._file.read(size)
+        return list(struct.unpack(endian + str(count) + fmt, raw))
+
+    def _parse_header(self):
+        """Parses TIFF header and first IFD
+        """
+        header = self._file.read(16)
+        if header[0:2] == b'II':
+            endian = '<'
+        elif header[0:2] == b'MM':
+            endian = '>'
+        else:
+            raise InvalidImageError('Not a TIFF file')
+        version = struct.unpack(endian + 'H', header[2:4])[0]
+        if version == 42:
+            big = False
+            ifd_offset = struct.unpack(endian + 'I', header[4:8])[0]
+            countfmt, entrysize, valsize = 'H', 12, 4
+        elif version == TiledTiffWriter.BIGTIFF_VERSION:
+            big = True
+            ifd_offset = struct.unpack(endian + 'Q', header[8:16])[0]
+            countfmt, entrysize, valsize = 'Q', 20, 8
+        else:
+            raise InvalidImageError('Not a TIFF file')
+
+        self._file.seek(ifd_offset)
+        countsize = struct.calcsize(countfmt)
+        numentries = struct.unpack(endian + countfmt,
+                                   self._file.read(countsize))[0]
+        raw_entries = self._file.read(numentries * entrysize)
+        tags = {}
+        for i in range(numentries):
+            entry = raw_entries[i * entrysize:(i + 1) * entrysize]
+            (tag, tagtype) = struct.unpack(endian + 'HH', entry[0:4])
+            count = struct.unpack(endian + countfmt,
+                                  entry[4:4 + countsize])[0]
+            tags[tag] = (tagtype, count, entry[entrysize - valsize:])
+
+        values = {}
+        for tag in tags:
+            (tagtype, count, data) = tags[tag]
+            values[tag] = self._read_values(endian, tagtype, count,
+                                            data, big)
+        if 322 not in values or 324 not in values or 325 not in values:
+            raise InvalidImageError('TIFF is not tiled')
+
+        compression = values.get(259, [1])[0]
+        if compression not in TiledTiffRegionReader.COMPRESSIONS:
+            raise InvalidImageError('Unsupported TIFF compression ' +
+                                    str(compression))
+        if values.get(317, [1])[0] != 1:
+            raise InvalidImageError('TIFF predictor not supported')
+        bits = values.get(258, [1])
+        samples = values.get(277, [1])[0]
+        photometric = values.get(262, [1])[0]
+        if samples == 1 and bits[0] == 8 and photometric == 1:
+            self._mode = 'L'
+            self._rawmode = 'L'
+        elif samples == 1 and bits[0] == 16 and photometric == 1:
+            self._mode = 'I;16'
+            self._rawmode = 'I;16B' if endian == '>' else 'I;16'
+        elif (samples == 3 and bits == [8, 8, 8] and photometric == 2 and
+              values.get(284, [1])[0] == 1):
+            self._mode = 'RGB'
+            self._rawmode = 'RGB'
+        else:
+            raise InvalidImageError('Unsupported TIFF pixel format')
+        self._compression = compression
+        self._size = (values[256][0], values[257][0])
+        self._tilesize = (values[322][0], values[323][0])
+        self._offsets = values[324]
+        self._counts = values[325]
+        self._tiles_across = ((self._size[0] + self._tilesize[0] - 1) //
+                              self._tilesize[0])
+
+    def get_size(self):
+        """Gets size of image
+        :returns: tuple (width, height)
+        """
+        return self._size
+
+    def get_tile_size(self):
+        """Gets size of TIFF tiles
+        :returns: tuple (width, height)
+        """
+        return self._tilesize
+
+    def _read_tile(self, col, row):
+        """Reads and decompresses tile at `col`, `row`
+        :returns: Pillow image of tile size
+        """
+        index = row * self._tiles_across + col
+        self._file.seek(self._offsets[index])
+        data = self._file.read(self._counts[index])
+        if self._compression != 1:
+            data = zlib.decompress(data)
+        return Image.frombytes(self._mode, self._tilesize, data, 'raw',
+                               self._rawmode)
+
+    def read_region(self, box):
+        """Reads region of image decompressing only tiles that overlap it
+        :param box: tuple (left, upper, right, lower), area outside of
+                    image is filled with 0
+        :returns: Pillow image
+        """
+        (left, upper, right, lower) = box
+        (twidth, theight) = self._tilesize
+        result = Image.new(self._mode, (right - left, lower - upper))
+        x0 = max(left, 0)
+        y0 = max(upper, 0)
+        x1 = min(right, self._size[0])
+        y1 = min(lower, self._size[1])
+        if x0 >= x1 or y0 >= y1:
+            return result
+        for row in range(y0 // theight, (y1 - 1) // theight + 1):
+            for col in range(x0 // twidth, (x1 - 1) // twidth + 1):
+                tile = self._read_tile(col, row)
+                tx = col * twidth
+                ty = row * theight
+                piece = tile.crop((max(x0, tx) - tx, max(y0, ty) - ty,
+                                   min(x1, tx + twidth) - tx,
+                                   min(y1, ty + theight) - ty))
+                result.paste(piece, (max(x0, tx) - left,
+                                     max(y0, ty) - upper))
+                piece.close()
+                tile.close()
+        return result
+
+    def close(self):
+        """Closes file
+        """
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def get_region_reader(path, section=0):
+    """Gets the most efficient reader for reading regions of image
+       at `path`. Files ending with .mrc get a `MRCRegionReader`,
+       images stored uncompressed get a `MappedRegionReader`,
+       compressed tiled TIFF files get a `TiledTiffRegionReader`,
+       and everything else gets a `PillowRegionReader`. Every reader
+       has get_size(), read_region(box), and close() methods
+    :param path: path to image
+    :param section: section to read if `path` is an MRC file
+    :returns: reader object
+    """
+    lower_path = path.lower()
+    if lower_path.endswith('.mrc'):
+        return MRCRegionReader(path, section=section)
+    try:
+        return MappedRegionReader(path)
+    except (InvalidImageError, ValueError) as e:
+        logger.debug('Unable to map ' + path + ' : ' + str(e))
+    if lower_path.endswith('.tif') or lower_path.endswith('.tiff'):
+        try:
+            return TiledTiffRegionReader(path)
+        except (InvalidImageError, struct.error) as e:
+            logger.debug('Unable to read tiles of ' + path + ' : ' +
+                         str(e))
+    logger.debug('Using Pillow to read ' + path)
+    return PillowRegionReader(path)
+
+
+def write_crop_config(image_file, offset, full_size):
+    """Writes configuration next to `image_file` noting it is a crop
+       of a larger image
+    :param image_file: path to cropped image
+    :param offset: tuple (x, y) of upper left corner of crop in
+                   full image
+    :param full_size: tuple (width, height) of full image
+    :returns: path to configuration file
+    """
+    config = configparser.ConfigParser()
+    config.set('', CROP_OFFSET, str(offset[0]) + ',' + str(offset[1]))
+    config.set('', CROP_FULL_SIZE, str(full_size[0]) + 'x' +
+               str(full_size[1]))
+    cfile = image_file + CROP_CONFIG_SUFFIX
+    f = open(cfile, 'w')
+    config.write(f)
+    f.flush()
+    f.close()
+    return cfile
+
+
+def read_crop_config(image_file):
+    """Reads configuration written by `write_crop_config` for
+       `image_file`
+    :param image_file: path to image
+    :returns: tuple ((x, y), (width, height)) of offset and full image
+              size or None if `image_file` is not a crop
+    """
+    cfile = image_file + CROP_CONFIG_SUFFIX
+    if not os.path.isfile(cfile):
+        return None
+    config = configparser.ConfigParser()
+    config.read(cfile)
+    (x, y) = config.get('DEFAULT', CROP_OFFSET).split(',')
+    (width, height) = config.get('DEFAULT', CROP_FULL_SIZE).split('x')
+    return (int(x), int(y)), (int(width), int(height))
+
+
 class SimpleImageMerger(object):
     """Merges two same size images together by taking maximum
-    pixel value from either image
+    pixel value from either image. Images that are crops of the
+    full image, as noted by `write_crop_config`, are merged into
+    just the region they cover
     """
     def __init__(self):
         """Constructor
@@ -73,6 +720,9 @@ class SimpleImageMerger(object):
     def merge_images(self, image_list):
         """Merge list of images
         :param image_list: List of full path to image files to merge
+        :raises InvalidImageError: if an image that is not a crop, or
+                                   the full size of a crop, differs in
+                                   size from the other images
         :return: Pillow Image containing merge of all images
         """
         if image_list is None:
@@ -81,6 +731,13 @@ class SimpleImageMerger(object):
         logger.info('Found ' + str(len(image_list)) + ' images to merge')
         merged = None
         for entry in image_list:
+            crop_info = read_crop_config(entry)
+            if crop_info is not None:
+                self._check_size(entry, crop_info[1], merged)
+                logger.debug('Merging crop ' + entry)
+                merged = self._merge_crop(merged, entry, crop_info[0],
+                                          crop_info[1])
+                continue
             if merged is None:
                 merged = Image.open(entry)
                 continue
@@ -88,17 +745,65 @@ class SimpleImageMerger(object):
             merged = self._merge_two_images(merged, entry)
         return merged
 
+    def _check_size(self, image_file, size, merged):
+        """Checks `size` of `image_file` matches size of `merged`
+           so a crop whose configuration is missing is not merged
+           as a full image
+        :param size: tuple (width, height) of image or full size of crop
+        :param merged: Pillow Image of images merged so far or None
+        :raises InvalidImageError: if sizes differ
+        """
+        if merged is None or tuple(size) == merged.size:
+            return
+        raise InvalidImageError(image_file + ' has size ' + str(size) +
+                                ' but expected ' + str(merged.size) +
+                                ', possibly a crop missing its ' +
+                                CROP_CONFIG_SUFFIX + ' file')
+
+    def _merge_crop(self, image1, image_file2, offset, full_size):
+        """Merges cropped image into region of `image1` it covers
+           by taking max value of each pixel
+        :param image1: Pillow Image or None in which case an empty
+                       image of `full_size` is created
+        :param image_file2: Path to cropped image
+        :param offset: tuple (x, y) of crop in full image
+        :param full_size: tuple (width, height) of full image
+        :returns: Pillow image of mode L
+        """
+        if image1 is None:
+            image1 = Image.new('L', full_size)
+        elif image1.mode != 'L':
+            converted = image1.convert('L')
+            image1.close()
+            image1 = converted
+        image2 = Image.open(image_file2)
+        try:
+            if image2.mode != 'L':
+                converted = image2.convert('L')
+                image2.close()
+                image2 = converted
+            box = (offset[0], offset[1], offset[0] + image2.size[0],
+                   offset[1] + image2.size[1])
+            region = image1.crop(box)
+            image1.paste(ImageChops.lighter(region, image2), box)
+            region.close()
+        finally:
+            image2.close()
+        return image1
+
     def _merge_two_images(self, image1, image_file2):
         """Merges two images together by taking max value of each
         pixel.
         :param image1: Pillow Image
         :param image_file2: Path to image
+        :raises InvalidImageError: if images differ in size
         :returns: Pillow image which is merge of image1 and image2 where
                   each pixel is max value found.
         """
         image2 = None
         try:
             image2 = Image.open(image_file2)
+            self._check_size(image_file2, image2.size, image1)
             logger.debug('Merging ' + image_file2)
             return ImageMath.eval("convert(max(a, b), 'L')", a=image1,
                                   b=image2)
@@ -197,18 +902,21 @@ class ImageTile(object):
     """Represents a tile from a Pillow Image
     """
     def __init__(self, image, box=None, row=None,
-                 col=None):
+                 col=None, zoom=None):
         """Constructor
         :param image: Pillow Image representing tile
         :param box: tuple (left, upper, right, lower) representing location of
                     tile in parent Image
         :param row: row tile belows to, expect int starting at 0
         :param col: column tile belows to, expect int starting at 0
+        :param zoom: zoom level tile belongs to, expect int starting at 0
+                     which denotes full resolution
         """
         self._image = image
         self._box = box
         self._row = row
         self._col = col
+        self._zoom = zoom
 
     def get_box(self):
         """Gets location of tile in parent image
@@ -232,17 +940,110 @@ class ImageTile(object):
         """
         return self._col
 
+    def get_zoom(self):
+        """Gets zoom level
+        """
+        return self._zoom
+
+
+class LazyImageTile(ImageTile):
+    """`ImageTile` that only holds a reference to the parent Pillow
+       Image and box. The tile image is not created until
+       `get_image()` is invoked so tiles that are never looked at
+       cost no allocation.
+    """
+    def __init__(self, parent_image, box, row=None, col=None, zoom=None,
+                 crop_box=None):
+        """Constructor
+        :param parent_image: Pillow Image tile is extracted from
+        :param box: tuple (left, upper, right, lower) representing location of
+                    tile in parent Image
+        :param row: row tile belows to, expect int starting at 0
+        :param col: column tile belows to, expect int starting at 0
+        :param zoom: zoom level tile belongs to
+        :param crop_box: box to pass to crop() if different from `box`,
+                         regions outside parent image are filled with 0
+        """
+        super(LazyImageTile, self).__init__(None, box=box, row=row,
+                                            col=col, zoom=zoom)
+        self._parent_image = parent_image
+        if crop_box is None:
+            self._crop_box = box
+        else:
+            self._crop_box = crop_box
+
+    def get_image(self):
+        """Gets Image tile, cropping it from parent image on first call
+        :returns: Pillow Image
+        """
+        if self._image is None:
+            self._image = self._parent_image.crop(self._crop_box)
+        return self._image
+
 
 class RowColumnImageTileGenerator(object):
     """Generator that extracts `ImageTile` objects from Pillow Image
        where each tile is a square tile of size specified in
-       constructor and i
+       constructor. Tiles are returned in row major order which
+       matches the memory layout of the image.
     """
-    def __init__(self, tilesize):
+    def __init__(self, tilesize, includepartialtiles=False,
+                 padpartialtiles=False, lazy=False):
         """Constructor
         :param tilesize: size of tile in pixels as int ie 128
+        :param includepartialtiles: If True, tiles along the right and
+                                    bottom edges of the image that are
+                                    smaller then `tilesize` are also
+                                    returned, otherwise they are skipped
+        :param padpartialtiles: If True and `includepartialtiles` is True,
+                                partial tiles are padded with 0 to
+                                `tilesize`. The box of the tile still
+                                denotes the region within the image
+        :param lazy: If True, `LazyImageTile` objects are returned which
+                     do not crop the tile until get_image() is called
         """
         self._tilesize = tilesize
+        self._includepartialtiles = includepartialtiles
+        self._padpartialtiles = padpartialtiles
+        self._lazy = lazy
+
+    def get_tile_boxes(self, width, height):
+        """Gets generator that returns location of every tile in an
+           image of size `width` x `height` in row major order. This
+           needs no image and the results can be handed to a pool of
+           workers that crop and encode tiles.
+        :param width: width of image in pixels
+        :param height: height of image in pixels
+        :returns: tuple (row, col, (left, upper, right, lower)) for each
+                  tile where box is clipped to the image
+        """
+        if width <= self._tilesize and height <= self._tilesize:
+            yield 0, 0, (0, 0, width, height)
+            return
+
+        if self._includepartialtiles is True:
+            numrows = int(math.ceil(float(height)/self._tilesize))
+            numcols = int(math.ceil(float(width)/self._tilesize))
+        else:
+            numrows = int(math.floor(height/self._tilesize))
+            numcols = int(math.floor(width/self._tilesize))
+
+        for r in range(numrows):
+            upper = r*self._tilesize
+            lower = min(upper + self._tilesize, height)
+            for c in range(numcols):
+                left = c*self._tilesize
+                yield r, c, (left, upper,
+                             min(left + self._tilesize, width), lower)
+
+    def _get_crop_box(self, box):
+        """Gets box to crop from image which is the full tile size
+           if padding was requested
+        """
+        if self._padpartialtiles is False:
+            return box
+        return (box[0], box[1], box[0] + self._tilesize,
+                box[1] + self._tilesize)
 
     def get_image_tiles(self, image):
         """Gets generator that obtains `ImageTile` from Pillow
@@ -255,22 +1056,182 @@ class RowColumnImageTileGenerator(object):
 
         (width, height) = image.size
 
-        if width <= self._tilesize and height <= self._tilesize:
+        if (width <= self._tilesize and height <= self._tilesize and
+                self._padpartialtiles is False and self._lazy is False):
             logger.info('Tilesize is larger then image')
             yield ImageTile(image, (0, 0, width, height), row=0, col=0)
             return
 
-        numrows = int(math.floor(height/self._tilesize))
-        numcols = int(math.floor(width/self._tilesize))
+        for r, c, thebox in self.get_tile_boxes(width, height):
+            crop_box = self._get_crop_box(thebox)
+            if self._lazy is True:
+                yield LazyImageTile(image, thebox, row=r, col=c,
+                                    crop_box=crop_box)
+                continue
+            yield ImageTile(image.crop(crop_box), box=thebox, row=r, col=c)
+
+
+class ImagePyramidTileGenerator(object):
+    """Generator that extracts `ImageTile` objects for every zoom
+       level of an image pyramid. Each level is built by downsampling
+       the level above it by a factor of 2 until the level fits within
+       a single tile. Zoom levels are numbered like Deep Zoom and
+       z/x/y map tiles, zoom 0 is the smallest level and the highest
+       zoom is the full resolution image. Tiles are generated starting
+       with the full resolution level and only one level is held in
+       memory at a time.
+    """
+    def __init__(self, tilesize):
+        """Constructor
+        :param tilesize: size of tile in pixels as int ie 128
+        """
+        self._tilesize = tilesize
+
+    def get_tilesize(self):
+        """Gets size of tiles in pixels
+        """
+        return self._tilesize
+
+    def _get_next_size(self, size):
+        """Gets size of level below level of `size`
+        """
+        return (max(int(math.ceil(size[0]/2.0)), 1),
+                max(int(math.ceil(size[1]/2.0)), 1))
+
+    def get_level_sizes(self, size):
+        """Gets size of every zoom level of pyramid for image of `size`
+        :param size: tuple (width, height) of full resolution image
+        :returns: list of tuples (width, height) where index is zoom
+        """
+        sizes = [tuple(size)]
+        while (sizes[-1][0] > self._tilesize or
+               sizes[-1][1] > self._tilesize):
+            sizes.append(self._get_next_size(sizes[-1]))
+        sizes.reverse()
+        return sizes
+
+    def _get_next_level(self, image):
+        """Downsamples `image` by a factor of 2 using box filter
+        :param image: Pillow Image
+        :returns: Pillow Image half the width and height of `image`
+                  rounded up
+        """
+        return image.resize(self._get_next_size(image.size), Image.BOX)
+
+    def get_image_tiles(self, image):
+        """Gets generator that obtains `ImageTile` for every zoom level
+           of Pillow `image` passed in. Partial tiles along right and
+           bottom edges are included.
+        :param image: Pillow image to tile
+        :raises InvalidImageError: if `image` is None
+        :returns: Generator that returns `ImageTile` objects with zoom set
+        """
+        if image is None:
+            raise InvalidImageError('Image is None')
+
+        tilegen = RowColumnImageTileGenerator(self._tilesize,
+                                              includepartialtiles=True)
+        zoom = len(self.get_level_sizes(image.size)) - 1
+        level = image
+        while True:
+            logger.debug('Generating tiles for zoom level ' + str(zoom) +
+                         ' with size ' + str(level.size))
+            for tile in tilegen.get_image_tiles(level):
+                yield ImageTile(tile.get_image(), box=tile.get_box(),
+                                row=tile.get_row(), col=tile.get_col(),
+                                zoom=zoom)
+
+            if zoom == 0:
+                break
+            nextlevel = self._get_next_level(level)
+            if level is not image:
+                level.close()
+            level = nextlevel
+            zoom -= 1
+        # last level fits in a single tile and is itself the image of
+        # the final tile so it is left for the caller to close
+
+
+def get_tile_file_name(tile, suffix='.png'):
+    """Gets file name for `tile` in format
+       <zoom>-r<row>_c<col><suffix>
+       which are the names createchmimage.py --gentiles has always
+       used for tiles of a single level
+    :param tile: `ImageTile` to get name for, if zoom is None 0 is used
+    :param suffix: suffix to append to name
+    :returns: file name as string
+    """
+    zoom = tile.get_zoom()
+    if zoom is None:
+        zoom = 0
+    return (str(zoom) + '-r' + str(tile.get_row()) + '_c' +
+            str(tile.get_col()) + suffix)
+
+
+def get_pyramid_tile_file_name(tile, suffix='.png'):
+    """Gets path of `tile` within an image pyramid in format
+       <zoom>/<row>_<col><suffix>
+    :param tile: `ImageTile` from `ImagePyramidTileGenerator`
+    :param suffix: suffix to append to name
+    :returns: relative path as string, always separated by /
+    """
+    return (str(tile.get_zoom()) + '/' + str(tile.get_row()) + '_' +
+            str(tile.get_col()) + suffix)
 
-        for c in range(numcols):
-            for r in range(numrows):
-                thebox = (c*self._tilesize,
-                          r*self._tilesize,
-                          c*self._tilesize + self._tilesize,
-                          r*self._tilesize + self._tilesize)
-                img = image.crop(thebox)
-                yield ImageTile(img, box=thebox, row=r, col=c)
+
+def get_pyramid_descriptor(tilegen, size, suffix='.png'):
+    """Gets description of image pyramid written by
+       `write_image_pyramid`
+    :param tilegen: `ImagePyramidTileGenerator` used to make pyramid
+    :param size: tuple (width, height) of full resolution image
+    :param suffix: suffix of tile files
+    :returns: dict that can be serialized as json
+    """
+    level_sizes = tilegen.get_level_sizes(size)
+    tilesize = tilegen.get_tilesize()
+    levels = []
+    for zoom in range(len(level_sizes)):
+        (width, height) = level_sizes[zoom]
+        levels.append({'zoom': zoom,
+                       'width': width,
+                       'height': height,
+                       'rows': int(math.ceil(float(height) / tilesize)),
+                       'cols': int(math.ceil(float(width) / tilesize))})
+    return {'format': suffix.lstrip('.'),
+            'tilesize': tilesize,
+            'width': size[0],
+            'height': size[1],
+            'levels': levels,
+            'maxzoom': len(level_sizes) - 1,
+            'zoomorder': 'zoom 0 is the smallest level which fits in one '
+                         'tile, maxzoom is full resolution',
+            'tilepath': '{zoom}/{row}_{col}' + suffix}
+
+
+def write_image_pyramid(img, tilegen, writer):
+    """Writes tiles of every zoom level of `img` with `writer`, named
+       by `get_pyramid_tile_file_name`, followed by a
+       `PYRAMID_DESCRIPTOR` json file with the tile size, the size of
+       each level and the zoom order. The descriptor is written after
+       every tile is written so its existence means the pyramid is
+       complete. The caller must close `writer`
+    :param img: Pillow Image of full resolution level, left open
+    :param tilegen: `ImagePyramidTileGenerator`
+    :param writer: `ParallelTileWriter`
+    """
+    size = img.size
+    for tile in tilegen.get_image_tiles(img):
+        if tile.get_image() is img:
+            # writer closes tile images once written
+            tile = ImageTile(img.copy(), box=tile.get_box(),
+                             row=tile.get_row(), col=tile.get_col(),
+                             zoom=tile.get_zoom())
+        writer.add_tile(get_pyramid_tile_file_name(tile), tile)
+    writer.flush()
+    descriptor = get_pyramid_descriptor(tilegen, size)
+    writer.write_file(PYRAMID_DESCRIPTOR,
+                      json.dumps(descriptor, indent=2,
+                                 sort_keys=True).encode('utf-8'))
 
 
 class SingleColumnImageTileGenerator(object):
@@ -315,6 +1276,160 @@ class SingleColumnImageTileGenerator(object):
             yield ImageTile(image.crop(box), box=box)
 
 
+class ParallelTileWriter(object):
+    """Encodes and writes `ImageTile` objects on a pool of threads.
+       Pillow releases the GIL while encoding so multiple tiles
+       are compressed concurrently. Tiles are handed to the threads
+       through a bounded queue so memory use stays flat no matter
+       how many tiles are written. Tiles are written as png (or tiff)
+       files into a directory or packed into a single uncompressed
+       zip file.
+    """
+    PNG_STRATEGIES = {'default': -1,
+                      'filtered': 1,
+                      'huffman': 2,
+                      'rle': 3,
+                      'fixed': 4}
+
+    def __init__(self, output, numthreads=4, compress_level=6,
+                 strategy='default', archive=False, queuesize=None,
+                 imageformat='PNG'):
+        """Constructor
+        :param output: directory to write tiles to or path to zip file
+                       if `archive` is True
+        :param numthreads: number of threads to encode and write tiles
+        :param compress_level: zlib compression level 0-9 for png
+        :param strategy: zlib strategy which must be a key in
+                         `PNG_STRATEGIES`
+        :param archive: If True tiles are written to zip file `output`
+        :param queuesize: max tiles waiting to be encoded, default is
+                          4 times `numthreads`
+        :param imageformat: Pillow format to save tiles as, compression
+                            settings only apply to PNG
+        """
+        self._output = output
+        self._numthreads = max(int(numthreads), 1)
+        self._compress_level = compress_level
+        self._compress_type = ParallelTileWriter.PNG_STRATEGIES[strategy]
+        self._imageformat = imageformat
+        if queuesize is None:
+            queuesize = self._numthreads * 4
+        self._queue = queue.Queue(maxsize=queuesize)
+        self._lock = threading.Lock()
+        self._error = None
+        self._zip = None
+        if archive is True:
+            self._zip = zipfile.ZipFile(output, 'w',
+                                        compression=zipfile.ZIP_STORED,
+                                        allowZip64=True)
+        self._threads = []
+        for i in range(self._numthreads):
+            t = threading.Thread(target=self._run)
+            t.daemon = True
+            t.start()
+            self._threads.append(t)
+
+    def _encode_and_write(self, name, tile):
+        """Encodes `tile` and writes it out
+        """
+        tile_img = tile.get_image()
+        try:
+            buf = io.BytesIO()
+            if self._imageformat == 'PNG':
+                tile_img.save(buf, 'PNG',
+                              compress_level=self._compress_level,
+                              compress_type=self._compress_type)
+            else:
+                tile_img.save(buf, self._imageformat)
+            self._write_data(name, buf.getvalue())
+        finally:
+            tile_img.close()
+
+    def _write_data(self, name, data):
+        """Writes `data` to file `name` in output directory, creating
+           subdirectories of output directory if `name` contains /,
+           or zip file
+        """
+        if self._zip is not None:
+            with self._lock:
+                self._zip.writestr(name, data)
+            return
+        path = os.path.join(self._output, *name.split('/'))
+        path_dir = os.path.dirname(path)
+        if '/' in name and not os.path.isdir(path_dir):
+            try:
+                os.makedirs(path_dir, mode=0o755)
+            except OSError:
+                # another thread may have created it
+                if not os.path.isdir(path_dir):
+                    raise
+        f = open(path, 'wb')
+        try:
+            f.write(data)
+        finally:
+            f.close()
+
+    def _run(self):
+        """Body of worker threads
+        """
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                if self._error is None:
+                    self._encode_and_write(item[0], item[1])
+            except Exception as e:
+                logger.exception('Caught exception writing tile ' +
+                                 str(item[0]))
+                with self._lock:
+                    if self._error is None:
+                        self._error = e
+            finally:
+                self._queue.task_done()
+
+    def add_tile(self, name, tile):
+        """Queues `tile` to be written with file name `name`. This call
+           blocks if the queue is full
+        :param name: file name for tile
+        :param tile: `ImageTile` to write, the tile image is closed
+                     once written
+        """
+        self._queue.put((name, tile))
+
+    def flush(self):
+        """Waits for all queued tiles to be written
+        :raises Exception: first exception encountered by any thread
+        """
+        self._queue.join()
+        if self._error is not None:
+            raise self._error
+
+    def write_file(self, name, data):
+        """Writes `data` to file `name` in the output directory or
+           zip file. Unlike tiles the data is written before this
+           call returns
+        :param name: file name, may contain / separated directories
+        :param data: bytes to write
+        """
+        self._write_data(name, data)
+
+    def close(self):
+        """Waits for all queued tiles to be written and stops threads
+        :raises Exception: first exception encountered by any thread
+        """
+        for t in self._threads:
+            self._queue.put(None)
+        for t in self._threads:
+            t.join()
+        self._threads = []
+        if self._zip is not None:
+            self._zip.close()
+            self._zip = None
+        if self._error is not None:
+            raise self._error
+
+
 class ImageStats(object):
     """Contains information about an image to be segmented
     """
@@ -104,6 +104,26 @@ def _run_single_merge_job(theargs, taskid):
         os.makedirs(out_dir, mode=0o775)
         cmd = (thebin + ' ' +
                input_dir + ' ' + out_file + ' --suffix png --log DEBUG')
+        if (config.has_option(taskid, CHMJobCreator.MERGE_TILEDTIFS) and
+                config.getboolean(taskid, CHMJobCreator.MERGE_TILEDTIFS)):
+            cmd += (' --tiledtif --tifftilesize ' +
+                    config.get(taskid, CHMJobCreator.MERGE_TIFF_TILE_SIZE))
+        if config.has_option(taskid, CHMJobCreator.MERGE_CHUNKSTORE):
+            store_dir = config.get(taskid, CHMJobCreator.MERGE_CHUNKSTORE)
+            if not store_dir.startswith('/'):
+                store_dir = os.path.join(theargs.jobdir,
+                                         CHMJobCreator.RUN_DIR, store_dir)
+            cmd += (' --chunkstore ' + store_dir + ' --section ' +
+                    config.get(taskid, CHMJobCreator.MERGE_SECTION))
+        if config.has_option(taskid, CHMJobCreator.MERGE_PYRAMID_DIR):
+            pyramid_dir = config.get(taskid, CHMJobCreator.MERGE_PYRAMID_DIR)
+            if not pyramid_dir.startswith('/'):
+                pyramid_dir = os.path.join(theargs.jobdir,
+                                           CHMJobCreator.RUN_DIR,
+                                           pyramid_dir)
+            cmd += (' --pyramiddir ' + pyramid_dir + ' --pyramidtilesize ' +
+                    config.get(taskid,
+                               CHMJobCreator.MERGE_PYRAMID_TILE_SIZE))
         exitcode, out, err = core.run_external_command(cmd, out_dir)
 
         sys.stdout.write(out)
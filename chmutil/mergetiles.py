@@ -10,6 +10,11 @@ from chmutil.core import Parameters
 from chmutil import image
 from chmutil import core
 from chmutil.image import SimpleImageMerger
+from chmutil.image import ImagePyramidTileGenerator
+from chmutil.image import ParallelTileWriter
+from chmutil.image import TiledTiffWriter
+from chmutil.chunkstore import ChunkStore
+from chmutil.chunkstore import ChunkStoreError
 
 LOG_FORMAT = "%(asctime)-15s %(levelname)s (%(process)d) %(name)s %(message)s"
 
@@ -35,6 +40,30 @@ def _parse_arguments(desc, args):
     parser.add_argument("--suffix", default='png',
                         help='Only attempt to merge image files with'
                              'this suffix. (Default png)')
+    parser.add_argument("--pyramiddir",
+                        help='If set, a zoom pyramid of png tiles is also '
+                             'written to this directory from the merged '
+                             'image as <zoom>/<row>_<col>.png where zoom 0 '
+                             'is the smallest level and the highest zoom '
+                             'is full resolution, along with a ' +
+                             image.PYRAMID_DESCRIPTOR + ' file describing '
+                             'the levels')
+    parser.add_argument("--pyramidtilesize", type=int, default=128,
+                        help='Size of tiles in pixels if --pyramiddir is '
+                             'set (default 128)')
+    parser.add_argument("--tiledtif", action='store_true',
+                        help='If set, output is written as a tiled deflate '
+                             'compressed BigTIFF file')
+    parser.add_argument("--tifftilesize", default='512x512',
+                        help='Size of tiles in WxH format if --tiledtif is '
+                             'set. Values must be multiples of 16 '
+                             '(default 512x512)')
+    parser.add_argument("--chunkstore",
+                        help='If set, merged image is also written to '
+                             'this chunk store as section --section')
+    parser.add_argument("--section", type=int, default=0,
+                        help='Section of --chunkstore to write merged '
+                             'image to (default 0)')
     parser.add_argument("--log", dest="loglevel", choices=['DEBUG',
                         'INFO', 'WARNING', 'ERROR', 'CRITICAL'],
                         help="Set the logging level (default WARNING)",
@@ -45,8 +74,72 @@ def _parse_arguments(desc, args):
     return parser.parse_args(args, namespace=parsed_arguments)
 
 
-def _merge_image_tiles(img_dir, dest_file, suffix):
+def _write_pyramid(merged, pyramid_dir, tilesize):
+    """Writes zoom pyramid of png tiles for `merged` image
+       into `pyramid_dir` directory with `image.write_image_pyramid`.
+       Every level is built from the level above it so the merged
+       image is only read once
+    :param merged: Pillow Image
+    :param pyramid_dir: directory to write tiles to, created if needed
+    :param tilesize: size of tiles in pixels
+    """
+    if not os.path.isdir(pyramid_dir):
+        logger.info('Creating directory: ' + pyramid_dir)
+        os.makedirs(pyramid_dir, mode=0o755)
+
+    writer = ParallelTileWriter(pyramid_dir)
+    try:
+        image.write_image_pyramid(merged, ImagePyramidTileGenerator(tilesize),
+                                  writer)
+    finally:
+        writer.close()
+
+
+def _write_tiled_tif(merged, dest_file, tiff_tilesize):
+    """Writes `merged` image as tiled compressed BigTIFF
+    :param merged: Pillow Image, converted to mode L if its mode is not
+                   supported by `TiledTiffWriter`
+    :param dest_file: path to write to
+    :param tiff_tilesize: tuple (width, height) of tiff tiles
+    """
+    if merged.mode not in TiledTiffWriter.MODES:
+        logger.info('Converting ' + merged.mode + ' image to L')
+        merged = merged.convert('L')
+    writer = TiledTiffWriter(tilesize=tiff_tilesize)
+    writer.save(merged, dest_file)
+
+
+def _write_chunk_store_section(merged, store_dir, section):
+    """Writes `merged` image to `section` of chunk store. Images smaller
+       than the sections of the store are padded with zeros on the right
+       and bottom
+    :param merged: Pillow Image
+    :param store_dir: path to chunk store
+    :param section: section index starting at 0
+    :raises ChunkStoreError: if `merged` is wider or taller than the
+                             sections of the store
+    """
+    store = ChunkStore(store_dir)
+    (nz, ny, nx) = store.get_shape()
+    if merged.size[0] > nx or merged.size[1] > ny:
+        raise ChunkStoreError('Image of size ' + str(merged.size) +
+                              ' is larger than sections of ' + store_dir +
+                              ' which are ' + str((nx, ny)))
+    if merged.size != (nx, ny):
+        logger.info('Padding image of size ' + str(merged.size) +
+                    ' to ' + str((nx, ny)))
+        merged = merged.crop((0, 0, nx, ny))
+    store.write_section(section, merged)
+
+
+def _merge_image_tiles(img_dir, dest_file, suffix, pyramid_dir=None,
+                       pyramid_tilesize=128, tiff_tilesize=None,
+                       store_dir=None, section=0):
     """Merges image tiles
+    :param tiff_tilesize: if set to tuple (width, height) output is
+                          written as a tiled tif with tiles of that size
+    :param store_dir: if set, merged image is also written to this
+                      chunk store as `section`
     """
     logger.info('Merging images in ' + img_dir)
     sim = SimpleImageMerger()
@@ -58,7 +151,18 @@ def _merge_image_tiles(img_dir, dest_file, suffix):
         return 1
 
     logger.info('Writing results to ' + dest_file)
-    merged.save(dest_file)
+    if tiff_tilesize is not None:
+        _write_tiled_tif(merged, dest_file, tiff_tilesize)
+    else:
+        merged.save(dest_file)
+
+    if store_dir is not None:
+        logger.info('Writing section ' + str(section) + ' of ' + store_dir)
+        _write_chunk_store_section(merged, store_dir, section)
+
+    if pyramid_dir is not None:
+        logger.info('Writing zoom pyramid to ' + pyramid_dir)
+        _write_pyramid(merged, pyramid_dir, pyramid_tilesize)
     return 0
 
 
@@ -91,9 +195,27 @@ def main(arglist):
                      str(theargs.maxpixels))
         Image.MAX_IMAGE_PIXELS = theargs.maxpixels
 
+        pyramid_dir = None
+        if theargs.pyramiddir is not None:
+            pyramid_dir = os.path.abspath(theargs.pyramiddir)
+
+        store_dir = None
+        if theargs.chunkstore is not None:
+            store_dir = os.path.abspath(theargs.chunkstore)
+
+        tiff_tilesize = None
+        if theargs.tiledtif is True:
+            tiff_tilesize = core.parse_width_and_height_from_str(
+                theargs.tifftilesize)
+
         return _merge_image_tiles(os.path.abspath(theargs.imagedir),
                                   os.path.abspath(theargs.output),
-                                  theargs.suffix)
+                                  theargs.suffix,
+                                  pyramid_dir=pyramid_dir,
+                                  pyramid_tilesize=theargs.pyramidtilesize,
+                                  tiff_tilesize=tiff_tilesize,
+                                  store_dir=store_dir,
+                                  section=theargs.section)
     except Exception:
         logger.exception('Caught exception')
         return 2
@@ -0,0 +1,447 @@
+# -*- coding: utf-8 -*-
+
+import os
+import math
+import mmap
+import struct
+import logging
+from PIL import Image
+
+import chmutil
+from chmutil import fileutil
+
+logger = logging.getLogger(__name__)
+
+HEADER_SIZE = 1024
+"""Size in bytes of MRC2014 header
+"""
+
+MODE_UINT8 = 0
+"""MRC mode for 8-bit data, IMOD treats it as unsigned when
+   the IMOD stamp is set and bit 0 of imodFlags is 0
+"""
+
+MODE_UINT16 = 6
+"""MRC mode for unsigned 16-bit data
+"""
+
+MRC2014_VERSION = 20140
+IMOD_STAMP = 1146047817
+MAP_ID = b'MAP '
+MACHST_LITTLE_ENDIAN = b'\x44\x44\x00\x00'
+MACHST_BIG_ENDIAN = b'\x11\x11\x00\x00'
+NUM_LABELS = 10
+LABEL_SIZE = 80
+
+
+class MRCError(Exception):
+    """Raised when there is a problem reading or writing an MRC file
+    """
+    pass
+
+
+def get_mrc_header(nx, ny, nz, dmin=0.0, dmax=0.0, dmean=0.0, rms=0.0,
+                   label=None):
+    """Builds MRC2014 header for little endian stack of 8-bit
+       sections with the IMOD stamp set so data is read as unsigned
+    :param nx: width of section in pixels
+    :param ny: height of section in pixels
+    :param nz: number of sections
+    :param dmin: minimum pixel value
+    :param dmax: maximum pixel value
+    :param dmean: mean pixel value
+    :param rms: standard deviation of pixel values
+    :param label: optional string stored as first label, truncated to
+                  80 characters
+    :returns: bytearray of `HEADER_SIZE` bytes
+    """
+    header = bytearray(HEADER_SIZE)
+    struct.pack_into('<4i', header, 0, nx, ny, nz, MODE_UINT8)
+    # nxstart, nystart, nzstart then mx, my, mz
+    struct.pack_into('<6i', header, 16, 0, 0, 0, nx, ny, nz)
+    # cell dimensions in angstroms (pixel size of 1) and angles
+    struct.pack_into('<6f', header, 40, float(nx), float(ny), float(nz),
+                     90.0, 90.0, 90.0)
+    # mapc, mapr, maps
+    struct.pack_into('<3i', header, 64, 1, 2, 3)
+    struct.pack_into('<3f', header, 76, dmin, dmax, dmean)
+    # ispg of 0 denotes image stack, nsymbt of 0 means no extended header
+    struct.pack_into('<2i', header, 88, 0, 0)
+    struct.pack_into('<i', header, 108, MRC2014_VERSION)
+    # imodStamp and imodFlags
+    struct.pack_into('<2i', header, 152, IMOD_STAMP, 0)
+    struct.pack_into('<4s4sf', header, 208, MAP_ID, MACHST_LITTLE_ENDIAN,
+                     rms)
+    if label is None:
+        label = 'chmutil ' + chmutil.__version__
+    label = label.encode('ascii', 'replace')[:LABEL_SIZE]
+    struct.pack_into('<i', header, 220, 1)
+    header[224:224 + len(label)] = label
+    return header
+
+
+def _get_section_data(img, nx, ny, z):
+    """Gets bytes and pixel statistics of `img` as section `z` of a
+       stack with sections of `nx` by `ny` pixels. The image is
+       flipped vertically since MRC puts the origin in the lower left
+       corner
+    :raises MRCError: if `img` is not the size of a section
+    :returns: tuple (bytes, (min, max, sum, sum of squares))
+    """
+    if img.size != (nx, ny):
+        raise MRCError('Section ' + str(z) + ' has size ' +
+                       str(img.size) + ' but stack requires ' +
+                       str((nx, ny)))
+    if img.mode != 'L':
+        img = img.convert('L')
+    flipped = img.transpose(Image.FLIP_TOP_BOTTOM)
+    try:
+        hist = flipped.histogram()
+        nonzero = [i for i in range(256) if hist[i]]
+        total = 0
+        totalsq = 0
+        for i in nonzero:
+            total += i * hist[i]
+            totalsq += i * i * hist[i]
+        return flipped.tobytes(), (nonzero[0], nonzero[-1], total, totalsq)
+    finally:
+        flipped.close()
+
+
+class MRCStackWriter(object):
+    """Writes a stack of 8-bit grayscale sections to an MRC file.
+       The file is created at full size up front so sections can be
+       written in any order and only one section is held in memory
+       at a time. Sections are flipped vertically since MRC puts the
+       origin in the lower left corner, matching what IMOD newstack
+       does with tif files. Pixel statistics in the header are
+       computed from the sections written and saved on `close`.
+       Sections can also be written by other processes with
+       `MRCSectionWriter` and recorded with `add_written_section`
+    """
+    def __init__(self, path, nx, ny, nz, label=None):
+        """Constructor, creates `path` overwriting any existing file
+        :param path: path to MRC file to write
+        :param nx: width of every section in pixels
+        :param ny: height of every section in pixels
+        :param nz: number of sections
+        :param label: optional label to store in header
+        """
+        self._path = path
+        self._nx = nx
+        self._ny = ny
+        self._nz = nz
+        self._label = label
+        self._section_size = nx * ny
+        self._written = set()
+        self._min = None
+        self._max = None
+        self._sum = 0
+        self._sumsq = 0
+        self._file = open(path, 'wb')
+        self._file.write(get_mrc_header(nx, ny, nz, label=label))
+        self._file.truncate(HEADER_SIZE + self._section_size * nz)
+        self._file.flush()
+
+    def get_dimensions(self):
+        """Gets dimensions of stack
+        :returns: tuple (nx, ny, nz)
+        """
+        return self._nx, self._ny, self._nz
+
+    def _check_section_index(self, z):
+        """Makes sure `z` is in the stack and was not already written
+        :raises MRCError: if it is not
+        """
+        if z < 0 or z >= self._nz:
+            raise MRCError('Section ' + str(z) + ' is outside of stack '
+                           'with ' + str(self._nz) + ' sections')
+        if z in self._written:
+            raise MRCError('Section ' + str(z) + ' already written')
+
+    def _update_stats(self, stats):
+        """Updates pixel statistics with `stats` of one section
+        :param stats: tuple (min, max, sum, sum of squares)
+        """
+        (smin, smax, ssum, ssumsq) = stats
+        if self._min is None or smin < self._min:
+            self._min = smin
+        if self._max is None or smax > self._max:
+            self._max = smax
+        self._sum += ssum
+        self._sumsq += ssumsq
+
+    def write_section(self, z, img):
+        """Writes `img` as section `z` of stack
+        :param z: index of section starting at 0
+        :param img: Pillow image which is converted to mode L if needed
+        :raises MRCError: if `z` is out of range, was already written,
+                          or `img` is not the size of a section
+        """
+        self._check_section_index(z)
+        (data, stats) = _get_section_data(img, self._nx, self._ny, z)
+        self._file.seek(HEADER_SIZE + z * self._section_size)
+        self._file.write(data)
+        self._update_stats(stats)
+        self._written.add(z)
+
+    def add_written_section(self, z, stats):
+        """Records section `z` written to the file by `MRCSectionWriter`
+        :param z: index of section starting at 0
+        :param stats: pixel statistics returned by
+                      `MRCSectionWriter.write_section`
+        :raises MRCError: if `z` is out of range or was already written
+        """
+        self._check_section_index(z)
+        self._update_stats(stats)
+        self._written.add(z)
+
+    def close(self):
+        """Writes header with pixel statistics and closes file
+        """
+        if self._file is None:
+            return
+        try:
+            if len(self._written) < self._nz:
+                logger.warning('Only ' + str(len(self._written)) + ' of ' +
+                               str(self._nz) + ' sections written to ' +
+                               self._path)
+            dmin = 0.0
+            dmax = 0.0
+            dmean = 0.0
+            rms = 0.0
+            if self._written:
+                count = float(len(self._written) * self._section_size)
+                dmin = float(self._min)
+                dmax = float(self._max)
+                dmean = self._sum / count
+                rms = math.sqrt(max(self._sumsq / count - dmean * dmean,
+                                    0.0))
+            self._file.seek(0)
+            self._file.write(get_mrc_header(self._nx, self._ny, self._nz,
+                                            dmin=dmin, dmax=dmax,
+                                            dmean=dmean, rms=rms,
+                                            label=self._label))
+        finally:
+            self._file.close()
+            self._file = None
+        logger.debug('Wrote ' + self._path + ' of size ' +
+                     str(os.path.getsize(self._path)) + ' bytes')
+
+
+class MRCSectionWriter(object):
+    """Writes sections into a stack file already created by
+       `MRCStackWriter` so worker processes can write the sections
+       they create instead of passing images back to the process that
+       owns the `MRCStackWriter`. Pixel statistics of each section are
+       returned so they can be passed to
+       `MRCStackWriter.add_written_section`
+    """
+    def __init__(self, path, nx, ny, nz):
+        """Constructor, opens `path` for update
+        :param path: path to MRC file created by `MRCStackWriter`
+        :param nx: width of every section in pixels
+        :param ny: height of every section in pixels
+        :param nz: number of sections
+        """
+        self._nx = nx
+        self._ny = ny
+        self._nz = nz
+        self._section_size = nx * ny
+        self._file = open(path, 'r+b')
+
+    def write_section(self, z, img):
+        """Writes `img` as section `z` of stack
+        :param z: index of section starting at 0
+        :param img: Pillow image which is converted to mode L if needed
+        :raises MRCError: if `z` is out of range or `img` is not the
+                          size of a section
+        :returns: tuple (min, max, sum, sum of squares) of pixel values
+        """
+        if z < 0 or z >= self._nz:
+            raise MRCError('Section ' + str(z) + ' is outside of stack '
+                           'with ' + str(self._nz) + ' sections')
+        (data, stats) = _get_section_data(img, self._nx, self._ny, z)
+        self._file.seek(HEADER_SIZE + z * self._section_size)
+        self._file.write(data)
+        return stats
+
+    def close(self):
+        """Closes file
+        """
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class MRCReader(object):
+    """Reads sections of an MRC file through a read only memory map so
+       only the pages for the sections accessed are read from disk and
+       sections are returned without copying. Supports 8-bit (mode 0)
+       and unsigned 16-bit (mode 6) files which covers image stacks
+       and masks created by IMOD imodmop.
+    """
+    def __init__(self, path):
+        """Constructor, opens and maps `path`
+        :param path: path to MRC file
+        :raises MRCError: if header is invalid, mode is unsupported,
+                          or file is smaller than header says
+        """
+        self._path = path
+        self._file = open(path, 'rb')
+        self._mmap = None
+        try:
+            self._parse_header(self._file.read(HEADER_SIZE))
+            self._mmap = mmap.mmap(self._file.fileno(), 0,
+                                   access=mmap.ACCESS_READ)
+        except Exception:
+            self._file.close()
+            raise
+
+    def _parse_header(self, header):
+        """Parses MRC header setting dimensions, mode, and data offset
+        """
+        if len(header) < HEADER_SIZE:
+            raise MRCError(self._path + ' is smaller than an MRC header')
+        if header[212:214] == MACHST_BIG_ENDIAN[0:2]:
+            self._endian = '>'
+        else:
+            self._endian = '<'
+        (self._nx, self._ny, self._nz,
+         self._mode) = struct.unpack_from(self._endian + '4i', header, 0)
+        nsymbt = struct.unpack_from(self._endian + 'i', header, 92)[0]
+        (stamp, flags) = struct.unpack_from(self._endian + '2i', header,
+                                            152)
+        self._signed = (self._mode == MODE_UINT8 and stamp == IMOD_STAMP and
+                        (flags & 1) == 1)
+        if self._mode == MODE_UINT8:
+            self._bytes_per_pixel = 1
+        elif self._mode == MODE_UINT16:
+            self._bytes_per_pixel = 2
+        else:
+            raise MRCError(self._path + ' has unsupported mode ' +
+                           str(self._mode))
+        if self._nx <= 0 or self._ny <= 0 or self._nz <= 0 or nsymbt < 0:
+            raise MRCError(self._path + ' has invalid dimensions ' +
+                           str((self._nx, self._ny, self._nz)))
+        self._data_offset = HEADER_SIZE + nsymbt
+        self._section_size = self._nx * self._ny * self._bytes_per_pixel
+        expected = self._data_offset + self._section_size * self._nz
+        actual = os.path.getsize(self._path)
+        if actual < expected:
+            raise MRCError(self._path + ' is ' + str(actual) +
+                           ' bytes, but header requires ' + str(expected))
+
+    def get_dimensions(self):
+        """Gets dimensions of volume
+        :returns: tuple (nx, ny, nz)
+        """
+        return self._nx, self._ny, self._nz
+
+    def get_mode(self):
+        """Gets MRC mode of data
+        """
+        return self._mode
+
+    def _get_section_offset(self, z):
+        """Gets offset in file of first byte of section `z`
+        :raises MRCError: if `z` is out of range
+        """
+        if z < 0 or z >= self._nz:
+            raise MRCError('Section ' + str(z) + ' is outside of volume '
+                           'with ' + str(self._nz) + ' sections')
+        return self._data_offset + z * self._section_size
+
+    def _get_image(self, buf, size):
+        """Creates Pillow image from `buf` holding rows of `size` in file
+           order, flipping so the top row is first and shifting signed
+           8-bit data by 128
+        """
+        if self._bytes_per_pixel == 1:
+            img = Image.frombuffer('L', size, buf, 'raw', 'L', 0, -1)
+            if self._signed is True:
+                return img.point([(i + 128) % 256 for i in range(256)])
+            return img
+        if self._endian == '>':
+            rawmode = 'I;16B'
+        else:
+            rawmode = 'I;16'
+        return Image.frombuffer('I;16', size, buf, 'raw', rawmode, 0, -1)
+
+    def get_section_buffer(self, z):
+        """Gets raw bytes of section `z` without copying. Rows are in
+           file order, bottom row of image first
+        :param z: index of section starting at 0
+        :raises MRCError: if `z` is out of range
+        :returns: memoryview or on python 2 buffer
+        """
+        start = self._get_section_offset(z)
+        return fileutil.get_mapped_buffer(self._mmap, start,
+                                          self._section_size)
+
+    def get_section_image(self, z):
+        """Gets section `z` as a Pillow image that refers to the mapped
+           file data flipped so the top row is first like mrc2tif does.
+           Signed 8-bit data is shifted by 128 into a new image. The
+           image must not be used after `close` is called.
+        :param z: index of section starting at 0
+        :raises MRCError: if `z` is out of range
+        :returns: Pillow image of mode L or I;16
+        """
+        buf = self.get_section_buffer(z)
+        return self._get_image(buf, (self._nx, self._ny))
+
+    def get_region_image(self, z, box):
+        """Gets region of section `z` as a Pillow image oriented like
+           `get_section_image`. Only the rows of the section overlapping
+           `box` are read from the memory map, they start at
+           header + z * nx * ny * bytes per pixel + (ny - lower) * nx *
+           bytes per pixel since rows are stored bottom row first
+        :param z: index of section starting at 0
+        :param box: tuple (left, upper, right, lower), area outside of
+                    section is filled with 0
+        :raises MRCError: if `z` is out of range
+        :returns: Pillow image of mode L or I;16
+        """
+        start = self._get_section_offset(z)
+        (left, upper, right, lower) = box
+        y0 = min(max(upper, 0), self._ny)
+        y1 = max(min(lower, self._ny), y0)
+        if y0 == y1:
+            # no rows overlap, read a single row so the crop below
+            # fills the region with 0
+            y0 = 0
+            y1 = 1
+        row_size = self._nx * self._bytes_per_pixel
+        start += (self._ny - y1) * row_size
+        buf = fileutil.get_mapped_buffer(self._mmap, start,
+                                         (y1 - y0) * row_size)
+        try:
+            rows = self._get_image(buf, (self._nx, y1 - y0))
+            # crop fills area outside of rows with 0
+            result = rows.crop((left, upper - y0, right, lower - y0))
+            if result.mode == 'I;16B':
+                result = Image.frombytes('I;16', result.size,
+                                         result.tobytes(), 'raw', 'I;16B')
+            result.load()
+            rows.close()
+            del rows
+        finally:
+            fileutil.release_mapped_buffer(buf)
+        return result
+
+    def close(self):
+        """Unmaps and closes file
+        """
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                # section images still refer to the map, it is
+                # unmapped once they are garbage collected
+                logger.debug('Sections of ' + self._path +
+                             ' still in use, leaving unmap to gc')
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -161,6 +161,60 @@ class TestBatchedTasksListGenerator(unittest.TestCase):
         finally:
             shutil.rmtree(temp_dir)
 
+    def test_write_batched_config_for_groups(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            gen = BatchedTasksListGenerator(2)
+            cfile = os.path.join(temp_dir, 'foo.config')
+            try:
+                gen.write_batched_config_for_groups(None, [])
+                self.fail('Expected InvalidConfigFileError')
+            except InvalidConfigFileError:
+                pass
+            try:
+                gen.write_batched_config_for_groups(cfile, None)
+                self.fail('Expected InvalidTaskListError')
+            except InvalidTaskListError:
+                pass
+            self.assertEqual(gen.write_batched_config_for_groups(cfile,
+                                                                 [[], []]),
+                             [(1, 0), (1, 0)])
+            self.assertFalse(os.path.isfile(cfile))
+
+            res = gen.write_batched_config_for_groups(cfile,
+                                                      [['1', '2', '3'],
+                                                       ['7'], ['9', '10']])
+            self.assertEqual(res, [(1, 2), (3, 1), (4, 1)])
+            bconfig = configparser.ConfigParser()
+            bconfig.read(cfile)
+            self.assertEqual(bconfig.sections(), ['1', '2', '3', '4'])
+            self.assertEqual(bconfig.get('2',
+                                         CHMJobCreator.BCONFIG_TASK_ID), '3')
+            self.assertEqual(bconfig.get('3',
+                                         CHMJobCreator.BCONFIG_TASK_ID), '7')
+            self.assertEqual(bconfig.get('4',
+                                         CHMJobCreator.BCONFIG_TASK_ID),
+                             '9,10')
+
+            # array tasks still running keep their sections
+            res = gen.write_batched_config_for_groups(cfile, [['1'], ['9']],
+                                                      keep_tasks={3: ['7'],
+                                                                  1: ['2',
+                                                                      '3']})
+            self.assertEqual(res, [(4, 1), (5, 1)])
+            bconfig = configparser.ConfigParser()
+            bconfig.read(cfile)
+            self.assertEqual(bconfig.sections(), ['1', '3', '4', '5'])
+            self.assertEqual(bconfig.get('1',
+                                         CHMJobCreator.BCONFIG_TASK_ID),
+                             '2,3')
+            self.assertEqual(bconfig.get('3',
+                                         CHMJobCreator.BCONFIG_TASK_ID), '7')
+            self.assertEqual(bconfig.get('5',
+                                         CHMJobCreator.BCONFIG_TASK_ID), '9')
+        finally:
+            shutil.rmtree(temp_dir)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -142,6 +142,29 @@ class TestCore(unittest.TestCase):
         self.assertEqual(a.does_box_intersect(b), False)
         self.assertEqual(b.does_box_intersect(a), False)
 
+        # test cross shaped overlap where no corners are in other box
+        a = Box(left=0, upper=60, right=100, lower=70)
+        self.assertEqual(a.does_box_intersect(b), True)
+        self.assertEqual(b.does_box_intersect(a), True)
+
+        # test boxes side by side not overlapping
+        a = Box(left=21, upper=50, right=30, lower=100)
+        self.assertEqual(a.does_box_intersect(b), False)
+        self.assertEqual(b.does_box_intersect(a), False)
+
+    def test_get_area(self):
+        self.assertEqual(Box().get_area(), None)
+        self.assertEqual(Box(10, 50, 20, 100).get_area(), 500)
+        self.assertEqual(Box(10, 50, 10, 100).get_area(), 0)
+
+    def test_slots(self):
+        b = Box()
+        try:
+            b.foo = 1
+            self.fail('Expected AttributeError')
+        except AttributeError:
+            pass
+
 
 if __name__ == '__main__':
     unittest.main()
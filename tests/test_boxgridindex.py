@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_boxgridindex.py
+----------------------------------
+
+Tests for `BoxGridIndex` in core
+"""
+
+import unittest
+import random
+
+from chmutil.core import Box
+from chmutil.core import BoxGridIndex
+
+
+class TestBoxGridIndex(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def test_empty_index_and_none_boxes(self):
+        index = BoxGridIndex(10, 10)
+        self.assertEqual(index.get_box_count(), 0)
+        self.assertEqual(index.does_box_intersect_any(None), False)
+        self.assertEqual(index.does_box_intersect_any(Box()), False)
+        self.assertEqual(index.does_box_intersect_any(Box(0, 0, 5, 5)),
+                         False)
+        index.add_box(None)
+        index.add_box(Box())
+        self.assertEqual(index.get_box_count(), 0)
+
+    def test_intersect(self):
+        index = BoxGridIndex(10, 10)
+        index.add_box(Box(left=10, upper=50, right=20, lower=100))
+        self.assertEqual(index.get_box_count(), 1)
+
+        # inside
+        self.assertTrue(index.does_box_intersect_any(Box(12, 60, 18, 75)))
+        # touching edge
+        self.assertTrue(index.does_box_intersect_any(Box(12, 40, 18, 50)))
+        # box far away
+        self.assertFalse(index.does_box_intersect_any(Box(12, 40, 18, 45)))
+        self.assertFalse(index.does_box_intersect_any(Box(500, 500,
+                                                          510, 510)))
+
+    def test_matches_brute_force(self):
+        rand = random.Random(3)
+        index = BoxGridIndex(20, 20)
+        box_list = []
+        for x in range(0, 300):
+            left = rand.randint(0, 400)
+            upper = rand.randint(0, 400)
+            box = Box(left, upper, left + 20, upper + 20)
+            expected = False
+            for abox in box_list:
+                if abox.does_box_intersect(box):
+                    expected = True
+                    break
+            self.assertEqual(index.does_box_intersect_any(box), expected)
+            if expected is False:
+                index.add_box(box)
+                box_list.append(box)
+        self.assertEqual(index.get_box_count(), len(box_list))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_boxlist.py
+----------------------------------
+
+Tests for `BoxList` in core
+"""
+
+import unittest
+import random
+
+from chmutil.core import Box
+from chmutil.core import BoxList
+
+
+class TestBoxList(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def test_empty_list(self):
+        blist = BoxList()
+        self.assertEqual(len(blist), 0)
+        self.assertEqual(blist.does_box_intersect_any(Box(0, 0, 1, 1)),
+                         False)
+        self.assertEqual(blist.get_intersecting_indexes(Box(0, 0, 1, 1)),
+                         [])
+        self.assertEqual(blist.get_containing_indexes((0, 0)), [])
+        self.assertEqual(list(blist.get_areas()), [])
+        self.assertEqual(blist.get_total_area(), 0)
+
+    def test_append_and_get_box(self):
+        blist = BoxList([Box(1, 2, 3, 4)])
+        blist.append(Box(5, 6, 7, 8))
+        self.assertEqual(len(blist), 2)
+        self.assertEqual(blist.get_box(0).get_box_as_tuple(), (1, 2, 3, 4))
+        self.assertEqual(blist.get_box(1).get_box_as_tuple(), (5, 6, 7, 8))
+        try:
+            blist.append(Box())
+            self.fail('Expected ValueError')
+        except ValueError as e:
+            self.assertEqual(str(e), 'Box cannot have None corners')
+
+    def test_none_queries(self):
+        blist = BoxList([Box(1, 2, 3, 4)])
+        self.assertEqual(blist.does_box_intersect_any(None), False)
+        self.assertEqual(blist.does_box_intersect_any(Box()), False)
+        self.assertEqual(blist.get_intersecting_indexes(None), [])
+        self.assertEqual(blist.get_containing_indexes(None), [])
+
+    def test_queries(self):
+        blist = BoxList([Box(10, 50, 20, 100),
+                         Box(0, 60, 100, 70),
+                         Box(200, 200, 210, 220)])
+        self.assertEqual(blist.get_intersecting_indexes(Box(15, 65,
+                                                            16, 66)),
+                         [0, 1])
+        self.assertEqual(blist.get_intersecting_indexes(Box(210, 0,
+                                                            300, 200)),
+                         [2])
+        self.assertEqual(blist.does_box_intersect_any(Box(300, 0,
+                                                          400, 10)),
+                         False)
+        self.assertEqual(blist.get_containing_indexes((20, 70)), [0, 1])
+        self.assertEqual(blist.get_containing_indexes((205, 221)), [])
+        self.assertEqual(list(blist.get_areas()), [500, 1000, 200])
+        self.assertEqual(blist.get_total_area(), 1700)
+
+    def test_matches_box(self):
+        rand = random.Random(11)
+        box_list = []
+        for x in range(0, 100):
+            left = rand.randint(0, 200)
+            upper = rand.randint(0, 200)
+            box_list.append(Box(left, upper, left + rand.randint(0, 40),
+                                upper + rand.randint(0, 40)))
+        blist = BoxList(box_list)
+        for x in range(0, 50):
+            left = rand.randint(0, 200)
+            upper = rand.randint(0, 200)
+            box = Box(left, upper, left + 30, upper + 30)
+            expected = [i for i in range(len(box_list))
+                        if box_list[i].does_box_intersect(box)]
+            self.assertEqual(blist.get_intersecting_indexes(box), expected)
+            self.assertEqual(blist.does_box_intersect_any(box),
+                             len(expected) > 0)
+            coord = (left, upper)
+            expected = [i for i in range(len(box_list))
+                        if box_list[i].is_coordinate_in_box(coord)]
+            self.assertEqual(blist.get_containing_indexes(coord), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -10,15 +10,26 @@ Tests for `checkchmjob.py`
 
 import unittest
 import os
+import sys
+import json
 import tempfile
 import shutil
+import configparser
 from PIL import Image
 
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
 from chmutil import checkchmjob
 from chmutil import createchmjob
 from chmutil.core import LoadConfigError
 from chmutil.core import CHMJobCreator
 from chmutil.core import CHMConfigFromConfigFactory
+from chmutil.cluster import TaskRetryPlanner
+from chmutil.cluster import CHMTaskChecker
+from chmutil.cluster import MergeTaskChecker
 
 
 def create_successful_job(a_tmp_dir):
@@ -78,6 +89,18 @@ class TestCheckCHMJob(unittest.TestCase):
         pargs = checkchmjob._parse_arguments('hi', ['1'])
         self.assertEqual(pargs.jobdir, '1')
 
+        orig_stdout = sys.stdout
+        sys.stdout = StringIO()
+        try:
+            checkchmjob._parse_arguments('hi', ['--help'])
+            self.fail('Expected SystemExit')
+        except SystemExit:
+            res = sys.stdout.getvalue()
+        finally:
+            sys.stdout = orig_stdout
+        self.assertTrue('{batch' not in res)
+        self.assertTrue(CHMJobCreator.TASK_RETRY_FILE_NAME in res)
+
     def test_check_chm_job_success(self):
         temp_dir = tempfile.mkdtemp()
         try:
@@ -251,6 +274,274 @@ class TestCheckCHMJob(unittest.TestCase):
         finally:
             shutil.rmtree(temp_dir)
 
+    def test_check_chm_job_watch_all_tasks_complete(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            out = create_successful_job(temp_dir)
+            pargs = checkchmjob._parse_arguments('hi', [out, '--watch',
+                                                        '--interval', '5'])
+            self.assertEqual(pargs.watch, True)
+            self.assertEqual(pargs.interval, 5.0)
+            pargs.program = 'foo'
+            pargs.version = '1.0.0'
+            run_dir = os.path.join(out, CHMJobCreator.RUN_DIR)
+            myimg = Image.new('L', (800, 800))
+            myimg.save(os.path.join(run_dir, CHMJobCreator.TILES_DIR,
+                                    'foo.png', '001.foo.png'), 'PNG')
+            myimg.save(os.path.join(run_dir, CHMJobCreator.PROBMAPS_DIR,
+                                    'foo.png'), 'PNG')
+            val = checkchmjob._check_chm_job(pargs)
+            self.assertEqual(val, 0)
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_check_chm_job_json_and_csv_format(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            out = create_successful_job(temp_dir)
+            pargs = checkchmjob._parse_arguments('hi', [out])
+            self.assertEqual(pargs.format, 'text')
+            self.assertEqual(pargs.costpercpuhour, 1.0)
+            for fmt, first in [('json', '{'), ('csv', 'phase,')]:
+                pargs = checkchmjob._parse_arguments('hi', [out, '--format',
+                                                            fmt])
+                pargs.program = 'foo'
+                pargs.version = '1.0.0'
+                self.assertEqual(pargs.detailed, False)
+                orig_stdout = sys.stdout
+                sys.stdout = StringIO()
+                try:
+                    val = checkchmjob._check_chm_job(pargs)
+                    res = sys.stdout.getvalue()
+                finally:
+                    sys.stdout = orig_stdout
+                self.assertEqual(val, 0)
+                self.assertEqual(pargs.detailed, True)
+                self.assertTrue(res.startswith(first))
+                if fmt == 'json':
+                    summary = json.loads(res)
+                    self.assertEqual(summary['chm']['total_tasks'], 1)
+                    self.assertEqual(summary['chm']['completed_tasks'], 0)
+                    self.assertEqual(summary['images']['count'], 1)
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_analyze_hosts(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            out = create_successful_job(temp_dir)
+            chmconfig = checkchmjob._get_chmconfig(out)
+            res = StringIO()
+            self.assertEqual(checkchmjob._analyze_hosts(chmconfig, out,
+                                                        out=res), [])
+            self.assertTrue('CHM tasks by host: no task logs' in
+                            res.getvalue())
+            stdout_dir = chmconfig.get_stdout_dir()
+            for i in range(6):
+                host = 'node' + str(i)
+                walltime = '10:00'
+                if i == 5:
+                    walltime = '59:00'
+                f = open(os.path.join(stdout_dir, '1.' + str(i) + '.out'),
+                         'w')
+                f.write('HOST: ' + host + '\n')
+                f.write('Elapsed (wall clock) time (h:mm:ss or m:ss): ' +
+                        walltime + '\n')
+                f.write('chmrunner.py exited with code: 0\n')
+                f.close()
+            res = StringIO()
+            self.assertEqual(checkchmjob._analyze_hosts(chmconfig, out,
+                                                        out=res), ['node5'])
+            self.assertTrue('CHM tasks by host (6 hosts):\n* node5' in
+                            res.getvalue())
+            exfile = os.path.join(out, CHMJobCreator.EXCLUDE_HOSTS_FILE_NAME)
+            f = open(exfile, 'r')
+            self.assertTrue('node5\n' in f.read())
+            f.close()
+
+            pargs = checkchmjob._parse_arguments('hi', [out,
+                                                        '--analyzehosts'])
+            self.assertEqual(pargs.analyzehosts, True)
+            pargs.program = 'foo'
+            pargs.version = '1.0.0'
+            self.assertEqual(checkchmjob._check_chm_job(pargs), 0)
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_submit_retries_failed_tasks(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            out = create_successful_job(temp_dir)
+            chmconfig = checkchmjob._get_chmconfig(out)
+            chm_tasks = CHMTaskChecker(chmconfig.get_config()).\
+                get_incomplete_tasks_list()
+            mem = str(chmconfig.get_max_chm_memory_in_gb())
+            bfile = chmconfig.get_batchedjob_config_file_path()
+            logfile = os.path.join(chmconfig.get_stdout_dir(), '1.1.out')
+
+            def submit():
+                if os.path.isfile(bfile):
+                    os.utime(bfile, (1, 1))
+                orig_stdout = sys.stdout
+                sys.stdout = StringIO()
+                try:
+                    self.assertEqual(checkchmjob._submit(chmconfig,
+                                                         chm_tasks, []), 0)
+                    return sys.stdout.getvalue()
+                finally:
+                    sys.stdout = orig_stdout
+
+            res = submit()
+            self.assertTrue('qsub -t 1-1 ' in res)
+            self.assertFalse('by cause' in res)
+
+            f = open(logfile, 'w')
+            f.write('MemoryError\nchmrunner.py exited with code: 2\n')
+            f.close()
+            res = submit()
+            self.assertTrue('Failed chm tasks by cause: oom 1' in res)
+            newmem = str(int(float(mem) * TaskRetryPlanner.RESOURCE_FACTOR +
+                             0.999))
+            self.assertTrue('qsub -l h_vmem=' + newmem + 'G -t 1-1 ' in res)
+
+            f = open(logfile, 'w')
+            f.write('cannot identify image file\n'
+                    'chmrunner.py exited with code: 2\n')
+            f.close()
+            res = submit()
+            self.assertTrue('Held back 1 chm tasks' in res)
+            self.assertTrue('chm task 1: badinput (' + logfile + ')' in res)
+            self.assertFalse('Run this' in res)
+            self.assertTrue(os.path.isfile(os.path.join(
+                out, CHMJobCreator.TASK_RETRY_FILE_NAME)))
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_submit_skips_running_tasks(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            out = create_successful_job(temp_dir)
+            chmconfig = checkchmjob._get_chmconfig(out)
+            self.assertEqual(chmconfig.get_job_name(), 'chmjob')
+            bfile = chmconfig.get_batchedjob_config_file_path()
+            qstat = os.path.join(temp_dir, 'qstat')
+
+            def write_qstat(output, exit_code=0):
+                f = open(qstat, 'w')
+                f.write('#!/bin/sh\ncat <<EOF\n' + output + '\nEOF\n'
+                        'exit ' + str(exit_code) + '\n')
+                f.close()
+                os.chmod(qstat, 0o700)
+
+            def check(args):
+                pargs = checkchmjob._parse_arguments('hi', [out, '--submit',
+                                                            '--skiprunning',
+                                                            '--schedulercmd',
+                                                            qstat] + args)
+                pargs.program = 'foo'
+                pargs.version = '1.0.0'
+                orig_stdout = sys.stdout
+                sys.stdout = StringIO()
+                try:
+                    val = checkchmjob._check_chm_job(pargs)
+                    return val, sys.stdout.getvalue()
+                finally:
+                    sys.stdout = orig_stdout
+
+            # nothing queued or running
+            write_qstat('<job_info></job_info>')
+            val, res = check([])
+            self.assertEqual(val, 0)
+            self.assertTrue('qsub -t 1-1 ' in res)
+            self.assertTrue(os.path.isfile(bfile))
+            os.utime(bfile, (1, 1))
+
+            # task is queued so batched config is left alone
+            write_qstat('<job_info><job_list><JB_name>chmjob</JB_name>'
+                        '<tasks>1</tasks></job_list></job_info>')
+            val, res = check([])
+            self.assertEqual(val, 0)
+            self.assertTrue('Skipping 1 chm tasks in 1 array tasks of '
+                            'chmjob' in res)
+            self.assertTrue('nothing to submit' in res)
+            self.assertFalse('Run this' in res)
+            self.assertEqual(os.path.getmtime(bfile), 1)
+
+            # scheduler query fails
+            write_qstat('', exit_code=1)
+            val, res = check([])
+            self.assertEqual(val, 3)
+            self.assertEqual(os.path.getmtime(bfile), 1)
+
+            # job created before job name was saved
+            write_qstat('<job_info></job_info>')
+            cfile = os.path.join(out, CHMJobCreator.CONFIG_FILE_NAME)
+            con = configparser.ConfigParser()
+            con.read(cfile)
+            con.remove_option(CHMJobCreator.CONFIG_DEFAULT,
+                              CHMJobCreator.CONFIG_JOB_NAME)
+            f = open(cfile, 'w')
+            con.write(f)
+            f.close()
+            val, res = check([])
+            self.assertEqual(val, 3)
+            self.assertEqual(os.path.getmtime(bfile), 1)
+
+            # cluster without scheduler query
+            con.set(CHMJobCreator.CONFIG_DEFAULT,
+                    CHMJobCreator.CONFIG_CLUSTER, 'foo')
+            f = open(cfile, 'w')
+            con.write(f)
+            f.close()
+            val, res = check([])
+            self.assertEqual(val, 3)
+            self.assertEqual(os.path.getmtime(bfile), 1)
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_watch_chm_job_until_complete(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            out = create_successful_job(temp_dir)
+            chmconfig = checkchmjob._get_chmconfig(out)
+            chm_tasks = CHMTaskChecker(chmconfig.get_config()).\
+                get_incomplete_tasks_list()
+            merge_tasks = MergeTaskChecker(chmconfig.get_merge_config()).\
+                get_incomplete_tasks_list()
+            self.assertEqual(len(chm_tasks), 1)
+            run_dir = os.path.join(out, CHMJobCreator.RUN_DIR)
+            outputs = [os.path.join(run_dir, CHMJobCreator.TILES_DIR,
+                                    'foo.png', '001.foo.png'),
+                       os.path.join(run_dir, CHMJobCreator.PROBMAPS_DIR,
+                                    'foo.png')]
+            sleeps = []
+
+            def fake_sleep(interval):
+                sleeps.append(interval)
+                Image.new('L', (10, 10)).save(outputs[len(sleeps) - 1],
+                                              'PNG')
+
+            val = checkchmjob._watch_chm_job(chmconfig, chm_tasks,
+                                             merge_tasks, 2,
+                                             sleep=fake_sleep)
+            self.assertEqual(val, 0)
+            self.assertEqual(sleeps, [2, 2])
+
+            def interrupt(interval):
+                sleeps.append(interval)
+                raise KeyboardInterrupt()
+
+            for path in outputs:
+                os.unlink(path)
+
+            val = checkchmjob._watch_chm_job(chmconfig, chm_tasks,
+                                             merge_tasks, 2,
+                                             sleep=interrupt)
+            self.assertEqual(val, 0)
+            self.assertEqual(sleeps, [2, 2, 2])
+        finally:
+            shutil.rmtree(temp_dir)
+
 
 if __name__ == '__main__':
     unittest.main()
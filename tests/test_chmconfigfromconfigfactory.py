@@ -101,6 +101,38 @@ class TestCHMConfigFromConfigFactory(unittest.TestCase):
             self.assertEqual(chmconfig.get_model(), None)
             self.assertEqual(chmconfig.get_out_dir(), temp_dir)
             self.assertEqual(chmconfig.get_number_merge_tasks_per_node(), 4)
+            self.assertEqual(chmconfig.get_tiledtifs_arg(), False)
+
+            config.set('', CHMJobCreator.MERGE_TILEDTIFS, 'True')
+            f = open(cfile, 'w')
+            config.write(f)
+            f.flush()
+            f.close()
+            chmconfig = fac.get_chmconfig(skip_loading_config=True,
+                                          skip_loading_mergeconfig=False)
+            self.assertEqual(chmconfig.get_tiledtifs_arg(), True)
+            self.assertEqual(chmconfig.get_chunkstore_arg(), False)
+            self.assertEqual(chmconfig.get_pyramids_arg(), False)
+
+            config.set('', CHMJobCreator.MERGE_PYRAMID_TILE_SIZE, '256')
+            f = open(cfile, 'w')
+            config.write(f)
+            f.flush()
+            f.close()
+            chmconfig = fac.get_chmconfig(skip_loading_config=True,
+                                          skip_loading_mergeconfig=False)
+            self.assertEqual(chmconfig.get_pyramids_arg(), True)
+            self.assertEqual(chmconfig.get_pyramid_tile_size(), 256)
+            self.assertEqual(chmconfig.get_mergejob_name(), 'mergechmjob')
+
+            config.set('', CHMJobCreator.MERGE_JOB_NAME, 'mergeyojob')
+            f = open(cfile, 'w')
+            config.write(f)
+            f.flush()
+            f.close()
+            chmconfig = fac.get_chmconfig(skip_loading_config=True,
+                                          skip_loading_mergeconfig=False)
+            self.assertEqual(chmconfig.get_mergejob_name(), 'mergeyojob')
         finally:
             shutil.rmtree(temp_dir)
 
@@ -219,6 +251,33 @@ class TestCHMConfigFromConfigFactory(unittest.TestCase):
             self.assertEqual(chmconfig.get_overlap_size(), '10x20')
             self.assertEqual(chmconfig.get_cluster(), 'mycluster')
             self.assertEqual(chmconfig.get_account(), 'gg123')
+            self.assertEqual(chmconfig.get_croptiles_arg(), False)
+
+            config.set('', CHMJobCreator.CONFIG_CROP_TILES, 'True')
+            f = open(cfile, 'w')
+            config.write(f)
+            f.flush()
+            f.close()
+            chmconfig = fac.get_chmconfig()
+            self.assertEqual(chmconfig.get_croptiles_arg(), True)
+            self.assertEqual(chmconfig.get_stageinput_arg(), False)
+
+            config.set('', CHMJobCreator.CONFIG_STAGE_INPUT, 'True')
+            f = open(cfile, 'w')
+            config.write(f)
+            f.flush()
+            f.close()
+            chmconfig = fac.get_chmconfig()
+            self.assertEqual(chmconfig.get_stageinput_arg(), True)
+            self.assertEqual(chmconfig.get_job_name(), 'chmjob')
+
+            config.set('', CHMJobCreator.CONFIG_JOB_NAME, 'yojob')
+            f = open(cfile, 'w')
+            config.write(f)
+            f.flush()
+            f.close()
+            chmconfig = fac.get_chmconfig()
+            self.assertEqual(chmconfig.get_job_name(), 'yojob')
 
             config.set('', CHMJobCreator.CONFIG_DISABLE_HISTEQ_IMAGES, 'False')
             f = open(cfile, 'w')
@@ -20,6 +20,7 @@ from PIL import Image
 from chmutil.core import CHMJobCreator
 from chmutil.core import CHMConfig
 from chmutil.image import ImageStats
+from chmutil.chunkstore import ChunkStore
 
 
 class TestCHMJobCreator(unittest.TestCase):
@@ -293,6 +294,130 @@ class TestCHMJobCreator(unittest.TestCase):
         finally:
             shutil.rmtree(temp_dir)
 
+    def test_create_job_tiledtifs_true(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            image_dir = os.path.join(temp_dir, 'images')
+            os.makedirs(image_dir, mode=0o775)
+            fooimg = os.path.join(image_dir, 'foo1.png')
+            self._create_png_image(fooimg, (400, 300))
+
+            opts = CHMConfig(image_dir, 'model',
+                             temp_dir, '200x100', '20x5',
+                             gentifs=True, tiledtifs=True)
+            creator = CHMJobCreator(opts)
+            opts = creator.create_job()
+            config = opts.get_merge_config()
+            res = config.getboolean(CHMJobCreator.CONFIG_DEFAULT,
+                                    CHMJobCreator.MERGE_TILEDTIFS)
+            self.assertEqual(res, True)
+            # 200 - 40 = 160 and 100 - 10 = 90 rounded up to 96
+            self.assertEqual(config.get('1',
+                                        CHMJobCreator.MERGE_TIFF_TILE_SIZE),
+                             '160x96')
+            res = config.get('1', CHMJobCreator.MERGE_OUTPUT_IMAGE)
+            self.assertEqual(res, os.path.join(CHMJobCreator.PROBMAPS_DIR,
+                                               'foo1.png' +
+                                               CHMJobCreator.PMAP_SUFFIX))
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_create_job_chunkstore_true(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            image_dir = os.path.join(temp_dir, 'images')
+            os.makedirs(image_dir, mode=0o775)
+            self._create_png_image(os.path.join(image_dir, 'b.png'),
+                                   (400, 300))
+            self._create_png_image(os.path.join(image_dir, 'a.png'),
+                                   (300, 350))
+
+            opts = CHMConfig(image_dir, 'model',
+                             temp_dir, '200x100', '0x0',
+                             chunkstore=True)
+            creator = CHMJobCreator(opts)
+            opts = creator.create_job()
+            config = opts.get_merge_config()
+            self.assertEqual(config.get(CHMJobCreator.CONFIG_DEFAULT,
+                                        CHMJobCreator.MERGE_CHUNKSTORE),
+                             CHMJobCreator.CHUNKSTORE_DIR)
+            self.assertEqual(config.get('1',
+                                        CHMJobCreator.MERGE_INPUT_IMAGE_DIR),
+                             os.path.join(CHMJobCreator.TILES_DIR, 'a.png'))
+            self.assertEqual(config.get('1', CHMJobCreator.MERGE_SECTION),
+                             '0')
+            self.assertEqual(config.get('2', CHMJobCreator.MERGE_SECTION),
+                             '1')
+            store = ChunkStore(os.path.join(opts.get_run_dir(),
+                                            CHMJobCreator.CHUNKSTORE_DIR))
+            self.assertEqual(store.get_shape(), (2, 350, 400))
+            self.assertEqual(store.get_chunks(), (1, 112, 208))
+            self.assertEqual(store.get_attributes(),
+                             {CHMJobCreator.CHUNKSTORE_SECTIONS: ['a.png',
+                                                                  'b.png']})
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_create_job_pyramids_true(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            image_dir = os.path.join(temp_dir, 'images')
+            os.makedirs(image_dir, mode=0o775)
+            self._create_png_image(os.path.join(image_dir, 'a.png'),
+                                   (400, 300))
+
+            opts = CHMConfig(image_dir, 'model',
+                             temp_dir, '200x100', '0x0',
+                             pyramids=True, pyramid_tile_size=256)
+            creator = CHMJobCreator(opts)
+            opts = creator.create_job()
+            config = opts.get_merge_config()
+            self.assertEqual(config.get(CHMJobCreator.CONFIG_DEFAULT,
+                                        CHMJobCreator.
+                                        MERGE_PYRAMID_TILE_SIZE), '256')
+            self.assertEqual(config.get('1',
+                                        CHMJobCreator.MERGE_PYRAMID_DIR),
+                             os.path.join(CHMJobCreator.PYRAMIDS_DIR,
+                                          'a.png'))
+
+            # no pyramid options unless enabled
+            opts = CHMConfig(image_dir, 'model',
+                             temp_dir, '200x100', '0x0')
+            config = CHMJobCreator(opts).create_job().get_merge_config()
+            self.assertFalse(config.has_option('1', CHMJobCreator.
+                                               MERGE_PYRAMID_DIR))
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_create_job_croptiles_true(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            image_dir = os.path.join(temp_dir, 'images')
+            os.makedirs(image_dir, mode=0o775)
+            self._create_png_image(os.path.join(image_dir, 'a.png'),
+                                   (400, 300))
+            opts = CHMConfig(image_dir, 'model',
+                             temp_dir, '200x100', '0x0')
+            config = CHMJobCreator(opts)._create_config()
+            self.assertFalse(config.has_option(CHMJobCreator.CONFIG_DEFAULT,
+                                               CHMJobCreator.
+                                               CONFIG_CROP_TILES))
+            opts = CHMConfig(image_dir, 'model',
+                             temp_dir, '200x100', '0x0', croptiles=True)
+            opts = CHMJobCreator(opts).create_job()
+            config = opts.get_config()
+            self.assertEqual(config.getboolean('1', CHMJobCreator.
+                                               CONFIG_CROP_TILES), True)
+            self.assertFalse(config.has_option('1', CHMJobCreator.
+                                               CONFIG_STAGE_INPUT))
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_get_tiff_tile_size(self):
+        opts = CHMConfig('images', 'model', 'out', '10x1000', '0x100')
+        creator = CHMJobCreator(opts)
+        self.assertEqual(creator._get_tiff_tile_size(), '16x800')
+
     def test_create_job_one_image_five_tiles_per_job(self):
         temp_dir = tempfile.mkdtemp()
         try:
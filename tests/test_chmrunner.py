@@ -14,8 +14,10 @@ import tempfile
 import shutil
 import configparser
 import stat
+from PIL import Image
 
 from chmutil import chmrunner
+from chmutil import image
 from chmutil.core import LoadConfigError
 from chmutil.core import CHMJobCreator
 from chmutil.chmrunner import SingularityAbortError
@@ -118,6 +120,253 @@ class TestCHMRunner(unittest.TestCase):
         finally:
             shutil.rmtree(temp_dir)
 
+    def test_crop_prob_map(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            prob_map = os.path.join(temp_dir, 'foo.png')
+            img = Image.new('L', (100, 80))
+            img.putpixel((15, 25), 10)
+            img.save(prob_map)
+
+            # no tiles in args
+            self.assertEqual(chmrunner._crop_prob_map(prob_map, '-h',
+                                                      '30x30', '5x5'),
+                             None)
+
+            # tiles cover whole image
+            args = ' '.join(['-t ' + str(c) + ',' + str(r)
+                             for c in range(1, 6) for r in range(1, 5)])
+            self.assertEqual(chmrunner._crop_prob_map(prob_map, args,
+                                                      '30x30', '5x5'),
+                             None)
+            self.assertFalse(os.path.isfile(prob_map +
+                                            image.CROP_CONFIG_SUFFIX))
+
+            # tiles 2,2 and 2,3 cover 20,20 to 40,60 and nonzero pixel
+            # at 15,25 grows the box
+            res = chmrunner._crop_prob_map(prob_map, '-t 2,2 -t 2,3',
+                                           '30x30', '5x5')
+            self.assertEqual(res, prob_map + image.CROP_CONFIG_SUFFIX)
+            self.assertEqual(image.read_crop_config(prob_map),
+                             ((15, 20), (100, 80)))
+            cropped = Image.open(prob_map)
+            self.assertEqual(cropped.size, (25, 40))
+            self.assertEqual(cropped.getpixel((0, 5)), 10)
+            cropped.close()
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_run_single_chm_job_with_croptiles(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            scratch = os.path.join(temp_dir, 'tmp')
+            os.makedirs(scratch, mode=0o755)
+            chmrundir = os.path.join(temp_dir, CHMJobCreator.RUN_DIR)
+            os.makedirs(chmrundir, mode=0o755)
+            img = Image.new('L', (100, 80))
+            img.putpixel((50, 50), 100)
+            img.save(os.path.join(temp_dir, 'input.1.png'))
+
+            con = configparser.ConfigParser()
+            con.set('', CHMJobCreator.CONFIG_DISABLE_HISTEQ_IMAGES,
+                    'False')
+            con.set('', CHMJobCreator.CONFIG_MODEL, '/model')
+            con.set('', CHMJobCreator.CONFIG_IMAGES, temp_dir)
+            con.set('', CHMJobCreator.CONFIG_TILE_SIZE, '40x40')
+            con.set('', CHMJobCreator.CONFIG_OVERLAP_SIZE, '0x0')
+            con.set('', CHMJobCreator.CONFIG_CROP_TILES, 'True')
+            con.add_section('1')
+            con.set('1', CHMJobCreator.CONFIG_INPUT_IMAGE, 'input.1.png')
+            con.set('1', CHMJobCreator.CONFIG_OUTPUT_IMAGE, 'output.1.png')
+            con.set('1', CHMJobCreator.CONFIG_ARGS, '-t 2,2')
+
+            # fake CHM that copies input image to output directory
+            fakecmd = os.path.join(temp_dir, 'fake.py')
+            f = open(fakecmd, 'w')
+            f.write('#!/usr/bin/env python\n\n')
+            f.write('import sys\n')
+            f.write('import shutil\n')
+            f.write('shutil.copy(sys.argv[2], sys.argv[3])\n')
+            f.close()
+            os.chmod(fakecmd, stat.S_IRWXU)
+            con.set('', CHMJobCreator.CONFIG_CHM_BIN, fakecmd)
+
+            o_image = os.path.join(chmrundir, 'output.1.png')
+            open(o_image + image.CROP_CONFIG_SUFFIX, 'w').close()
+            ecode = chmrunner._run_single_chm_job(temp_dir,
+                                                  scratch, '1', con)
+            self.assertEqual(ecode, 0)
+            self.assertEqual(image.read_crop_config(o_image),
+                             ((40, 40), (100, 80)))
+            cropped = Image.open(o_image)
+            self.assertEqual(cropped.size, (40, 40))
+            self.assertEqual(cropped.getpixel((10, 10)), 100)
+            cropped.close()
+
+            # rerun without croptiles removes old crop config
+            con.remove_option('DEFAULT', CHMJobCreator.CONFIG_CROP_TILES)
+            ecode = chmrunner._run_single_chm_job(temp_dir,
+                                                  scratch, '1', con)
+            self.assertEqual(ecode, 0)
+            self.assertEqual(image.read_crop_config(o_image), None)
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_run_single_chm_job_with_stageinput_and_outbox(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            scratch = os.path.join(temp_dir, 'tmp')
+            os.makedirs(scratch, mode=0o755)
+            chmrundir = os.path.join(temp_dir, CHMJobCreator.RUN_DIR)
+            os.makedirs(chmrundir, mode=0o755)
+            outbox = os.path.join(scratch, 'outbox')
+            os.makedirs(outbox, mode=0o755)
+            open(os.path.join(temp_dir, 'input.1.png'), 'w').close()
+
+            con = configparser.ConfigParser()
+            con.set('', CHMJobCreator.CONFIG_DISABLE_HISTEQ_IMAGES,
+                    'False')
+            con.set('', CHMJobCreator.CONFIG_MODEL, '/model')
+            con.set('', CHMJobCreator.CONFIG_IMAGES, temp_dir)
+            con.set('', CHMJobCreator.CONFIG_TILE_SIZE, '3x3')
+            con.set('', CHMJobCreator.CONFIG_OVERLAP_SIZE, '2x2')
+            con.set('', CHMJobCreator.CONFIG_STAGE_INPUT, 'True')
+            con.add_section('1')
+            con.set('1', CHMJobCreator.CONFIG_INPUT_IMAGE, 'input.1.png')
+            con.set('1', CHMJobCreator.CONFIG_OUTPUT_IMAGE,
+                    os.path.join('tiles', 'output.1.png'))
+            con.set('1', CHMJobCreator.CONFIG_ARGS, '-t 1,1')
+
+            # fake CHM that copies input image to output directory and
+            # records path of input image
+            fakecmd = os.path.join(temp_dir, 'fake.py')
+            f = open(fakecmd, 'w')
+            f.write('#!/usr/bin/env python\n\n')
+            f.write('import sys\n')
+            f.write('import shutil\n')
+            f.write('shutil.copy(sys.argv[2], sys.argv[3])\n')
+            f.write('f = open("' + os.path.join(temp_dir, 'in.txt') +
+                    '", "w")\n')
+            f.write('f.write(sys.argv[2])\n')
+            f.write('f.close()\n')
+            f.close()
+            os.chmod(fakecmd, stat.S_IRWXU)
+            con.set('', CHMJobCreator.CONFIG_CHM_BIN, fakecmd)
+            ecode = chmrunner._run_single_chm_job(temp_dir, scratch, '1',
+                                                  con, outbox=outbox)
+            self.assertEqual(ecode, 0)
+
+            # chm was run on staged copy which is removed afterwards
+            staging_dir = os.path.join(scratch, CHMJobCreator.STAGING_DIR)
+            f = open(os.path.join(temp_dir, 'in.txt'), 'r')
+            in_image = f.read()
+            f.close()
+            self.assertTrue(in_image.startswith(staging_dir))
+            self.assertTrue(in_image.endswith('input.1.png'))
+            self.assertEqual([e for e in os.listdir(staging_dir)
+                              if not e.endswith('.lock')], [])
+
+            # result waits in outbox until copied back
+            self.assertFalse(os.path.isfile(os.path.join(chmrundir, 'tiles',
+                                                         'output.1.png')))
+            self.assertTrue(os.path.isfile(os.path.join(outbox, 'tiles',
+                                                        'output.1.png')))
+            out_image = con.get('1', CHMJobCreator.CONFIG_OUTPUT_IMAGE)
+            self.assertEqual(chmrunner._copy_back_task_outputs(outbox,
+                                                               chmrundir,
+                                                               out_image),
+                             0)
+            self.assertTrue(os.path.isfile(os.path.join(chmrundir, 'tiles',
+                                                        'output.1.png')))
+            self.assertFalse(os.path.isfile(os.path.join(outbox, 'tiles',
+                                                         'output.1.png')))
+            self.assertEqual(chmrunner._copy_back_outputs(outbox,
+                                                          chmrundir), 0)
+            self.assertFalse(os.path.isdir(outbox))
+            self.assertEqual(sorted(os.listdir(scratch)),
+                             [CHMJobCreator.STAGING_DIR])
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_copy_back_task_outputs(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            outbox = os.path.join(temp_dir, 'outbox')
+            run_dir = os.path.join(temp_dir, 'run')
+            os.makedirs(os.path.join(outbox, 'tiles'), mode=0o755)
+            rel_image = os.path.join('tiles', 'out.png')
+
+            # absolute paths are written directly so nothing to move
+            self.assertEqual(chmrunner._copy_back_task_outputs(
+                outbox, run_dir, os.path.join(temp_dir, 'out.png')), 0)
+
+            # nothing in outbox
+            self.assertEqual(chmrunner._copy_back_task_outputs(
+                outbox, run_dir, rel_image), 0)
+
+            open(os.path.join(outbox, rel_image), 'w').close()
+            open(os.path.join(outbox, rel_image +
+                              image.CROP_CONFIG_SUFFIX), 'w').close()
+            open(os.path.join(outbox, 'tiles', 'other.png'), 'w').close()
+            self.assertEqual(chmrunner._copy_back_task_outputs(
+                outbox, run_dir, rel_image), 0)
+            self.assertTrue(os.path.isfile(os.path.join(run_dir,
+                                                        rel_image)))
+            self.assertTrue(os.path.isfile(os.path.join(
+                run_dir, rel_image + image.CROP_CONFIG_SUFFIX)))
+
+            # results of other tasks are left for final copy back
+            self.assertEqual(os.listdir(os.path.join(outbox, 'tiles')),
+                             ['other.png'])
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_copy_back_image_not_moved_if_crop_config_fails(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            outbox = os.path.join(temp_dir, 'outbox')
+            run_dir = os.path.join(temp_dir, 'run')
+            os.makedirs(os.path.join(outbox, 'tiles'), mode=0o755)
+            rel_image = os.path.join('tiles', 'out.png')
+            rel_config = rel_image + image.CROP_CONFIG_SUFFIX
+            open(os.path.join(outbox, rel_image), 'w').close()
+            open(os.path.join(outbox, rel_config), 'w').close()
+            open(os.path.join(outbox, 'tiles', 'other.png'), 'w').close()
+
+            # directory in the way makes move of crop config fail
+            blocker = os.path.join(run_dir, rel_config)
+            os.makedirs(blocker, mode=0o755)
+            open(os.path.join(blocker, os.path.basename(rel_config)),
+                 'w').close()
+
+            self.assertEqual(chmrunner._copy_back_task_outputs(
+                outbox, run_dir, rel_image), 2)
+            self.assertFalse(os.path.isfile(os.path.join(run_dir,
+                                                         rel_image)))
+            self.assertTrue(os.path.isfile(os.path.join(outbox,
+                                                        rel_image)))
+
+            self.assertEqual(chmrunner._copy_back_outputs(outbox,
+                                                          run_dir), 2)
+            self.assertFalse(os.path.isfile(os.path.join(run_dir,
+                                                         rel_image)))
+            self.assertTrue(os.path.isfile(os.path.join(outbox,
+                                                        rel_image)))
+            self.assertTrue(os.path.isfile(os.path.join(run_dir, 'tiles',
+                                                        'other.png')))
+
+            # once crop config can be moved everything is copied back
+            shutil.rmtree(blocker)
+            self.assertEqual(chmrunner._copy_back_outputs(outbox,
+                                                          run_dir), 0)
+            self.assertTrue(os.path.isfile(os.path.join(run_dir,
+                                                        rel_image)))
+            self.assertTrue(os.path.isfile(os.path.join(run_dir,
+                                                        rel_config)))
+            self.assertFalse(os.path.isdir(outbox))
+        finally:
+            shutil.rmtree(temp_dir)
+
     def test_run_single_chm_job_success_full_path_to_out_image(self):
         temp_dir = tempfile.mkdtemp()
         try:
@@ -130,6 +130,38 @@ class TestCHMJobChecker(unittest.TestCase):
         finally:
             shutil.rmtree(temp_dir)
 
+    def test_get_incomplete_jobs_list_with_dir_files(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            config = configparser.ConfigParser()
+            config.set('', CHMJobCreator.JOB_DIR, temp_dir)
+            rundir = os.path.join(temp_dir, CHMJobCreator.RUN_DIR)
+            os.makedirs(os.path.join(rundir, 'a'), mode=0o755)
+            for taskid, path in [('1', 'a/one.png'), ('2', 'a/two.png'),
+                                 ('3', os.path.join(temp_dir, 'b',
+                                                    'three.png'))]:
+                config.add_section(taskid)
+                config.set(taskid, CHMJobCreator.CONFIG_OUTPUT_IMAGE,
+                           path)
+            open(os.path.join(rundir, 'a', 'one.png'), 'a').close()
+
+            dir_files = {}
+            checker = CHMTaskChecker(config, dir_files=dir_files)
+            self.assertEqual(checker.get_incomplete_tasks_list(),
+                             ['2', '3'])
+            self.assertEqual(dir_files,
+                             {os.path.join(rundir, 'a'): set(['one.png']),
+                              os.path.join(temp_dir, 'b'): set()})
+
+            # listings in cache are used instead of file system
+            open(os.path.join(rundir, 'a', 'two.png'), 'a').close()
+            self.assertEqual(checker.get_incomplete_tasks_list(),
+                             ['2', '3'])
+            self.assertEqual(CHMTaskChecker(config).
+                             get_incomplete_tasks_list(), ['3'])
+        finally:
+            shutil.rmtree(temp_dir)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_chunkstore.py
+----------------------------------
+
+Tests for `ChunkStore` in chunkstore.py
+"""
+
+import unittest
+import os
+import json
+import zlib
+import random
+import tempfile
+import shutil
+from PIL import Image
+
+from chmutil import chunkstore
+from chmutil.chunkstore import ChunkStore
+from chmutil.chunkstore import ChunkStoreError
+
+
+class TestChunkStore(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def _get_random_image(self, size, mode='L'):
+        img = Image.new(mode, size)
+        maxval = 255
+        if mode == 'I;16':
+            maxval = 65535
+        img.putdata([random.randint(1, maxval)
+                     for i in range(size[0] * size[1])])
+        return img
+
+    def test_create_chunk_store_invalid_args(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            store_dir = os.path.join(temp_dir, 'x.zarr')
+            try:
+                chunkstore.create_chunk_store(store_dir, (1, 2, 3),
+                                              (1, 2, 3), dtype='<f4')
+                self.fail('Expected ChunkStoreError')
+            except ChunkStoreError as e:
+                self.assertEqual(str(e), 'Unsupported dtype <f4')
+            try:
+                chunkstore.create_chunk_store(store_dir, (1, 2),
+                                              (1, 2, 3))
+                self.fail('Expected ChunkStoreError')
+            except ChunkStoreError as e:
+                self.assertEqual(str(e),
+                                 'shape and chunks must have 3 dimensions')
+            try:
+                chunkstore.create_chunk_store(store_dir, (1, 2, 3),
+                                              (1, 0, 3))
+                self.fail('Expected ChunkStoreError')
+            except ChunkStoreError as e:
+                self.assertTrue('chunks must be positive' in str(e))
+
+            chunkstore.create_chunk_store(store_dir, (1, 2, 3), (1, 2, 3))
+            try:
+                chunkstore.create_chunk_store(store_dir, (1, 2, 3),
+                                              (1, 2, 3))
+                self.fail('Expected ChunkStoreError')
+            except ChunkStoreError as e:
+                self.assertTrue('already exists' in str(e))
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_constructor_no_store(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            ChunkStore(temp_dir)
+            self.fail('Expected ChunkStoreError')
+        except ChunkStoreError as e:
+            self.assertTrue('No .zarray found' in str(e))
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_metadata(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            store_dir = os.path.join(temp_dir, 'x.zarr')
+            store = chunkstore.create_chunk_store(store_dir, (3, 40, 70),
+                                                  (1, 16, 32),
+                                                  attributes={'a': 'b'})
+            self.assertEqual(store.get_shape(), (3, 40, 70))
+            self.assertEqual(store.get_chunks(), (1, 16, 32))
+            self.assertEqual(store.get_attributes(), {'a': 'b'})
+            f = open(os.path.join(store_dir, chunkstore.ZARRAY_FILE))
+            meta = json.load(f)
+            f.close()
+            self.assertEqual(meta['zarr_format'], 2)
+            self.assertEqual(meta['dtype'], '|u1')
+            self.assertEqual(meta['compressor'], {'id': 'zlib',
+                                                  'level': 5})
+            self.assertEqual(meta['order'], 'C')
+
+            store = chunkstore.create_chunk_store(os.path.join(temp_dir,
+                                                               'y'),
+                                                  (1, 1, 1), (1, 1, 1))
+            self.assertEqual(store.get_attributes(), {})
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_write_section_errors(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            store = chunkstore.create_chunk_store(temp_dir, (2, 40, 70),
+                                                  (1, 16, 32))
+            try:
+                store.write_section(2, Image.new('L', (70, 40)))
+                self.fail('Expected ChunkStoreError')
+            except ChunkStoreError as e:
+                self.assertEqual(str(e), 'Section 2 is outside of array '
+                                         'with 2 sections')
+            try:
+                store.write_section(0, Image.new('L', (40, 70)))
+                self.fail('Expected ChunkStoreError')
+            except ChunkStoreError as e:
+                self.assertTrue('has size (40, 70)' in str(e))
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_write_and_read_sections(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            for (dtype, mode) in [('|u1', 'L'), ('<u2', 'I;16')]:
+                store_dir = os.path.join(temp_dir, dtype)
+                store = chunkstore.create_chunk_store(store_dir,
+                                                      (3, 40, 70),
+                                                      (1, 16, 32),
+                                                      dtype=dtype)
+                imgs = [self._get_random_image((70, 40), mode),
+                        self._get_random_image((70, 40), mode)]
+                store.write_section(0, imgs[0])
+                store.write_section(2, imgs[1])
+                # 3 columns by 3 rows of chunks per section
+                chunks = [c for c in os.listdir(store_dir)
+                          if not c.startswith('.')]
+                self.assertEqual(len(chunks), 18)
+                self.assertTrue('2.2.2' in chunks)
+
+                # edge chunks are full size
+                f = open(os.path.join(store_dir, '0.2.2'), 'rb')
+                data = zlib.decompress(f.read())
+                f.close()
+                self.assertEqual(len(data), 16 * 32 * (2 if mode ==
+                                                       'I;16' else 1))
+
+                store = ChunkStore(store_dir)
+                for box in [(0, 0, 70, 40), (5, 3, 50, 33),
+                            (60, 30, 90, 50), (-5, -5, 3, 3)]:
+                    region = store.read_region(0, box)
+                    self.assertEqual(region.mode, mode)
+                    self.assertEqual(list(region.getdata()),
+                                     list(imgs[0].crop(box).getdata()))
+                    region.close()
+                # unwritten section reads as zeros
+                region = store.read_region(1, (0, 0, 70, 40))
+                self.assertEqual(region.getbbox(), None)
+                vol = store.read_subvolume((1, 3), (10, 10, 20, 20))
+                self.assertEqual(len(vol), 2)
+                self.assertEqual(list(vol[1].getdata()),
+                                 list(imgs[1].crop((10, 10, 20,
+                                                    20)).getdata()))
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_empty_chunks_not_written_and_removed_on_rewrite(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            store = chunkstore.create_chunk_store(temp_dir, (1, 32, 32),
+                                                  (1, 16, 16))
+            img = Image.new('L', (32, 32))
+            img.putpixel((20, 20), 9)
+            store.write_section(0, img)
+            self.assertEqual(sorted([c for c in os.listdir(temp_dir)
+                                     if not c.startswith('.')]),
+                             ['0.1.1'])
+            store.write_section(0, Image.new('L', (32, 32)))
+            self.assertEqual([c for c in os.listdir(temp_dir)
+                              if not c.startswith('.')], [])
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_chunks_spanning_sections(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            store = chunkstore.create_chunk_store(temp_dir, (3, 20, 20),
+                                                  (2, 16, 16))
+            imgs = [self._get_random_image((20, 20)) for i in range(3)]
+            for z in [1, 0, 2]:
+                store.write_section(z, imgs[z])
+            self.assertEqual(sorted([c for c in os.listdir(temp_dir)
+                                     if not c.startswith('.')]),
+                             ['0.0.0', '0.0.1', '0.1.0', '0.1.1',
+                              '1.0.0', '1.0.1', '1.1.0', '1.1.1'])
+            for z in range(3):
+                region = store.read_region(z, (0, 0, 20, 20))
+                self.assertEqual(list(region.getdata()),
+                                 list(imgs[z].getdata()))
+        finally:
+            shutil.rmtree(temp_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
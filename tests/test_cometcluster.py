@@ -131,6 +131,42 @@ class TestCometCluster(unittest.TestCase):
                          'cd "out";sbatch -a 1-100 ' +
                          CometCluster.MERGE_SUBMIT_SCRIPT_NAME)
 
+    def test_submit_commands_with_range_and_resources(self):
+        opts = CHMConfig('images', 'model', 'out',
+                         '500x500', '20x20')
+
+        rc = CometCluster(opts)
+        self.assertEqual(rc.get_chm_submit_command(3, first_task=6,
+                                                   walltime='18:00:00',
+                                                   memory_in_gb='30'),
+                         'cd "out";sbatch -t 18:00:00 --mem=30G -a 6-8 ' +
+                         CometCluster.SUBMIT_SCRIPT_NAME)
+        self.assertEqual(rc.get_merge_submit_command(1, first_task=2,
+                                                     memory_in_gb=20),
+                         'cd "out";sbatch --mem=20G -a 2-2 ' +
+                         CometCluster.MERGE_SUBMIT_SCRIPT_NAME)
+
+    def test_submit_commands_with_exclude_hosts(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            opts = CHMConfig('images', 'model', temp_dir,
+                             '500x500', '20x20')
+            rc = CometCluster(opts)
+            f = open(os.path.join(temp_dir,
+                                  CHMJobCreator.EXCLUDE_HOSTS_FILE_NAME), 'w')
+            f.write('comet-22-63\ncomet-01-01\n')
+            f.close()
+            self.assertEqual(rc.get_chm_submit_command(5),
+                             'cd "' + temp_dir + '";sbatch '
+                             '--exclude=comet-01-01,comet-22-63 -a 1-5 ' +
+                             CometCluster.SUBMIT_SCRIPT_NAME)
+            self.assertEqual(rc.get_merge_submit_command(2),
+                             'cd "' + temp_dir + '";sbatch '
+                             '--exclude=comet-01-01,comet-22-63 -a 1-2 ' +
+                             CometCluster.MERGE_SUBMIT_SCRIPT_NAME)
+        finally:
+            shutil.rmtree(temp_dir)
+
     def test_generate_submit_script(self):
         temp_dir = tempfile.mkdtemp()
         try:
@@ -153,6 +153,20 @@ class TestCoreFunctions(unittest.TestCase):
         self.assertEqual(core.get_first_sequence_of_numbers_in_string(val),
                          23)
 
+    def test_get_chm_tiles_bounding_box(self):
+        self.assertEqual(core.get_chm_tiles_bounding_box('', '10x10',
+                                                         '0x0'), None)
+        self.assertEqual(core.get_chm_tiles_bounding_box('-h -t', '10x10',
+                                                         '0x0'), None)
+        self.assertEqual(core.get_chm_tiles_bounding_box('-t 1,1',
+                                                         '10x20', '0x0'),
+                         (0, 0, 10, 20))
+        self.assertEqual(core.get_chm_tiles_bounding_box('-t 2,3 -t 4,1 '
+                                                         '-t 3,2',
+                                                         '100x60',
+                                                         '10x5'),
+                         (80, 0, 320, 150))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -12,10 +12,12 @@ import unittest
 import os
 import tempfile
 import shutil
+import zipfile
 from PIL import Image
 
 from chmutil import createchmimage
 from chmutil.createchmimage import NoInputImageFoundError
+from chmutil import image
 
 
 class TestCreateCHMImage(unittest.TestCase):
@@ -32,6 +34,10 @@ class TestCreateCHMImage(unittest.TestCase):
         self.assertEqual(pargs.output, 'out.png')
         self.assertEqual(pargs.downsample, 0)
         self.assertEqual(pargs.loglevel, 'WARNING')
+        self.assertEqual(pargs.threads, 4)
+        self.assertEqual(pargs.pngcompresslevel, 6)
+        self.assertEqual(pargs.pngstrategy, 'default')
+        self.assertEqual(pargs.tilearchive, False)
 
     def test_main(self):
         temp_dir = tempfile.mkdtemp()
@@ -117,6 +123,277 @@ class TestCreateCHMImage(unittest.TestCase):
         finally:
             shutil.rmtree(temp_dir)
 
+    def test_convert_image_on_valid_image_with_pyramid(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            input = os.path.join(temp_dir, 'input.png')
+            output = os.path.join(temp_dir, 'output')
+
+            size = 300, 200
+            myimg = Image.new('L', size)
+            myimg.save(input, 'PNG')
+
+            pargs = createchmimage._parse_arguments('hi', [input, output,
+                                                           '--genpyramid',
+                                                           '--tilesize',
+                                                           '100'])
+            val = createchmimage._convert_image(pargs.image,
+                                                pargs.output, pargs)
+            self.assertEqual(val, 0)
+
+            # 300x200 -> 150x100 -> 75x50
+            self.assertEqual(sorted(os.listdir(output)),
+                             ['0', '1', '2', image.PYRAMID_DESCRIPTOR])
+            self.assertEqual(len(os.listdir(os.path.join(output, '2'))), 6)
+            self.assertEqual(len(os.listdir(os.path.join(output, '1'))), 2)
+            self.assertEqual(len(os.listdir(os.path.join(output, '0'))), 1)
+
+            img = Image.open(os.path.join(output, '2', '1_2.png'))
+            self.assertEqual(img.size, (100, 100))
+            img.close()
+
+            img = Image.open(os.path.join(output, '1', '0_1.png'))
+            self.assertEqual(img.size, (50, 100))
+            img.close()
+
+            img = Image.open(os.path.join(output, '0', '0_0.png'))
+            self.assertEqual(img.size, (75, 50))
+            img.close()
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_convert_image_with_tiles_in_archive(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            input = os.path.join(temp_dir, 'input.png')
+            output = os.path.join(temp_dir, 'output')
+
+            size = 200, 150
+            myimg = Image.new('L', size)
+            myimg.save(input, 'PNG')
+
+            pargs = createchmimage._parse_arguments('hi', [input, output,
+                                                           '--gentiles',
+                                                           '--tilesize',
+                                                           '100',
+                                                           '--threads',
+                                                           '2',
+                                                           '--pngstrategy',
+                                                           'rle',
+                                                           '--tilearchive'])
+            val = createchmimage._convert_image(pargs.image,
+                                                pargs.output, pargs)
+            self.assertEqual(val, 0)
+            self.assertFalse(os.path.isdir(output))
+            self.assertFalse(os.path.exists(output + '.zip.tmp'))
+
+            zf = zipfile.ZipFile(output + '.zip')
+            try:
+                self.assertEqual(sorted(zf.namelist()),
+                                 ['0-r0_c0.png', '0-r0_c1.png'])
+            finally:
+                zf.close()
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_convert_stack(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            input = os.path.join(temp_dir, 'input')
+            os.makedirs(input)
+            output = os.path.join(temp_dir, 'output')
+            for x in range(0, 3):
+                myimg = Image.new('RGB', (20, 10), (x, x, x))
+                myimg.save(os.path.join(input, str(x) + '.tif'), 'TIFF')
+            open(os.path.join(input, 'notimage.txt'), 'a').close()
+
+            # create output for 0.tif which should be skipped
+            os.makedirs(output)
+            done = os.path.join(output, '0.png')
+            open(done, 'a').close()
+
+            val = createchmimage.main(['createchmimage.py', input, output,
+                                       '--suffix', '.tif',
+                                       '--processes', '2',
+                                       '--downsample', '2',
+                                       '--equalize'])
+            self.assertEqual(val, 0)
+            self.assertEqual(sorted(os.listdir(output)),
+                             ['0.png', '1.png', '2.png'])
+            self.assertEqual(os.path.getsize(done), 0)
+            img = Image.open(os.path.join(output, '2.png'))
+            self.assertEqual(img.size, (10, 5))
+            self.assertEqual(img.mode, 'L')
+            img.close()
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_convert_stack_with_failure_and_tiles(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            input = os.path.join(temp_dir, 'input')
+            os.makedirs(input)
+            output = os.path.join(temp_dir, 'output')
+            myimg = Image.new('L', (20, 10))
+            myimg.save(os.path.join(input, 'a.png'), 'PNG')
+            open(os.path.join(input, 'b.png'), 'a').close()
+
+            pargs = createchmimage._parse_arguments('hi', [input, output,
+                                                           '--gentiles',
+                                                           '--tilesize',
+                                                           '10',
+                                                           '--processes',
+                                                           '1'])
+            # tiles left by a run killed part way
+            os.makedirs(os.path.join(output, 'a.tmp'))
+            open(os.path.join(output, 'a.tmp', 'partial.png'), 'a').close()
+
+            val = createchmimage._convert_stack(input, output, pargs)
+            self.assertEqual(val, 1)
+            self.assertEqual(sorted(os.listdir(output)), ['a'])
+            self.assertEqual(sorted(os.listdir(os.path.join(output, 'a'))),
+                             ['0-r0_c0.png', '0-r0_c1.png'])
+
+            # failed image is converted when run is resumed
+            myimg.save(os.path.join(input, 'b.png'), 'PNG')
+            val = createchmimage._convert_stack(input, output, pargs)
+            self.assertEqual(val, 0)
+            self.assertEqual(sorted(os.listdir(output)), ['a', 'b'])
+            self.assertEqual(sorted(os.listdir(os.path.join(output, 'b'))),
+                             ['0-r0_c0.png', '0-r0_c1.png'])
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_histogram_cache(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            cache = os.path.join(temp_dir, 'cache.cfg')
+            self.assertEqual(createchmimage._load_histogram_cache(cache, 1,
+                                                                  'x'),
+                             None)
+            hist = list(range(256))
+            createchmimage._write_histogram_cache(cache, hist, 3, 'x')
+            self.assertEqual(createchmimage._load_histogram_cache(cache, 3,
+                                                                  'x'),
+                             hist)
+            # different number of images
+            self.assertEqual(createchmimage._load_histogram_cache(cache, 2,
+                                                                  'x'),
+                             None)
+            # different images
+            self.assertEqual(createchmimage._load_histogram_cache(cache, 3,
+                                                                  'y'),
+                             None)
+            # invalid file
+            f = open(cache, 'w')
+            f.write('[histogram]\nnumimages = 3\nsignature = x\n'
+                    'counts = 1,2\n')
+            f.close()
+            self.assertEqual(createchmimage._load_histogram_cache(cache, 3,
+                                                                  'x'),
+                             None)
+            f = open(cache, 'w')
+            f.write('blah\n')
+            f.close()
+            self.assertEqual(createchmimage._load_histogram_cache(cache, 3,
+                                                                  'x'),
+                             None)
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_get_image_list_signature(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            one = os.path.join(temp_dir, '1.png')
+            two = os.path.join(temp_dir, '2.png')
+            Image.new('L', (10, 10), 0).save(one, 'PNG')
+            Image.new('L', (10, 10), 0).save(two, 'PNG')
+            os.utime(one, (100, 100))
+            os.utime(two, (100, 100))
+            sig = createchmimage._get_image_list_signature([one, two])
+            self.assertEqual(createchmimage._get_image_list_signature(
+                [two, one]), sig)
+            self.assertNotEqual(createchmimage._get_image_list_signature(
+                [one]), sig)
+
+            # same size image replacing a slice changes signature
+            Image.new('L', (10, 10), 255).save(two, 'PNG')
+            os.utime(two, (200, 200))
+            self.assertNotEqual(createchmimage._get_image_list_signature(
+                [one, two]), sig)
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_convert_stack_with_stackequalize(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            input = os.path.join(temp_dir, 'input')
+            os.makedirs(input)
+            output = os.path.join(temp_dir, 'output')
+
+            # two images whose values only make sense as a stack
+            # first has values 0 and 100, second 100 and 200
+            img = Image.new('L', (10, 10), 0)
+            img.paste(100, (0, 0, 5, 10))
+            img.save(os.path.join(input, '0.png'), 'PNG')
+            img = Image.new('L', (10, 10), 200)
+            img.paste(100, (0, 0, 5, 10))
+            img.save(os.path.join(input, '1.png'), 'PNG')
+
+            hist = [0] * 256
+            hist[0] = 50
+            hist[100] = 100
+            hist[200] = 50
+            lut = createchmimage.image.get_point_lut(hist, equalize=True)
+
+            val = createchmimage.main(['createchmimage.py', input, output,
+                                       '--stackequalize',
+                                       '--processes', '2'])
+            self.assertEqual(val, 0)
+            cache = os.path.join(output, createchmimage.HISTOGRAM_CACHE)
+            image_list = [os.path.join(input, '0.png'),
+                          os.path.join(input, '1.png')]
+            sig = createchmimage._get_image_list_signature(image_list)
+            self.assertEqual(createchmimage._load_histogram_cache(cache, 2,
+                                                                  sig),
+                             hist)
+
+            res = Image.open(os.path.join(output, '0.png'))
+            self.assertEqual(res.getpixel((0, 0)), lut[100])
+            self.assertEqual(res.getpixel((9, 0)), lut[0])
+            res.close()
+            res = Image.open(os.path.join(output, '1.png'))
+            self.assertEqual(res.getpixel((0, 0)), lut[100])
+            self.assertEqual(res.getpixel((9, 0)), lut[200])
+            res.close()
+
+            # rerun with modified cache, should use cached histogram
+            os.unlink(os.path.join(output, '1.png'))
+            fakehist = [0] * 256
+            fakehist[255] = 200
+            createchmimage._write_histogram_cache(cache, fakehist, 2, sig)
+            val = createchmimage.main(['createchmimage.py', input, output,
+                                       '--stackequalize',
+                                       '--processes', '1'])
+            self.assertEqual(val, 0)
+            res = Image.open(os.path.join(output, '1.png'))
+            self.assertEqual(res.getpixel((0, 0)), 100)
+            res.close()
+
+            # modified slice invalidates cached histogram
+            os.unlink(os.path.join(output, '1.png'))
+            st = os.stat(image_list[1])
+            os.utime(image_list[1], (st.st_atime, st.st_mtime + 10))
+            val = createchmimage.main(['createchmimage.py', input, output,
+                                       '--stackequalize',
+                                       '--processes', '1'])
+            self.assertEqual(val, 0)
+            res = Image.open(os.path.join(output, '1.png'))
+            self.assertEqual(res.getpixel((0, 0)), lut[100])
+            res.close()
+        finally:
+            shutil.rmtree(temp_dir)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -46,6 +46,12 @@ class TestCreateCHMJob(unittest.TestCase):
         self.assertEqual(pargs.walltime, '12:00:00')
         self.assertEqual(pargs.jobname, 'chmjob')
         self.assertEqual(pargs.gentifs, False)
+        self.assertEqual(pargs.tiledtifs, False)
+        self.assertEqual(pargs.chunkstore, False)
+        self.assertEqual(pargs.pyramids, False)
+        self.assertEqual(pargs.pyramidtilesize, 128)
+        self.assertEqual(pargs.croptiles, False)
+        self.assertEqual(pargs.stageinput, False)
 
     def test_create_chm_job_where_not_able_to_create_job(self):
         temp_dir = tempfile.mkdtemp()
@@ -134,6 +140,43 @@ class TestCreateCHMJob(unittest.TestCase):
         finally:
             shutil.rmtree(temp_dir)
 
+    def test_create_chm_job_success_with_tiledtifs_set(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            images = os.path.join(temp_dir, 'images')
+            os.makedirs(images, mode=0o755)
+            pngfile = os.path.join(images, 'foo.png')
+            myimg = Image.new('L', (800, 800))
+            myimg.save(pngfile, 'PNG')
+
+            model = os.path.join(temp_dir, 'model')
+            os.makedirs(model, mode=0o755)
+            open(os.path.join(model, 'param.mat'), 'a').close()
+
+            out = os.path.join(temp_dir, 'out')
+
+            pargs = createchmjob._parse_arguments('hi',
+                                                  [images, model,
+                                                   out,
+                                                   '--tilesize',
+                                                   '520x520',
+                                                   '--tiledtifs'])
+            pargs.program = 'foo'
+            pargs.version = '0.1.2'
+            pargs.rawargs = 'hi how are you'
+            val = createchmjob._create_chm_job(pargs)
+            self.assertEqual(val, 0)
+            fac = CHMConfigFromConfigFactory(out)
+            chmconfig = fac.get_chmconfig(skip_loading_mergeconfig=False)
+            self.assertEqual(chmconfig.get_gentifs_arg(), True)
+            self.assertEqual(chmconfig.get_tiledtifs_arg(), True)
+            mcon = chmconfig.get_merge_config()
+            self.assertEqual(mcon.get(CHMJobCreator.CONFIG_DEFAULT,
+                                      CHMJobCreator.MERGE_TIFF_TILE_SIZE),
+                             '528x528')
+        finally:
+            shutil.rmtree(temp_dir)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -13,8 +13,10 @@ import os
 import tempfile
 import shutil
 import stat
+from PIL import Image
 
 from chmutil import createchmtrainjob
+from chmutil.mrc import MRCStackWriter
 from chmutil.core import Parameters
 from chmutil.createchmtrainjob import UnsupportedClusterError
 from chmutil.createchmtrainjob import InvalidOutDirError
@@ -453,6 +455,91 @@ class TestCreateCHMTrainJob(unittest.TestCase):
         finally:
             shutil.rmtree(temp_dir)
 
+    def _write_fake_imod(self, bin_dir, mrc_file):
+        """Writes fake imodmop that copies `mrc_file` to output and
+           mrc2tif that always fails
+        """
+        imodmop = os.path.join(bin_dir, 'imodmop')
+        f = open(imodmop, 'w')
+        f.write('#!/usr/bin/env python\nimport sys\nimport shutil\n')
+        f.write('shutil.copy("' + mrc_file + '", sys.argv[5])\n')
+        f.close()
+        os.chmod(imodmop, stat.S_IRWXU | stat.S_IRGRP | stat.S_IROTH)
+        mrc2tif = os.path.join(bin_dir, 'mrc2tif')
+        f = open(mrc2tif, 'w')
+        f.write('#!/usr/bin/env python\nimport sys;sys.exit(3)\n')
+        f.close()
+        os.chmod(mrc2tif, stat.S_IRWXU | stat.S_IRGRP | stat.S_IROTH)
+
+    def test_convert_mod_mrc_files_reads_mrc_directly(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            images_file = os.path.join(temp_dir, 'images.mrc')
+            labels_file = os.path.join(temp_dir, 'labels.mod')
+            mask_file = os.path.join(temp_dir, 'mask.mrc')
+            os.makedirs(os.path.join(temp_dir,
+                                     createchmtrainjob.TMP_DIR), mode=0o755)
+            open(labels_file, 'a').close()
+            writer = MRCStackWriter(images_file, 4, 3, 2)
+            writer.write_section(0, Image.new('L', (4, 3), 10))
+            writer.write_section(1, Image.new('L', (4, 3), 20))
+            writer.close()
+            writer = MRCStackWriter(mask_file, 4, 3, 2)
+            writer.write_section(0, Image.new('L', (4, 3), 1))
+            writer.write_section(1, Image.new('L', (4, 3), 0))
+            writer.close()
+            self._write_fake_imod(temp_dir, mask_file)
+
+            params = createchmtrainjob._parse_arguments('hi',
+                                                        [images_file,
+                                                         labels_file,
+                                                         temp_dir,
+                                                         '--imodbindir',
+                                                         temp_dir,
+                                                         '--threads', '2'])
+            self.assertEqual(params.usemrc2tif, False)
+            img, lbl = createchmtrainjob._convert_mod_mrc_files(params)
+            self.assertEqual(sorted(os.listdir(img)),
+                             ['x.000.png', 'x.001.png'])
+            self.assertEqual(sorted(os.listdir(lbl)),
+                             ['x.000.png', 'x.001.png'])
+            res = Image.open(os.path.join(img, 'x.001.png'))
+            self.assertEqual(res.size, (4, 3))
+            self.assertEqual(res.getpixel((0, 0)), 20)
+            res.close()
+            res = Image.open(os.path.join(lbl, 'x.000.png'))
+            self.assertEqual(res.getpixel((3, 2)), 1)
+            res.close()
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_convert_mod_mrc_files_usemrc2tif(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            images_file = os.path.join(temp_dir, 'images.mrc')
+            labels_file = os.path.join(temp_dir, 'labels.mod')
+            os.makedirs(os.path.join(temp_dir,
+                                     createchmtrainjob.TMP_DIR), mode=0o755)
+            open(labels_file, 'a').close()
+            writer = MRCStackWriter(images_file, 4, 3, 1)
+            writer.write_section(0, Image.new('L', (4, 3), 10))
+            writer.close()
+            self._write_fake_imod(temp_dir, images_file)
+            params = createchmtrainjob._parse_arguments('hi',
+                                                        [images_file,
+                                                         labels_file,
+                                                         temp_dir,
+                                                         '--imodbindir',
+                                                         temp_dir,
+                                                         '--usemrc2tif'])
+            createchmtrainjob._convert_mod_mrc_files(params)
+            self.fail('Expected IMODConversionError')
+        except IMODConversionError as e:
+            self.assertTrue('Non zero exit code from '
+                            'mrc2tif: 3 :  :' in str(e))
+        finally:
+            shutil.rmtree(temp_dir)
+
 
 if __name__ == '__main__':
     unittest.main()
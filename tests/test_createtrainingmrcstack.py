@@ -12,8 +12,11 @@ import unittest
 import os
 import tempfile
 import shutil
+import random
+from PIL import Image
 
 from chmutil.core import Parameters
+from chmutil.core import Box
 from chmutil import createtrainingmrcstack
 
 
@@ -36,12 +39,18 @@ class TestCreateTrainingMRCStack(unittest.TestCase):
         self.assertEqual(pargs.suffix, '.png')
 
         self.assertEqual(pargs.loglevel, 'WARNING')
+        self.assertEqual(pargs.sampling, 'random')
+        self.assertEqual(pargs.usenewstack, False)
+        self.assertEqual(pargs.processes, 1)
 
     def test_create_mrc_stack_no_images_found(self):
         temp_dir = tempfile.mkdtemp()
         try:
             params = Parameters()
             params.suffix = '.png'
+            params.sampling = createtrainingmrcstack.RANDOM_SAMPLING
+            params.usenewstack = False
+            params.processes = 1
             dest_file = os.path.join(temp_dir, 'foo.mrc')
             res = createtrainingmrcstack._create_mrc_stack(temp_dir, 2,
                                                            dest_file,
@@ -50,6 +59,221 @@ class TestCreateTrainingMRCStack(unittest.TestCase):
         finally:
             shutil.rmtree(temp_dir)
 
+    def _assert_no_overlap(self, tile_list, size_dict, width, height):
+        for i in range(len(tile_list)):
+            (left, upper, right, lower) = tile_list[i][1].get_box_as_tuple()
+            self.assertEqual(right - left, width)
+            self.assertEqual(lower - upper, height)
+            self.assertTrue(left >= 0 and upper >= 0)
+            self.assertTrue(right <= size_dict[tile_list[i][0]][0])
+            self.assertTrue(lower <= size_dict[tile_list[i][0]][1])
+            for j in range(i + 1, len(tile_list)):
+                if tile_list[i][0] != tile_list[j][0]:
+                    continue
+                self.assertFalse(tile_list[i][1].does_box_intersect(
+                    tile_list[j][1]))
+
+    def test_get_image_sizes_and_pick_tile(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            img_path = os.path.join(temp_dir, '1.png')
+            Image.new('L', (30, 20)).save(img_path, 'PNG')
+            res = createtrainingmrcstack._get_image_sizes([img_path])
+            self.assertEqual(res, {img_path: (30, 20)})
+
+            random.seed(1)
+            box = createtrainingmrcstack._pick_tile(img_path, 10, 5)
+            random.seed(1)
+            box2 = createtrainingmrcstack._pick_tile('x', 10, 5,
+                                                     img_size=(30, 20))
+            self.assertEqual(box.get_box_as_tuple(),
+                             box2.get_box_as_tuple())
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_pick_random_tiles(self):
+        size_dict = {'a': (200, 100), 'b': (100, 100)}
+        random.seed(5)
+        res = createtrainingmrcstack._pick_random_tiles(['a', 'b'], 20,
+                                                        tile_width=15,
+                                                        tile_height=10,
+                                                        size_dict=size_dict)
+        self.assertEqual(len(res), 20)
+        self._assert_no_overlap(res, size_dict, 15, 10)
+
+        # same seed should give same tiles
+        random.seed(5)
+        res2 = createtrainingmrcstack._pick_random_tiles(['a', 'b'], 20,
+                                                         tile_width=15,
+                                                         tile_height=10,
+                                                         size_dict=size_dict)
+        self.assertEqual([(x[0], x[1].get_box_as_tuple()) for x in res],
+                         [(x[0], x[1].get_box_as_tuple()) for x in res2])
+
+        # impossible request
+        res = createtrainingmrcstack._pick_random_tiles(['a'], 2,
+                                                        tile_width=200,
+                                                        tile_height=100,
+                                                        size_dict=size_dict)
+        self.assertEqual(res, None)
+
+    def test_pick_stratified_tiles(self):
+        size_dict = {'a': (200, 100), 'b': (100, 99)}
+        random.seed(2)
+        # a has 9x4 cells and b has 4x4 cells
+        res = createtrainingmrcstack.\
+            _pick_stratified_tiles(['a', 'b'], 52, tile_width=21,
+                                   tile_height=24, size_dict=size_dict)
+        self.assertEqual(len(res), 52)
+        self._assert_no_overlap(res, size_dict, 21, 24)
+
+        res = createtrainingmrcstack.\
+            _pick_stratified_tiles(['a', 'b'], 53, tile_width=21,
+                                   tile_height=24, size_dict=size_dict)
+        self.assertEqual(res, None)
+
+        # tile size of image
+        res = createtrainingmrcstack.\
+            _pick_stratified_tiles(['b'], 1, tile_width=100,
+                                   tile_height=99, size_dict=size_dict)
+        self.assertEqual(res[0][1].get_box_as_tuple(), (0, 0, 100, 99))
+
+    def test_group_tiles_by_image(self):
+        self.assertEqual(createtrainingmrcstack._group_tiles_by_image([]),
+                         [])
+        a = Box(0, 0, 1, 1)
+        b = Box(1, 1, 2, 2)
+        c = Box(2, 2, 3, 3)
+        res = createtrainingmrcstack.\
+            _group_tiles_by_image([('x', a), ('y', b), ('x', c)])
+        self.assertEqual(res, [('x', [(0, a), (2, c)]),
+                               ('y', [(1, b)])])
+
+    def test_extract_tiles(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            out_dir = os.path.join(temp_dir, 'out')
+            os.makedirs(out_dir)
+            img_list = []
+            for x in range(0, 2):
+                img = Image.new('L', (40, 30), 0)
+                img.putpixel((5, 5), 10 + x)
+                img_path = os.path.join(temp_dir, str(x) + '.png')
+                img.save(img_path, 'PNG')
+                img_list.append(img_path)
+
+            tile_list = [(img_list[0], Box(0, 0, 10, 10)),
+                         (img_list[1], Box(5, 5, 15, 15)),
+                         (img_list[0], Box(20, 20, 30, 30)),
+                         (img_list[1], Box(0, 0, 10, 10))]
+            for processes in [1, 2]:
+                res = createtrainingmrcstack._extract_tiles(out_dir,
+                                                            tile_list,
+                                                            processes)
+                self.assertEqual(res, 0)
+                self.assertEqual(sorted(os.listdir(out_dir)),
+                                 ['0000.tif', '0001.tif', '0002.tif',
+                                  '0003.tif'])
+                img = Image.open(os.path.join(out_dir, '0000.tif'))
+                self.assertEqual(img.size, (10, 10))
+                self.assertEqual(img.getpixel((5, 5)), 10)
+                img.close()
+                img = Image.open(os.path.join(out_dir, '0001.tif'))
+                self.assertEqual(img.getpixel((0, 0)), 11)
+                img.close()
+                img = Image.open(os.path.join(out_dir, '0003.tif'))
+                self.assertEqual(img.getpixel((5, 5)), 11)
+                img.close()
+
+            # test with missing image
+            tile_list.append((os.path.join(temp_dir, 'doesnotexist.png'),
+                              Box(0, 0, 1, 1)))
+            res = createtrainingmrcstack._extract_tiles(out_dir,
+                                                        tile_list, 2)
+            self.assertEqual(res, 1)
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_create_mrc_stack_native_writer(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            img_dir = os.path.join(temp_dir, 'images')
+            os.makedirs(img_dir)
+            for x in range(0, 3):
+                img = Image.new('L', (60, 50), 20 * (x + 1))
+                img.save(os.path.join(img_dir, str(x) + '.png'), 'PNG')
+
+            dest_file = os.path.join(temp_dir, 'foo.mrc')
+            pargs = createtrainingmrcstack._parse_arguments('hi',
+                                                            [img_dir, '5',
+                                                             dest_file,
+                                                             '--tilesize',
+                                                             '10x8',
+                                                             '--seed',
+                                                             '1',
+                                                             '--processes',
+                                                             '2'])
+            res = createtrainingmrcstack._create_mrc_stack(img_dir, 5,
+                                                           dest_file,
+                                                           pargs)
+            self.assertEqual(res, 0)
+            self.assertEqual(os.path.getsize(dest_file),
+                             1024 + 5 * 10 * 8)
+            self.assertTrue(os.path.isfile(dest_file +
+                                           '.tile.list.config'))
+
+            # every section should be filled with value of image
+            # it came from
+            f = open(dest_file, 'rb')
+            f.seek(1024)
+            data = bytearray(f.read())
+            f.close()
+            for z in range(0, 5):
+                section = set(data[z * 80:(z + 1) * 80])
+                self.assertEqual(len(section), 1)
+                self.assertTrue(section.pop() in (20, 40, 60))
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_write_mrc_stack_with_bad_image(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            img_path = os.path.join(temp_dir, '1.png')
+            Image.new('L', (30, 20), 5).save(img_path, 'PNG')
+            dest_file = os.path.join(temp_dir, 'foo.mrc')
+            tile_list = [(img_path, Box(0, 0, 10, 10)),
+                         (os.path.join(temp_dir, 'doesnotexist.png'),
+                          Box(0, 0, 10, 10))]
+            res = createtrainingmrcstack._write_mrc_stack(dest_file,
+                                                          tile_list, 2)
+            self.assertEqual(res, 1)
+            # tile sizes mismatch
+            tile_list = [(img_path, Box(0, 0, 10, 10)),
+                         (img_path, Box(10, 10, 15, 15))]
+            res = createtrainingmrcstack._write_mrc_stack(dest_file,
+                                                          tile_list, 1)
+            self.assertEqual(res, 1)
+
+            # no tile config is written if stack could not be written
+            # truncated png has a readable size but cannot be decoded
+            f = open(img_path, 'rb')
+            data = f.read()
+            f.close()
+            f = open(img_path, 'wb')
+            f.write(data[:50])
+            f.close()
+            params = createtrainingmrcstack._parse_arguments('hi', [
+                temp_dir, '1', dest_file, '--tilesize', '10x10',
+                '--processes', '1'])
+            res = createtrainingmrcstack._create_mrc_stack(temp_dir, 1,
+                                                           dest_file,
+                                                           params)
+            self.assertEqual(res, 1)
+            self.assertFalse(os.path.isfile(dest_file +
+                                            '.tile.list.config'))
+        finally:
+            shutil.rmtree(temp_dir)
+
 
 if __name__ == '__main__':
     unittest.main()
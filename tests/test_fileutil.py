@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_fileutil.py
+----------------------------------
+
+Tests for `fileutil` module
+"""
+
+import unittest
+import os
+import tempfile
+import shutil
+import mmap
+
+from chmutil import fileutil
+
+
+class TestFileUtil(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def _touch(self, path):
+        open(path, 'a').close()
+        return path
+
+    def test_walk_files_path_none(self):
+        self.assertEqual(list(fileutil.walk_files(None)), [])
+
+    def test_walk_files_path_does_not_exist(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            noexist = os.path.join(temp_dir, 'noexist')
+            self.assertEqual(list(fileutil.walk_files(noexist)), [])
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_walk_files_path_is_file(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            afile = self._touch(os.path.join(temp_dir, 'foo.png'))
+            self.assertEqual(list(fileutil.walk_files(afile)), [afile])
+            self.assertEqual(list(fileutil.walk_files(afile,
+                                                      suffix='.png')),
+                             [afile])
+            self.assertEqual(list(fileutil.walk_files(afile,
+                                                      suffix='.tif')), [])
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_walk_files_empty_dir(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            self.assertEqual(list(fileutil.walk_files(temp_dir)), [])
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_walk_files_nested_with_suffix_and_recursive(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            one = self._touch(os.path.join(temp_dir, '1.png'))
+            txt = self._touch(os.path.join(temp_dir, 'a.txt'))
+            subdir = os.path.join(temp_dir, 'sub', 'sub2')
+            os.makedirs(subdir)
+            two = self._touch(os.path.join(temp_dir, 'sub', '2.png'))
+            three = self._touch(os.path.join(subdir, '3.png'))
+            # directory whose name matches suffix is not yielded
+            os.makedirs(os.path.join(temp_dir, 'dir.png'))
+
+            res = sorted(fileutil.walk_files(temp_dir))
+            self.assertEqual(res, sorted([one, txt, two, three]))
+
+            res = sorted(fileutil.walk_files(temp_dir, suffix='.png'))
+            self.assertEqual(res, sorted([one, two, three]))
+
+            res = sorted(fileutil.walk_files(temp_dir, suffix='.png',
+                                             recursive=False))
+            self.assertEqual(res, [one])
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_walk_files_unreadable_subdir_skipped(self):
+        if os.geteuid() == 0:
+            self.skipTest('root can read any directory')
+        temp_dir = tempfile.mkdtemp()
+        try:
+            one = self._touch(os.path.join(temp_dir, '1.png'))
+            subdir = os.path.join(temp_dir, 'sub')
+            os.makedirs(subdir)
+            self._touch(os.path.join(subdir, '2.png'))
+            os.chmod(subdir, 0o000)
+            try:
+                self.assertEqual(list(fileutil.walk_files(temp_dir)), [one])
+            finally:
+                os.chmod(subdir, 0o755)
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_walk_files_symlink_cycle(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            subdir = os.path.join(temp_dir, 'sub')
+            os.makedirs(subdir)
+            two = self._touch(os.path.join(subdir, '2.png'))
+            os.symlink(temp_dir, os.path.join(subdir, 'loop'))
+            os.symlink(two, os.path.join(temp_dir, 'link.png'))
+            res = sorted(fileutil.walk_files(temp_dir))
+            self.assertEqual(res, [os.path.join(temp_dir, 'link.png'),
+                                   two])
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_get_file_names(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            self.assertEqual(fileutil.get_file_names(os.path.join(temp_dir,
+                                                                  'nope')),
+                             set())
+            self._touch(os.path.join(temp_dir, '1.png'))
+            self._touch(os.path.join(temp_dir, '2.png'))
+            os.makedirs(os.path.join(temp_dir, 'sub'))
+            self.assertEqual(fileutil.get_file_names(temp_dir),
+                             set(['1.png', '2.png']))
+            # a file is not a directory so nothing is listed
+            self.assertEqual(fileutil.get_file_names(os.path.join(temp_dir,
+                                                                  '1.png')),
+                             set())
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_get_mapped_buffer(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(temp_dir, 'data')
+            f = open(path, 'wb')
+            f.write(b'0123456789')
+            f.close()
+            f = open(path, 'rb')
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            buf = fileutil.get_mapped_buffer(mapped, 2, 3)
+            self.assertEqual(bytes(buf), b'234')
+            fileutil.release_mapped_buffer(buf)
+            # map can be closed once buffer is released
+            mapped.close()
+            f.close()
+        finally:
+            shutil.rmtree(temp_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
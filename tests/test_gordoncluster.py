@@ -130,6 +130,48 @@ class TestGordonCluster(unittest.TestCase):
         finally:
             shutil.rmtree(temp_dir)
 
+    def test_submit_commands_with_range_and_resources(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            opts = CHMConfig('images', 'model', temp_dir,
+                             '500x500', '20x20')
+            rc = GordonCluster(opts)
+            self.assertEqual(rc.get_chm_submit_command(3, first_task=6,
+                                                       walltime='18:00:00',
+                                                       memory_in_gb='30'),
+                             'cd "' + temp_dir + '";qsub -l '
+                             'walltime=18:00:00 -t 6-8 ' +
+                             GordonCluster.SUBMIT_SCRIPT_NAME)
+            # script is only written for range starting at 1
+            self.assertFalse(os.path.isfile(os.path.join(
+                temp_dir, GordonCluster.SUBMIT_SCRIPT_NAME)))
+            self.assertEqual(rc.get_merge_submit_command(1, first_task=2),
+                             'cd "' + temp_dir + '";qsub -t 2-2 ' +
+                             GordonCluster.MERGE_SUBMIT_SCRIPT_NAME)
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_submit_commands_with_exclude_hosts(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            opts = CHMConfig('images', 'model', temp_dir,
+                             '500x500', '20x20')
+            f = open(os.path.join(temp_dir,
+                                  CHMJobCreator.EXCLUDE_HOSTS_FILE_NAME), 'w')
+            f.write('gcn-1\n')
+            f.close()
+            rc = GordonCluster(opts)
+            warn = ('\n# gordon cannot exclude hosts on submit, tasks '
+                    'may run on: gcn-1\n\n')
+            self.assertEqual(rc.get_chm_submit_command(5),
+                             warn + 'cd "' + temp_dir + '";qsub ' +
+                             GordonCluster.SUBMIT_SCRIPT_NAME)
+            self.assertEqual(rc.get_merge_submit_command(5),
+                             warn + 'cd "' + temp_dir + '";qsub ' +
+                             GordonCluster.MERGE_SUBMIT_SCRIPT_NAME)
+        finally:
+            shutil.rmtree(temp_dir)
+
     def test_get_checkchmjob_command(self):
         temp_dir = tempfile.mkdtemp()
         try:
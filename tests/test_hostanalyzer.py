@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_hostanalyzer
+----------------------------------
+
+Tests for `HostAnalyzer` and `HostStats` in cluster
+"""
+
+import unittest
+import tempfile
+import os
+import shutil
+
+from chmutil.cluster import HostAnalyzer
+from chmutil.cluster import HostStats
+from chmutil import cluster
+
+
+def write_task_log(path, host, walltime=None, exit_code=None):
+    """Writes task log like submit scripts generate
+    """
+    f = open(path, 'w')
+    if host is not None:
+        f.write('HOST: ' + host + '\n')
+    f.write('DATE: today\n\nJOBID: 1\nTASKID: 1\n')
+    f.write('lots of output\n' * 10)
+    if walltime is not None:
+        f.write('        User time (seconds): ' + str(walltime * 2) + '\n')
+        f.write('        Elapsed (wall clock) time (h:mm:ss or m:ss): ' +
+                '0:' + str(walltime) + '\n')
+        f.write('        Maximum resident set size (kbytes): 1000\n')
+    if exit_code is not None:
+        f.write('chmrunner.py exited with code: ' + str(exit_code) + '\n')
+    f.close()
+
+
+class TestHostAnalyzer(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def test_parse_task_log_host_info(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            self.assertEqual(cluster.parse_task_log_host_info(
+                os.path.join(temp_dir, 'nope')), None)
+            logfile = os.path.join(temp_dir, '1.1.out')
+            write_task_log(logfile, 'comet-22-63', walltime=40,
+                           exit_code=0)
+            self.assertEqual(cluster.parse_task_log_host_info(logfile),
+                             ('comet-22-63', 0, 80.0, 40.0, 1000))
+
+            # host is found even if not in tail
+            self.assertEqual(cluster.parse_task_log_host_info(logfile,
+                                                              tail_bytes=172),
+                             ('comet-22-63', 0, 80.0, 40.0, 1000))
+
+            write_task_log(logfile, None, exit_code=137)
+            self.assertEqual(cluster.parse_task_log_host_info(logfile),
+                             (None, 137, 0.0, 0.0, 0))
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_read_and_write_exclude_hosts_file(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            exfile = os.path.join(temp_dir, 'excludehosts')
+            self.assertEqual(cluster.read_exclude_hosts_file(None), [])
+            self.assertEqual(cluster.read_exclude_hosts_file(exfile), [])
+            res = cluster.write_exclude_hosts_file(exfile, ['b', 'a'])
+            self.assertEqual(res, ['a', 'b'])
+            res = cluster.write_exclude_hosts_file(exfile, ['c', 'a'])
+            self.assertEqual(res, ['a', 'b', 'c'])
+            self.assertEqual(cluster.read_exclude_hosts_file(exfile),
+                             ['a', 'b', 'c'])
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_host_stats(self):
+        hs = HostStats('foo')
+        self.assertEqual(hs.get_host(), 'foo')
+        self.assertEqual(hs.get_task_count(), 0)
+        self.assertEqual(hs.get_median_seconds_per_tile(), None)
+        hs.add_task(0, 100.0, 10)
+        hs.add_task(None, 0.0, 10)
+        hs.add_task(1, 50.0, 10)
+        hs.add_task(0, 0.0, 10)
+        self.assertEqual(hs.get_task_count(), 4)
+        self.assertEqual(hs.get_failed_task_count(), 1)
+        self.assertEqual(hs.get_unknown_task_count(), 1)
+        self.assertEqual(hs.get_finished_task_count(), 3)
+        self.assertEqual(hs.get_total_walltime(), 100.0)
+        self.assertEqual(hs.get_median_seconds_per_tile(), 10.0)
+
+    def _get_host_stats(self, values):
+        host_stats = {}
+        for host in values:
+            hs = HostStats(host)
+            for (exit_code, walltime) in values[host]:
+                hs.add_task(exit_code, walltime, 1)
+            host_stats[host] = hs
+        return host_stats
+
+    def test_get_outlier_scores(self):
+        analyzer = HostAnalyzer(processes=1)
+        # too few hosts
+        host_stats = self._get_host_stats({'a': [(0, 10.0)],
+                                           'b': [(0, 100.0)]})
+        self.assertEqual(analyzer.get_outlier_scores(host_stats), {})
+
+        # all hosts the same
+        host_stats = self._get_host_stats({'a': [(0, 10.0)],
+                                           'b': [(0, 10.0)],
+                                           'c': [(0, 10.0)]})
+        self.assertEqual(analyzer.get_outlier_scores(host_stats), {})
+
+        host_stats = self._get_host_stats({'a': [(0, 10.0)],
+                                           'b': [(0, 11.0)],
+                                           'c': [(0, 12.0)],
+                                           'd': [(0, 13.0)],
+                                           'e': [(1, 0.0)]})
+        scores = analyzer.get_outlier_scores(host_stats)
+        self.assertEqual(sorted(scores.keys()), ['a', 'b', 'c', 'd'])
+        self.assertAlmostEqual(scores['a'], -0.6745 * 1.5, places=2)
+        self.assertAlmostEqual(scores['d'], 0.6745 * 1.5, places=2)
+
+        # MAD of 0 falls back to mean absolute deviation
+        host_stats = self._get_host_stats({'a': [(0, 10.0)],
+                                           'b': [(0, 10.0)],
+                                           'c': [(0, 10.0)],
+                                           'd': [(0, 50.0)]})
+        scores = analyzer.get_outlier_scores(host_stats)
+        self.assertEqual(scores['a'], 0.0)
+        self.assertAlmostEqual(scores['d'], 40.0 / (1.2533 * 10.0),
+                               delta=0.05)
+
+    def test_get_flagged_hosts_and_report(self):
+        analyzer = HostAnalyzer(processes=1)
+        values = {}
+        for i in range(10):
+            values['node' + str(i)] = [(0, 100.0 + i), (0, 100.0 + i)]
+        values['slow'] = [(0, 400.0), (0, 400.0)]
+        values['flaky'] = [(0, 100.0), (1, 0.0), (2, 0.0), (None, 0.0)]
+        values['onefail'] = [(0, 100.0), (0, 100.0), (1, 0.0)]
+        # tasks still running, no exit code in log, are not failures
+        values['running'] = [(0, 100.0), (None, 0.0), (None, 0.0),
+                             (None, 0.0)]
+        host_stats = self._get_host_stats(values)
+        flagged = analyzer.get_flagged_hosts(host_stats)
+        self.assertEqual(sorted(flagged.keys()), ['flaky', 'slow'])
+        self.assertTrue(flagged['slow'].startswith('slow, 400.0 seconds '
+                                                   'per tile (score '))
+        self.assertEqual(flagged['flaky'], '2 of 3 finished tasks failed')
+
+        report = analyzer.get_report('CHM', host_stats, flagged)
+        lines = report.split('\n')
+        self.assertEqual(lines[0], 'CHM tasks by host (14 hosts):')
+        self.assertTrue(lines[1].startswith('* slow: 2 tasks, 0 failed, '
+                                            '0 unknown, 400.0 seconds '
+                                            'per tile, score '))
+        self.assertTrue('* flaky flagged: 2 of 3 finished tasks '
+                        'failed' in report)
+        self.assertTrue('  node0: 2 tasks, 0 failed, 0 unknown, 100.0 '
+                        'seconds per tile, score ' in report)
+        self.assertTrue('  running: 4 tasks, 0 failed, 3 unknown, 100.0 '
+                        'seconds per tile, score ' in report)
+
+    def test_get_host_stats(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            analyzer = HostAnalyzer(processes=1)
+            self.assertEqual(analyzer.get_host_stats(temp_dir, 5), {})
+            write_task_log(os.path.join(temp_dir, '1.1.out'), 'a',
+                           walltime=50, exit_code=0)
+            write_task_log(os.path.join(temp_dir, '1.2.out'), 'a',
+                           walltime=30, exit_code=0)
+            write_task_log(os.path.join(temp_dir, '1.3.out'), 'b')
+            write_task_log(os.path.join(temp_dir, '1.4.out'), None,
+                           walltime=30, exit_code=0)
+            host_stats = analyzer.get_host_stats(temp_dir, 5)
+            self.assertEqual(sorted(host_stats.keys()), ['a', 'b'])
+            self.assertEqual(host_stats['a'].get_task_count(), 2)
+            self.assertEqual(host_stats['a'].get_total_walltime(), 80.0)
+            self.assertEqual(host_stats['b'].get_failed_task_count(), 0)
+            self.assertEqual(host_stats['b'].get_unknown_task_count(), 1)
+
+            # same result when parsed in a process pool
+            analyzer = HostAnalyzer(processes=2)
+            orig_threshold = HostAnalyzer.PARALLEL_LOG_THRESHOLD
+            try:
+                HostAnalyzer.PARALLEL_LOG_THRESHOLD = 1
+                host_stats = analyzer.get_host_stats(temp_dir, 5)
+            finally:
+                HostAnalyzer.PARALLEL_LOG_THRESHOLD = orig_threshold
+            self.assertEqual(host_stats['a'].get_total_walltime(), 80.0)
+            self.assertEqual(host_stats['b'].get_failed_task_count(), 0)
+            self.assertEqual(host_stats['b'].get_unknown_task_count(), 1)
+        finally:
+            shutil.rmtree(temp_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -12,9 +12,13 @@ import os
 import unittest
 import tempfile
 import shutil
+import random
+from PIL import Image
+from PIL import ImageOps
 
 from chmutil import image
 from chmutil import core
+from chmutil.mrc import MRCStackWriter
 from chmutil.image import InvalidImageDirError
 
 
@@ -139,6 +143,103 @@ class TestImageFunctions(unittest.TestCase):
         finally:
             shutil.rmtree(temp_dir)
 
+    def _get_test_images(self):
+        rand = random.Random(7)
+        imgs = [Image.new('L', (10, 10)),
+                Image.new('L', (10, 10), 80)]
+        img = Image.new('L', (10, 10), 50)
+        img.putpixel((0, 0), 60)
+        imgs.append(img)
+        for maxval in [30, 128, 255]:
+            img = Image.new('L', (64, 48))
+            img.putdata([rand.randint(10, maxval)
+                         for x in range(64 * 48)])
+            imgs.append(img)
+        return imgs
+
+    def test_get_equalize_lut_matches_imageops(self):
+        for img in self._get_test_images():
+            expected = ImageOps.equalize(img)
+            res = img.point(image.get_equalize_lut(img.histogram()))
+            self.assertEqual(list(res.getdata()),
+                             list(expected.getdata()))
+
+    def test_get_autocontrast_lut_matches_imageops(self):
+        for img in self._get_test_images():
+            expected = ImageOps.autocontrast(img)
+            res = img.point(image.get_autocontrast_lut(img.histogram()))
+            self.assertEqual(list(res.getdata()),
+                             list(expected.getdata()))
+
+    def test_remap_histogram(self):
+        hist = [0] * 256
+        hist[1] = 5
+        hist[2] = 3
+        lut = list(range(256))
+        lut[1] = 10
+        lut[2] = 10
+        res = image.remap_histogram(hist, lut)
+        self.assertEqual(res[10], 8)
+        self.assertEqual(sum(res), 8)
+
+    def test_get_point_lut(self):
+        self.assertEqual(image.get_point_lut([0] * 256), None)
+        for img in self._get_test_images():
+            hist = img.histogram()
+            expected = ImageOps.equalize(img)
+            res = img.point(image.get_point_lut(hist, equalize=True))
+            self.assertEqual(list(res.getdata()),
+                             list(expected.getdata()))
+
+            expected = ImageOps.autocontrast(ImageOps.equalize(img))
+            res = img.point(image.get_point_lut(hist, equalize=True,
+                                                autocontrast=True))
+            self.assertEqual(list(res.getdata()),
+                             list(expected.getdata()))
+
+            expected = ImageOps.autocontrast(img)
+            res = img.point(image.get_point_lut(hist, autocontrast=True))
+            self.assertEqual(list(res.getdata()),
+                             list(expected.getdata()))
+
+    def test_get_region_reader(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            img = Image.new('L', (20, 10))
+            img.putdata([x % 256 for x in range(200)])
+            box = (3, 2, 15, 9)
+
+            path = os.path.join(temp_dir, 'foo.png')
+            img.save(path)
+            reader = image.get_region_reader(path)
+            self.assertTrue(isinstance(reader, image.PillowRegionReader))
+            self.assertEqual(reader.get_size(), (20, 10))
+            self.assertEqual(list(reader.read_region(box).getdata()),
+                             list(img.crop(box).getdata()))
+            reader.close()
+            reader.close()
+
+            path = os.path.join(temp_dir, 'foo.tif')
+            img.save(path)
+            reader = image.get_region_reader(path)
+            self.assertTrue(isinstance(reader, image.MappedRegionReader))
+            reader.close()
+
+            path = os.path.join(temp_dir, 'foo.mrc')
+            writer = MRCStackWriter(path, 20, 10, 2)
+            writer.write_section(0, Image.new('L', (20, 10)))
+            writer.write_section(1, img)
+            writer.close()
+            reader = image.get_region_reader(path, section=1)
+            self.assertTrue(isinstance(reader, image.MRCRegionReader))
+            self.assertEqual(reader.get_size(), (20, 10))
+            self.assertEqual(list(reader.read_region(box).getdata()),
+                             list(img.crop(box).getdata()))
+            reader.close()
+            reader.close()
+        finally:
+            shutil.rmtree(temp_dir)
+
 
 if __name__ == '__main__':
     unittest.main()
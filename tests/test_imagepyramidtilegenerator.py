@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_imagepyramidtilegenerator
+----------------------------------
+
+Tests for `ImagePyramidTileGenerator in image`
+"""
+
+import unittest
+from PIL import Image
+from chmutil.image import ImagePyramidTileGenerator
+from chmutil.image import InvalidImageError
+from chmutil.image import ImageTile
+from chmutil import image
+
+
+class TestImagePyramidTileGenerator(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def test_image_is_none(self):
+        gen = ImagePyramidTileGenerator(128)
+        try:
+            for res in gen.get_image_tiles(None):
+                self.fail('expected exception')
+        except InvalidImageError as e:
+            self.assertEqual(str(e), 'Image is None')
+
+    def test_image_smaller_then_tile(self):
+        im = Image.new('L', (100, 50))
+        gen = ImagePyramidTileGenerator(128)
+        tiles = list(gen.get_image_tiles(im))
+        self.assertEqual(len(tiles), 1)
+        self.assertEqual(tiles[0].get_zoom(), 0)
+        self.assertEqual(tiles[0].get_box(), (0, 0, 100, 50))
+
+    def test_three_levels_with_partial_tiles(self):
+        im = Image.new('L', (250, 120))
+        im.putpixel((249, 119), 255)
+        gen = ImagePyramidTileGenerator(64)
+        tiles = list(gen.get_image_tiles(im))
+
+        levels = {}
+        for t in tiles:
+            levels.setdefault(t.get_zoom(), []).append(t)
+
+        # 250x120 -> 125x60 -> 63x30, zoom 0 is smallest level
+        self.assertEqual(gen.get_level_sizes(im.size),
+                         [(63, 30), (125, 60), (250, 120)])
+        self.assertEqual(sorted(levels.keys()), [0, 1, 2])
+        self.assertEqual(len(levels[2]), 8)
+        self.assertEqual(len(levels[1]), 2)
+        self.assertEqual(len(levels[0]), 1)
+
+        # full resolution level is generated first
+        self.assertEqual(tiles[0].get_zoom(), 2)
+        self.assertEqual(tiles[-1].get_zoom(), 0)
+
+        last = [t for t in levels[2] if t.get_row() == 1 and
+                t.get_col() == 3][0]
+        self.assertEqual(last.get_box(), (192, 64, 250, 120))
+        self.assertEqual(last.get_image().size, (58, 56))
+        self.assertEqual(last.get_image().getpixel((57, 55)), 255)
+
+        self.assertEqual(levels[1][1].get_box(), (64, 0, 125, 60))
+        self.assertEqual(levels[0][0].get_box(), (0, 0, 63, 30))
+
+    def test_get_level_sizes(self):
+        gen = ImagePyramidTileGenerator(128)
+        self.assertEqual(gen.get_level_sizes((100, 50)), [(100, 50)])
+        self.assertEqual(gen.get_level_sizes((128, 128)), [(128, 128)])
+        self.assertEqual(gen.get_level_sizes((129, 1)),
+                         [(65, 1), (129, 1)])
+
+    def test_get_pyramid_tile_file_name_and_descriptor(self):
+        tile = ImageTile(None, row=3, col=4, zoom=2)
+        self.assertEqual(image.get_pyramid_tile_file_name(tile),
+                         '2/3_4.png')
+        gen = ImagePyramidTileGenerator(64)
+        desc = image.get_pyramid_descriptor(gen, (250, 120))
+        self.assertEqual(desc['tilesize'], 64)
+        self.assertEqual(desc['format'], 'png')
+        self.assertEqual(desc['width'], 250)
+        self.assertEqual(desc['height'], 120)
+        self.assertEqual(desc['maxzoom'], 2)
+        self.assertEqual(desc['tilepath'], '{zoom}/{row}_{col}.png')
+        self.assertEqual(desc['levels'][0], {'zoom': 0, 'width': 63,
+                                             'height': 30, 'rows': 1,
+                                             'cols': 1})
+        self.assertEqual(desc['levels'][2], {'zoom': 2, 'width': 250,
+                                             'height': 120, 'rows': 2,
+                                             'cols': 4})
+
+    def test_get_tile_file_name(self):
+        tile = ImageTile(None, row=1, col=2)
+        self.assertEqual(image.get_tile_file_name(tile), '0-r1_c2.png')
+        tile = ImageTile(None, row=3, col=4, zoom=2)
+        self.assertEqual(image.get_tile_file_name(tile, suffix='.tif'),
+                         '2-r3_c4.tif')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -28,6 +28,7 @@ class TestImageTile(unittest.TestCase):
         self.assertEqual(tile.get_image(), im)
         self.assertEqual(tile.get_row(), None)
         self.assertEqual(tile.get_col(), None)
+        self.assertEqual(tile.get_zoom(), None)
 
         tile = ImageTile(im, box=(4, 5, 6, 7), row=2,
                          col=3)
@@ -36,6 +37,9 @@ class TestImageTile(unittest.TestCase):
         self.assertEqual(tile.get_row(), 2)
         self.assertEqual(tile.get_col(), 3)
 
+        tile = ImageTile(im, zoom=1)
+        self.assertEqual(tile.get_zoom(), 1)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_inputstager
+----------------------------------
+
+Tests for `InputStager` in core
+"""
+
+import unittest
+import os
+import tempfile
+import shutil
+
+from chmutil.core import InputStager
+
+
+class TestInputStager(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def _write_file(self, path, data):
+        f = open(path, 'w')
+        f.write(data)
+        f.close()
+
+    def _read_file(self, path):
+        f = open(path, 'r')
+        try:
+            return f.read()
+        finally:
+            f.close()
+
+    def test_get_staged_path(self):
+        stager = InputStager('/scratch')
+        staged = stager.get_staged_path('/foo/bar.png')
+        self.assertTrue(staged.startswith('/scratch/'))
+        self.assertTrue(staged.endswith('/bar.png'))
+        self.assertNotEqual(staged, stager.get_staged_path('/foo2/bar.png'))
+
+    def test_acquire_and_release(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            image = os.path.join(temp_dir, 'foo.png')
+            self._write_file(image, 'hello')
+            staging_dir = os.path.join(temp_dir, 'staging')
+            stager = InputStager(staging_dir)
+
+            staged = stager.acquire(image)
+            self.assertEqual(staged, stager.get_staged_path(image))
+            self.assertEqual(self._read_file(staged), 'hello')
+
+            # second task reuses the copy
+            self._write_file(image, 'changed')
+            self.assertEqual(stager.acquire(image), staged)
+            self.assertEqual(self._read_file(staged), 'hello')
+
+            stager.release(image)
+            self.assertTrue(os.path.isfile(staged))
+            stager.release(image)
+            self.assertFalse(os.path.exists(staged))
+            self.assertFalse(os.path.exists(os.path.dirname(staged)))
+            self.assertEqual([f for f in os.listdir(staging_dir)
+                              if not f.endswith(InputStager.LOCK_SUFFIX)],
+                             [])
+
+            # acquire after everything was released copies again
+            staged = stager.acquire(image)
+            self.assertEqual(self._read_file(staged), 'changed')
+            stager.release(image)
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_acquire_missing_image(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            stager = InputStager(os.path.join(temp_dir, 'staging'))
+            try:
+                stager.acquire(os.path.join(temp_dir, 'nope.png'))
+                self.fail('Expected IOError')
+            except (IOError, OSError):
+                pass
+            # failed acquire does not hold a reference
+            self._write_file(os.path.join(temp_dir, 'nope.png'), 'x')
+            staged = stager.acquire(os.path.join(temp_dir, 'nope.png'))
+            stager.release(os.path.join(temp_dir, 'nope.png'))
+            self.assertFalse(os.path.exists(staged))
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def _get_dead_pid(self):
+        """Gets process id of a child process that has exited"""
+        pid = os.fork()
+        if pid == 0:
+            os._exit(0)
+        os.waitpid(pid, 0)
+        return pid
+
+    def test_release_drops_killed_tasks(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            image = os.path.join(temp_dir, 'foo.png')
+            self._write_file(image, 'hello')
+            staging_dir = os.path.join(temp_dir, 'staging')
+            stager = InputStager(staging_dir)
+            staged = stager.acquire(image)
+            refs_file = os.path.dirname(staged) + InputStager.REFS_SUFFIX
+            self._write_file(refs_file, self._read_file(refs_file) +
+                             str(self._get_dead_pid()) + '\nbad\n')
+
+            # reference of killed task does not keep copy around
+            stager.release(image)
+            self.assertFalse(os.path.exists(staged))
+            self.assertFalse(os.path.isfile(refs_file))
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_remove_stale(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            staging_dir = os.path.join(temp_dir, 'staging')
+            stager = InputStager(staging_dir)
+            self.assertEqual(stager.remove_stale(), 0)
+
+            image = os.path.join(temp_dir, 'foo.png')
+            self._write_file(image, 'hello')
+            live = stager.acquire(image)
+            image2 = os.path.join(temp_dir, 'foo2.png')
+            self._write_file(image2, 'hello')
+            stale = stager.acquire(image2)
+            stale_refs = os.path.dirname(stale) + InputStager.REFS_SUFFIX
+            self._write_file(stale_refs, str(self._get_dead_pid()) + '\n')
+
+            self.assertEqual(stager.remove_stale(), 1)
+            self.assertFalse(os.path.exists(stale))
+            self.assertFalse(os.path.isfile(stale_refs))
+            self.assertTrue(os.path.isfile(live))
+
+            stager.release(image)
+            self.assertFalse(os.path.exists(live))
+            self.assertEqual(stager.remove_stale(), 0)
+        finally:
+            shutil.rmtree(temp_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
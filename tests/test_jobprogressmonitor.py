@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_jobprogressmonitor
+----------------------------------
+
+Tests for `JobProgressMonitor in cluster`
+"""
+
+import unittest
+import configparser
+import tempfile
+import os
+import shutil
+import time
+
+from chmutil.cluster import JobProgressMonitor
+from chmutil.cluster import TaskLogCache
+from chmutil.core import CHMConfig
+from chmutil.core import CHMJobCreator
+
+
+class FakeClock(object):
+    """Clock ahead of real time that advances 60 seconds on every call
+       to `advance`
+    """
+    def __init__(self):
+        self.now = time.time() + 100.0
+
+    def advance(self):
+        self.now += 60.0
+
+    def __call__(self):
+        return self.now
+
+
+def write_log(path, usertime=None, walltime=None):
+    """Writes task log with run times if set
+    """
+    f = open(path, 'w')
+    f.write('running\n')
+    if usertime is not None:
+        f.write('        User time (seconds): ' + str(usertime) + '\n')
+    if walltime is not None:
+        f.write(' Elapsed (wall clock) time (h:mm:ss or m:ss): ' +
+                walltime + '\n')
+    f.close()
+
+
+class TestJobProgressMonitor(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def _create_config(self, temp_dir):
+        """Creates `CHMConfig` with 4 CHM tasks writing to two
+           tile directories and 2 merge tasks
+        """
+        con = CHMConfig('./images', './model', temp_dir, '500x500',
+                        '20x20')
+        run_dir = os.path.join(temp_dir, CHMJobCreator.RUN_DIR)
+        for name in ['a.png', 'b.png']:
+            os.makedirs(os.path.join(run_dir, CHMJobCreator.TILES_DIR,
+                                     name))
+        os.makedirs(os.path.join(run_dir, CHMJobCreator.PROBMAPS_DIR))
+        os.makedirs(os.path.join(run_dir, CHMJobCreator.STDOUT_DIR))
+        os.makedirs(os.path.join(run_dir, CHMJobCreator.MERGE_STDOUT_DIR))
+
+        cfig = configparser.ConfigParser()
+        cfig.set(CHMJobCreator.CONFIG_DEFAULT, CHMJobCreator.JOB_DIR,
+                 temp_dir)
+        for taskid in range(1, 5):
+            img = 'a.png' if taskid <= 2 else 'b.png'
+            cfig.add_section(str(taskid))
+            cfig.set(str(taskid), CHMJobCreator.CONFIG_OUTPUT_IMAGE,
+                     os.path.join(CHMJobCreator.TILES_DIR, img,
+                                  str(taskid) + '.' + img))
+        con.set_config(cfig)
+
+        mcfig = configparser.ConfigParser()
+        mcfig.set(CHMJobCreator.CONFIG_DEFAULT, CHMJobCreator.JOB_DIR,
+                  temp_dir)
+        for taskid, img in [('1', 'a.png'), ('2', 'b.png')]:
+            mcfig.add_section(taskid)
+            mcfig.set(taskid, CHMJobCreator.MERGE_OUTPUT_IMAGE,
+                      os.path.join(CHMJobCreator.PROBMAPS_DIR, img))
+        con.set_merge_config(mcfig)
+        return con
+
+    def _touch(self, temp_dir, relpath):
+        open(os.path.join(temp_dir, CHMJobCreator.RUN_DIR, relpath),
+             'a').close()
+
+    def test_no_configs(self):
+        con = CHMConfig('./images', './model', './outdir', '500x500',
+                        '20x20')
+        mon = JobProgressMonitor(con)
+        mon.update()
+        self.assertTrue(mon.is_complete())
+        self.assertEqual(mon.get_total_task_count('CHM'), 0)
+        self.assertEqual(mon.get_completed_task_count('Merge'), 0)
+        self.assertEqual(mon.get_tasks_per_minute('CHM'), None)
+        self.assertEqual(mon.get_eta_in_seconds('CHM'), 0.0)
+        self.assertEqual(mon.get_cpu_hours(), 0.0)
+
+    def test_update_tracks_progress_and_rate(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            con = self._create_config(temp_dir)
+            clock = FakeClock()
+            mon = JobProgressMonitor(con,
+                                     chm_incomplete_tasks=['2', '3', '4'],
+                                     merge_incomplete_tasks=['1', '2'],
+                                     clock=clock)
+            self.assertFalse(mon.is_complete())
+            self.assertEqual(mon.get_total_task_count('CHM'), 4)
+            self.assertEqual(mon.get_completed_task_count('CHM'), 1)
+            mon.update()
+            self.assertEqual(mon.get_completed_task_count('CHM'), 1)
+            self.assertEqual(mon.get_tasks_per_minute('CHM'), None)
+            self.assertEqual(mon.get_eta_in_seconds('CHM'), None)
+            self.assertTrue('ETA NA' in mon.get_progress())
+
+            # two tasks finish in a minute
+            self._touch(temp_dir, os.path.join(CHMJobCreator.TILES_DIR,
+                                               'a.png', '2.a.png'))
+            self._touch(temp_dir, os.path.join(CHMJobCreator.TILES_DIR,
+                                               'b.png', '3.b.png'))
+            clock.advance()
+            mon.update()
+            self.assertEqual(mon.get_completed_task_count('CHM'), 3)
+            self.assertEqual(mon.get_tasks_per_minute('CHM'), 2.0)
+            self.assertEqual(mon.get_eta_in_seconds('CHM'), 30.0)
+            self.assertEqual(mon.get_tasks_per_minute('Merge'), 0.0)
+            self.assertEqual(mon.get_eta_in_seconds('Merge'), None)
+            res = mon.get_progress()
+            self.assertTrue('CHM tasks: 3 of 4 completed, 2.0 tasks/min, '
+                            'ETA 0:00:30\n' in res)
+            self.assertTrue('Merge tasks: 0 of 2 completed, 0.0 '
+                            'tasks/min, ETA NA\n' in res)
+
+            self._touch(temp_dir, os.path.join(CHMJobCreator.TILES_DIR,
+                                               'b.png', '4.b.png'))
+            self._touch(temp_dir, os.path.join(CHMJobCreator.PROBMAPS_DIR,
+                                               'a.png'))
+            self._touch(temp_dir, os.path.join(CHMJobCreator.PROBMAPS_DIR,
+                                               'b.png'))
+            clock.advance()
+            mon.update()
+            self.assertTrue(mon.is_complete())
+            self.assertEqual(mon.get_eta_in_seconds('CHM'), 0.0)
+            self.assertEqual(mon.get_completed_task_count('Merge'), 2)
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_update_skips_unchanged_directories(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            con = self._create_config(temp_dir)
+            clock = FakeClock()
+            mon = JobProgressMonitor(con, chm_incomplete_tasks=['1'],
+                                     merge_incomplete_tasks=[],
+                                     clock=clock)
+            mon.update()
+            tile_dir = os.path.join(temp_dir, CHMJobCreator.RUN_DIR,
+                                    CHMJobCreator.TILES_DIR, 'a.png')
+            st = os.stat(tile_dir)
+            self._touch(temp_dir, os.path.join(CHMJobCreator.TILES_DIR,
+                                               'a.png', '1.a.png'))
+            # hide change by restoring old modification time
+            os.utime(tile_dir, (st.st_atime, st.st_mtime))
+            clock.advance()
+            mon.update()
+            self.assertEqual(mon.get_completed_task_count('CHM'), 3)
+
+            os.utime(tile_dir, (st.st_atime, st.st_mtime + 10))
+            clock.advance()
+            mon.update()
+            self.assertEqual(mon.get_completed_task_count('CHM'), 4)
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_cpu_hours_from_new_and_running_logs(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            con = self._create_config(temp_dir)
+            mon = JobProgressMonitor(con, chm_incomplete_tasks=['1'],
+                                     merge_incomplete_tasks=[],
+                                     clock=FakeClock())
+            write_log(os.path.join(con.get_stdout_dir(), '1.1'),
+                      usertime=3600, walltime='1:00:00')
+            running = os.path.join(con.get_merge_stdout_dir(), '2.1')
+            write_log(running)
+            mon.update()
+            self.assertEqual(mon.get_cpu_hours(), 1.0)
+
+            # running task finishes, log grows
+            write_log(running, usertime=1800, walltime='30:00')
+            mon.update()
+            self.assertEqual(mon.get_cpu_hours(), 1.5)
+
+            # no changes so nothing is counted twice
+            mon.update()
+            self.assertEqual(mon.get_cpu_hours(), 1.5)
+            self.assertTrue('CPU consumption so far: 1.5 CPU hours' in
+                            mon.get_progress())
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_cpu_hours_from_cache(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            con = self._create_config(temp_dir)
+            cache_file = os.path.join(temp_dir, 'cache')
+            log = os.path.join(con.get_stdout_dir(), '1.1')
+            write_log(log, usertime=3600, walltime='1:00:00')
+            mon = JobProgressMonitor(con, chm_incomplete_tasks=['1'],
+                                     merge_incomplete_tasks=[],
+                                     clock=FakeClock(),
+                                     cache_file=cache_file)
+            mon.update()
+            self.assertEqual(mon.get_cpu_hours(), 1.0)
+            cache = TaskLogCache(cache_file)
+            self.assertEqual(cache.get_entry_count(), 1)
+
+            # cached run times are used on first update of new monitor
+            # so changing the cache entry changes what is counted
+            st = os.stat(log)
+            cache.set(log, st.st_size, st.st_mtime, (7200.0, 7200.0, 0))
+            cache.save()
+            mon = JobProgressMonitor(con, chm_incomplete_tasks=['1'],
+                                     merge_incomplete_tasks=[],
+                                     clock=FakeClock(),
+                                     cache_file=cache_file)
+            mon.update()
+            self.assertEqual(mon.get_cpu_hours(), 2.0)
+        finally:
+            shutil.rmtree(temp_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
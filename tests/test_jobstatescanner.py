@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_jobstatescanner
+----------------------------------
+
+Tests for `JobStateScanner` and `JobState` in cluster
+"""
+
+import unittest
+import tempfile
+import os
+import shutil
+from PIL import Image
+
+from chmutil.cluster import JobStateScanner
+from chmutil.cluster import JobState
+from chmutil.cluster import CHMTaskChecker
+from chmutil.cluster import MergeTaskChecker
+from chmutil.cluster import TaskSummaryFactory
+from chmutil.core import CHMJobCreator
+from chmutil.core import CHMConfigFromConfigFactory
+from chmutil import createchmjob
+
+
+def create_job(a_tmp_dir, num_images=3):
+    """Creates CHM job with `num_images` 800x800 images
+    """
+    images = os.path.join(a_tmp_dir, 'images')
+    os.makedirs(images, mode=0o755)
+    for i in range(num_images):
+        Image.new('L', (800, 800)).save(os.path.join(images,
+                                                     str(i) + '.png'),
+                                        'PNG')
+    model = os.path.join(a_tmp_dir, 'model')
+    os.makedirs(model, mode=0o755)
+    open(os.path.join(model, 'param.mat'), 'a').close()
+
+    out = os.path.join(a_tmp_dir, 'out')
+    pargs = createchmjob._parse_arguments('hi', [images, model, out,
+                                                 '--tilesize', '520x520',
+                                                 '--tilespertask', '1'])
+    pargs.program = 'foo'
+    pargs.version = '0.1.2'
+    pargs.rawargs = 'hi how are you'
+    createchmjob._create_chm_job(pargs)
+    cfac = CHMConfigFromConfigFactory(out)
+    return cfac.get_chmconfig(skip_loading_mergeconfig=False)
+
+
+def complete_tasks(config, option, task_ids):
+    """Writes output image of tasks in `task_ids`
+    """
+    jobdir = config.get(CHMJobCreator.CONFIG_DEFAULT, CHMJobCreator.JOB_DIR)
+    for taskid in task_ids:
+        out_file = os.path.join(jobdir, CHMJobCreator.RUN_DIR,
+                                config.get(taskid, option))
+        Image.new('L', (10, 10)).save(out_file, 'PNG')
+
+
+class TestJobStateScanner(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def test_job_state_defaults(self):
+        state = JobState()
+        self.assertEqual(state.get_chm_incomplete_tasks(), None)
+        self.assertEqual(state.get_merge_incomplete_tasks(), None)
+        self.assertEqual(state.get_chm_log_files(), None)
+        self.assertEqual(state.get_merge_log_files(), None)
+        self.assertEqual(state.get_image_stats_summary(), None)
+
+    def test_scan_matches_task_checkers(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            chmconfig = create_job(temp_dir)
+            con = chmconfig.get_config()
+            mcon = chmconfig.get_merge_config()
+            self.assertTrue(len(con.sections()) > 3)
+            self.assertEqual(len(mcon.sections()), 3)
+
+            state = JobStateScanner(chmconfig).scan()
+            self.assertEqual(state.get_chm_incomplete_tasks(),
+                             con.sections())
+            self.assertEqual(state.get_merge_incomplete_tasks(),
+                             mcon.sections())
+            self.assertEqual(state.get_chm_log_files(), None)
+            self.assertEqual(state.get_image_stats_summary(), None)
+
+            complete_tasks(con, CHMJobCreator.CONFIG_OUTPUT_IMAGE,
+                           con.sections()[1:3])
+            complete_tasks(mcon, CHMJobCreator.MERGE_OUTPUT_IMAGE, ['2'])
+            state = JobStateScanner(chmconfig).scan()
+            self.assertEqual(state.get_chm_incomplete_tasks(),
+                             CHMTaskChecker(con).get_incomplete_tasks_list())
+            self.assertEqual(len(state.get_chm_incomplete_tasks()),
+                             len(con.sections()) - 2)
+            self.assertEqual(state.get_merge_incomplete_tasks(),
+                             MergeTaskChecker(mcon).
+                             get_incomplete_tasks_list())
+            self.assertEqual(state.get_merge_incomplete_tasks(), ['1', '3'])
+
+            state = JobStateScanner(chmconfig, skip_chm=True).scan()
+            self.assertEqual(state.get_chm_incomplete_tasks(), [])
+            self.assertEqual(state.get_merge_incomplete_tasks(), ['1', '3'])
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_scan_logs_and_images(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            chmconfig = create_job(temp_dir, num_images=2)
+            log = os.path.join(chmconfig.get_stdout_dir(), '1.1.out')
+            f = open(log, 'w')
+            f.write('User time (seconds): 10.0\n'
+                    'Elapsed (wall clock) time (h:mm:ss or m:ss): 0:20\n')
+            f.close()
+            scanner = JobStateScanner(chmconfig, scan_logs=True,
+                                      scan_images=True)
+            state = scanner.scan()
+            self.assertEqual(state.get_chm_log_files(), [log])
+            self.assertEqual(state.get_merge_log_files(), [])
+            self.assertEqual(state.get_image_stats_summary().
+                             get_image_count(), 2)
+
+            # summary uses job state instead of scanning again
+            os.unlink(log)
+            tsf = TaskSummaryFactory(chmconfig,
+                                     chm_incomplete_tasks=state.
+                                     get_chm_incomplete_tasks(),
+                                     merge_incomplete_tasks=state.
+                                     get_merge_incomplete_tasks(),
+                                     output_compute=True,
+                                     job_state=state)
+            ts = tsf.get_task_summary()
+            self.assertEqual(ts.get_chm_task_stats().
+                             get_total_tasks_with_cputimes(), 0)
+            self.assertTrue(ts.get_image_stats_summary() is
+                            state.get_image_stats_summary())
+
+            f = open(log, 'w')
+            f.write('User time (seconds): 10.0\n'
+                    'Elapsed (wall clock) time (h:mm:ss or m:ss): 0:20\n')
+            f.close()
+            ts = tsf.get_task_summary()
+            self.assertEqual(ts.get_chm_task_stats().
+                             get_total_tasks_with_cputimes(), 1)
+            self.assertEqual(ts.get_chm_task_stats().
+                             get_total_cpu_walltime(), 20.0)
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_scan_raises_error_from_thread(self):
+        scanner = JobStateScanner(None)
+
+        def fail():
+            raise ValueError('hi')
+
+        try:
+            scanner._run_in_threads({'ok': (lambda x: x, (1,)),
+                                     'bad': (fail, ())})
+            self.fail('Expected ValueError')
+        except ValueError as e:
+            self.assertEqual(str(e), 'hi')
+        self.assertEqual(scanner._run_in_threads({'ok': (lambda x: x,
+                                                         (1,))}),
+                         {'ok': 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_logbuckethistogram
+----------------------------------
+
+Tests for `LogBucketHistogram in cluster`
+"""
+
+import unittest
+import random
+
+from chmutil.cluster import LogBucketHistogram
+
+
+class TestLogBucketHistogram(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def test_empty(self):
+        hist = LogBucketHistogram()
+        self.assertEqual(hist.get_count(), 0)
+        self.assertEqual(hist.get_sum(), 0)
+        self.assertEqual(hist.get_min(), None)
+        self.assertEqual(hist.get_max(), None)
+        self.assertEqual(hist.get_percentile(50), None)
+        self.assertEqual(hist.get_percentile(100), None)
+
+    def test_single_value(self):
+        hist = LogBucketHistogram()
+        hist.add(123.0)
+        self.assertEqual(hist.get_count(), 1)
+        self.assertEqual(hist.get_sum(), 123.0)
+        # clamped to min and max so exact for one value
+        for pct in [0, 50, 95, 99, 100]:
+            self.assertEqual(hist.get_percentile(pct), 123.0)
+
+    def test_zero_and_out_of_range_values(self):
+        hist = LogBucketHistogram(min_value=1.0, max_value=1000.0)
+        hist.add(0)
+        hist.add(0)
+        hist.add(5000.0)
+        self.assertEqual(hist.get_percentile(50), 0)
+        self.assertEqual(hist.get_percentile(100), 5000.0)
+        self.assertEqual(hist.get_min(), 0)
+
+    def test_percentiles_within_relative_accuracy(self):
+        rand = random.Random(1)
+        values = [rand.lognormvariate(7, 1.5) for x in range(5000)]
+        hist = LogBucketHistogram(relative_accuracy=0.01)
+        for val in values:
+            hist.add(val)
+        values.sort()
+        for pct in [1, 25, 50, 75, 95, 99]:
+            rank = int(len(values) * pct / 100.0 + 0.999999)
+            expected = values[rank - 1]
+            self.assertAlmostEqual(hist.get_percentile(pct), expected,
+                                   delta=expected * 0.01)
+        self.assertEqual(hist.get_percentile(0), values[0])
+        self.assertEqual(hist.get_percentile(100), values[-1])
+
+    def test_merge(self):
+        rand = random.Random(2)
+        values = [rand.uniform(1, 10000) for x in range(1000)]
+        whole = LogBucketHistogram()
+        first = LogBucketHistogram()
+        second = LogBucketHistogram()
+        for i, val in enumerate(values):
+            whole.add(val)
+            if i % 2 == 0:
+                first.add(val)
+            else:
+                second.add(val)
+        merged = LogBucketHistogram()
+        merged.merge(first)
+        merged.merge(second)
+        merged.merge(LogBucketHistogram())
+        self.assertEqual(merged.get_count(), 1000)
+        self.assertAlmostEqual(merged.get_sum(), whole.get_sum())
+        self.assertEqual(merged.get_min(), whole.get_min())
+        self.assertEqual(merged.get_max(), whole.get_max())
+        for pct in [50, 95, 99]:
+            self.assertEqual(merged.get_percentile(pct),
+                             whole.get_percentile(pct))
+
+    def test_merge_different_parameters(self):
+        hist = LogBucketHistogram()
+        try:
+            hist.merge(LogBucketHistogram(relative_accuracy=0.05))
+            self.fail('Expected ValueError')
+        except ValueError as e:
+            self.assertEqual(str(e), 'Cannot merge histograms with '
+                                     'different parameters')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_mappedregionreader.py
+----------------------------------
+
+Tests for `MappedRegionReader` in image.py
+"""
+
+import unittest
+import os
+import struct
+import random
+import tempfile
+import shutil
+from PIL import Image
+
+from chmutil.image import MappedRegionReader
+from chmutil.image import InvalidImageError
+
+
+def write_tiled_tiff(path, img, tilesize=16):
+    """Writes 8-bit grayscale `img` as uncompressed tiled tiff
+    """
+    (width, height) = img.size
+    tiles = []
+    for y in range(0, height, tilesize):
+        for x in range(0, width, tilesize):
+            tile = Image.new('L', (tilesize, tilesize))
+            tile.paste(img.crop((x, y, min(x + tilesize, width),
+                                 min(y + tilesize, height))), (0, 0))
+            tiles.append(tile.tobytes())
+    numtiles = len(tiles)
+    tagcount = 10
+    ifd_offset = 8
+    data_offset = ifd_offset + 2 + tagcount * 12 + 4
+    arrays_size = numtiles * 8
+    tile_offset = data_offset + arrays_size
+    offsets = [tile_offset + i * tilesize * tilesize
+               for i in range(numtiles)]
+    counts = [tilesize * tilesize] * numtiles
+    out = bytearray(b'II*\x00' + struct.pack('<I', ifd_offset))
+    out += struct.pack('<H', tagcount)
+
+    def tag(tagid, tagtype, count, value):
+        return struct.pack('<HHII', tagid, tagtype, count, value)
+    out += tag(256, 4, 1, width)
+    out += tag(257, 4, 1, height)
+    out += tag(258, 3, 1, 8)
+    out += tag(259, 3, 1, 1)
+    out += tag(262, 3, 1, 1)
+    out += tag(277, 3, 1, 1)
+    out += tag(322, 4, 1, tilesize)
+    out += tag(323, 4, 1, tilesize)
+    out += tag(324, 4, numtiles, data_offset)
+    out += tag(325, 4, numtiles, data_offset + numtiles * 4)
+    out += struct.pack('<I', 0)
+    out += struct.pack('<' + str(numtiles) + 'I', *offsets)
+    out += struct.pack('<' + str(numtiles) + 'I', *counts)
+    for tile in tiles:
+        out += tile
+    f = open(path, 'wb')
+    f.write(out)
+    f.close()
+
+
+class TestMappedRegionReader(unittest.TestCase):
+
+    BOXES = [(0, 0, 37, 23), (5, 3, 20, 19), (16, 0, 17, 23),
+             (30, 20, 45, 30), (-5, -5, 3, 3)]
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def _get_random_image(self, mode, size=(37, 23)):
+        rand = random.Random(1)
+        img = Image.new(mode, size)
+        if mode == 'RGB':
+            img.putdata([(rand.randint(0, 255), rand.randint(0, 255), 0)
+                         for x in range(size[0] * size[1])])
+        elif mode == 'I;16':
+            img.putdata([rand.randint(0, 65535)
+                         for x in range(size[0] * size[1])])
+        else:
+            img.putdata([rand.randint(0, 255)
+                         for x in range(size[0] * size[1])])
+        return img
+
+    def _check_reader(self, path, img):
+        reader = MappedRegionReader(path)
+        try:
+            self.assertEqual(reader.get_size(), img.size)
+            for box in TestMappedRegionReader.BOXES:
+                res = reader.read_region(box)
+                self.assertEqual(res.mode, img.mode)
+                self.assertEqual(list(res.getdata()),
+                                 list(img.crop(box).getdata()))
+        finally:
+            reader.close()
+            reader.close()
+
+    def test_uncompressed_formats(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            for mode, suffix in [('L', '.tif'), ('L', '.bmp'),
+                                 ('RGB', '.ppm'), ('I;16', '.tif')]:
+                img = self._get_random_image(mode)
+                path = os.path.join(temp_dir, mode.replace(';', '') +
+                                    suffix)
+                img.save(path)
+                self._check_reader(path, img)
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_palette_images_keep_palette(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            img = self._get_random_image('P')
+            img.putpalette([255 - (x % 256) for x in range(768)])
+            for suffix in ['.tif', '.bmp']:
+                path = os.path.join(temp_dir, 'P' + suffix)
+                img.save(path)
+                self._check_reader(path, img)
+                reader = MappedRegionReader(path)
+                try:
+                    res = reader.read_region((5, 3, 20, 19))
+                    self.assertEqual(res.convert('RGB').tobytes(),
+                                     img.crop((5, 3, 20, 19)).
+                                     convert('RGB').tobytes())
+                finally:
+                    reader.close()
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_tiled_tiff(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            img = self._get_random_image('L')
+            path = os.path.join(temp_dir, 'tiled.tif')
+            write_tiled_tiff(path, img)
+            check = Image.open(path)
+            self.assertEqual(len(check.tile), 6)
+            check.close()
+            self._check_reader(path, img)
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_compressed_formats_not_supported(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            img = self._get_random_image('L')
+            path = os.path.join(temp_dir, 'foo.png')
+            img.save(path)
+            try:
+                MappedRegionReader(path)
+                self.fail('Expected InvalidImageError')
+            except InvalidImageError as e:
+                self.assertEqual(str(e), 'Image data uses zip decoder')
+
+            path = os.path.join(temp_dir, 'foo.tif')
+            Image.new('1', (8, 8)).save(path)
+            try:
+                MappedRegionReader(path)
+                self.fail('Expected InvalidImageError')
+            except InvalidImageError as e:
+                self.assertTrue('Unsupported rawmode' in str(e))
+        finally:
+            shutil.rmtree(temp_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
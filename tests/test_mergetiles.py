@@ -12,9 +12,12 @@ import unittest
 import os
 import tempfile
 import shutil
+import json
 from PIL import Image
 
 from chmutil import mergetiles
+from chmutil import image
+from chmutil import chunkstore
 
 
 class TestMergeTiles(unittest.TestCase):
@@ -32,6 +35,12 @@ class TestMergeTiles(unittest.TestCase):
         self.assertEqual(pargs.maxpixels, 768000000)
         self.assertEqual(pargs.suffix, 'png')
         self.assertEqual(pargs.loglevel, 'WARNING')
+        self.assertEqual(pargs.pyramiddir, None)
+        self.assertEqual(pargs.pyramidtilesize, 128)
+        self.assertEqual(pargs.tiledtif, False)
+        self.assertEqual(pargs.tifftilesize, '512x512')
+        self.assertEqual(pargs.chunkstore, None)
+        self.assertEqual(pargs.section, 0)
 
     def test_main_invalid_input(self):
         temp_dir = tempfile.mkdtemp()
@@ -101,6 +110,132 @@ class TestMergeTiles(unittest.TestCase):
         finally:
             shutil.rmtree(temp_dir)
 
+    def test_merge_tiles_with_pyramid(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            img_dir = os.path.join(temp_dir, 'images')
+            os.makedirs(img_dir, mode=0o755)
+            out_img = os.path.join(temp_dir, 'out.png')
+            pyramid_dir = os.path.join(temp_dir, 'pyramid')
+
+            myimg = Image.new('L', (300, 300))
+            myimg.putpixel((299, 299), 200)
+            myimg.save(os.path.join(img_dir, '1.png'), 'PNG')
+
+            myimg = Image.new('L', (300, 300))
+            myimg.putpixel((0, 0), 100)
+            myimg.save(os.path.join(img_dir, '2.png'), 'PNG')
+
+            self.assertEqual(mergetiles.main(['yo.py', img_dir, out_img,
+                                              '--pyramiddir', pyramid_dir,
+                                              '--pyramidtilesize', '200']),
+                             0)
+            # 300x300 -> 150x150
+            self.assertEqual(sorted(os.listdir(pyramid_dir)),
+                             ['0', '1', image.PYRAMID_DESCRIPTOR])
+            self.assertEqual(os.listdir(os.path.join(pyramid_dir, '0')),
+                             ['0_0.png'])
+            self.assertEqual(sorted(os.listdir(os.path.join(pyramid_dir,
+                                                            '1'))),
+                             ['0_0.png', '0_1.png', '1_0.png', '1_1.png'])
+            tile = Image.open(os.path.join(pyramid_dir, '1', '1_1.png'))
+            self.assertEqual(tile.size, (100, 100))
+            self.assertEqual(tile.getpixel((99, 99)), 200)
+            tile.close()
+
+            tile = Image.open(os.path.join(pyramid_dir, '1', '0_0.png'))
+            self.assertEqual(tile.getpixel((0, 0)), 100)
+            tile.close()
+
+            tile = Image.open(os.path.join(pyramid_dir, '0', '0_0.png'))
+            self.assertEqual(tile.size, (150, 150))
+            tile.close()
+
+            f = open(os.path.join(pyramid_dir, image.PYRAMID_DESCRIPTOR))
+            desc = json.load(f)
+            f.close()
+            self.assertEqual(desc['tilesize'], 200)
+            self.assertEqual(desc['maxzoom'], 1)
+            self.assertEqual(desc['levels'][1]['width'], 300)
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_merge_tiles_tiled_tif(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            img_dir = os.path.join(temp_dir, 'images')
+            os.makedirs(img_dir, mode=0o755)
+            out_img = os.path.join(temp_dir, 'out.tif')
+
+            myimg = Image.new('L', (100, 60))
+            myimg.putpixel((99, 59), 200)
+            myimg.save(os.path.join(img_dir, '1.png'), 'PNG')
+
+            myimg = Image.new('L', (100, 60))
+            myimg.putpixel((0, 0), 100)
+            myimg.save(os.path.join(img_dir, '2.png'), 'PNG')
+
+            self.assertEqual(mergetiles.main(['yo.py', img_dir, out_img,
+                                              '--tiledtif',
+                                              '--tifftilesize', '32x48']),
+                             0)
+            reader = image.TiledTiffRegionReader(out_img)
+            self.assertEqual(reader.get_size(), (100, 60))
+            self.assertEqual(reader.get_tile_size(), (32, 48))
+            region = reader.read_region((90, 50, 100, 60))
+            self.assertEqual(region.getpixel((9, 9)), 200)
+            reader.close()
+
+            merged_img = Image.open(out_img)
+            self.assertEqual(merged_img.getpixel((0, 0)), 100)
+            self.assertEqual(merged_img.getpixel((99, 59)), 200)
+            merged_img.close()
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_merge_tiles_chunkstore(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            img_dir = os.path.join(temp_dir, 'images')
+            os.makedirs(img_dir, mode=0o755)
+            out_img = os.path.join(temp_dir, 'out.png')
+            store_dir = os.path.join(temp_dir, 'store')
+            chunkstore.create_chunk_store(store_dir, (2, 80, 120),
+                                          (1, 32, 32))
+
+            myimg = Image.new('L', (100, 60))
+            myimg.putpixel((99, 59), 200)
+            myimg.save(os.path.join(img_dir, '1.png'), 'PNG')
+
+            self.assertEqual(mergetiles.main(['yo.py', img_dir, out_img,
+                                              '--chunkstore', store_dir,
+                                              '--section', '1']),
+                             0)
+            self.assertTrue(os.path.isfile(out_img))
+            store = chunkstore.ChunkStore(store_dir)
+            region = store.read_region(1, (0, 0, 120, 80))
+            self.assertEqual(region.getpixel((99, 59)), 200)
+            self.assertEqual(region.getbbox(), (99, 59, 100, 60))
+            self.assertEqual(store.read_region(0, (0, 0, 120,
+                                                   80)).getbbox(), None)
+
+            # image taller than sections of store is an error
+            myimg = Image.new('L', (100, 90))
+            myimg.save(os.path.join(img_dir, '1.png'), 'PNG')
+            self.assertEqual(mergetiles.main(['yo.py', img_dir, out_img,
+                                              '--chunkstore', store_dir,
+                                              '--section', '0']),
+                             2)
+            try:
+                mergetiles._write_chunk_store_section(myimg, store_dir, 0)
+                self.fail('Expected ChunkStoreError')
+            except chunkstore.ChunkStoreError as e:
+                self.assertTrue('is larger than sections' in str(e))
+            self.assertEqual(store.read_region(0, (0, 0, 120,
+                                                   80)).getbbox(), None)
+        finally:
+            shutil.rmtree(temp_dir)
+
 
 if __name__ == '__main__':
     unittest.main()
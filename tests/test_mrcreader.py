@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_mrcreader.py
+----------------------------------
+
+Tests for `MRCReader` in mrc.py
+"""
+
+import unittest
+import os
+import struct
+import tempfile
+import shutil
+from PIL import Image
+
+from chmutil import mrc
+from chmutil.mrc import MRCReader
+from chmutil.mrc import MRCStackWriter
+from chmutil.mrc import MRCError
+
+
+class TestMRCReader(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def _write_raw_mrc(self, path, nx, ny, nz, mode, data, flags=0,
+                       nsymbt=0, bigendian=False):
+        header = mrc.get_mrc_header(nx, ny, nz)
+        endian = '<'
+        if bigendian is True:
+            endian = '>'
+            header[212:216] = mrc.MACHST_BIG_ENDIAN
+            struct.pack_into('>3i', header, 0, nx, ny, nz)
+        struct.pack_into(endian + 'i', header, 12, mode)
+        struct.pack_into(endian + 'i', header, 92, nsymbt)
+        struct.pack_into(endian + '2i', header, 152, mrc.IMOD_STAMP, flags)
+        f = open(path, 'wb')
+        f.write(header)
+        f.write(b'\0' * nsymbt)
+        f.write(data)
+        f.close()
+
+    def test_read_stack_written_by_writer(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(temp_dir, 'foo.mrc')
+            writer = MRCStackWriter(path, 3, 2, 2)
+            img = Image.new('L', (3, 2))
+            img.putdata([1, 2, 3, 4, 5, 6])
+            writer.write_section(0, Image.new('L', (3, 2), 9))
+            writer.write_section(1, img)
+            writer.close()
+
+            reader = MRCReader(path)
+            self.assertEqual(reader.get_dimensions(), (3, 2, 2))
+            self.assertEqual(reader.get_mode(), 0)
+            buf = reader.get_section_buffer(1)
+            self.assertEqual(bytes(buf), b'\x04\x05\x06\x01\x02\x03')
+            del buf
+            res = reader.get_section_image(1)
+            self.assertEqual(res.mode, 'L')
+            self.assertEqual(list(res.getdata()), [1, 2, 3, 4, 5, 6])
+            res = reader.get_section_image(0)
+            self.assertEqual(list(res.getdata()), [9] * 6)
+            for z in [-1, 2]:
+                try:
+                    reader.get_section_buffer(z)
+                    self.fail('Expected MRCError')
+                except MRCError as e:
+                    self.assertEqual(str(e), 'Section ' + str(z) +
+                                     ' is outside of volume with 2 '
+                                     'sections')
+            # close with image still referring to map
+            reader.close()
+            reader.close()
+            del res
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_signed_bytes_and_extended_header(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(temp_dir, 'foo.mrc')
+            self._write_raw_mrc(path, 2, 1, 1, 0, b'\x00\xff', flags=1,
+                                nsymbt=16)
+            reader = MRCReader(path)
+            res = reader.get_section_image(0)
+            self.assertEqual(list(res.getdata()), [128, 127])
+            reader.close()
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_uint16(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(temp_dir, 'foo.mrc')
+            self._write_raw_mrc(path, 2, 1, 1, 6, struct.pack('<2H', 1,
+                                                              1000))
+            reader = MRCReader(path)
+            res = reader.get_section_image(0)
+            self.assertEqual(res.mode, 'I;16')
+            self.assertEqual(list(res.getdata()), [1, 1000])
+            del res
+            reader.close()
+
+            self._write_raw_mrc(path, 2, 1, 1, 6, struct.pack('>2H', 1,
+                                                              1000),
+                                bigendian=True)
+            reader = MRCReader(path)
+            self.assertEqual(reader.get_dimensions(), (2, 1, 1))
+            res = reader.get_section_image(0)
+            self.assertEqual(list(res.getdata()), [1, 1000])
+            del res
+            reader.close()
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_get_region_image(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(temp_dir, 'foo.mrc')
+            writer = MRCStackWriter(path, 4, 3, 2)
+            img = Image.new('L', (4, 3))
+            img.putdata(list(range(1, 13)))
+            writer.write_section(0, Image.new('L', (4, 3), 9))
+            writer.write_section(1, img)
+            writer.close()
+
+            reader = MRCReader(path)
+            for box in [(0, 0, 4, 3), (1, 1, 3, 3), (0, 0, 2, 1),
+                        (2, 2, 4, 3), (-1, -1, 2, 2), (3, 1, 6, 5)]:
+                res = reader.get_region_image(1, box)
+                self.assertEqual(res.mode, 'L')
+                self.assertEqual(list(res.getdata()),
+                                 list(img.crop(box).getdata()))
+            res = reader.get_region_image(0, (1, 0, 3, 2))
+            self.assertEqual(list(res.getdata()), [9] * 4)
+
+            # region outside of section is all 0
+            res = reader.get_region_image(1, (5, 5, 7, 6))
+            self.assertEqual(res.size, (2, 1))
+            self.assertEqual(list(res.getdata()), [0, 0])
+            try:
+                reader.get_region_image(2, (0, 0, 1, 1))
+                self.fail('Expected MRCError')
+            except MRCError as e:
+                self.assertEqual(str(e), 'Section 2 is outside of volume '
+                                         'with 2 sections')
+            reader.close()
+
+            self._write_raw_mrc(path, 2, 2, 1, 0, b'\x00\xff\x01\x7f',
+                                flags=1)
+            reader = MRCReader(path)
+            res = reader.get_region_image(0, (1, 0, 2, 2))
+            self.assertEqual(list(res.getdata()), [255, 127])
+            reader.close()
+
+            self._write_raw_mrc(path, 2, 2, 1, 6,
+                                struct.pack('>4H', 1, 2, 3, 1000),
+                                bigendian=True)
+            reader = MRCReader(path)
+            res = reader.get_region_image(0, (0, 0, 2, 1))
+            self.assertEqual(res.mode, 'I;16')
+            self.assertEqual(list(res.getdata()), [3, 1000])
+            reader.close()
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_invalid_files(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(temp_dir, 'foo.mrc')
+            open(path, 'a').close()
+            try:
+                MRCReader(path)
+                self.fail('Expected MRCError')
+            except MRCError as e:
+                self.assertEqual(str(e), path + ' is smaller than an MRC '
+                                                'header')
+
+            self._write_raw_mrc(path, 2, 1, 1, 2, b'\0' * 8)
+            try:
+                MRCReader(path)
+                self.fail('Expected MRCError')
+            except MRCError as e:
+                self.assertEqual(str(e), path + ' has unsupported mode 2')
+
+            self._write_raw_mrc(path, 0, 1, 1, 0, b'')
+            try:
+                MRCReader(path)
+                self.fail('Expected MRCError')
+            except MRCError as e:
+                self.assertEqual(str(e), path + ' has invalid dimensions '
+                                                '(0, 1, 1)')
+
+            self._write_raw_mrc(path, 2, 2, 2, 0, b'\0' * 7)
+            try:
+                MRCReader(path)
+                self.fail('Expected MRCError')
+            except MRCError as e:
+                self.assertEqual(str(e), path + ' is 1031 bytes, but header '
+                                                'requires 1032')
+        finally:
+            shutil.rmtree(temp_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_mrcstackwriter.py
+----------------------------------
+
+Tests for `MRCStackWriter` in mrc.py
+"""
+
+import unittest
+import os
+import struct
+import tempfile
+import shutil
+from PIL import Image
+
+from chmutil import mrc
+from chmutil.mrc import MRCStackWriter
+from chmutil.mrc import MRCError
+
+
+class TestMRCStackWriter(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def test_get_mrc_header(self):
+        header = mrc.get_mrc_header(5, 4, 3, dmin=1.0, dmax=2.0,
+                                    dmean=1.5, rms=0.5, label='hi')
+        self.assertEqual(len(header), mrc.HEADER_SIZE)
+        self.assertEqual(struct.unpack_from('<4i', header, 0),
+                         (5, 4, 3, 0))
+        self.assertEqual(struct.unpack_from('<3i', header, 28), (5, 4, 3))
+        self.assertEqual(struct.unpack_from('<6f', header, 40),
+                         (5.0, 4.0, 3.0, 90.0, 90.0, 90.0))
+        self.assertEqual(struct.unpack_from('<3i', header, 64), (1, 2, 3))
+        self.assertEqual(struct.unpack_from('<3f', header, 76),
+                         (1.0, 2.0, 1.5))
+        self.assertEqual(struct.unpack_from('<2i', header, 88), (0, 0))
+        self.assertEqual(struct.unpack_from('<i', header, 108)[0], 20140)
+        self.assertEqual(struct.unpack_from('<2i', header, 152),
+                         (mrc.IMOD_STAMP, 0))
+        self.assertEqual(bytes(header[208:212]), b'MAP ')
+        self.assertEqual(bytes(header[212:216]), b'\x44\x44\x00\x00')
+        self.assertEqual(struct.unpack_from('<f', header, 216)[0], 0.5)
+        self.assertEqual(struct.unpack_from('<i', header, 220)[0], 1)
+        self.assertEqual(bytes(header[224:227]), b'hi\x00')
+
+        # default label
+        header = mrc.get_mrc_header(1, 1, 1)
+        self.assertEqual(bytes(header[224:231]), b'chmutil')
+
+    def test_write_stack(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(temp_dir, 'foo.mrc')
+            writer = MRCStackWriter(path, 3, 2, 2)
+            self.assertEqual(writer.get_dimensions(), (3, 2, 2))
+
+            img = Image.new('L', (3, 2), 0)
+            img.putdata([1, 2, 3, 4, 5, 6])
+            # write out of order and with rgb image
+            writer.write_section(1, img.convert('RGB'))
+            writer.write_section(0, Image.new('L', (3, 2), 10))
+            writer.close()
+            # close twice is fine
+            writer.close()
+
+            f = open(path, 'rb')
+            data = f.read()
+            f.close()
+            self.assertEqual(len(data), mrc.HEADER_SIZE + 12)
+            self.assertEqual(struct.unpack_from('<4i', data, 0),
+                             (3, 2, 2, 0))
+            # sections are flipped vertically
+            self.assertEqual(list(bytearray(data[mrc.HEADER_SIZE:])),
+                             [10, 10, 10, 10, 10, 10, 4, 5, 6, 1, 2, 3])
+            (dmin, dmax, dmean) = struct.unpack_from('<3f', data, 76)
+            self.assertEqual((dmin, dmax), (1.0, 10.0))
+            self.assertAlmostEqual(dmean, 81.0 / 12.0, places=5)
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_write_errors(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(temp_dir, 'foo.mrc')
+            writer = MRCStackWriter(path, 3, 2, 2)
+            img = Image.new('L', (3, 2))
+            for z in [-1, 2]:
+                try:
+                    writer.write_section(z, img)
+                    self.fail('Expected MRCError')
+                except MRCError as e:
+                    self.assertEqual(str(e), 'Section ' + str(z) +
+                                     ' is outside of stack with 2 '
+                                     'sections')
+            try:
+                writer.write_section(0, Image.new('L', (2, 2)))
+                self.fail('Expected MRCError')
+            except MRCError as e:
+                self.assertEqual(str(e), 'Section 0 has size (2, 2) but '
+                                         'stack requires (3, 2)')
+            writer.write_section(0, img)
+            try:
+                writer.write_section(0, img)
+                self.fail('Expected MRCError')
+            except MRCError as e:
+                self.assertEqual(str(e), 'Section 0 already written')
+            writer.close()
+            self.assertEqual(os.path.getsize(path), mrc.HEADER_SIZE + 12)
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_section_writer(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(temp_dir, 'foo.mrc')
+            writer = MRCStackWriter(path, 3, 2, 2)
+            img = Image.new('L', (3, 2), 0)
+            img.putdata([1, 2, 3, 4, 5, 6])
+            section_writer = mrc.MRCSectionWriter(path, 3, 2, 2)
+            self.assertEqual(section_writer.write_section(1, img),
+                             (1, 6, 21, 91))
+            try:
+                section_writer.write_section(2, img)
+                self.fail('Expected MRCError')
+            except MRCError as e:
+                self.assertEqual(str(e), 'Section 2 is outside of stack '
+                                         'with 2 sections')
+            try:
+                section_writer.write_section(0, Image.new('L', (2, 2)))
+                self.fail('Expected MRCError')
+            except MRCError as e:
+                self.assertEqual(str(e), 'Section 0 has size (2, 2) but '
+                                         'stack requires (3, 2)')
+            section_writer.close()
+            section_writer.close()
+            writer.add_written_section(1, (1, 6, 21, 91))
+            try:
+                writer.add_written_section(1, (1, 6, 21, 91))
+                self.fail('Expected MRCError')
+            except MRCError as e:
+                self.assertEqual(str(e), 'Section 1 already written')
+            writer.write_section(0, Image.new('L', (3, 2), 10))
+            writer.close()
+
+            f = open(path, 'rb')
+            data = f.read()
+            f.close()
+            self.assertEqual(list(bytearray(data[mrc.HEADER_SIZE:])),
+                             [10, 10, 10, 10, 10, 10, 4, 5, 6, 1, 2, 3])
+            (dmin, dmax, dmean) = struct.unpack_from('<3f', data, 76)
+            self.assertEqual((dmin, dmax), (1.0, 10.0))
+            self.assertAlmostEqual(dmean, 81.0 / 12.0, places=5)
+        finally:
+            shutil.rmtree(temp_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
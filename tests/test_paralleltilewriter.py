@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_paralleltilewriter.py
+----------------------------------
+
+Tests for `ParallelTileWriter` in image.py
+"""
+
+import unittest
+import os
+import io
+import tempfile
+import shutil
+import zipfile
+from PIL import Image
+
+from chmutil.image import ParallelTileWriter
+from chmutil.image import ImageTile
+from chmutil.image import LazyImageTile
+
+
+class TestParallelTileWriter(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def test_write_no_tiles(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            writer = ParallelTileWriter(temp_dir, numthreads=2)
+            writer.close()
+            self.assertEqual(os.listdir(temp_dir), [])
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_write_tiles_to_directory(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            parent = Image.new('L', (40, 20))
+            parent.putpixel((25, 5), 200)
+            writer = ParallelTileWriter(temp_dir, numthreads=3,
+                                        compress_level=1,
+                                        strategy='rle', queuesize=1)
+            for x in range(0, 4):
+                writer.add_tile('t' + str(x) + '.png',
+                                LazyImageTile(parent,
+                                              (x*10, 0, x*10+10, 20)))
+            writer.close()
+            self.assertEqual(sorted(os.listdir(temp_dir)),
+                             ['t0.png', 't1.png', 't2.png', 't3.png'])
+            img = Image.open(os.path.join(temp_dir, 't2.png'))
+            self.assertEqual(img.size, (10, 20))
+            self.assertEqual(img.getpixel((5, 5)), 200)
+            self.assertEqual(img.getpixel((0, 0)), 0)
+            img.close()
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_write_tiles_to_archive(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            zpath = os.path.join(temp_dir, 'tiles.zip')
+            writer = ParallelTileWriter(zpath, numthreads=2, archive=True)
+            for x in range(0, 5):
+                writer.add_tile(str(x) + '.png',
+                                ImageTile(Image.new('L', (8, 8), x)))
+            writer.close()
+            zf = zipfile.ZipFile(zpath)
+            try:
+                self.assertEqual(sorted(zf.namelist()),
+                                 ['0.png', '1.png', '2.png',
+                                  '3.png', '4.png'])
+                img = Image.open(io.BytesIO(zf.read('3.png')))
+                self.assertEqual(img.getpixel((0, 0)), 3)
+                img.close()
+            finally:
+                zf.close()
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_write_tiff_tiles(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            writer = ParallelTileWriter(temp_dir, numthreads=1,
+                                        imageformat='TIFF')
+            writer.add_tile('foo.tif', ImageTile(Image.new('L', (8, 4), 7)))
+            writer.close()
+            img = Image.open(os.path.join(temp_dir, 'foo.tif'))
+            self.assertEqual(img.format, 'TIFF')
+            self.assertEqual(img.size, (8, 4))
+            self.assertEqual(img.getpixel((0, 0)), 7)
+            img.close()
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_write_error_raised_on_close(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            baddir = os.path.join(temp_dir, 'doesnotexist')
+            writer = ParallelTileWriter(baddir, numthreads=2)
+            writer.add_tile('foo.png', ImageTile(Image.new('L', (8, 8))))
+            try:
+                writer.close()
+                self.fail('Expected IOError')
+            except (IOError, OSError):
+                pass
+        finally:
+            shutil.rmtree(temp_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
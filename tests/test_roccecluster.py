@@ -138,6 +138,45 @@ class TestRocceCluster(unittest.TestCase):
                          'cd "out";qsub -t 1-100 ' +
                          RocceCluster.MERGE_SUBMIT_SCRIPT_NAME)
 
+    def test_submit_commands_with_range_and_resources(self):
+        opts = CHMConfig('images', 'model', 'out',
+                         '500x500', '20x20')
+
+        rc = RocceCluster(opts)
+        self.assertEqual(rc.get_chm_submit_command(3, first_task=6,
+                                                   walltime='18:00:00',
+                                                   memory_in_gb='30'),
+                         'cd "out";qsub -l h_rt=18:00:00,h_vmem=30G '
+                         '-t 6-8 ' + RocceCluster.SUBMIT_SCRIPT_NAME)
+        self.assertEqual(rc.get_merge_submit_command(1, first_task=2,
+                                                     memory_in_gb=20),
+                         'cd "out";qsub -l h_vmem=20G,virtual_free=20G '
+                         '-t 2-2 ' + RocceCluster.MERGE_SUBMIT_SCRIPT_NAME)
+
+    def test_submit_commands_with_exclude_hosts(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            opts = CHMConfig('images', 'model', temp_dir,
+                             '500x500', '20x20')
+            rc = RocceCluster(opts)
+            self.assertEqual(rc.get_exclude_hosts(), [])
+            f = open(os.path.join(temp_dir,
+                                  CHMJobCreator.EXCLUDE_HOSTS_FILE_NAME), 'w')
+            f.write('# comment\ncompute-1\n\ncompute-0\n')
+            f.close()
+            self.assertEqual(rc.get_exclude_hosts(),
+                             ['compute-0', 'compute-1'])
+            self.assertEqual(rc.get_chm_submit_command(5),
+                             'cd "' + temp_dir + '";qsub '
+                             "-l h='!(compute-0|compute-1)' -t 1-5 " +
+                             RocceCluster.SUBMIT_SCRIPT_NAME)
+            self.assertEqual(rc.get_merge_submit_command(2),
+                             'cd "' + temp_dir + '";qsub '
+                             "-l h='!(compute-0|compute-1)' -t 1-2 " +
+                             RocceCluster.MERGE_SUBMIT_SCRIPT_NAME)
+        finally:
+            shutil.rmtree(temp_dir)
+
     def test_generate_submit_script(self):
         temp_dir = tempfile.mkdtemp()
         try:
@@ -85,16 +85,86 @@ class TestRowColumnImageTileGenerator(unittest.TestCase):
         self.assertEqual(im_list[0].get_box(), (0, 0, 100, 100))
 
         self.assertEqual(im_list[1].get_image().size, (100, 100))
-        self.assertEqual(im_list[1].get_box(), (0, 100, 100, 200))
+        self.assertEqual(im_list[1].get_box(), (100, 0, 200, 100))
 
         self.assertEqual(im_list[2].get_image().size, (100, 100))
-        self.assertEqual(im_list[2].get_box(), (100, 0, 200, 100))
+        self.assertEqual(im_list[2].get_box(), (0, 100, 100, 200))
 
         self.assertEqual(im_list[3].get_image().size, (100, 100))
         self.assertEqual(im_list[3].get_box(), (100, 100, 200, 200))
 
         self.assertEqual(counter, 4)
 
+    def test_partial_tiles_included(self):
+        im = Image.new('L', (150, 210))
+        gen = RowColumnImageTileGenerator(100, includepartialtiles=True)
+        im_list = list(gen.get_image_tiles(im))
+        self.assertEqual(len(im_list), 6)
+
+        self.assertEqual(im_list[4].get_box(), (0, 200, 100, 210))
+        self.assertEqual(im_list[4].get_image().size, (100, 10))
+        self.assertEqual(im_list[4].get_row(), 2)
+        self.assertEqual(im_list[4].get_col(), 0)
+
+        self.assertEqual(im_list[5].get_box(), (100, 200, 150, 210))
+        self.assertEqual(im_list[5].get_image().size, (50, 10))
+        self.assertEqual(im_list[5].get_row(), 2)
+        self.assertEqual(im_list[5].get_col(), 1)
+
+    def test_partial_tiles_padded(self):
+        im = Image.new('L', (150, 210), color=7)
+        gen = RowColumnImageTileGenerator(100, includepartialtiles=True,
+                                          padpartialtiles=True)
+        im_list = list(gen.get_image_tiles(im))
+        self.assertEqual(len(im_list), 6)
+        self.assertEqual(im_list[5].get_box(), (100, 200, 150, 210))
+        self.assertEqual(im_list[5].get_image().size, (100, 100))
+        self.assertEqual(im_list[5].get_image().getpixel((49, 9)), 7)
+        self.assertEqual(im_list[5].get_image().getpixel((50, 10)), 0)
+
+        # image smaller then tile is padded as well
+        im = Image.new('L', (20, 10), color=7)
+        im_list = list(gen.get_image_tiles(im))
+        self.assertEqual(len(im_list), 1)
+        self.assertEqual(im_list[0].get_box(), (0, 0, 20, 10))
+        self.assertEqual(im_list[0].get_image().size, (100, 100))
+
+    def test_row_major_order(self):
+        im = Image.new('L', (300, 200))
+        gen = RowColumnImageTileGenerator(100)
+        rc_list = [(t.get_row(), t.get_col()) for t in
+                   gen.get_image_tiles(im)]
+        self.assertEqual(rc_list, [(0, 0), (0, 1), (0, 2),
+                                   (1, 0), (1, 1), (1, 2)])
+
+    def test_lazy_tiles(self):
+        im = Image.new('L', (200, 100))
+        im.putpixel((150, 50), 255)
+        gen = RowColumnImageTileGenerator(100, lazy=True)
+        im_list = list(gen.get_image_tiles(im))
+        self.assertEqual(len(im_list), 2)
+        self.assertEqual(im_list[1].get_box(), (100, 0, 200, 100))
+        # tile is not cropped until asked for
+        self.assertEqual(im_list[1]._image, None)
+        tile_img = im_list[1].get_image()
+        self.assertEqual(tile_img.size, (100, 100))
+        self.assertEqual(tile_img.getpixel((50, 50)), 255)
+        self.assertTrue(im_list[1].get_image() is tile_img)
+
+    def test_get_tile_boxes(self):
+        gen = RowColumnImageTileGenerator(100)
+        self.assertEqual(list(gen.get_tile_boxes(50, 60)),
+                         [(0, 0, (0, 0, 50, 60))])
+        self.assertEqual(list(gen.get_tile_boxes(250, 100)),
+                         [(0, 0, (0, 0, 100, 100)),
+                          (0, 1, (100, 0, 200, 100))])
+
+        gen = RowColumnImageTileGenerator(100, includepartialtiles=True)
+        self.assertEqual(list(gen.get_tile_boxes(250, 100)),
+                         [(0, 0, (0, 0, 100, 100)),
+                          (0, 1, (100, 0, 200, 100)),
+                          (0, 2, (200, 0, 250, 100))])
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_schedulerquery
+----------------------------------
+
+Tests for `SchedulerQuery` classes in cluster
+"""
+
+import unittest
+import tempfile
+import os
+import stat
+import shutil
+import configparser
+
+from chmutil.cluster import SchedulerQuery
+from chmutil.cluster import SLURMSchedulerQuery
+from chmutil.cluster import SGESchedulerQuery
+from chmutil.cluster import PBSSchedulerQuery
+from chmutil.cluster import SchedulerQueryFactory
+from chmutil.cluster import SchedulerQueryError
+from chmutil.core import CHMJobCreator
+from chmutil import cluster
+
+SGE_XML = """<?xml version='1.0'?>
+<job_info>
+  <queue_info>
+    <job_list state="running">
+      <JB_job_number>10</JB_job_number>
+      <JB_name>chmjob</JB_name>
+      <tasks>2</tasks>
+    </job_list>
+  </queue_info>
+  <job_info>
+    <job_list state="pending">
+      <JB_job_number>10</JB_job_number>
+      <JB_name>chmjob</JB_name>
+      <tasks>5-9:2</tasks>
+    </job_list>
+    <job_list state="pending">
+      <JB_job_number>11</JB_job_number>
+      <JB_name>otherjob</JB_name>
+      <tasks>1</tasks>
+    </job_list>
+  </job_info>
+</job_info>
+"""
+
+PBS_OUTPUT = """Job Id: 55[1].gordon-fe2.local
+    Job_Name = chmjob-1
+    Job_Owner = bob@gordon-ln1.local
+    job_state = R
+
+Job Id: 55[2].gordon-fe2.local
+    Job_Name = chmjob-2
+    Job_Owner = bob@gordon-ln1.local
+    job_state = C
+
+Job Id: 55[3].gordon-fe2.local
+    Job_Name = chmjob-3
+    Job_Owner = bob@gordon-ln1.local
+    job_state = Q
+
+Job Id: 56[4].gordon-fe2.local
+    Job_Name = chmjob-4
+    Job_Owner = alice@gordon-ln1.local
+    job_state = Q
+
+Job Id: 57.gordon-fe2.local
+    Job_Name = chmjob
+    Job_Owner = bob@gordon-ln1.local
+    job_state = R
+"""
+
+
+def write_fake_command(path, output, exit_code=0):
+    """Writes script that saves its arguments to `path`.args, prints
+       `output` and exits with `exit_code`
+    """
+    outfile = path + '.output'
+    f = open(outfile, 'w')
+    f.write(output)
+    f.close()
+    f = open(path, 'w')
+    f.write('#!/bin/sh\n')
+    f.write('echo "$@" > "' + path + '.args"\n')
+    f.write('cat "' + outfile + '"\n')
+    f.write('echo "fake error" 1>&2\n')
+    f.write('exit ' + str(exit_code) + '\n')
+    f.close()
+    os.chmod(path, stat.S_IRWXU)
+    return path
+
+
+def read_args(path):
+    """Reads arguments saved by fake command
+    """
+    f = open(path + '.args', 'r')
+    try:
+        return f.read().strip()
+    finally:
+        f.close()
+
+
+class TestSchedulerQuery(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def test_base_class(self):
+        query = SchedulerQuery(command='true', user='bob')
+        self.assertEqual(query.get_command(), 'true')
+        self.assertEqual(query.get_live_array_task_ids('chmjob'), set())
+        self.assertEqual(SLURMSchedulerQuery().get_command(), 'squeue')
+        self.assertEqual(SGESchedulerQuery().get_command(), 'qstat')
+        self.assertEqual(PBSSchedulerQuery().get_command(), 'qstat')
+
+    def test_command_errors(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            query = SLURMSchedulerQuery(command=os.path.join(temp_dir,
+                                                             'nope'))
+            try:
+                query.get_live_array_task_ids('chmjob')
+                self.fail('Expected SchedulerQueryError')
+            except SchedulerQueryError as e:
+                self.assertTrue('Unable to run' in str(e))
+
+            cmd = write_fake_command(os.path.join(temp_dir, 'squeue'), '',
+                                     exit_code=1)
+            query = SLURMSchedulerQuery(command=cmd)
+            try:
+                query.get_live_array_task_ids('chmjob')
+                self.fail('Expected SchedulerQueryError')
+            except SchedulerQueryError as e:
+                self.assertTrue('exited with code 1 : fake error' in str(e))
+
+            cmd = write_fake_command(os.path.join(temp_dir, 'qstat'),
+                                     '<job_info>')
+            query = SGESchedulerQuery(command=cmd)
+            try:
+                query.get_live_array_task_ids('chmjob')
+                self.fail('Expected SchedulerQueryError')
+            except SchedulerQueryError as e:
+                self.assertTrue('Unable to parse' in str(e))
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_slurm(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            cmd = write_fake_command(os.path.join(temp_dir, 'squeue'),
+                                     '12_1\n12_4\n  13_10\n14\n15_[1-3]\n')
+            query = SLURMSchedulerQuery(command=cmd, user='bob')
+            self.assertEqual(query.get_live_array_task_ids('chmjob'),
+                             set([1, 4, 10]))
+            self.assertEqual(read_args(cmd), '-h -r -u bob -n chmjob -o %i')
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_sge(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            cmd = write_fake_command(os.path.join(temp_dir, 'qstat'),
+                                     SGE_XML)
+            query = SGESchedulerQuery(command=cmd, user='bob')
+            self.assertEqual(query.get_live_array_task_ids('chmjob'),
+                             set([2, 5, 7, 9]))
+            self.assertEqual(read_args(cmd), '-u bob -g d -xml')
+            self.assertEqual(cluster._parse_array_task_ids('1,3-4, ,8'),
+                             set([1, 3, 4, 8]))
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_pbs(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            cmd = write_fake_command(os.path.join(temp_dir, 'qstat'),
+                                     PBS_OUTPUT)
+            query = PBSSchedulerQuery(command=cmd, user='bob')
+            self.assertEqual(query.get_live_array_task_ids('chmjob'),
+                             set([1, 3]))
+            self.assertEqual(read_args(cmd), '-t -f')
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_factory(self):
+        fac = SchedulerQueryFactory()
+        self.assertEqual(fac.get_scheduler_query_by_cluster_name(None), None)
+        self.assertEqual(fac.get_scheduler_query_by_cluster_name('foo'),
+                         None)
+        query = fac.get_scheduler_query_by_cluster_name('Comet',
+                                                        command='/x')
+        self.assertTrue(isinstance(query, SLURMSchedulerQuery))
+        self.assertEqual(query.get_command(), '/x')
+        self.assertTrue(isinstance(fac.get_scheduler_query_by_cluster_name(
+            'rocce'), SGESchedulerQuery))
+        self.assertTrue(isinstance(fac.get_scheduler_query_by_cluster_name(
+            'gordon'), PBSSchedulerQuery))
+
+    def test_get_live_batched_tasks(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            bfile = os.path.join(temp_dir, 'batched')
+            self.assertEqual(cluster.get_live_batched_tasks(bfile,
+                                                            set([1])), {})
+            bconfig = configparser.ConfigParser()
+            bconfig.add_section('1')
+            bconfig.set('1', CHMJobCreator.BCONFIG_TASK_ID, '1,2')
+            bconfig.add_section('2')
+            bconfig.set('2', CHMJobCreator.BCONFIG_TASK_ID, '3')
+            bconfig.add_section('3')
+            f = open(bfile, 'w')
+            bconfig.write(f)
+            f.close()
+            self.assertEqual(cluster.get_live_batched_tasks(bfile, set()),
+                             {})
+            self.assertEqual(cluster.get_live_batched_tasks(bfile,
+                                                            set([1, 3, 4])),
+                             {1: ['1', '2']})
+        finally:
+            shutil.rmtree(temp_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -15,6 +15,8 @@ import shutil
 
 from PIL import Image
 from chmutil.image import SimpleImageMerger
+from chmutil.image import InvalidImageError
+from chmutil import image
 
 
 class TestSimpleImageMerger(unittest.TestCase):
@@ -102,6 +104,74 @@ class TestSimpleImageMerger(unittest.TestCase):
         finally:
             shutil.rmtree(temp_dir)
 
+    def test_merge_images_with_crops(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            full = os.path.join(temp_dir, '1.png')
+            img = Image.new('L', (50, 40))
+            img.putpixel((5, 5), 20)
+            img.putpixel((30, 30), 50)
+            img.save(full)
+
+            crop_one = os.path.join(temp_dir, '2.png')
+            img = Image.new('L', (10, 10))
+            img.putpixel((0, 0), 40)
+            img.putpixel((5, 5), 10)
+            img.save(crop_one)
+            image.write_crop_config(crop_one, (25, 25), (50, 40))
+
+            crop_two = os.path.join(temp_dir, '3.png')
+            img = Image.new('L', (20, 20), 0)
+            img.putpixel((19, 19), 99)
+            img.save(crop_two)
+            image.write_crop_config(crop_two, (30, 20), (50, 40))
+
+            merger = SimpleImageMerger()
+            for im_list in [[crop_one, full, crop_two],
+                            [full, crop_two, crop_one],
+                            [crop_two, crop_one, full]]:
+                merged = merger.merge_images(im_list)
+                self.assertEqual(merged.size, (50, 40))
+                self.assertEqual(merged.getpixel((5, 5)), 20)
+                self.assertEqual(merged.getpixel((25, 25)), 40)
+                self.assertEqual(merged.getpixel((30, 30)), 50)
+                self.assertEqual(merged.getpixel((49, 39)), 99)
+                self.assertEqual(merged.getpixel((40, 5)), 0)
+                merged.close()
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_merge_images_size_mismatch(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            full = os.path.join(temp_dir, '1.png')
+            img = Image.new('L', (50, 40))
+            img.save(full)
+
+            # crop whose config is missing
+            crop = os.path.join(temp_dir, '2.png')
+            img = Image.new('L', (10, 10))
+            img.save(crop)
+
+            other_crop = os.path.join(temp_dir, '3.png')
+            img.save(other_crop)
+            image.write_crop_config(other_crop, (0, 0), (60, 40))
+
+            merger = SimpleImageMerger()
+            for im_list in [[full, crop], [crop, full],
+                            [full, other_crop], [other_crop, full]]:
+                try:
+                    merger.merge_images(im_list)
+                    self.fail('Expected InvalidImageError')
+                except InvalidImageError as e:
+                    self.assertTrue('has size' in str(e))
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_read_crop_config_no_config(self):
+        self.assertEqual(image.read_crop_config('/nonexistantfile.png'),
+                         None)
+
 
 if __name__ == '__main__':
     unittest.main()
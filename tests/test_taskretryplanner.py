@@ -0,0 +1,257 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_taskretryplanner
+----------------------------------
+
+Tests for `TaskFailureClassifier` and `TaskRetryPlanner` in cluster
+"""
+
+import unittest
+import tempfile
+import os
+import shutil
+import time
+import configparser
+
+from chmutil.cluster import TaskFailureClassifier
+from chmutil.cluster import TaskRetryPlanner
+from chmutil.core import CHMJobCreator
+from chmutil import cluster
+
+
+def write_task_log(path, body, exit_code=None, maxrss=1000, mtime=None):
+    """Writes task log like submit scripts generate
+    """
+    f = open(path, 'w')
+    f.write('HOST: comet-01-01\nDATE: today\n\nJOBID: 1\nTASKID: 1\n')
+    f.write(body)
+    f.write('        Maximum resident set size (kbytes): ' + str(maxrss) +
+            '\n')
+    if exit_code is not None:
+        f.write('chmrunner.py exited with code: ' + str(exit_code) + '\n')
+    f.close()
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+
+
+class TestTaskRetryPlanner(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def test_walltime_conversion(self):
+        self.assertEqual(cluster._get_seconds_from_walltime('12:00:00'),
+                         43200)
+        self.assertEqual(cluster._get_seconds_from_walltime('1-00:01:05'),
+                         86465)
+        self.assertEqual(cluster._get_walltime_from_seconds(43200 * 1.5),
+                         '18:00:00')
+        self.assertEqual(cluster._get_walltime_from_seconds(200000.2),
+                         '55:33:21')
+
+    def test_classify(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            classifier = TaskFailureClassifier(memory_limit_in_gb=1)
+            self.assertEqual(classifier.classify(None),
+                             TaskFailureClassifier.NO_LOG)
+            self.assertEqual(classifier.classify(os.path.join(temp_dir,
+                                                              'nope')),
+                             TaskFailureClassifier.NO_LOG)
+            logfile = os.path.join(temp_dir, '1.1.out')
+
+            write_task_log(logfile, 'ABORT: Could not create temporary '
+                                    'directory /tmp\n', exit_code=3)
+            self.assertEqual(classifier.classify(logfile),
+                             TaskFailureClassifier.SINGULARITY)
+
+            write_task_log(logfile, 'OSError: cannot identify image file '
+                                    '/foo/1.png\n', exit_code=2)
+            self.assertEqual(classifier.classify(logfile),
+                             TaskFailureClassifier.BAD_INPUT)
+
+            write_task_log(logfile, 'slurmstepd: error: *** JOB 5 ON '
+                                    'comet-01-01 CANCELLED AT 2017 DUE TO '
+                                    'TIME LIMIT ***\n')
+            self.assertEqual(classifier.classify(logfile),
+                             TaskFailureClassifier.WALLTIME)
+
+            write_task_log(logfile, 'MemoryError\n', exit_code=2)
+            self.assertEqual(classifier.classify(logfile),
+                             TaskFailureClassifier.OOM)
+
+            write_task_log(logfile, 'Killed\n', exit_code=137)
+            self.assertEqual(classifier.classify(logfile),
+                             TaskFailureClassifier.OOM)
+
+            # resident set size near limit
+            write_task_log(logfile, 'blah\n', exit_code=1, maxrss=1040000)
+            self.assertEqual(classifier.classify(logfile),
+                             TaskFailureClassifier.OOM)
+            self.assertEqual(TaskFailureClassifier().classify(logfile),
+                             TaskFailureClassifier.UNKNOWN)
+
+            write_task_log(logfile, 'blah\n', exit_code=3)
+            self.assertEqual(classifier.classify(logfile),
+                             TaskFailureClassifier.UNKNOWN)
+
+            # only tail of file is searched
+            write_task_log(logfile, 'MemoryError\n' + 'x' * 1000 + '\n',
+                           exit_code=2)
+            classifier = TaskFailureClassifier(tail_bytes=500)
+            self.assertEqual(classifier.classify(logfile),
+                             TaskFailureClassifier.UNKNOWN)
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_get_latest_task_logs(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            self.assertEqual(cluster.get_latest_task_logs(
+                os.path.join(temp_dir, 'nope')), {})
+            now = time.time()
+            write_task_log(os.path.join(temp_dir, '5.1.out'), '',
+                           mtime=now - 100)
+            write_task_log(os.path.join(temp_dir, '6.1.out'), '',
+                           mtime=now - 50)
+            write_task_log(os.path.join(temp_dir, '5.2.out'), '',
+                           mtime=now - 100)
+            write_task_log(os.path.join(temp_dir, '1234[3].gordon.3.out'),
+                           '', mtime=now - 10)
+            write_task_log(os.path.join(temp_dir, 'foo.out'), '')
+            write_task_log(os.path.join(temp_dir, '5.4.log'), '')
+
+            res = cluster.get_latest_task_logs(temp_dir)
+            self.assertEqual(res, {1: os.path.join(temp_dir, '6.1.out'),
+                                   2: os.path.join(temp_dir, '5.2.out'),
+                                   3: os.path.join(temp_dir,
+                                                   '1234[3].gordon.3.out')})
+            res = cluster.get_latest_task_logs(temp_dir,
+                                               newer_than=now - 60)
+            self.assertEqual(sorted(res.keys()), [1, 3])
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_get_task_failures(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            classifier = TaskFailureClassifier()
+            log_dir = os.path.join(temp_dir, 'logs')
+            os.makedirs(log_dir)
+            bfile = os.path.join(temp_dir, 'batched')
+            no_log = (TaskFailureClassifier.NO_LOG, None)
+
+            # no batched config
+            self.assertEqual(cluster.get_task_failures(bfile, log_dir,
+                                                       ['1', '2'],
+                                                       classifier),
+                             {'1': no_log, '2': no_log})
+
+            bconfig = configparser.ConfigParser()
+            bconfig.add_section('1')
+            bconfig.set('1', CHMJobCreator.BCONFIG_TASK_ID, '1,2')
+            bconfig.add_section('2')
+            bconfig.set('2', CHMJobCreator.BCONFIG_TASK_ID, '3')
+            bconfig.add_section('3')
+            bconfig.set('3', CHMJobCreator.BCONFIG_TASK_ID, '4')
+            bconfig.add_section('4')
+            f = open(bfile, 'w')
+            bconfig.write(f)
+            f.close()
+            now = time.time()
+            os.utime(bfile, (now - 100, now - 100))
+
+            log1 = os.path.join(log_dir, '7.1.out')
+            write_task_log(log1, 'MemoryError\n', exit_code=2)
+            # log from previous submission is ignored
+            write_task_log(os.path.join(log_dir, '6.3.out'), 'MemoryError\n',
+                           exit_code=2, mtime=now - 200)
+            log4 = os.path.join(log_dir, '7.4.out')
+            write_task_log(log4, 'DUE TO TIME LIMIT\n')
+
+            res = cluster.get_task_failures(bfile, log_dir,
+                                            ['2', '3', '4', '5'], classifier)
+            self.assertEqual(res, {'2': (TaskFailureClassifier.OOM, log1),
+                                   '3': no_log,
+                                   '4': no_log,
+                                   '5': no_log})
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_plan_no_failures(self):
+        planner = TaskRetryPlanner(None)
+        groups, held = planner.plan('chm', ['1', '2'], {}, '12:00:00', 15)
+        self.assertEqual(groups, [('12:00:00', '15', ['1', '2'])])
+        self.assertEqual(held, {})
+        planner.save()
+
+    def test_plan_and_save(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            state_file = os.path.join(temp_dir, 'state')
+            planner = TaskRetryPlanner(state_file)
+            self.assertEqual(planner.get_state_file(), state_file)
+            failures = {'1': (TaskFailureClassifier.OOM, 'a'),
+                        '2': (TaskFailureClassifier.WALLTIME, 'b'),
+                        '3': (TaskFailureClassifier.BAD_INPUT, 'c'),
+                        '4': (TaskFailureClassifier.SINGULARITY, 'd'),
+                        '5': (TaskFailureClassifier.NO_LOG, None),
+                        '6': (TaskFailureClassifier.OOM, 'e')}
+            tasks = ['1', '2', '3', '4', '5', '6']
+            groups, held = planner.plan('chm', tasks, failures,
+                                        '12:00:00', '15')
+            self.assertEqual(groups, [('12:00:00', '15', ['4', '5']),
+                                      ('18:00:00', '15', ['2']),
+                                      ('12:00:00', '23', ['1', '6'])])
+            self.assertEqual(held, {'3': (TaskFailureClassifier.BAD_INPUT,
+                                          'c')})
+            planner.save()
+
+            # increases compound, tasks no longer incomplete are dropped
+            # and tasks that did not run keep their resources
+            planner = TaskRetryPlanner(state_file, max_failures=3)
+            failures = {'1': (TaskFailureClassifier.OOM, 'a'),
+                        '2': (TaskFailureClassifier.NO_LOG, None)}
+            groups, held = planner.plan('chm', ['1', '2', '3'], failures,
+                                        '12:00:00', '15')
+            self.assertEqual(groups, [('18:00:00', '15', ['2']),
+                                      ('12:00:00', '35', ['1'])])
+            self.assertEqual(held, {'3': (TaskFailureClassifier.BAD_INPUT,
+                                          None)})
+            # state of running tasks is kept
+            groups, held = planner.plan('chm', ['1'], {}, '12:00:00', '15',
+                                        running_tasks=['2', '3'])
+            self.assertTrue(('12:00:00', '35', ['1']) in groups)
+            # merge tasks with same ids are separate
+            groups, held = planner.plan('merge', ['1'], {}, '1:00:00', '5')
+            self.assertEqual(groups, [('1:00:00', '5', ['1'])])
+            planner.save()
+
+            state = configparser.ConfigParser()
+            state.read(state_file)
+            self.assertEqual(state.sections(), ['chm.1', 'chm.2', 'chm.3'])
+            self.assertEqual(state.get('chm.1', TaskRetryPlanner.FAILURES),
+                             '2')
+            self.assertEqual(state.get('chm.1', TaskRetryPlanner.MEMORY),
+                             '35')
+
+            # third failure holds task back
+            planner = TaskRetryPlanner(state_file)
+            groups, held = planner.plan('chm', ['1'],
+                                        {'1': (TaskFailureClassifier.UNKNOWN,
+                                               'z')},
+                                        '12:00:00', '15')
+            self.assertEqual(groups, [])
+            self.assertEqual(held, {'1': (TaskFailureClassifier.UNKNOWN,
+                                          'z')})
+        finally:
+            shutil.rmtree(temp_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
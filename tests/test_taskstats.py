@@ -46,6 +46,54 @@ class TestCore(unittest.TestCase):
         self.assertEqual(ts.get_max_memory_in_kb(), 300)
         self.assertEqual(ts.get_total_memory_in_kb(), 400)
 
+    def test_add_task_runtimes_and_percentiles(self):
+        ts = TaskStats()
+        self.assertEqual(ts.get_walltime_percentile(50), None)
+        self.assertEqual(ts.get_usertime_percentile(50), None)
+        self.assertEqual(ts.get_max_memory_percentile_in_kb(95), None)
+        for (user, wall, mem) in [(3.0, 30.0, 400), (1.0, 10.0, 100),
+                                  (2.0, 20.0, 300), (4.0, 40.0, 200)]:
+            ts.add_task_runtimes(user, wall, mem)
+        self.assertEqual(ts.get_total_tasks_with_cputimes(), 4)
+        self.assertEqual(ts.get_total_cpu_usertime(), 10.0)
+        self.assertEqual(ts.get_total_cpu_walltime(), 100.0)
+        self.assertEqual(ts.get_total_memory_in_kb(), 1000)
+        self.assertEqual(ts.get_max_memory_in_kb(), 400)
+        self.assertAlmostEqual(ts.get_walltime_percentile(50), 20.0,
+                               delta=0.2)
+        self.assertEqual(ts.get_walltime_percentile(100), 40.0)
+        self.assertAlmostEqual(ts.get_usertime_percentile(95), 4.0,
+                               delta=0.04)
+        self.assertAlmostEqual(ts.get_max_memory_percentile_in_kb(50), 200,
+                               delta=2)
+        self.assertEqual(ts.get_max_memory_percentile_in_kb(0), 100)
+
+    def test_merge(self):
+        one = TaskStats()
+        one.set_completed_task_count(1)
+        one.set_total_task_count(2)
+        one.add_task_runtimes(1.0, 10.0, 100)
+        two = TaskStats()
+        two.set_completed_task_count(3)
+        two.set_total_task_count(4)
+        two.add_task_runtimes(2.0, 20.0, 300)
+        two.add_task_runtimes(3.0, 30.0, 200)
+        one.merge(two)
+        self.assertEqual(one.get_completed_task_count(), 4)
+        self.assertEqual(one.get_total_task_count(), 6)
+        self.assertEqual(one.get_total_tasks_with_cputimes(), 3)
+        self.assertEqual(one.get_total_cpu_usertime(), 6.0)
+        self.assertEqual(one.get_total_cpu_walltime(), 60.0)
+        self.assertEqual(one.get_total_memory_in_kb(), 600)
+        self.assertEqual(one.get_max_memory_in_kb(), 300)
+        self.assertEqual(one.get_walltime_percentile(0), 10.0)
+        self.assertEqual(one.get_walltime_percentile(100), 30.0)
+
+        # merging empty stats changes nothing
+        one.merge(TaskStats())
+        self.assertEqual(one.get_total_tasks_with_cputimes(), 3)
+        self.assertEqual(one.get_max_memory_in_kb(), 300)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -10,6 +10,7 @@ Tests for `TaskSummary in cluster`
 
 import unittest
 import sys
+import json
 
 from chmutil.cluster import TaskStats
 from chmutil.cluster import TaskSummary
@@ -178,6 +179,95 @@ class TestCore(unittest.TestCase):
                         '\nfoo estimated remaining compute: '
                         '7,884.0 CPU hours (~0.9 years)\n' in res)
 
+    def test_get_summary_as_dict_no_stats(self):
+        tsum = TaskSummary(None)
+        res = tsum.get_summary_as_dict()
+        self.assertEqual(res['chmutil_version'], None)
+        self.assertEqual(res['job'], None)
+        self.assertEqual(res['images'], None)
+        self.assertEqual(res['chm']['total_tasks'], None)
+        self.assertEqual(res['merge']['cpu_hours'], None)
+        self.assertEqual(sorted(res['chm'].keys()),
+                         sorted(TaskSummary.CSV_COLUMNS[1:]))
+
+        ts = TaskStats()
+        ts.set_completed_task_count(1)
+        ts.set_total_task_count(2)
+        tsum = TaskSummary(None, chm_task_stats=ts)
+        res = tsum.get_summary_as_dict()
+        self.assertEqual(res['chm']['total_tasks'], 2)
+        self.assertEqual(res['chm']['completed_tasks'], 1)
+        self.assertEqual(res['chm']['tasks_with_cputimes'], 0)
+        self.assertEqual(res['chm']['walltime_p95_seconds'], None)
+        self.assertEqual(res['chm']['estimated_cost_to_finish'], None)
+
+    def _get_task_stats_with_compute(self):
+        ts = TaskStats()
+        ts.set_completed_task_count(2)
+        ts.set_total_task_count(4)
+        ts.add_task_runtimes(3600.0, 1000.0, 1000)
+        ts.add_task_runtimes(3600.0, 2600.0, 2000)
+        return ts
+
+    def test_get_summary_as_dict_and_json(self):
+        con = CHMConfig('./images', './model', './outdir', '500x500', '20x20')
+        iss = ImageStatsSummary()
+        iss.add_image_stats(ImageStats('/foo', 1000, 720, 'L',
+                                       size_in_bytes=50))
+        tsum = TaskSummary(con, chm_task_stats=self.
+                           _get_task_stats_with_compute(),
+                           image_stats_summary=iss)
+        self.assertEqual(tsum.get_image_stats_summary(), iss)
+        res = tsum.get_summary_as_dict(cost_per_cpu_hour=2.5)
+        self.assertEqual(res['chmutil_version'], 'unknown')
+        self.assertEqual(res['job']['tile_size'], '500x500')
+        self.assertEqual(res['job']['model'], './model')
+        self.assertEqual(res['images'], {'count': 1, 'total_bytes': 50,
+                                         'total_pixels': 720000})
+        chm = res['chm']
+        self.assertEqual(chm['cpu_hours'], 2.0)
+        self.assertEqual(chm['cpu_walltime_seconds'], 3600.0)
+        self.assertEqual(chm['avg_memory_kb'], 1500.0)
+        self.assertEqual(chm['max_memory_kb'], 2000)
+        self.assertAlmostEqual(chm['walltime_p50_seconds'], 1000.0,
+                               delta=10)
+        self.assertAlmostEqual(chm['walltime_p99_seconds'], 2600.0,
+                               delta=26)
+        self.assertEqual(chm['walltime_max_seconds'], 2600.0)
+        self.assertAlmostEqual(chm['max_rss_p50_kb'], 1000, delta=10)
+        self.assertEqual(chm['max_rss_max_kb'], 2000)
+        # half the pixels processed with 7200 cpu seconds
+        self.assertEqual(chm['pixels_per_cpu_second'], 50.0)
+        self.assertEqual(chm['remaining_cpu_hours'], 2.0)
+        self.assertEqual(chm['estimated_cost_to_finish'], 5.0)
+        self.assertEqual(res['merge']['total_tasks'], None)
+
+        res = json.loads(tsum.get_summary_as_json())
+        self.assertEqual(res['chm']['estimated_cost_to_finish'], 2.0)
+        self.assertEqual(res['job']['tasks_per_node'], 1)
+
+    def test_get_summary_as_csv(self):
+        mts = TaskStats()
+        mts.set_completed_task_count(3)
+        mts.set_total_task_count(4)
+        tsum = TaskSummary(None, chm_task_stats=self.
+                           _get_task_stats_with_compute(),
+                           merge_task_stats=mts)
+        lines = tsum.get_summary_as_csv().split('\n')
+        self.assertEqual(len(lines), 4)
+        self.assertEqual(lines[3], '')
+        self.assertEqual(lines[0], ','.join(TaskSummary.CSV_COLUMNS))
+        chm = lines[1].split(',')
+        self.assertEqual(len(chm), len(TaskSummary.CSV_COLUMNS))
+        self.assertEqual(chm[0], 'chm')
+        self.assertEqual(chm[1], '4')
+        self.assertEqual(chm[TaskSummary.CSV_COLUMNS.index('cpu_hours')],
+                         '2.0')
+        self.assertEqual(chm[TaskSummary.CSV_COLUMNS.
+                             index('pixels_per_cpu_second')], '')
+        self.assertEqual(lines[2], 'merge,4,3,0' +
+                         ',' * (len(TaskSummary.CSV_COLUMNS) - 4))
+
     def test_get_summary(self):
         tsum = TaskSummary(None)
         self.assertEqual(tsum.get_summary(),
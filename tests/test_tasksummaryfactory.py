@@ -19,6 +19,17 @@ from chmutil.cluster import TaskSummaryFactory
 from chmutil.core import CHMConfig
 from chmutil.core import CHMJobCreator
 from chmutil.cluster import TaskStats
+from chmutil import cluster
+
+
+def get_runtimes(taskstats):
+    """Gets tuple (tasks with cpu times, user time, walltime,
+       max memory) from `taskstats`
+    """
+    return (taskstats.get_total_tasks_with_cputimes(),
+            taskstats.get_total_cpu_usertime(),
+            taskstats.get_total_cpu_walltime(),
+            taskstats.get_max_memory_in_kb())
 
 
 class TestTaskSummaryFactory(unittest.TestCase):
@@ -133,7 +144,7 @@ class TestTaskSummaryFactory(unittest.TestCase):
             # test empty directory
             tsf = TaskSummaryFactory(con)
             res = tsf._get_compute_hours_consumed(temp_dir)
-            self.assertEqual(len(res), 0)
+            self.assertEqual(get_runtimes(res), (0, 0, 0, 0))
 
             # test one file valid format old way ie real, user, sys
             oldformatfile = os.path.join(temp_dir, '1234.1')
@@ -144,14 +155,12 @@ class TestTaskSummaryFactory(unittest.TestCase):
             f.flush()
             f.close()
             res = tsf._get_compute_hours_consumed(temp_dir)
-            self.assertEqual(len(res), 1)
-            self.assertEqual(res, [(250.1, 150.05, 0)])
+            self.assertEqual(get_runtimes(res), (1, 250.1, 150.05, 0))
 
             # test 2 files one with no content
             open(os.path.join(temp_dir, '234.22'), 'a').close()
             res = tsf._get_compute_hours_consumed(temp_dir)
-            self.assertEqual(len(res), 1)
-            self.assertEqual(res, [(250.1, 150.05, 0)])
+            self.assertEqual(get_runtimes(res), (1, 250.1, 150.05, 0))
 
             # test 3 files one with content but not run stats
             no_time_file = os.path.join(temp_dir, 'hello.txt')
@@ -160,8 +169,7 @@ class TestTaskSummaryFactory(unittest.TestCase):
             f.flush()
             f.close()
             res = tsf._get_compute_hours_consumed(temp_dir)
-            self.assertEqual(len(res), 1)
-            self.assertEqual(res, [(250.1, 150.05, 0)])
+            self.assertEqual(get_runtimes(res), (1, 250.1, 150.05, 0))
 
             # test 5 files 3 have content, one old format, two new format
             new_format_file = os.path.join(temp_dir, '778786.1')
@@ -192,11 +200,155 @@ class TestTaskSummaryFactory(unittest.TestCase):
             f.close()
 
             res = tsf._get_compute_hours_consumed(temp_dir)
-            self.assertEqual(len(res), 3)
-            res.sort()
-            self.assertEqual(res, [(100.0, 1215.0, 5287148),
-                                   (250.1, 150.05, 0),
-                                   (9823.73, 12195.0, 0)])
+            self.assertEqual(res.get_total_tasks_with_cputimes(), 3)
+            self.assertAlmostEqual(res.get_total_cpu_usertime(),
+                                   100.0 + 250.1 + 9823.73)
+            self.assertAlmostEqual(res.get_total_cpu_walltime(),
+                                   1215.0 + 150.05 + 12195.0)
+            self.assertEqual(res.get_max_memory_in_kb(), 5287148)
+            self.assertEqual(res.get_total_memory_in_kb(), 5287148)
+            self.assertEqual(res.get_walltime_percentile(0), 150.05)
+            self.assertEqual(res.get_walltime_percentile(100), 12195.0)
+            self.assertAlmostEqual(res.get_walltime_percentile(50), 1215.0,
+                                   delta=1215.0 * 0.01)
+
+            # same result when parsed in a process pool
+            tsf = TaskSummaryFactory(con, processes=2)
+            orig_threshold = TaskSummaryFactory.PARALLEL_LOG_THRESHOLD
+            try:
+                TaskSummaryFactory.PARALLEL_LOG_THRESHOLD = 1
+                pres = tsf._get_compute_hours_consumed(temp_dir)
+            finally:
+                TaskSummaryFactory.PARALLEL_LOG_THRESHOLD = orig_threshold
+            self.assertEqual(pres.get_total_tasks_with_cputimes(), 3)
+            self.assertAlmostEqual(pres.get_total_cpu_usertime(),
+                                   res.get_total_cpu_usertime())
+            self.assertAlmostEqual(pres.get_total_cpu_walltime(),
+                                   res.get_total_cpu_walltime())
+            self.assertEqual(pres.get_max_memory_in_kb(), 5287148)
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_parse_task_log(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            self.assertEqual(cluster.parse_task_log(os.path.join(temp_dir,
+                                                                 'nope')),
+                             None)
+            logfile = os.path.join(temp_dir, 'log')
+            f = open(logfile, 'wb')
+            # blocks from several task runs are summed
+            f.write(b'\tUser time (seconds): 1.5\n')
+            f.write(b'\tElapsed (wall clock) time (h:mm:ss or m:ss): '
+                    b'0:10\n')
+            f.write(b'\tMaximum resident set size (kbytes): 5000\n')
+            f.write(b'x' * 100 + b'\n')
+            f.write(b'\tUser time (seconds): 5.5\r\n')
+            f.write(b'\tElapsed (wall clock) time (h:mm:ss or m:ss): '
+                    b'1:02:03.5\n')
+            f.write(b'\tMaximum resident set size (kbytes): 1234\n')
+            f.write(b'\xff\xfe not utf-8\n')
+            f.close()
+            self.assertEqual(cluster.parse_task_log(logfile),
+                             (7.0, 3733.5, 5000))
+            # old line constants still match what is parsed
+            self.assertEqual(cluster.TaskSummaryFactory.USERTIME_STR,
+                             'User time (seconds):')
+            self.assertEqual(cluster.TaskSummaryFactory.MAXMEM_STR,
+                             'Maximum resident set size (kbytes): ')
+
+            # only tail is searched if it has a walltime
+            self.assertEqual(cluster.parse_task_log(logfile,
+                                                    tail_bytes=120),
+                             (0.0, 3723.5, 1234))
+
+            # whole file is searched if tail has no walltime
+            f = open(logfile, 'wb')
+            f.write(b'real 10.0\nuser 20.0\n')
+            f.write(b'y' * 500 + b'\n')
+            f.close()
+            self.assertEqual(cluster.parse_task_log(logfile,
+                                                    tail_bytes=10),
+                             (20.0, 10.0, 0))
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_task_log_cache(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            cache_file = os.path.join(temp_dir, 'cache')
+            cache = cluster.TaskLogCache(cache_file)
+            self.assertEqual(cache.get_entry_count(), 0)
+            self.assertEqual(cache.get('/a', 1, 2.0), None)
+            # nothing to save
+            cache.save()
+            self.assertFalse(os.path.isfile(cache_file))
+
+            cache.set('/a', 10, 1500000000.123456, (1.5, 2.25, 3))
+            cache.set('/b c', 20, 1500000001.0, (0, 0, 0))
+            self.assertEqual(cache.get('/a', 10, 1500000000.123456),
+                             (1.5, 2.25, 3))
+            cache.save()
+
+            cache = cluster.TaskLogCache(cache_file)
+            self.assertEqual(cache.get_entry_count(), 2)
+            self.assertEqual(cache.get('/a', 10, 1500000000.123456),
+                             (1.5, 2.25, 3))
+            self.assertEqual(cache.get('/b c', 20, 1500000001.0),
+                             (0.0, 0.0, 0))
+            # changed size or mtime is a miss
+            self.assertEqual(cache.get('/a', 11, 1500000000.123456), None)
+            self.assertEqual(cache.get('/a', 10, 1500000002.0), None)
+
+            # invalid lines are skipped
+            f = open(cache_file, 'a')
+            f.write('bad\tline\n/c\t1\t2\tx\t1\t1\n')
+            f.close()
+            self.assertEqual(cluster.TaskLogCache(cache_file).
+                             get_entry_count(), 2)
+
+            # unknown format is ignored
+            f = open(cache_file, 'w')
+            f.write('/a\t10\t1500000000.123456\t1.5\t2.25\t3\n')
+            f.close()
+            self.assertEqual(cluster.TaskLogCache(cache_file).
+                             get_entry_count(), 0)
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_compute_hours_consumed_with_cache(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            log_dir = os.path.join(temp_dir, 'logs')
+            os.makedirs(log_dir, mode=0o755)
+            cache_file = os.path.join(temp_dir, 'cache')
+            one = os.path.join(log_dir, '1')
+            f = open(one, 'w')
+            f.write('real 10.0\nuser 20.0\n')
+            f.close()
+            open(os.path.join(log_dir, '2'), 'w').close()
+
+            tsf = TaskSummaryFactory(None, cache_file=cache_file)
+            res = tsf._get_compute_hours_consumed(log_dir)
+            self.assertEqual(get_runtimes(res), (1, 20.0, 10.0, 0))
+            cache = cluster.TaskLogCache(cache_file)
+            self.assertEqual(cache.get_entry_count(), 2)
+
+            # cached entries are used instead of parsing
+            st = os.stat(one)
+            cache.set(one, st.st_size, st.st_mtime, (7.0, 8.0, 9))
+            cache.save()
+            tsf = TaskSummaryFactory(None, cache_file=cache_file)
+            res = tsf._get_compute_hours_consumed(log_dir)
+            self.assertEqual(get_runtimes(res), (1, 7.0, 8.0, 9))
+
+            # changed file is parsed again
+            f = open(one, 'a')
+            f.write('Maximum resident set size (kbytes): 5\n')
+            f.close()
+            tsf = TaskSummaryFactory(None, cache_file=cache_file)
+            res = tsf._get_compute_hours_consumed(log_dir)
+            self.assertEqual(get_runtimes(res), (1, 20.0, 10.0, 5))
         finally:
             shutil.rmtree(temp_dir)
 
@@ -212,17 +364,21 @@ class TestTaskSummaryFactory(unittest.TestCase):
         self.assertEqual(res, ts)
 
         # None for taskstats
-        res = tsf._update_chm_task_stats_with_compute(None, [])
+        res = tsf._update_chm_task_stats_with_compute(None, TaskStats())
         self.assertEqual(res, None)
 
         # empty res list
         ts = TaskStats()
-        res = tsf._update_chm_task_stats_with_compute(ts, [])
+        res = tsf._update_chm_task_stats_with_compute(ts, TaskStats())
         self.assertEqual(res, ts)
+        self.assertEqual(res.get_total_tasks_with_cputimes(), 0)
+        self.assertEqual(res.get_max_memory_in_kb(), 0)
 
         # try 1 stats
         ts = TaskStats()
-        res = tsf._update_chm_task_stats_with_compute(ts, [(1, 2, 3)])
+        cs = TaskStats()
+        cs.add_task_runtimes(1, 2, 3)
+        res = tsf._update_chm_task_stats_with_compute(ts, cs)
         self.assertEqual(res, ts)
         self.assertEqual(res.get_total_tasks_with_cputimes(), 1)
         self.assertEqual(res.get_max_memory_in_kb(), 3)
@@ -231,9 +387,10 @@ class TestTaskSummaryFactory(unittest.TestCase):
 
         # try 3 entries
         ts = TaskStats()
-        res = tsf._update_chm_task_stats_with_compute(ts, [(5, 5, 10),
-                                                           (1, 2, 3),
-                                                           (4, 5, 1)])
+        cs = TaskStats()
+        for (user, wall, mem) in [(5, 5, 10), (1, 2, 3), (4, 5, 1)]:
+            cs.add_task_runtimes(user, wall, mem)
+        res = tsf._update_chm_task_stats_with_compute(ts, cs)
         self.assertEqual(res, ts)
         self.assertEqual(res.get_total_tasks_with_cputimes(), 3)
         self.assertEqual(res.get_max_memory_in_kb(), 10)
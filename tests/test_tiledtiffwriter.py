@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_tiledtiffwriter.py
+----------------------------------
+
+Tests for `TiledTiffWriter` and `TiledTiffRegionReader` in image.py
+"""
+
+import unittest
+import os
+import random
+import tempfile
+import shutil
+from PIL import Image
+
+from chmutil import image
+from chmutil.image import TiledTiffWriter
+from chmutil.image import TiledTiffRegionReader
+from chmutil.image import InvalidImageError
+
+
+class TestTiledTiffWriter(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def _get_random_image(self, mode, size):
+        img = Image.new(mode, size)
+        count = size[0] * size[1]
+        if mode == 'RGB':
+            img.putdata([(random.randint(0, 255), random.randint(0, 255),
+                          random.randint(0, 255)) for i in range(count)])
+        elif mode == 'I;16':
+            img.putdata([random.randint(0, 65535) for i in range(count)])
+        else:
+            img.putdata([random.randint(0, 255) for i in range(count)])
+        return img
+
+    def test_constructor_invalid_tilesize(self):
+        for tilesize in [(0, 16), (16, 10), (17, 32), (-16, 16)]:
+            try:
+                TiledTiffWriter(tilesize=tilesize)
+                self.fail('Expected ValueError')
+            except ValueError as e:
+                self.assertTrue('multiples of 16' in str(e))
+
+    def test_save_none_and_unsupported_mode(self):
+        writer = TiledTiffWriter(tilesize=(16, 16))
+        try:
+            writer.save(None, 'foo.tif')
+            self.fail('Expected InvalidImageError')
+        except InvalidImageError as e:
+            self.assertEqual(str(e), 'Image is None')
+
+        try:
+            writer.save(Image.new('RGBA', (10, 10)), 'foo.tif')
+            self.fail('Expected InvalidImageError')
+        except InvalidImageError as e:
+            self.assertEqual(str(e), 'Unsupported image mode RGBA')
+
+    def test_save_matches_pillow_read(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            for mode in ['L', 'I;16', 'RGB']:
+                img = self._get_random_image(mode, (70, 40))
+                tif = os.path.join(temp_dir, 'x.tif')
+                writer = TiledTiffWriter(tilesize=(32, 16),
+                                         compress_level=1)
+                writer.save(img, tif)
+                pimg = Image.open(tif)
+                self.assertEqual(pimg.size, (70, 40))
+                self.assertEqual(pimg.mode, mode)
+                self.assertEqual(list(pimg.getdata()),
+                                 list(img.getdata()))
+                pimg.close()
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_save_image_smaller_than_tile(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            img = Image.new('L', (10, 5), 7)
+            img.putpixel((9, 4), 200)
+            tif = os.path.join(temp_dir, 'x.tif')
+            TiledTiffWriter(tilesize=(16, 16)).save(img, tif)
+            pimg = Image.open(tif)
+            self.assertEqual(pimg.size, (10, 5))
+            self.assertEqual(list(pimg.getdata()), list(img.getdata()))
+            pimg.close()
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_region_reader(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            for mode in ['L', 'I;16', 'RGB']:
+                img = self._get_random_image(mode, (70, 40))
+                tif = os.path.join(temp_dir, 'x.tif')
+                TiledTiffWriter(tilesize=(32, 16)).save(img, tif)
+                reader = image.get_region_reader(tif)
+                try:
+                    self.assertTrue(isinstance(reader,
+                                               TiledTiffRegionReader))
+                    self.assertEqual(reader.get_size(), (70, 40))
+                    self.assertEqual(reader.get_tile_size(), (32, 16))
+                    for box in [(0, 0, 70, 40), (5, 3, 50, 33),
+                                (32, 16, 64, 32), (60, 30, 90, 50),
+                                (-5, -5, 3, 3), (100, 100, 110, 110)]:
+                        region = reader.read_region(box)
+                        self.assertEqual(region.mode, mode)
+                        self.assertEqual(list(region.getdata()),
+                                         list(img.crop(box).getdata()))
+                        region.close()
+                finally:
+                    reader.close()
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_region_reader_not_tiled_or_not_tiff(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            tif = os.path.join(temp_dir, 'x.tif')
+            Image.new('L', (20, 20)).save(tif, compression='tiff_deflate')
+            try:
+                TiledTiffRegionReader(tif)
+                self.fail('Expected InvalidImageError')
+            except InvalidImageError as e:
+                self.assertEqual(str(e), 'TIFF is not tiled')
+
+            png = os.path.join(temp_dir, 'x.png')
+            Image.new('L', (20, 20)).save(png)
+            try:
+                TiledTiffRegionReader(png)
+                self.fail('Expected InvalidImageError')
+            except InvalidImageError as e:
+                self.assertEqual(str(e), 'Not a TIFF file')
+
+            reader = image.get_region_reader(tif)
+            self.assertTrue(isinstance(reader, image.PillowRegionReader))
+            reader.close()
+        finally:
+            shutil.rmtree(temp_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()